@@ -0,0 +1,81 @@
+"""
+Compares output of PostGIS and in-process spatial engines (see opensite/processing/inprocess.py)
+Runs same operation on existing input table with both engines and reports whether outputs are equivalent
+
+Usage:
+python3 compare-engines.py [input table] buffer [buffer distance]
+python3 compare-engines.py [input table] preprocess
+python3 compare-engines.py [input table] clip [clip areas separated by semicolon]
+"""
+
+import sys
+import time
+import logging
+from psycopg2 import sql
+from opensite.constants import OpenSiteConstants
+from opensite.model.node import Node
+from opensite.postgis.opensite import OpenSitePostGIS
+from opensite.processing.inprocess import OpenSiteInProcess
+from opensite.processing.spatial import OpenSiteSpatial
+
+ENGINES = ['postgis', 'inprocess']
+ACTIONS = ['buffer', 'preprocess', 'clip']
+
+if len(sys.argv) < 3 or sys.argv[2] not in ACTIONS:
+    print(__doc__)
+    sys.exit(1)
+
+input_table, action = sys.argv[1], sys.argv[2]
+postgis = OpenSitePostGIS(logging.WARNING)
+
+if not postgis.table_exists(input_table):
+    print(f"Input table {input_table} does not exist")
+    sys.exit(1)
+
+custom_properties = {}
+if action == 'buffer':
+    if len(sys.argv) < 4:
+        print("Buffer distance required")
+        sys.exit(1)
+    custom_properties['buffer'] = float(sys.argv[3])
+if action == 'clip':
+    if len(sys.argv) < 4:
+        print("Clip areas required")
+        sys.exit(1)
+    custom_properties['clip'] = sorted(area.lower() for area in sys.argv[3].split(';'))
+
+outputs, timings, success = {}, {}, True
+
+for urn, engine in enumerate(ENGINES):
+    output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX}compare_{engine}_{input_table}"[:63]
+    name = f"compare--{input_table}" if action == 'clip' else f"compare-{input_table}"
+    node = Node(urn=urn, name=name, action=action, input=input_table, output=output, \
+                custom_properties={'branch': None, 'engine': engine, **custom_properties})
+
+    # Register output so success gate of spatial operation finds registry record
+    postgis.drop_table(output)
+    postgis.register_node(node, None, 'compare')
+
+    start = time.time()
+    if not getattr(OpenSiteSpatial(node, logging.WARNING), action)():
+        print(f"{engine}: {action} failed")
+        success = False
+    timings[engine] = time.time() - start
+    outputs[engine] = output
+
+if success:
+    comparison = OpenSiteInProcess(postgis, logging.WARNING).compare_tables(outputs['postgis'], outputs['inprocess'])
+    for engine in ENGINES:
+        print(f"{engine}: {round(timings[engine], 2)}s")
+    print(f"Features: postgis {comparison['features_a']}, inprocess {comparison['features_b']}")
+    print(f"Area: postgis {comparison['area_a']}, inprocess {comparison['area_b']}")
+    print(f"Area of symmetric difference: {comparison['area_difference']}")
+    print(f"Equivalent: {comparison['equivalent']}")
+    success = comparison['equivalent']
+
+# Remove compared tables and their registry records
+for output in outputs.values(): postgis.drop_table(output)
+postgis.execute_query(sql.SQL("DELETE FROM {registry} WHERE table_id = ANY({outputs})").format( \
+    registry=sql.Identifier(OpenSiteConstants.OPENSITE_REGISTRY), outputs=sql.Literal(list(outputs.values()))))
+
+sys.exit(0 if success else 1)
@@ -0,0 +1,229 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import zipfile
+from pathlib import Path
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+
+class _OpenSiteArchiveWriter:
+    """
+    Write-only file wrapper so zipfile treats archive as unseekable stream
+    zipfile then writes sizes and CRCs in data descriptors after each file rather than seeking back
+    to rewrite local headers, so bytes already written - and possibly already sent - never change
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+class OpenSiteDownloadArchives:
+    """
+    Cached zip archives of output files for downloading
+
+    Archives are content-addressed by archive type and name, size and modification time of every file in
+    archive so archive is built once and reused by all sessions until output files change
+    Archive is streamed while it is built and concurrent requests for same archive share one build
+    Already-compressed formats are stored and only text formats are deflated
+    """
+
+    def __init__(self, log_level=logging.INFO, shared_lock=None):
+        self.log = OpenSiteLogger("OpenSiteDownloadArchives", log_level, shared_lock)
+        self.folder = Path(OpenSiteConstants.DOWNLOAD_ARCHIVES_FOLDER)
+        self.lock = threading.Lock()
+        self.builds = {}
+
+    def get_files(self, extension_filter=None, qgis_mode=False):
+        """
+        Gets list of (file path, archive name) to include in archive
+        """
+
+        folder = Path(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
+        files = []
+
+        if qgis_mode:
+            qgis_file = folder.parent / f"{OpenSiteConstants.OPENSITEENERGY_SHORTNAME}.qgs"
+            if qgis_file.is_file(): files.append((qgis_file, qgis_file.name))
+            for f in sorted(folder.iterdir()):
+                if f.is_file() and f.suffix == '.gpkg' and not f.name.startswith('tmp-'):
+                    files.append((f, f"output/{f.name}"))
+        else:
+            for f in sorted(folder.iterdir()):
+                if not f.is_file() or f.name.startswith('tmp-'): continue
+                if extension_filter and f.suffix.lstrip('.') not in extension_filter: continue
+                files.append((f, f.name))
+
+        return files
+
+    def get_archive_key(self, archive_type, files):
+        """
+        Gets content address of archive from archive type and name, size and modification time of each file
+        """
+
+        entries = []
+        for file_path, arcname in files:
+            stat = file_path.stat()
+            entries.append([arcname, stat.st_size, stat.st_mtime_ns])
+
+        return hashlib.sha256(json.dumps([archive_type, entries]).encode('utf-8')).hexdigest()
+
+    def get_archive_path(self, key):
+        """
+        Gets path of completed archive
+        """
+
+        return self.folder / f"{key}.zip"
+
+    def get_compression(self, file_path):
+        """
+        Gets zip compression for file - text formats are deflated, already-compressed and binary formats are stored
+        """
+
+        if Path(file_path).suffix.lstrip('.').lower() in OpenSiteConstants.DOWNLOAD_DEFLATE_EXTENSIONS: return zipfile.ZIP_DEFLATED
+        return zipfile.ZIP_STORED
+
+    def get_archive(self, archive_type, extension_filter=None, qgis_mode=False):
+        """
+        Gets archive for files of archive_type, starting build if archive is not cached and not already being built
+        Returns archive key used to get progress and stream archive
+        """
+
+        files = self.get_files(extension_filter, qgis_mode)
+        key = self.get_archive_key(archive_type, files)
+
+        with self.lock:
+            build = self.builds.get(key)
+            if build and build['status'] == 'processing': return key
+
+            if self.get_archive_path(key).exists():
+                self.builds[key] = {"current": len(files), "total": len(files), "status": "complete", "archive_type": archive_type, "done": threading.Event()}
+                self.builds[key]['done'].set()
+                os.utime(self.get_archive_path(key))
+                return key
+
+            self.folder.mkdir(parents=True, exist_ok=True)
+            build = {"current": 0, "total": len(files), "status": "processing", "archive_type": archive_type, "done": threading.Event(), \
+                     "temp_path": self.folder / f"tmp-{key}.zip"}
+            # Create empty archive before build starts so readers can open it straight away
+            build['temp_path'].write_bytes(b'')
+            self.builds[key] = build
+
+        threading.Thread(target=self.build_archive, args=(key, build, files), daemon=True).start()
+        return key
+
+    def get_download_key(self, key, archive_request=None):
+        """
+        Gets key of archive to download for key, rebuilding archive if it has been removed from cache since it was built
+        archive_request is (archive_type, extension_filter, qgis_mode) that archive was requested with
+        Returns new key if archive is rebuilt, as output files may have changed since, or None if archive can't be found
+        """
+
+        with self.lock:
+            build = self.builds.get(key)
+            if build and build['status'] == 'processing': return key
+            if key and self.get_archive_path(key).exists(): return key
+            if build: del self.builds[key]
+
+        if not archive_request: return None
+        self.log.info(f"Download archive {str(key)[:12]} is no longer cached, rebuilding it")
+        return self.get_archive(*archive_request)
+
+    def build_archive(self, key, build, files):
+        """
+        Builds archive for key, updating build progress as each file is added
+        """
+
+        try:
+            self.log.info(f"Building {build['archive_type']} download archive {key[:12]} with {len(files)} files")
+
+            with open(build['temp_path'], 'wb', buffering=OpenSiteConstants.DOWNLOAD_ARCHIVE_CHUNK_SIZE) as file:
+                with zipfile.ZipFile(_OpenSiteArchiveWriter(file), 'w') as zf:
+                    for i, (file_path, arcname) in enumerate(files):
+                        zf.write(file_path, arcname=arcname, compress_type=self.get_compression(file_path))
+                        file.flush()
+                        build['current'] = i + 1
+
+            os.replace(build['temp_path'], self.get_archive_path(key))
+            build['status'] = "complete"
+            self.log.info(f"Built {build['archive_type']} download archive {key[:12]}")
+            self.prune()
+
+        except Exception as e:
+            self.log.error(f"Building download archive {key[:12]} failed: {e}")
+            build['status'] = "failed"
+            if build['temp_path'].exists(): build['temp_path'].unlink()
+
+        finally:
+            build['done'].set()
+
+    def get_progress(self, key):
+        """
+        Gets progress of archive build
+        """
+
+        build = self.builds.get(key)
+        if build is None: return {"status": "idle"}
+        return {"current": build['current'], "total": build['total'], "status": build['status'], "archive_type": build['archive_type']}
+
+    def get_completed_path(self, key):
+        """
+        Gets path of completed archive for key or None if archive is still being built or doesn't exist
+        """
+
+        build = self.builds.get(key)
+        if build and build['status'] != 'complete': return None
+        archive_path = self.get_archive_path(key)
+        return archive_path if archive_path.exists() else None
+
+    def stream(self, key):
+        """
+        Yields archive for key while it is being built
+        Archive file is read as it grows until build completes - if build fails, stream is aborted
+        """
+
+        build = self.builds[key]
+
+        try:
+            file = open(build['temp_path'], 'rb')
+        except FileNotFoundError:
+            # Build completed or failed between request and opening temporary archive
+            if build['status'] != 'complete': raise
+            file = open(self.get_archive_path(key), 'rb')
+
+        with file:
+            while True:
+                chunk = file.read(OpenSiteConstants.DOWNLOAD_ARCHIVE_CHUNK_SIZE)
+                if chunk:
+                    yield chunk
+                    continue
+
+                if build['done'].is_set():
+                    # Read anything written between last read and build completing
+                    chunk = file.read()
+                    if chunk: yield chunk
+                    if build['status'] != 'complete': raise RuntimeError(f"Building download archive {key[:12]} failed")
+                    return
+
+                build['done'].wait(0.2)
+
+    def prune(self):
+        """
+        Removes least recently used archives so at most DOWNLOAD_ARCHIVES_KEEP archives remain
+        Builds of removed archives are forgotten so later requests for them start new build
+        """
+
+        with self.lock:
+            archives = sorted(self.folder.glob('*.zip'), key=lambda path: path.stat().st_mtime)
+            archives = [archive for archive in archives if not archive.name.startswith('tmp-')]
+            for archive in archives[:max(len(archives) - OpenSiteConstants.DOWNLOAD_ARCHIVES_KEEP, 0)]:
+                self.log.info(f"Removing cached download archive {archive.stem[:12]}")
+                archive.unlink(missing_ok=True)
+                build = self.builds.get(archive.stem)
+                if build and build['status'] == 'complete': del self.builds[archive.stem]
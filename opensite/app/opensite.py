@@ -13,12 +13,16 @@ from fastapi import FastAPI, Response
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
 from pathlib import Path
+from opensite.app.archives import OpenSiteDownloadArchives
 from opensite.app.routes import OpenSiteRouter
+from opensite.app.staticfiles import OpenSiteStaticFiles
+from opensite.app.tiles import OpenSiteTileCache
 from opensite.constants import OpenSiteConstants
 from opensite.logging.opensite import OpenSiteLogger
 from opensite.cli.opensite import OpenSiteCLI
 from opensite.ckan.opensite import OpenSiteCKAN
 from opensite.model.graph.opensite import OpenSiteGraph
+from opensite.output.releases import OpenSiteTileserverReleases
 from opensite.queue.opensite import OpenSiteQueue
 from opensite.postgis.opensite import OpenSitePostGIS
 from opensite.processing.spatial import OpenSiteSpatial
@@ -37,6 +41,9 @@ class GlobalNoCacheMiddleware(BaseHTTPMiddleware):
         path = request.url.path.lower()
         no_cache_extensions = (".json", ".mbtiles")
         is_index = path in ["/", "/index.html"]
+
+        # Output files set their own caching headers so they can be revalidated or cached when versioned
+        if "cache-control" in response.headers: return response
         
         if path.endswith(no_cache_extensions) or is_index:
             # no-store: Do not save to disk
@@ -119,8 +126,12 @@ class OpenSiteApplication:
         self._cleanup_signals()
 
         self.app.mount("/static", StaticFiles(directory=folder_static), name="static")
-        self.app.mount("/outputfiles", StaticFiles(directory=folder_layers), name="outputfiles")
+        self.app.mount("/outputfiles", OpenSiteStaticFiles(directory=folder_layers), name="outputfiles")
+        # Same path relative to web page as in output folder so PMTiles style works when served by app or static host
+        self.app.mount("/" + Path(folder_layers).name, OpenSiteStaticFiles(directory=folder_layers), name="layers")
         self.app.state.templates = Jinja2Templates(directory=folder_templates)
+        self.app.state.archives = OpenSiteDownloadArchives(self.log_level)
+        self.app.state.tiles = OpenSiteTileCache(self.log_level)
         self.app.state.processing_start = self.processing_start
         self.app.include_router(OpenSiteRouter)
 
@@ -353,7 +364,7 @@ class OpenSiteApplication:
         self.log.info(f"{Fore.YELLOW}Completed processing - {time_text}{Style.RESET_ALL}")
         print("")
 
-    def init_environment(self):
+    def init_environment(self, preview=False):
         """Creates required system folders defined in constants."""
         folders = OpenSiteConstants.ALL_FOLDERS
         for folder in folders:
@@ -365,6 +376,12 @@ class OpenSiteApplication:
         spatial.create_output_grid()
         spatial.create_processing_grid_buffered_edges()
 
+        # Preview builds use coarser preview processing grid
+        if preview:
+            spatial.set_processing_grid(preview=True)
+            spatial.create_processing_grid()
+            spatial.create_processing_grid_buffered_edges()
+
     def delete_folder(self, folder_path):
         """Deletes the specified directory and all its contents."""
         try:
@@ -393,14 +410,19 @@ class OpenSiteApplication:
         self.log.info("[purgeall] completed")
         return True
     
-    def show_success_message(self, outputformats):
+    def show_success_message(self, outputformats, preview=False):
         """Gets final message text"""
 
+        output_layers_folder = OpenSiteConstants.PREVIEW_OUTPUT_LAYERS_FOLDER if preview else OpenSiteConstants.OUTPUT_LAYERS_FOLDER
+
         final_message = f"""
 {Fore.MAGENTA + Style.BRIGHT}{'='*60}\n{'*'*10} OPEN SITE ENERGY BUILD PROCESS COMPLETE {'*'*9}\n{'='*60}{Style.RESET_ALL}
-\nFinal layers created at:\n\n{Fore.CYAN + Style.BRIGHT}{OpenSiteConstants.OUTPUT_LAYERS_FOLDER}{Style.RESET_ALL}\n\n\n"""
+\nFinal layers created at:\n\n{Fore.CYAN + Style.BRIGHT}{output_layers_folder}{Style.RESET_ALL}\n\n\n"""
 
-        if 'web' in outputformats:
+        if preview:
+            if 'web' in outputformats:
+                final_message += f"""Preview tileserver config created at:\n\n{Fore.CYAN + Style.BRIGHT}{Path(OpenSiteConstants.PREVIEW_TILESERVER_FOLDER) / 'config.json'}{Style.RESET_ALL}\n\n\n"""
+        elif 'web' in outputformats:
             final_message += f"""To view constraint layers as map, enter:\n\n{Fore.CYAN + Style.BRIGHT}./webview.sh{Style.RESET_ALL}\n\n\n"""
         
         if 'qgis' in outputformats:
@@ -444,6 +466,7 @@ class OpenSiteApplication:
         outputs_folder = Path(OpenSiteConstants.OUTPUT_FOLDER).resolve()
 
         self.delete_folder(outputs_folder)
+        self.delete_folder(Path(OpenSiteConstants.PREVIEW_OUTPUT_FOLDER).resolve())
         self.log.info("[purgeoutput] completed")
 
         return True
@@ -453,6 +476,9 @@ class OpenSiteApplication:
 
         postgis = OpenSitePostGIS()
         postgis.purge_database()
+
+        # Archived tables are part of database state so remove them too
+        self.delete_folder(Path(OpenSiteConstants.ARCHIVE_FOLDER).resolve())
         self.log.info("[purgedb] completed")
 
         return True
@@ -510,6 +536,10 @@ class OpenSiteApplication:
 
             if tables_purged: self.init_environment()
 
+            if cli.rollbacktileserver:
+                if OpenSiteTileserverReleases(self.log_level).rollback(): self.restart_tileserver()
+                return
+
         if cli.get_server():
             self.start(port=cli.get_server())
             return
@@ -529,11 +559,16 @@ class OpenSiteApplication:
 
         tileserver_used = ('web' in cli.get_outputformats())
         
+        # Preview builds need coarser preview processing grid
+        if cli.get_preview(): self.init_environment(preview=True)
+
         # Initialize data model for session
         graph = OpenSiteGraph(  cli.get_overrides(), \
                                 cli.get_outputformats(), \
                                 cli.get_clip(), \
                                 cli.get_snapgrid(), \
+                                cli.get_scenarios(), \
+                                preview=cli.get_preview(), \
                                 log_level=self.log_level)
         graph.add_yamls(site_ymls)
         graph.update_metadata(ckan)
@@ -545,14 +580,14 @@ class OpenSiteApplication:
         graph.generate_graph_preview()
 
         # If not '--graphonly', run processing queue
-        queue = OpenSiteQueue(graph, log_level=self.log_level, overwrite=cli.get_overwrite())
+        queue = OpenSiteQueue(graph, log_level=self.log_level, overwrite=cli.get_overwrite(), gc=cli.get_gc())
 
         # Main processing loop
         success = False
         if not cli.get_graphonly(): 
             
             self.processing_start = time.time()
-            success = queue.run(preview=cli.get_preview())
+            success = queue.run()
             self.processing_stop = time.time()
 
             # Show elapsed time at end
@@ -561,9 +596,10 @@ class OpenSiteApplication:
             if success:
 
                 # Wait till very end before copying main web index page to FastAPI templates folder
-                if tileserver_used: self.restart_tileserver()
+                # Preview builds publish to preview tileserver folder so main tileserver is left unchanged
+                if tileserver_used and not cli.get_preview(): self.restart_tileserver()
 
-                self.show_success_message(cli.get_outputformats())
+                self.show_success_message(cli.get_outputformats(), cli.get_preview())
 
     def restart_tileserver(self):
         """Copies main tileserver page and triggers restart of tileserver"""
@@ -1,4 +1,5 @@
 import asyncio
+import hashlib
 import httpx
 import json
 import os
@@ -7,17 +8,16 @@ import time
 import threading
 import uuid
 import yaml
-import zipfile
 from datetime import timedelta
 from io import BytesIO
 from typing import List, Dict, Any, Optional
 from pathlib import Path
-from psycopg2 import sql
 from pydantic import BaseModel
-from fastapi import APIRouter, Request, BackgroundTasks, Query, Form, Response, HTTPException
-from fastapi.responses import RedirectResponse, FileResponse, PlainTextResponse, HTMLResponse, JSONResponse
+from fastapi import APIRouter, Request, Query, Form, Response, HTTPException
+from fastapi.responses import RedirectResponse, FileResponse, PlainTextResponse, HTMLResponse, JSONResponse, StreamingResponse
 from starlette.status import HTTP_303_SEE_OTHER
 from dotenv import load_dotenv
+from opensite.app.staticfiles import get_file_version
 from opensite.constants import OpenSiteConstants
 from opensite.postgis.opensite import OpenSitePostGIS
 
@@ -70,6 +70,15 @@ async def get_site_data():
     
     return {"error": f"File not found at {file_path}"}
 
+@OpenSiteRouter.get(f"/{OpenSiteConstants.OPENSITEENERGY_SHORTNAME}-pmtiles.json")
+async def get_pmtiles_style():
+    file_path = Path(OpenSiteConstants.OUTPUT_FOLDER) / f"{OpenSiteConstants.OPENSITEENERGY_SHORTNAME}-pmtiles.json"
+
+    if file_path.exists():
+        return FileResponse(path=file_path)
+
+    return {"error": f"File not found at {file_path}"}
+
 @OpenSiteRouter.get("/admin", response_class=HTMLResponse)
 def admin(request: Request):
     """
@@ -309,7 +318,7 @@ class BuildConfiguration(BaseModel):
 
 def get_clipping_areas(request: Request):
     """
-    Gets all available clipping areas from PostGIS _opensite_clipping_master table
+    Gets all available clipping areas from PostGIS gazetteer of OSM boundaries
     """
 
     log = request.app.state.log
@@ -318,15 +327,7 @@ def get_clipping_areas(request: Request):
         log.warning(f"Table {OpenSiteConstants.OPENSITE_OSMBOUNDARIES} missing")
         return COUNTRIES_LIST
 
-    clipping_query = sql.SQL("""
-    SELECT DISTINCT all_names.name FROM 
-    (
-        SELECT DISTINCT name name FROM {boundaries} WHERE name <> '' AND admin_level <> '4' UNION 
-        SELECT DISTINCT council_name name FROM {boundaries} WHERE council_name <> '' AND admin_level <> '4' 
-    ) all_names ORDER BY all_names.name""").format(boundaries=sql.Identifier(OpenSiteConstants.OPENSITE_OSMBOUNDARIES))  
-    clippingareas = postgis.fetch_all(clipping_query)
-    clippingareas = [clippingarea['name'] for clippingarea in clippingareas]
-    clippingareas = COUNTRIES_LIST + clippingareas
+    clippingareas = COUNTRIES_LIST + postgis.get_area_names()
 
     return clippingareas
 
@@ -473,53 +474,20 @@ SUFFIX_TO_NAME = {
     'shp': 'Shapefile',
     'mbtiles': 'MBTiles',
     'gpkg': 'GPKG',
+    'fgb': 'FlatGeobuf',
+    'parquet': 'GeoParquet',
     'qgis': 'QGIS',
     'all': 'all'
 }
 
-zip_progress = {}
-
-def zip_worker(request: Request, session_id: str, zip_suffix: str, extension_filter: list = None, qgis_mode: bool = False):
+def start_download(request: Request, zip_suffix: str, extension_filter: list = None, qgis_mode: bool = False):
     """
-    Background worker that zips files and updates the progress global dict.
+    Starts building download archive - or reuses cached or in-progress archive - and stores its key in session
     """
-    log = request.app.state.log
-    folder = OpenSiteConstants.OUTPUT_LAYERS_FOLDER
-    
-    # 1. Identify files to process
-    files_to_process = []
-    if qgis_mode:
-        qgis_file = get_qgis_path()
-        if qgis_file.is_file():
-            files_to_process.append((qgis_file, qgis_file.name))
-        for f in folder.iterdir():
-            if f.is_file() and f.suffix == '.gpkg':
-                files_to_process.append((f, f"output/{f.name}"))
-    else:
-        for f in folder.iterdir():
-            if f.is_file():
-                if extension_filter and f.suffix.lstrip('.') not in extension_filter:
-                    continue
-                files_to_process.append((f, f.name))
-
-    # 2. Update Progress Metadata
-    zip_progress[session_id] = {"current": 0, "total": len(files_to_process), "status": "processing", "file_type": SUFFIX_TO_NAME[zip_suffix]}
-        
-    # 3. Create the Physical Zip in /tmp
-    temp_path = f"/tmp/opensite_{session_id}.zip"
-    try:
-        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for i, (file_path, arcname) in enumerate(files_to_process):
-                log.info(f"Adding {file_path.name} to zip for session {session_id}")
-                zf.write(file_path, arcname=arcname)
-                
-                # Update progress count
-                zip_progress[session_id]["current"] = i + 1
-        
-        zip_progress[session_id]["status"] = "complete"
-    except Exception as e:
-        log.error(f"Zip failed for {session_id}: {e}")
-        zip_progress[session_id]["status"] = "failed"
+    archives = request.app.state.archives
+    request.session["download_id"] = archives.get_archive(zip_suffix, extension_filter, qgis_mode)
+    request.session["download_request"] = [zip_suffix, extension_filter, qgis_mode]
+    return {"status": "started"}
 
 @OpenSiteRouter.get("/files", response_class=HTMLResponse)
 async def files_page(request: Request):
@@ -534,7 +502,7 @@ async def files_page(request: Request):
     if OpenSiteConstants.OUTPUT_LAYERS_FOLDER.is_dir():
         # Using a simple list comprehension with pathlib
         files_list = [
-            {'name': f.name, 'url': f'/outputfiles/{f.name}'} 
+            {'name': f.name, 'url': f'/outputfiles/{f.name}?v={get_file_version(f)}'} 
             for f in OpenSiteConstants.OUTPUT_LAYERS_FOLDER.iterdir() if f.is_file()
         ]
 
@@ -554,73 +522,85 @@ def get_progress(request: Request):
             return JSONResponse({"status": "unauthorized"}, status_code=401)
 
     session_id = request.session.get("download_id")
-    return zip_progress.get(session_id, {"status": "idle"})
+    progress = request.app.state.archives.get_progress(session_id)
+    if 'archive_type' in progress: progress['file_type'] = SUFFIX_TO_NAME[progress['archive_type']]
+    return progress
 
 @OpenSiteRouter.get("/download/get-file")
 def get_file(request: Request):
-    """Final endpoint to download the result"""
+    """
+    Final endpoint to download the result
+    Completed archives are sent as files, archives still being built are streamed as they are written
+    """
 
     if not request.session.get('logged_in', False):
         return JSONResponse({"status": "unauthorized"}, status_code=401)
 
-    session_id = request.session.get("download_id")
-    temp_path = f"/tmp/opensite_{session_id}.zip"
-    
-    if os.path.exists(temp_path):
-        return FileResponse(
-            temp_path, 
-            filename=f"{OpenSiteConstants.OPENSITEENERGY_SHORTNAME}-export.zip"
+    archives = request.app.state.archives
+    filename = f"{OpenSiteConstants.OPENSITEENERGY_SHORTNAME}-export.zip"
+
+    # Archive may have been removed from cache since it was built, in which case it is rebuilt under new key
+    session_id = archives.get_download_key(request.session.get("download_id"), request.session.get("download_request"))
+    if session_id is None: return JSONResponse({"error": "File not found"}, status_code=404)
+    request.session["download_id"] = session_id
+
+    completed_path = archives.get_completed_path(session_id)
+    if completed_path:
+        return FileResponse(completed_path, filename=filename)
+
+    if archives.get_progress(session_id)['status'] == 'processing':
+        return StreamingResponse(
+            archives.stream(session_id),
+            media_type="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
         )
     return JSONResponse({"error": "File not found"}, status_code=404)
 
 @OpenSiteRouter.get("/downloadall")
-def download_all(request: Request, background_tasks: BackgroundTasks):
+def download_all(request: Request):
     if not request.session.get('logged_in', False):
         return RedirectResponse(url="/login", status_code=303)
-    session_id = str(uuid.uuid4())
-    request.session["download_id"] = session_id
-    background_tasks.add_task(zip_worker, request, session_id, 'all', None)
-    return {"status": "started"}
+    return start_download(request, 'all', None)
 
 @OpenSiteRouter.get("/downloadgpkg")
-def download_gpkg(request: Request, background_tasks: BackgroundTasks):
+def download_gpkg(request: Request):
     if not request.session.get('logged_in', False):
         return RedirectResponse(url="/login", status_code=303)
-    session_id = str(uuid.uuid4())
-    request.session["download_id"] = session_id
-    background_tasks.add_task(zip_worker, request, session_id, 'gpkg', ['gpkg'])
-    return {"status": "started"}
+    return start_download(request, 'gpkg', ['gpkg'])
 
 @OpenSiteRouter.get("/downloadgeojson")
-def download_geojson(request: Request, background_tasks: BackgroundTasks):
+def download_geojson(request: Request):
     if not request.session.get('logged_in', False):
         return RedirectResponse(url="/login", status_code=303)
-    session_id = str(uuid.uuid4())
-    request.session["download_id"] = session_id
-    background_tasks.add_task(zip_worker, request, session_id, 'geojson', ['geojson'])
-    return {"status": "started"}
+    return start_download(request, 'geojson', ['geojson'])
+
+@OpenSiteRouter.get("/downloadfgb")
+def download_fgb(request: Request):
+    if not request.session.get('logged_in', False):
+        return RedirectResponse(url="/login", status_code=303)
+    return start_download(request, 'fgb', ['fgb'])
+
+@OpenSiteRouter.get("/downloadparquet")
+def download_parquet(request: Request):
+    if not request.session.get('logged_in', False):
+        return RedirectResponse(url="/login", status_code=303)
+    return start_download(request, 'parquet', ['parquet'])
 
 @OpenSiteRouter.get("/downloadshp")
-def download_shp(request: Request, background_tasks: BackgroundTasks):
+def download_shp(request: Request):
     if not request.session.get('logged_in', False):
         return RedirectResponse(url="/login", status_code=303)
-    session_id = str(uuid.uuid4())
-    request.session["download_id"] = session_id
     # Shapefiles require multiple extensions to be functional
-    background_tasks.add_task(zip_worker, request, session_id, 'shp', ['shp', 'prj', 'shx', 'dbf'])
-    return {"status": "started"}
+    return start_download(request, 'shp', ['shp', 'prj', 'shx', 'dbf'])
 
 @OpenSiteRouter.get("/downloadmbtiles")
-def download_mbtiles(request: Request, background_tasks: BackgroundTasks):
+def download_mbtiles(request: Request):
     if not request.session.get('logged_in', False):
         return RedirectResponse(url="/login", status_code=303)
-    session_id = str(uuid.uuid4())
-    request.session["download_id"] = session_id
-    background_tasks.add_task(zip_worker, request, session_id, 'mbtiles', ['mbtiles'])
-    return {"status": "started"}
+    return start_download(request, 'mbtiles', ['mbtiles'])
 
 @OpenSiteRouter.get("/downloadqgis")
-def download_qgis(request: Request, background_tasks: BackgroundTasks):
+def download_qgis(request: Request):
     if not request.session.get('logged_in', False):
         return RedirectResponse(url="/login", status_code=303)
     
@@ -632,11 +612,54 @@ def download_qgis(request: Request, background_tasks: BackgroundTasks):
             status_code=404
         )
 
-    session_id = str(uuid.uuid4())
-    request.session["download_id"] = session_id
-    
-    background_tasks.add_task(zip_worker, request, session_id, 'qgis', qgis_mode=True)
-    return {"status": "started"}
+    return start_download(request, 'qgis', qgis_mode=True)
+
+# **********************************************************
+# ****************** Vector tile functions *****************
+# **********************************************************
+
+@OpenSiteRouter.get("/tiles/{layer}.json")
+def get_tilejson(request: Request, layer: str):
+    """
+    TileJSON for layer so map libraries can load layer's tiles from app
+    """
+
+    tiles_url = str(request.base_url) + f"tiles/{layer}/{{z}}/{{x}}/{{y}}.pbf"
+    tilejson = request.app.state.tiles.get_tilejson(layer, tiles_url)
+    if tilejson is None: return JSONResponse({"error": "Layer not found"}, status_code=404)
+    return JSONResponse(tilejson)
+
+@OpenSiteRouter.get("/tiles/{layer}/{z}/{x}/{y}.pbf")
+def get_tile(request: Request, layer: str, z: int, x: int, y: int):
+    """
+    Vector tile for layer from layer's mbtiles file
+    Tiles are sent gzip-compressed as stored if client accepts gzip, missing tiles return 204
+    Tiles above maximum zoom of layer return 404 so clients overzoom tiles of maximum zoom instead
+    """
+
+    tiles = request.app.state.tiles
+    if not (0 <= z <= 30 and 0 <= x < (1 << z) and 0 <= y < (1 << z)): return Response(status_code=404)
+
+    tile, version = tiles.get_tile(layer, z, x, y)
+    if version is None: return Response(status_code=404)
+
+    send_gzipped = tiles.is_gzipped(tile) and ('gzip' in request.headers.get('accept-encoding', ''))
+    tile_hash = hashlib.sha256(f"{version}-{z}-{x}-{y}".encode('utf-8')).hexdigest()[:32]
+    headers = \
+    {
+        "etag":             f'"{tile_hash}-gzip"' if send_gzipped else f'"{tile_hash}"',
+        "cache-control":    "no-cache",
+        "vary":             "Accept-Encoding",
+    }
+
+    if request.headers.get('if-none-match') == headers['etag']: return Response(status_code=304, headers=headers)
+    if not tile: return Response(status_code=204, headers=headers)
+
+    if send_gzipped:
+        headers["content-encoding"] = "gzip"
+        return Response(tile, media_type="application/x-protobuf", headers=headers)
+
+    return Response(tiles.decompress(tile), media_type="application/x-protobuf", headers=headers)
 
 # **********************************************************
 # ***************** Set domain functions *******************
@@ -0,0 +1,155 @@
+import hashlib
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, QueryParams
+from opensite.constants import OpenSiteConstants
+
+def get_file_etag(stat_result):
+    """
+    Gets strong ETag for output file
+    Output files are never modified in place - each export writes new file and renames it over old one -
+    so inode, size and modification time change whenever content changes and identify content exactly
+    """
+
+    identity = f"{stat_result.st_ino}-{stat_result.st_size}-{stat_result.st_mtime_ns}"
+    return '"' + hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32] + '"'
+
+def get_file_version(path):
+    """
+    Gets version of output file for use in versioned URLs, eg. '/outputfiles/layer.gpkg?v=[version]'
+    """
+
+    return get_file_etag(os.stat(path)).strip('"')
+
+class OpenSiteStaticFiles(StaticFiles):
+    """
+    Static files with caching-aware responses for output files
+    - Strong ETags and Last-Modified with 304 responses to conditional requests
+    - Single byte-range requests, including If-Range, so downloads can resume and tile archives can be read in parts
+    - Long-lived immutable caching when URL has 'v' query parameter matching current file version,
+      otherwise clients must revalidate, which is cheap as unchanged files get 304
+    """
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        if status_code != 200:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        request_headers = Headers(scope=scope)
+        etag = get_file_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        headers = \
+        {
+            "etag":             etag,
+            "last-modified":    last_modified,
+            "accept-ranges":    "bytes",
+        }
+
+        if QueryParams(scope.get("query_string", b"")).get("v") == etag.strip('"'):
+            headers["cache-control"] = f"public, max-age={OpenSiteConstants.STATIC_IMMUTABLE_MAX_AGE}, immutable"
+        else:
+            headers["cache-control"] = "no-cache"
+
+        if self.is_not_modified_since(request_headers, etag, stat_result):
+            return Response(status_code=304, headers=headers)
+
+        file_size = stat_result.st_size
+        byte_range = self.get_byte_range(request_headers, etag, stat_result)
+
+        if byte_range == 'unsatisfiable':
+            headers["content-range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+
+        if byte_range is None:
+            if scope["method"] == "HEAD":
+                headers["content-length"] = str(file_size)
+                return Response(status_code=200, headers=headers)
+            return FileResponse(full_path, stat_result=stat_result, headers=headers)
+
+        start, end = byte_range
+        headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+        headers["content-length"] = str(end - start + 1)
+        if scope["method"] == "HEAD":
+            return Response(status_code=206, headers=headers)
+
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+        return StreamingResponse(self.read_range(full_path, start, end), status_code=206, headers=headers, media_type=media_type)
+
+    def is_not_modified_since(self, request_headers, etag, stat_result):
+        """
+        Checks conditional request headers - If-None-Match takes precedence over If-Modified-Since
+        """
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            return ("*" in tags) or (etag in tags)
+
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    def get_byte_range(self, request_headers, etag, stat_result):
+        """
+        Gets (start, end) of requested byte range, None if whole file should be sent or 'unsatisfiable'
+        Multiple ranges are answered with whole file, which is allowed by HTTP
+        """
+
+        range_header = request_headers.get("range")
+        if not range_header or not range_header.startswith("bytes="): return None
+
+        # If-Range only allows partial response if file is unchanged, otherwise whole file is sent
+        if_range = request_headers.get("if-range")
+        if if_range:
+            if if_range.startswith('"') or if_range.startswith('W/'):
+                if if_range != etag: return None
+            else:
+                try:
+                    if int(stat_result.st_mtime) > parsedate_to_datetime(if_range).timestamp(): return None
+                except (TypeError, ValueError):
+                    return None
+
+        ranges = range_header[len("bytes="):].split(",")
+        if len(ranges) != 1: return None
+
+        file_size = stat_result.st_size
+        start, _, end = ranges[0].strip().partition("-")
+
+        try:
+            if start == '':
+                # Suffix range, eg. 'bytes=-500' for last 500 bytes
+                length = int(end)
+                if length <= 0: return 'unsatisfiable'
+                start, end = max(file_size - length, 0), file_size - 1
+            else:
+                start = int(start)
+                end = int(end) if end else file_size - 1
+                if end < start and start < file_size: return None
+                end = min(end, file_size - 1)
+        except ValueError:
+            return None
+
+        if start >= file_size: return 'unsatisfiable'
+        return start, end
+
+    def read_range(self, full_path, start, end):
+        """
+        Yields bytes start to end inclusive of file
+        """
+
+        with open(full_path, 'rb') as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = file.read(min(OpenSiteConstants.DOWNLOAD_ARCHIVE_CHUNK_SIZE, remaining))
+                if not chunk: break
+                remaining -= len(chunk)
+                yield chunk
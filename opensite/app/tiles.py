@@ -0,0 +1,189 @@
+import gzip
+import json
+import logging
+import queue
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+
+class OpenSiteTileCache:
+    """
+    Serves vector tiles from build's mbtiles files so app can show map without separate tileserver
+
+    Each mbtiles file has pool of read-only SQLite connections that is reopened when file is replaced by new build
+    Tiles are held in memory in least recently used cache of up to TILE_CACHE_MAX_BYTES, keyed by file version,
+    and are kept gzip-compressed as stored in mbtiles so they are only decompressed for clients not accepting gzip
+    Each cached tile also counts ENTRY_OVERHEAD bytes so cache of missing (empty) tiles is bounded too
+    """
+
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, log_level=logging.INFO, shared_lock=None):
+        self.log = OpenSiteLogger("OpenSiteTileCache", log_level, shared_lock)
+        self.lock = threading.Lock()
+        self.pools = {}
+        self.tiles = OrderedDict()
+        self.tiles_size = 0
+
+    def get_mbtiles_path(self, layer):
+        """
+        Gets path of mbtiles file for layer from output layers folder, or from tileserver data folder for basemap
+        Returns None if layer name is invalid or no mbtiles file exists
+        """
+
+        if not re.fullmatch(r'[A-Za-z0-9_\-\.]+', layer) or layer.startswith('.'): return None
+
+        for folder in [OpenSiteConstants.OUTPUT_LAYERS_FOLDER, OpenSiteConstants.TILESERVER_DATA_FOLDER]:
+            mbtiles_path = Path(folder) / f"{layer}.mbtiles"
+            if mbtiles_path.is_file(): return mbtiles_path
+
+        return None
+
+    def get_version(self, mbtiles_path):
+        """
+        Gets version of mbtiles file that changes whenever file is replaced
+        """
+
+        stat = mbtiles_path.stat()
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def get_pool(self, mbtiles_path, version):
+        """
+        Gets connection pool for current version of mbtiles file, discarding pool of any previous version
+        """
+
+        with self.lock:
+            pool = self.pools.get(mbtiles_path)
+            if pool is None or pool['version'] != version:
+                if pool is not None:
+                    self.log.info(f"{mbtiles_path.name} has changed, reopening connections")
+                    self.close_pool(pool)
+                pool = {'version': version, 'connections': queue.SimpleQueue()}
+                self.pools[mbtiles_path] = pool
+            return pool
+
+    def close_pool(self, pool):
+        """
+        Closes idle connections in pool - connections in use are closed when returned
+        """
+
+        pool['closed'] = True
+        while True:
+            try:
+                pool['connections'].get_nowait().close()
+            except queue.Empty:
+                return
+
+    def query(self, mbtiles_path, version, sql, parameters=()):
+        """
+        Runs query on pooled read-only connection to mbtiles file and returns first row
+        """
+
+        pool = self.get_pool(mbtiles_path, version)
+
+        try:
+            conn = pool['connections'].get_nowait()
+        except queue.Empty:
+            # Output mbtiles are replaced rather than modified so can be opened as immutable, which avoids file locking
+            conn = sqlite3.connect(f"file:{mbtiles_path}?mode=ro&immutable=1", uri=True, check_same_thread=False)
+
+        try:
+            return conn.execute(sql, parameters).fetchone()
+        finally:
+            if pool.get('closed'): conn.close()
+            else: pool['connections'].put(conn)
+
+    def get_maxzoom(self, mbtiles_path, version):
+        """
+        Gets maximum zoom of mbtiles file from metadata or, if not set, from tiles
+        """
+
+        pool = self.get_pool(mbtiles_path, version)
+        if 'maxzoom' not in pool:
+            row = self.query(mbtiles_path, version, "SELECT value FROM metadata WHERE name = 'maxzoom'")
+            if row is None or not str(row[0]).strip().isdigit():
+                row = self.query(mbtiles_path, version, "SELECT MAX(zoom_level) FROM tiles")
+            pool['maxzoom'] = int(row[0]) if row and row[0] is not None else -1
+
+        return pool['maxzoom']
+
+    def get_tile(self, layer, z, x, y):
+        """
+        Gets tile as stored in mbtiles, ie. usually gzip-compressed, or b'' if tile doesn't exist
+        Returns (tile, version) or (None, None) if layer doesn't exist or z is above maximum zoom of layer
+        """
+
+        mbtiles_path = self.get_mbtiles_path(layer)
+        if mbtiles_path is None: return None, None
+
+        version = self.get_version(mbtiles_path)
+        if z > self.get_maxzoom(mbtiles_path, version): return None, None
+
+        key = (str(mbtiles_path), version, z, x, y)
+
+        with self.lock:
+            if key in self.tiles:
+                self.tiles.move_to_end(key)
+                return self.tiles[key], version
+
+        # Tiles are stored with TMS row numbering
+        row = self.query(mbtiles_path, version, "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", \
+                         (z, x, (1 << z) - 1 - y))
+        tile = bytes(row[0]) if row else b''
+
+        with self.lock:
+            if key not in self.tiles:
+                self.tiles[key] = tile
+                self.tiles_size += len(tile) + self.ENTRY_OVERHEAD
+                while self.tiles_size > OpenSiteConstants.TILE_CACHE_MAX_BYTES and self.tiles:
+                    _, evicted = self.tiles.popitem(last=False)
+                    self.tiles_size -= len(evicted) + self.ENTRY_OVERHEAD
+
+        return tile, version
+
+    def is_gzipped(self, tile):
+        """
+        Checks whether tile is gzip-compressed
+        """
+
+        return tile[:2] == b'\x1f\x8b'
+
+    def decompress(self, tile):
+        """
+        Decompresses gzip-compressed tile for clients not accepting gzip
+        """
+
+        return gzip.decompress(tile) if self.is_gzipped(tile) else tile
+
+    def get_tilejson(self, layer, tiles_url):
+        """
+        Gets TileJSON for layer from mbtiles metadata, or None if layer doesn't exist
+        """
+
+        mbtiles_path = self.get_mbtiles_path(layer)
+        if mbtiles_path is None: return None
+
+        version = self.get_version(mbtiles_path)
+        metadata = {}
+        for name in ['name', 'description', 'attribution', 'bounds', 'center', 'minzoom', 'maxzoom', 'json']:
+            row = self.query(mbtiles_path, version, "SELECT value FROM metadata WHERE name = ?", (name,))
+            if row: metadata[name] = row[0]
+
+        tilejson = {"tilejson": "3.0.0", "name": metadata.get('name', layer), "scheme": "xyz", "tiles": [tiles_url]}
+        for name in ['description', 'attribution']:
+            if name in metadata: tilejson[name] = metadata[name]
+        for name in ['minzoom', 'maxzoom']:
+            if name in metadata: tilejson[name] = int(metadata[name])
+        for name in ['bounds', 'center']:
+            if name in metadata: tilejson[name] = [float(value) for value in metadata[name].split(',')]
+        if 'json' in metadata:
+            try:
+                tilejson['vector_layers'] = json.loads(metadata['json']).get('vector_layers', [])
+            except ValueError:
+                self.log.warning(f"Unable to parse 'json' metadata of {mbtiles_path.name}")
+
+        return tilejson
@@ -19,9 +19,12 @@ class OpenSiteCLI(BaseCLI):
         self.clip = None
         self.purgedb = False
         self.purgeall = False
+        self.rollbacktileserver = False
         self.overwrite = False
         self.graphonly = False
         self.snapgrid = None
+        self.scenarios = None
+        self.gc = None
         # Load and filter immediately
         self._load_and_filter_defaults()
         self._incoporate_cli_switched()
@@ -33,13 +36,16 @@ class OpenSiteCLI(BaseCLI):
         super().add_standard_args()
         self.parser.add_argument("sites", nargs="*", help="Site(s) to generate")
         self.parser.add_argument('--server', type=int, nargs='?', const=8000, help="Runs headless app. Default port 8000, or specify with --server=[port]")
-        self.parser.add_argument('--preview', action='store_true', help='Loads interactive processing graph view')
+        self.parser.add_argument('--preview', action='store_true', help="Quick, coarse preview build with simplified geometries, coarser processing grid, capped mbtiles zoom and without slow output formats. Preview tables are kept separate from tables of full builds")
         self.parser.add_argument('--purgedb', action='store_true', help="Drop all opensite tables and exit")
         self.parser.add_argument('--purgeall', action='store_true', help="Delete all download files, drop all opensite tables and exit")
+        self.parser.add_argument('--rollbacktileserver', action='store_true', help="Switch tileserver back to previous published release and exit")
         self.parser.add_argument('--clip', type=str, help="Name of area to clip data to, e.g., 'Surrey'. For multiple clipping areas, separate with semicolon, eg. --clip=\"East Sussex;Devon\"")
         self.parser.add_argument('--overwrite', action='store_true', help="Reexports all output files, overwriting files already created")
         self.parser.add_argument('--graphonly', action='store_true', help="Generate build graph but don't run build")
         self.parser.add_argument('--snapgrid', type=float, help="Snaps all imported datasets to grid of size [snapgrid] metres")
+        self.parser.add_argument('--gc', type=str, choices=['off', 'drop', 'archive'], help="Garbage collect intermediate tables once no longer needed, either dropping them or archiving them to compressed files (Default: GC_MODE environment variable or 'off')")
+        self.parser.add_argument('--scenarios', type=str, help="Builds every site once for each scenario, sharing imported and preprocessed data between scenarios. Separate values within scenario with commas and scenarios with semicolons, eg. --scenarios=\"height-to-tip=100,blade-radius=40;height-to-tip=150,blade-radius=60\"")
 
     def get_command_line(self):
         """
@@ -82,8 +88,8 @@ class OpenSiteCLI(BaseCLI):
             if key == 'snapgrid': continue
             if key == 'outputformats': 
                 help =  f"Set output format(s) from "\
-                        f"'gpkg', 'shp', 'geojson', "\
-                        f"'mbtiles', 'web', 'qgis'. "\
+                        f"'gpkg', 'shp', 'geojson', 'fgb', 'parquet', "\
+                        f"'mbtiles', 'pmtiles', 'tif', 'web', 'qgis'. "\
                         f"For multiple formats, separate values with commas (Default: {','.join(value)})"
             self.parser.add_argument(
                 f"--{key}",
@@ -146,6 +152,38 @@ class OpenSiteCLI(BaseCLI):
         """Gets value of snapgrid"""
         return self.snapgrid
 
+    def get_scenarios(self):
+        """Gets list of scenarios from CLI - None if not set"""
+        return self.scenarios
+
+    def get_gc(self):
+        """Gets garbage collection mode from CLI - None if not set"""
+        return self.gc
+
+    def parse_scenarios(self, scenarios_text):
+        """
+        Parses scenarios text, eg. 'height-to-tip=100,blade-radius=40;height-to-tip=150'
+        into list of dicts, eg. [{'height-to-tip': 100.0, 'blade-radius': 40.0}, {'height-to-tip': 150.0}]
+        Returns None if scenarios text is invalid
+        """
+
+        scenarios = []
+        for scenario_text in scenarios_text.split(';'):
+            if not scenario_text.strip(): continue
+            scenario = {}
+            for item in scenario_text.split(','):
+                if '=' not in item:
+                    self.log.error(f"Invalid scenario value '{item}', should be in form [key]=[value]")
+                    return None
+                key, value = [element.strip() for element in item.split('=', 1)]
+                try:
+                    scenario[key] = float(value)
+                except ValueError:
+                    scenario[key] = value
+            scenarios.append(scenario)
+
+        return scenarios
+
     def _incoporate_cli_switched(self):
         """Standard execution flow."""
         self.add_standard_args()
@@ -162,6 +200,9 @@ class OpenSiteCLI(BaseCLI):
         # Boolean for purgedb
         self.purgedb = self.args.purgedb
 
+        # Boolean for rollbacktileserver
+        self.rollbacktileserver = self.args.rollbacktileserver
+
         # Boolean for preview
         self.preview = self.args.preview
         
@@ -182,13 +223,11 @@ class OpenSiteCLI(BaseCLI):
             self.outputformats = self.defaults['outputformats']
         else:
             self.outputformats = (''.join(self.args.outputformats)).split(',')
-            # If 'qgis' or 'shp' or 'geojson', ensure 'gpkg' in output formats as required for all of them
-            if  ('qgis' in self.outputformats) or \
-                ('shp' in self.outputformats) or \
-                ('geojson' in self.outputformats):
+            # If 'qgis', ensure 'gpkg' in output formats as required for it
+            if 'qgis' in self.outputformats:
                 if 'gpkg' not in self.outputformats: self.outputformats.append('gpkg')
-            # If 'web', ensure 'mbtiles' in output formats as required for it
-            if 'web' in self.outputformats:
+            # If 'web' or 'pmtiles', ensure 'mbtiles' in output formats as required for them
+            if ('web' in self.outputformats) or ('pmtiles' in self.outputformats):
                 if 'mbtiles' not in self.outputformats: self.outputformats.append('mbtiles')
 
         # Set clip to clip value provided in CLI
@@ -204,6 +243,16 @@ class OpenSiteCLI(BaseCLI):
             if self.defaults['snapgrid']:
                 self.snapgrid = self.defaults['snapgrid']
 
+        # Set garbage collection mode to value provided in CLI
+        self.gc = self.args.gc
+
+        # Set scenarios to scenarios provided in CLI
+        if self.args.scenarios:
+            self.scenarios = self.parse_scenarios(self.args.scenarios)
+            if self.scenarios is None:
+                self.log.error("Unable to parse --scenarios, exiting")
+                sys.exit(1)
+
         # Capture the final state of the simple variables
         overrides = {}
         for key in self.defaults.keys():
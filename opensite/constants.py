@@ -45,6 +45,14 @@ class OpenSiteConstants:
     # Format text used by CKAN to indicate osm-export-tool YML file
     OSM_YML_FORMAT              = "osm-export-tool YML"
 
+    # Engine used to extract layers defined in osm-export-tool YML files from OSM files
+    # 'pyosmium' streams OSM file once and loads every layer straight into PostGIS tables of import nodes
+    # 'osm-export-tool' runs external osm-export-tool to create GPKG that import nodes then import with ogr2ogr
+    # OSM_LOCATION_INDEX is pyosmium node location index, file-based indexes are created in OSM download folder
+    OSM_ENGINE                  = os.getenv("OSM_ENGINE", "pyosmium")
+    OSM_LOCATION_INDEX          = os.getenv("OSM_LOCATION_INDEX", "sparse_file_array")
+    OSM_LOAD_WORKERS            = int(os.getenv("OSM_LOAD_WORKERS", "4"))
+
     # Format text used by CKAN to indicate Open Site Energy YML file
     SITES_YML_FORMAT            = "Open Site Energy YML"
 
@@ -133,8 +141,10 @@ class OpenSiteConstants:
     BUILD_CONFIG                = CONFIGS_FOLDER / f"{OPENSITEENERGY_SHORTNAME}.json"
     DOWNLOAD_FOLDER             = BUILD_ROOT / "downloads"
     OSM_DOWNLOAD_FOLDER         = DOWNLOAD_FOLDER / OSM_SUBFOLDER
+    OSM_EXTRACTS_FOLDER         = OSM_DOWNLOAD_FOLDER / "extracts"
     OPENLIBRARY_DOWNLOAD_FOLDER = DOWNLOAD_FOLDER / OPENLIBRARY_SUBFOLDER
     CACHE_FOLDER                = BUILD_ROOT / "cache"
+    ARCHIVE_FOLDER              = BUILD_ROOT / "archive"
     LOG_FOLDER                  = BUILD_ROOT / "logs"
     OUTPUT_FOLDER               = BUILD_ROOT / "output"
     OUTPUT_LAYERS_FOLDER        = OUTPUT_FOLDER / "layers"
@@ -161,6 +171,13 @@ class OpenSiteConstants:
     TILESERVER_FONTS_SRC_GITHUB = 'https://github.com/openmaptiles/fonts'
     TILESERVER_URL              = os.getenv("TILESERVER_URL", "http://localhost:8080")
 
+    # Each build's tileserver config, styles and links to mbtiles are written to new folder in TILESERVER_RELEASES_FOLDER
+    # and published by atomically switching TILESERVER_CURRENT_LINK symlink to it
+    # TILESERVER_KEEP_RELEASES releases (including current release) are kept for rollback with --rollbacktileserver
+    TILESERVER_RELEASES_FOLDER  = TILESERVER_OUTPUT_FOLDER / "releases"
+    TILESERVER_CURRENT_LINK     = TILESERVER_OUTPUT_FOLDER / "current"
+    TILESERVER_KEEP_RELEASES    = max(int(os.getenv("TILESERVER_KEEP_RELEASES", "3")), 1)
+
     # Location of shell script that downloads coastline and landcover data for whole earth
     SHELL_COASTLINE_LANDCOVER   = 'get-coastline-landcover.sh'
 
@@ -176,6 +193,11 @@ class OpenSiteConstants:
     TILEMAKER_OMT_CONFIG        = BASEMAP_FOLDER_DEST / 'config-openmaptiles.json'
     TILEMAKER_OMT_PROCESS       = BASEMAP_FOLDER_DEST / 'process-openmaptiles.lua'
 
+    # Generated basemaps are cached in BASEMAP_CACHE_FOLDER by hash of OSM file, tilemaker files and tilemaker version
+    # BASEMAP_CACHE_KEEP most recently used basemaps are kept
+    BASEMAP_CACHE_FOLDER        = CACHE_FOLDER / "basemap"
+    BASEMAP_CACHE_KEEP          = max(int(os.getenv("BASEMAP_CACHE_KEEP", "2")), 1)
+
     # ------------------------------------------------------------
     # Processing state files - used by server implementation
     # ------------------------------------------------------------
@@ -208,9 +230,32 @@ class OpenSiteConstants:
                                                         'clipping-path', 
                                                         'osm',
                                                         'ckan',
+                                                        'engine',
+                                                    ],
+                                    'structured':   [
+                                                        'storage',
                                                     ]
                                 }
 
+    # Default storage policy for tables created by each processing stage
+    # Site YAML or defaults.yml can override policy in 'storage' section, eg.
+    # storage:
+    #   default:
+    #     tablespace: opensite_durable
+    #   buffer:
+    #     persistence: unlogged
+    #     tablespace: opensite_scratch
+    # Stages are 'default', 'scratch' (temporary tables used within a stage) and processing actions,
+    # ie. 'buffer', 'distance', 'preprocess', 'amalgamate', 'postprocess', 'clip' and 'generalise'
+    # Each policy may set 'persistence' ('logged' or 'unlogged'), 'tablespace', 'fillfactor' and 'compression' ('pglz' or 'lz4')
+    # Unlogged tables avoid WAL but are emptied if PostgreSQL crashes, in which case they're rebuilt on next run
+    STORAGE_STAGES              = ['buffer', 'distance', 'preprocess', 'amalgamate', 'postprocess', 'clip', 'generalise']
+    STORAGE_POLICY              = \
+                                {
+                                    'default':  {'persistence': 'logged', 'tablespace': None, 'fillfactor': None, 'compression': None},
+                                    'scratch':  {'persistence': 'unlogged'},
+                                }
+
     # Processing grid is used to cut up core datasets into grid squares
     # to reduce memory load on ST_Union. All final layers will have ST_Union
     # so it's okay to cut up early datasets before this
@@ -221,6 +266,141 @@ class OpenSiteConstants:
     GRID_OUTPUT_SPACING_KM      = 100 # Size of grid squares in kilometres
     GRID_OUTPUT_SPACING         = GRID_OUTPUT_SPACING_KM * 1000 
 
+    # Maximum number of vertices in each polygon of subdivided clip mask
+    # Small subdivided polygons make ST_Intersects and ST_Intersection against mask much cheaper
+    CLIP_MASK_MAX_VERTICES      = 256
+
+    # Extra margin in metres added around clip area when clip is pushed down to imports
+    # This is on top of any buffer or distance exclusion applied to dataset
+    CLIP_PUSHDOWN_MARGIN        = 100
+
+    # Tile zoom levels used when creating mbtiles
+    MBTILES_MIN_ZOOM            = 4
+    MBTILES_MAX_ZOOM            = 15
+
+    # When output tables change in only some grid squares, mbtiles are updated incrementally:
+    # - Tiles at or above this zoom are only regenerated within tile range of changed grid squares
+    # - Tiles below this zoom are regenerated from whole dataset as they cover large areas
+    MBTILES_INCREMENTAL_SPLIT_ZOOM = 10
+
+    # If 'true', features are streamed from PostGIS into tippecanoe as newline-delimited GeoJSON
+    # rather than exported to temporary GeoJSON file first, so export and tiling overlap
+    MBTILES_STREAMING           = os.getenv("MBTILES_STREAMING", "true").lower() == 'true'
+
+    # Engine used to create mbtiles
+    # 'tippecanoe' exports features to tippecanoe, 'postgis' generates tiles inside PostGIS using ST_AsMVT
+    # PostGIS engine creates MVT_TILES_PER_QUERY tiles per query on MVT_WORKERS parallel connections 
+    # and inserts tiles into mbtiles in transactions of MVT_INSERT_BATCH tiles
+    MBTILES_ENGINE              = os.getenv("MBTILES_ENGINE", "tippecanoe")
+    MVT_EXTENT                  = 4096
+    MVT_BUFFER                  = 64
+    MVT_TILES_PER_QUERY         = 64
+    MVT_INSERT_BATCH            = 1000
+    MVT_WORKERS                 = int(os.getenv("MVT_WORKERS", str(os.cpu_count() or 1)))
+
+    # Generalised level of detail (LOD) tables are created from every output table for each tolerance in GENERALISE_TOLERANCES
+    # (in units of CRS_DEFAULT) using topology-preserving simplification, with coordinates snapped to grid of 
+    # tolerance * GENERALISE_PRECISION_FACTOR. Exporters and tile pipeline use LOD tables where full detail isn't needed:
+    # - Mbtiles are built in zoom bands, each from LOD table with largest tolerance not above MBTILES_GENERALISE_BANDS tolerance
+    #   of band, where bands are (first zoom of band, tolerance)
+    # - File formats in GENERALISE_FORMATS are exported from LOD table with largest tolerance not above tolerance of format
+    #   This is lossy so is opt-in, eg. GENERALISE_FORMATS=geojson:10 - by default every file format has full detail
+    GENERALISE_TOLERANCES       = sorted(float(tolerance) for tolerance in os.getenv("GENERALISE_TOLERANCES", "1,10,100").split(',') if tolerance.strip())
+    GENERALISE_PRECISION_FACTOR = 0.1
+    GENERALISE_FORMATS          = {item.split(':')[0].strip(): float(item.split(':')[1]) for item in os.getenv("GENERALISE_FORMATS", "").split(',') if ':' in item}
+    GENERALISE_GEOJSON_PRECISION = 6 # Decimal places of GeoJSON coordinates, ie. ~0.1m in EPSG:4326
+    MBTILES_GENERALISE_BANDS    = [(MBTILES_MIN_ZOOM, 100), (8, 10), (12, 1)]
+
+    # ogr2ogr layer creation options of indexed download formats
+    # - FlatGeobuf files include packed Hilbert R-tree spatial index
+    # - GeoParquet files are sorted spatially into zstd-compressed row groups of PARQUET_ROW_GROUP_SIZE rows 
+    #   with bounding box covering column (SORT_BY_BBOX requires GDAL 3.9 or later)
+    PARQUET_ROW_GROUP_SIZE      = int(os.getenv("PARQUET_ROW_GROUP_SIZE", "65536"))
+    FGB_LAYER_CREATION_OPTIONS  = ['SPATIAL_INDEX=YES']
+    PARQUET_LAYER_CREATION_OPTIONS = ['COMPRESSION=ZSTD', 'WRITE_COVERING_BBOX=YES', 'SORT_BY_BBOX=YES', f"ROW_GROUP_SIZE={PARQUET_ROW_GROUP_SIZE}"]
+
+    # Settings used when finalising output tables, ie. building indexes, reordering rows and analyzing
+    # Larger maintenance memory and parallel workers speed up index builds on large tables
+    POSTGIS_MAINTENANCE_WORK_MEM    = os.getenv("POSTGIS_MAINTENANCE_WORK_MEM", "512MB")
+    POSTGIS_MAINTENANCE_WORKERS     = int(os.getenv("POSTGIS_MAINTENANCE_WORKERS", "2"))
+
+    # Optional method used to reorder rows of tables so nearby features are stored together
+    # 'none' (default) leaves rows unordered, 'geohash' sorts rows by geohash (fast), 'gist' clusters on spatial index (slower)
+    # Clustering rewrites every table it's applied to under exclusive lock so is opt-in
+    POSTGIS_CLUSTER_METHOD          = os.getenv("POSTGIS_CLUSTER_METHOD", "none")
+
+    # Geometry statistics (feature count, vertices, extent, etc) are recorded for every data table when finalised
+    # These thresholds use them to pick cheaper paths for small datasets and guard expensive operations on large ones
+    # - Mbtiles grid squares are only subdivided if they contain more than MBTILES_GRID_CUTOFF_VERTICES vertices
+    # - Tippecanoe drops and coalesces features from outset for datasets above MBTILES_HEAVY_VERTICES vertices
+    # - Postprocess only unions seams if region being unioned has at most POSTPROCESS_UNION_MAX_VERTICES vertices
+    MBTILES_GRID_CUTOFF_VERTICES    = 600000
+    MBTILES_HEAVY_VERTICES          = int(os.getenv("MBTILES_HEAVY_VERTICES", "50000000"))
+    POSTPROCESS_UNION_MAX_VERTICES  = int(os.getenv("POSTPROCESS_UNION_MAX_VERTICES", "100000000"))
+
+    # Spatial engine used for buffer, preprocess and clip
+    # 'postgis' runs operations as SQL, 'inprocess' runs them in worker process using Shapely 
+    # 'auto' uses 'inprocess' for datasets with at most INPROCESS_MAX_FEATURES features and INPROCESS_MAX_VERTICES vertices
+    # Outputs of engines are equivalent if area of symmetric difference is at most INPROCESS_COMPARE_TOLERANCE of total area
+    SPATIAL_ENGINE                  = os.getenv("SPATIAL_ENGINE", "auto")
+    SPATIAL_ENGINES                 = ['postgis', 'inprocess', 'auto']
+    SPATIAL_ENGINE_STAGES           = ['buffer', 'preprocess', 'clip']
+    INPROCESS_MAX_FEATURES          = int(os.getenv("INPROCESS_MAX_FEATURES", "2000"))
+    INPROCESS_MAX_VERTICES          = int(os.getenv("INPROCESS_MAX_VERTICES", "500000"))
+    INPROCESS_COMPARE_TOLERANCE     = 1e-9
+
+    # Raster engine used for 'tif' output format
+    # Rasterises each preprocessed layer onto shared grid with RASTER_RESOLUTION pixel size (in units of CRS_DEFAULT) 
+    # and combines layers using bitwise OR into single feasibility mask, optionally polygonised if RASTER_POLYGONISE is 'true'
+    # Layers are processed in windows of RASTER_WINDOW_SIZE pixels using RASTER_WORKERS threads
+    RASTER_RESOLUTION               = float(os.getenv("RASTER_RESOLUTION", "50"))
+    RASTER_BLOCK_SIZE               = 512
+    RASTER_WINDOW_SIZE              = 4096
+    RASTER_WORKERS                  = int(os.getenv("RASTER_WORKERS", str(os.cpu_count() or 1)))
+    RASTER_POLYGONISE               = os.getenv("RASTER_POLYGONISE", "false").lower() == 'true'
+    RASTER_CACHE_FOLDER             = CACHE_FOLDER / "raster"
+
+    # Download archives of output files are cached in DOWNLOAD_ARCHIVES_FOLDER, keeping DOWNLOAD_ARCHIVES_KEEP most recently used archives
+    # Files with DOWNLOAD_DEFLATE_EXTENSIONS are deflated, all other files are already compressed or compress poorly so are stored
+    DOWNLOAD_ARCHIVES_FOLDER        = CACHE_FOLDER / "downloads"
+    DOWNLOAD_ARCHIVES_KEEP          = int(os.getenv("DOWNLOAD_ARCHIVES_KEEP", "10"))
+    DOWNLOAD_ARCHIVE_CHUNK_SIZE     = 1024 * 1024
+    DOWNLOAD_DEFLATE_EXTENSIONS     = ['geojson', 'json', 'qgs', 'prj', 'cpg', 'csv', 'txt', 'xml']
+
+    # Output files requested with versioned URL, ie. '?v=[file version]', are cached by clients for STATIC_IMMUTABLE_MAX_AGE seconds
+    STATIC_IMMUTABLE_MAX_AGE        = 31536000
+
+    # Vector tiles served by app from mbtiles files are cached in memory, keeping up to TILE_CACHE_MB of most recently used tiles
+    TILE_CACHE_MAX_BYTES            = int(os.getenv("TILE_CACHE_MB", "256")) * 1024 * 1024
+
+    # Garbage collection of intermediate tables once every node consuming them has completed
+    # 'off' keeps all tables, 'drop' drops them, 'archive' moves them to compressed files in ARCHIVE_FOLDER
+    # that are restored rather than rebuilt if tables are needed again
+    GC_MODE                         = os.getenv("GC_MODE", "off")
+
+    # If non-zero, tables are only collected while database is larger than budget, largest tables first
+    GC_DISK_BUDGET_GB               = float(os.getenv("GC_DISK_BUDGET_GB", "0"))
+
+    # Tables that are never collected, as patterns matched against table name, node name or node action
+    # Amalgamate, postprocess, clip and generalise tables are kept by default as they allow incremental rebuilds of outputs
+    GC_KEEP                         = [pattern.strip() for pattern in os.getenv("GC_KEEP", "amalgamate,postprocess,clip,generalise").split(',') if pattern.strip()]
+
+    # Preview builds ('--preview') give quick, coarse version of outputs
+    # - Imported datasets are simplified with ST_SimplifyPreserveTopology using PREVIEW_SIMPLIFY_TOLERANCE (in units of CRS_DEFAULT)
+    # - Processing uses coarser grid of PREVIEW_GRID_PROCESSING_SPACING so fewer, larger grid squares are processed
+    # - Mbtiles stop at PREVIEW_MBTILES_MAX_ZOOM and slow output formats in PREVIEW_SKIP_FORMATS are skipped
+    # All preview tables start with DATABASE_PREVIEW_PREFIX so never mix with tables of full builds
+    PREVIEW_SIMPLIFY_TOLERANCE      = float(os.getenv("PREVIEW_SIMPLIFY_TOLERANCE", "50"))
+    PREVIEW_GRID_PROCESSING_SPACING = int(os.getenv("PREVIEW_GRID_PROCESSING_SPACING_KM", "400")) * 1000
+    PREVIEW_MBTILES_MAX_ZOOM        = int(os.getenv("PREVIEW_MBTILES_MAX_ZOOM", "10"))
+    PREVIEW_SKIP_FORMATS            = ['shp', 'geojson', 'qgis']
+
+    # Preview outputs and tileserver releases are written to their own folders so never replace those of full builds
+    # Preview tileserver config is PREVIEW_TILESERVER_FOLDER/config.json and shares fonts, sprites and basemap with full builds
+    PREVIEW_OUTPUT_FOLDER           = BUILD_ROOT / "output-preview"
+    PREVIEW_OUTPUT_LAYERS_FOLDER    = PREVIEW_OUTPUT_FOLDER / "layers"
+    PREVIEW_TILESERVER_FOLDER       = TILESERVER_OUTPUT_FOLDER / "preview"
+
     # Basename of OSM boundaries files
     # If [basename].gpkg file doesn't exist, processing nodes will be added to create it
     OSM_BOUNDARIES              = 'osm-boundaries'
@@ -231,6 +411,7 @@ class OpenSiteConstants:
     # Database tables
     DATABASE_GENERAL_PREFIX     = f"opensite_"
     DATABASE_BASE               = f"_{DATABASE_GENERAL_PREFIX}" 
+    DATABASE_PREVIEW_PREFIX     = f"{DATABASE_GENERAL_PREFIX}pv_" # Kept short as scratch tables add to length of table names
     OPENSITE_REGISTRY           = DATABASE_BASE + 'registry'
     OPENSITE_BRANCH             = DATABASE_BASE + 'branch'
     OPENSITE_OUTPUTS            = DATABASE_BASE + 'outputs'
@@ -238,8 +419,16 @@ class OpenSiteConstants:
     OPENSITE_CLIPPINGTEMP       = DATABASE_BASE + 'clipping_temp'
     OPENSITE_GRIDPROCESSING     = DATABASE_BASE + 'grid_processing'
     OPENSITE_GRIDBUFFEDGES      = OPENSITE_GRIDPROCESSING + '_buffered_edges'
+    OPENSITE_GRIDPROCESSINGPREVIEW = OPENSITE_GRIDPROCESSING + '_preview'
+    OPENSITE_GRIDBUFFEDGESPREVIEW  = OPENSITE_GRIDPROCESSINGPREVIEW + '_buffered_edges'
     OPENSITE_GRIDOUTPUT         = DATABASE_BASE + f"grid_output_{GRID_OUTPUT_SPACING_KM}"
     OPENSITE_OSMBOUNDARIES      = DATABASE_BASE + OSM_BOUNDARIES.replace('-', '_')
+    OPENSITE_CLIPMASK_PREFIX    = DATABASE_BASE + 'clip_mask_'
+    OPENSITE_GRIDHASHES         = DATABASE_BASE + 'grid_hashes'
+    OPENSITE_GRIDLINEAGE        = DATABASE_BASE + 'grid_lineage'
+    OPENSITE_STATS              = DATABASE_BASE + 'stats'
+    OPENSITE_GAZETTEER          = DATABASE_BASE + 'gazetteer'
+    OPENSITE_GAZETTEERPARTS     = OPENSITE_GAZETTEER + '_parts'
 
     # Lookup to convert internal areas to OSM names
     OSM_NAME_CONVERT            = \
@@ -259,11 +448,17 @@ class OpenSiteConstants:
                                     BUILD_ROOT,
                                     DOWNLOAD_FOLDER,
                                     OSM_DOWNLOAD_FOLDER,
+                                    OSM_EXTRACTS_FOLDER,
                                     OPENLIBRARY_DOWNLOAD_FOLDER,
                                     CACHE_FOLDER,
+                                    RASTER_CACHE_FOLDER,
+                                    DOWNLOAD_ARCHIVES_FOLDER,
+                                    ARCHIVE_FOLDER,
                                     LOG_FOLDER,
                                     OUTPUT_FOLDER,
                                     OUTPUT_LAYERS_FOLDER,
+                                    PREVIEW_OUTPUT_FOLDER,
+                                    PREVIEW_OUTPUT_LAYERS_FOLDER,
                                     INSTALL_FOLDER,
                                     TILESERVER_OUTPUT_FOLDER,
                                     TILESERVER_DATA_FOLDER,
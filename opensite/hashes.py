@@ -0,0 +1,32 @@
+import hashlib
+import json
+from pathlib import Path
+
+def get_file_hash(file_path, log=None):
+    """
+    Gets MD5 hash of file
+    Hash is stored alongside file and only recomputed if file's size or modification time changes
+    """
+
+    file_path = Path(file_path)
+    hash_path = file_path.with_name(file_path.name + '.md5.json')
+    stat = file_path.stat()
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    if hash_path.exists():
+        try:
+            with open(hash_path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            if stored.get('size') == fingerprint['size'] and stored.get('mtime') == fingerprint['mtime']: return stored['md5']
+        except Exception:
+            pass
+
+    if log: log.info(f"[get_file_hash] Computing hash of {file_path.name}")
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b''): md5.update(chunk)
+
+    with open(hash_path, 'w', encoding='utf-8') as f:
+        json.dump({**fingerprint, 'md5': md5.hexdigest()}, f)
+
+    return md5.hexdigest()
@@ -1,11 +1,14 @@
+import hashlib
 import json
 import logging
 import os
+import re
 import shutil
 import subprocess
 import tempfile
 from pathlib import Path
 from opensite.constants import OpenSiteConstants
+from opensite.hashes import get_file_hash
 from opensite.install.base import InstallBase
 from opensite.logging.opensite import OpenSiteLogger
 
@@ -65,6 +68,75 @@ class OpenSiteTileserver(InstallBase):
             return False
 
 
+    def get_tilemaker_version(self):
+        """
+        Gets version of installed tilemaker from its help text, or None if version can't be determined
+        """
+
+        try:
+            result = subprocess.run(["tilemaker", "--help"], capture_output=True, text=True)
+        except Exception as e:
+            self.log.warning(f"Unable to run tilemaker to get version: {e}")
+            return None
+
+        output = (result.stdout or '') + (result.stderr or '')
+        match = re.search(r'tilemaker\s+v?(\d+(?:\.\d+)+)', output, re.IGNORECASE)
+        if match: return match.group(1)
+
+        # Fall back to first line of help text, which changes between releases
+        return output.strip().splitlines()[0] if output.strip() else None
+
+    def get_basemap_key(self, basemap_pbf):
+        """
+        Gets content address of basemap from hash of OSM file, tilemaker config and process files,
+        basemap bounds and tilemaker version, so basemap is only regenerated when one of these changes
+        """
+
+        key_inputs = \
+        {
+            'pbf':          get_file_hash(basemap_pbf, self.log),
+            'bbox':         OpenSiteConstants.TILEMAKER_BBOX_UK,
+            'tilemaker':    self.get_tilemaker_version(),
+            'files':        {}
+        }
+
+        for file_path in [  OpenSiteConstants.TILEMAKER_COASTLINE_CONFIG, 
+                            OpenSiteConstants.TILEMAKER_COASTLINE_PROCESS,
+                            OpenSiteConstants.TILEMAKER_OMT_CONFIG,
+                            OpenSiteConstants.TILEMAKER_OMT_PROCESS]:
+            key_inputs['files'][Path(file_path).name] = hashlib.md5(Path(file_path).read_bytes()).hexdigest()
+
+        return hashlib.sha256(json.dumps(key_inputs, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def link_basemap(self, cached_mbtiles, basemap_mbtiles):
+        """
+        Links cached basemap into tileserver data folder, copying if hard link isn't possible
+        Basemap is replaced atomically so tileserver releases linking to previous basemap are unaffected
+        """
+
+        if basemap_mbtiles.exists() and os.path.samefile(cached_mbtiles, basemap_mbtiles): return
+
+        basemap_tmp_mbtiles = basemap_mbtiles.with_name(f"tmp-{basemap_mbtiles.name}")
+        if basemap_tmp_mbtiles.exists(): basemap_tmp_mbtiles.unlink()
+
+        try:
+            os.link(cached_mbtiles, basemap_tmp_mbtiles)
+        except OSError:
+            shutil.copy2(cached_mbtiles, basemap_tmp_mbtiles)
+
+        os.replace(basemap_tmp_mbtiles, basemap_mbtiles)
+
+    def prune_basemap_cache(self):
+        """
+        Removes least recently used cached basemaps so at most BASEMAP_CACHE_KEEP basemaps remain
+        """
+
+        cached = sorted(OpenSiteConstants.BASEMAP_CACHE_FOLDER.glob('*.mbtiles'), key=lambda path: path.stat().st_mtime)
+        cached = [path for path in cached if not path.name.startswith('tmp-')]
+        for path in cached[:max(len(cached) - OpenSiteConstants.BASEMAP_CACHE_KEEP, 0)]:
+            self.log.info(f"Removing cached basemap {path.stem[:12]}")
+            path.unlink(missing_ok=True)
+
     def run(self):
         """
         Installs tileserver-related core files and generates overall basemap
@@ -78,7 +150,6 @@ class OpenSiteTileserver(InstallBase):
         basename_mbtiles        = basename_pbf.replace(".osm.pbf", ".mbtiles")
         basemap_pbf             = OpenSiteConstants.OSM_DOWNLOAD_FOLDER / basename_pbf
         basemap_mbtiles         = OpenSiteConstants.TILESERVER_DATA_FOLDER / basename_mbtiles
-        basemap_tmp_mbtiles     = OpenSiteConstants.TILESERVER_DATA_FOLDER / f"tmp-{basename_mbtiles}"
         fonts_tmp_folder        = OpenSiteConstants.TILESERVER_OUTPUT_FOLDER / 'tmp-fonts'
         fonts_tmp_fonts_folder  = fonts_tmp_folder / 'fonts'
         
@@ -86,9 +157,13 @@ class OpenSiteTileserver(InstallBase):
             self.log.info("Creating tileserver data folder")
             OpenSiteConstants.TILESERVER_DATA_FOLDER.mkdir(parents=True, exist_ok=True)
 
-        if basemap_tmp_mbtiles.exists(): basemap_tmp_mbtiles.unlink()
         if fonts_tmp_folder.exists(): shutil.rmtree(fonts_tmp_folder)
 
+        # If every branch is clipped to same area, basemap is generated from extract of that area
+        if 'osm_extract' in self.node.custom_properties:
+            basemap_pbf = OpenSiteConstants.DOWNLOAD_FOLDER / self.node.custom_properties['osm_extract']
+            basename_pbf = os.path.basename(basemap_pbf)
+
         if not basemap_pbf.exists():
             self.log.error(f"{basename_pbf} missing from OSM downloads folder - required to install tileserver files")
             return False
@@ -142,25 +217,34 @@ class OpenSiteTileserver(InstallBase):
                 self.log.error(f"General error: {e}")
                 return False
 
-        if basemap_mbtiles.exists():
+        # Prefix paths in config file to use correct location
+        self.update_json_file_paths(str(OpenSiteConstants.TILEMAKER_COASTLINE_CONFIG), f"{str(OpenSiteConstants.BASEMAP_FOLDER_DEST)}/")
 
-            self.log.info(f"{os.path.basename(basemap_mbtiles)} already exists, skipping creation")
+        # Basemap is cached by content address of everything used to generate it
+        # so basemap is only generated if OSM file, tilemaker files or tilemaker version change
+        OpenSiteConstants.BASEMAP_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+        basemap_key             = self.get_basemap_key(basemap_pbf)
+        cached_mbtiles          = OpenSiteConstants.BASEMAP_CACHE_FOLDER / f"{basemap_key}.mbtiles"
+        cached_tmp_mbtiles      = OpenSiteConstants.BASEMAP_CACHE_FOLDER / f"tmp-{basemap_key}.mbtiles"
+
+        if cached_mbtiles.exists():
+
+            self.log.info(f"Basemap for {basename_pbf} already generated with same tilemaker files and version, skipping creation")
+            os.utime(cached_mbtiles)
 
         else:
 
             self.log.info(f"Generating {os.path.basename(basemap_mbtiles)}...")
+            if cached_tmp_mbtiles.exists(): cached_tmp_mbtiles.unlink()
 
             try:
 
                 self.log.info("Generating global coastline mbtiles as initial map")
 
-                # Prefix paths in config file to use correct location
-                self.update_json_file_paths(str(OpenSiteConstants.TILEMAKER_COASTLINE_CONFIG), f"{str(OpenSiteConstants.BASEMAP_FOLDER_DEST)}/")
-
                 cmd = ([
                     "tilemaker", 
                     "--input",      str(basemap_pbf), 
-                    "--output",     str(basemap_tmp_mbtiles), 
+                    "--output",     str(cached_tmp_mbtiles), 
                     "--bbox",       OpenSiteConstants.TILEMAKER_BBOX_UK, 
                     "--process",    str(OpenSiteConstants.TILEMAKER_COASTLINE_PROCESS), 
                     "--config",     str(OpenSiteConstants.TILEMAKER_COASTLINE_CONFIG) 
@@ -182,7 +266,7 @@ class OpenSiteTileserver(InstallBase):
                 cmd = ([
                     "tilemaker", 
                     "--input",      str(basemap_pbf), 
-                    "--output",     str(basemap_tmp_mbtiles), 
+                    "--output",     str(cached_tmp_mbtiles), 
                     "--merge", 
                     "--process",    str(OpenSiteConstants.TILEMAKER_OMT_PROCESS), 
                     "--config",     str(OpenSiteConstants.TILEMAKER_OMT_CONFIG)
@@ -197,12 +281,15 @@ class OpenSiteTileserver(InstallBase):
                 self.log.error(f"General error when merging {basename_pbf} into global coastline mbtiles: {e}")
                 return False
 
-            try:
-                self.log.info(f"Copying {os.path.basename(basemap_tmp_mbtiles)} to {os.path.basename(basemap_mbtiles)}")
-                os.replace(str(basemap_tmp_mbtiles), str(basemap_mbtiles))
-            except (Exception) as e:
-                self.log.error(f"General error when copying {os.path.basename(basemap_tmp_mbtiles)} to {os.path.basename(basemap_mbtiles)}: {e}")
-                return False
+            os.replace(str(cached_tmp_mbtiles), str(cached_mbtiles))
+
+        try:
+            self.log.info(f"Linking cached basemap to {os.path.basename(basemap_mbtiles)}")
+            self.link_basemap(cached_mbtiles, basemap_mbtiles)
+            self.prune_basemap_cache()
+        except (Exception) as e:
+            self.log.error(f"General error when linking cached basemap to {os.path.basename(basemap_mbtiles)}: {e}")
+            return False
 
         if OpenSiteConstants.TILESERVER_FONTS_FOLDER.exists():
 
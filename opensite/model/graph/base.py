@@ -455,8 +455,8 @@ class Graph:
                 self.yaml_unique_ids.append(unique_id_value)
                 return True
 
-    def add_yaml(self, path_or_url: str):
-        """Adds a YAML file/url as a new sibling branch under the root."""
+    def read_yaml(self, path_or_url: str):
+        """Reads YAML file/url and returns its data."""
         
         if path_or_url.startswith(('http://', 'https://')):
             try:
@@ -475,8 +475,22 @@ class Graph:
             with open(path_or_url, 'r') as f:
                 data = yaml.safe_load(f)
 
+        return data
+
+    def add_yaml(self, path_or_url: str):
+        """Adds a YAML file/url as a new sibling branch under the root."""
+
+        data = self.read_yaml(path_or_url)
         if not data: return False
 
+        return self.add_branch(data, path_or_url)
+
+    def add_branch(self, data: dict, path_or_url: str, scenario: dict = None):
+        """
+        Adds YAML data as a new sibling branch under the root.
+        If scenario set, its values are applied after defaults and overrides.
+        """
+
         self.check_unique_id(data)
 
         processed_data = data.copy()
@@ -491,6 +505,11 @@ class Graph:
             if self._overrides[key]:
                 processed_data[key] = self._overrides[key]
 
+        # Apply scenario values last as they define branch
+        if scenario:
+            for key in scenario:
+                processed_data[key] = scenario[key]
+
         # Generate the unique hash for this specific state
         # We use sort_keys to ensure consistent hashing regardless of dictionary order
         state_string = json.dumps(processed_data, sort_keys=True).encode('utf-8')
@@ -24,7 +24,7 @@ class OpenSiteGraph(Graph):
     TABLENAME_BASE          = OpenSiteConstants.DATABASE_BASE
     TREE_BRANCH_PROPERTIES  = OpenSiteConstants.TREE_BRANCH_PROPERTIES
 
-    def __init__(self, overrides=None, outputformats=None, clip=None, snapgrid=None, log_level=logging.INFO):
+    def __init__(self, overrides=None, outputformats=None, clip=None, snapgrid=None, scenarios=None, preview=False, log_level=logging.INFO):
         super().__init__(overrides)
 
         self.log = OpenSiteLogger("OpenSiteGraph", log_level)
@@ -39,6 +39,14 @@ class OpenSiteGraph(Graph):
 
         self.snapgrid = snapgrid
 
+        # List of parameter sets, eg. [{'height-to-tip': 100}, {'height-to-tip': 150}]
+        # If set, every YAML is built once per scenario, overriding any 'scenarios' in YAML
+        self.scenarios = scenarios
+
+        # Preview builds write to separate table namespace so never overwrite or reuse tables of full builds
+        self.preview = preview
+        if preview: self.TABLENAME_PREFIX = OpenSiteConstants.DATABASE_PREVIEW_PREFIX
+
         self.log.info("Graph initialized and ready.")
         
     def is_database_output(self, output):
@@ -58,7 +66,8 @@ class OpenSiteGraph(Graph):
         def _recurse_and_register(node, branch):
             # Use debug for high-volume mapping logs (White)
             self.log.debug(f"Mapping node: {node.name} -> {node.output}")
-            if self.is_database_output(node.output):
+            # Internal tables, eg. OSM boundaries, are never tracked in registry
+            if self.is_database_output(node.output) and not node.output.startswith(self.TABLENAME_BASE):
                 self.db.register_node(node, branch)
             
             for child in node.children:
@@ -92,6 +101,7 @@ class OpenSiteGraph(Graph):
             ],
             "cpu_bound": [
                 'run', 
+                'extract',
                 'import',
                 'preprocess',
                 'buffer',
@@ -99,6 +109,7 @@ class OpenSiteGraph(Graph):
                 'amalgamate',
                 'postprocess',
                 'clip',
+                'generalise',
                 'output',
                 'web',
                 'qgis',
@@ -147,6 +158,19 @@ class OpenSiteGraph(Graph):
         distance = distance.replace('.', '-')
         return f"--distance-{distance}"
 
+    def get_suffix_scenario(self, scenario):
+        """
+        Generates scenario suffix
+        """
+
+        scenario_elements = []
+        for key in sorted(scenario.keys()):
+            value = self.get_string_buffer_distance(scenario[key]).replace('.', '-')
+            scenario_elements.append(f"{key}-{value}")
+
+        sanitized_scenario = re.sub(r'[^a-zA-Z0-9-]+', '-', '--'.join(scenario_elements))
+        return f"--scenario--{sanitized_scenario}"
+
     def get_suffix_clip(self, clip):
         """
         Generates clip suffix
@@ -320,18 +344,43 @@ class OpenSiteGraph(Graph):
         }
 
     def add_yaml(self, filepath: str):
-        """Loads a YAML file and triggers the branch-specific enrichment logic."""
-        # 1. Use the base class to load the raw file structure into a branch
-        super().add_yaml(filepath)
-        
-        if not self.root.children: return False
+        """
+        Loads a YAML file and triggers the branch-specific enrichment logic.
+        If scenarios are set in CLI or YAML, one branch is created for each scenario.
+        """
+
+        # 1. Use the base class to load the raw file structure into one branch per scenario
+        data = self.read_yaml(filepath)
+        if not data: return False
+
+        scenarios = self.scenarios or data.get('scenarios')
+        data = {key: value for key, value in data.items() if key != 'scenarios'}
+
+        branches = []
+        for scenario in (scenarios or [None]):
+            scenario_data = data
+            if scenario:
+                scenario_data = data.copy()
+                scenario_suffix = self.get_suffix_scenario(scenario)
+                if self.yaml_unique_id_field in scenario_data:
+                    scenario_data[self.yaml_unique_id_field] = f"{scenario_data[self.yaml_unique_id_field]}{scenario_suffix}"
+                if 'title' in scenario_data:
+                    scenario_data['title'] = f"{scenario_data['title']} - Scenario " + \
+                                             ', '.join([f"{key} {value}" for key, value in sorted(scenario.items())])
+                self.log.info(f"Adding scenario {scenario_suffix} for {filepath}")
+
+            if not self.add_branch(scenario_data, filepath, scenario): continue
             
-        # 2. Get the branch we just created (the last child of the root)
-        current_branch = self.root.children[-1]
-        
+            # 2. Get the branch we just created (the last child of the root)
+            current_branch = self.root.children[-1]
+            if scenario: current_branch.custom_properties['scenario'] = scenario
+            branches.append(current_branch)
+
+        if not branches: return False
+
         # 3. Trigger the unified enrichment logic
         # This now handles property mapping, math, and surgical pruning
-        self.enrich_branch(current_branch)
+        for branch in branches: self.enrich_branch(branch)
 
         self.register_to_database()
 
@@ -366,8 +415,11 @@ class OpenSiteGraph(Graph):
             prop_node = self.find_child(branch, key)
             
             # 2. Determine value: Local Node > Global Default
+            # Structured properties, eg. storage, are nested so use value from merged YAML data
             val = None
-            if prop_node:
+            if key in self.TREE_BRANCH_PROPERTIES.get('structured', []):
+                val = branch.custom_properties['yml'].get(key)
+            elif prop_node:
                 val = prop_node.custom_properties.get('value')
             else:
                 val = self._defaults.get(key)
@@ -571,6 +623,12 @@ class OpenSiteGraph(Graph):
         # During preprocessing, we dump and select single geometry type then slice data into grid squares to reduce memory use 
         self.add_preprocess()
 
+        # Push clip area down into clipped branches so only clip area is processed
+        self.add_clip_pushdown()
+
+        # Set tables that native OSM extractor loads into now clip pushdown has renamed import tables
+        self.add_osm_tables()
+
         # Calculate final amalgamation children outputs
         self.compute_amalgamation_outputs()
 
@@ -583,6 +641,15 @@ class OpenSiteGraph(Graph):
         # Generate installer nodes
         self.add_installers()
 
+        # Apply storage policy from site YAML or defaults to all nodes that create tables
+        self.add_storage_policies()
+
+        # Apply spatial engine from site YAML or defaults to all nodes that can run in-process
+        self.add_spatial_engines()
+
+        # Mark all nodes of preview build so processing uses preview settings
+        self.add_preview()
+
         # Add global urns across nodes that share same output
         self.add_global_urns()
 
@@ -822,7 +889,7 @@ class OpenSiteGraph(Graph):
             hash_payload = osm_url + json.dumps(group_outputs, sort_keys=True)
             yml_group_hash = hashlib.md5(hash_payload.encode()).hexdigest()[0:16]
             concat_output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX.replace('_', '-')}{yml_group_hash}.yml"
-            run_output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX.replace('_', '-')}{yml_group_hash}.gpkg"
+            run_output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX.replace('_', '-')}{yml_group_hash}.{self.get_osm_runner_extension()}"
 
             for node in group_nodes:
                 node_branch = node.custom_properties['branch']
@@ -900,6 +967,14 @@ class OpenSiteGraph(Graph):
 
         self.log.debug("OSM Tree complete: Runner is now parent to both Downloader and Concatenator.")
 
+    def get_osm_runner_extension(self):
+        """
+        Gets file extension of osm-runner output
+        Native OSM extractor writes JSON manifest of tables it has loaded, osm-export-tool writes GPKG
+        """
+
+        return 'json' if OpenSiteConstants.OSM_ENGINE == 'pyosmium' else 'gpkg'
+
     def add_openlibrary(self):
         """
         Builds Open Library nodes by changing type of 'download' to 'run' and modifying paths
@@ -961,6 +1036,9 @@ class OpenSiteGraph(Graph):
             # Don't do anything if not buffer or distance node
             if ('buffer' not in node.custom_properties) and ('distance' not in node.custom_properties): continue
 
+            # Scenario buffers are applied after preprocess so are added by add_preprocess
+            if self.is_scenario_buffer(node): continue
+
             # Only one of 'buffer' or 'distance' can exist for any dataset
             if 'buffer' in node.custom_properties:
                 buffer = node.custom_properties['buffer']
@@ -1026,6 +1104,11 @@ class OpenSiteGraph(Graph):
             import_node = self.find_node_by_urn(d['urn'])
             if not import_node: continue
 
+            # Scenario buffers are applied to shared gridded base rather than import
+            if self.is_scenario_buffer(import_node):
+                self.add_scenario_buffer(import_node)
+                continue
+
             # Identify target to "wrap" - check immediate parent to see if buffer/distance has already 'claimed' import
             parent = self.find_parent(import_node.urn)
             if parent and ((getattr(parent, 'action', None) == 'buffer') or (getattr(parent, 'action', None) == 'distance')): target_node = parent
@@ -1049,6 +1132,190 @@ class OpenSiteGraph(Graph):
 
         self.log.info("Preprocess nodes injected with status 'unprocessed'.")
 
+    def is_scenario_buffer(self, node):
+        """
+        Checks whether node is buffered dataset in scenario branch
+        Hedgerows are buffered as lines so must be buffered before they are cut into grid squares
+        """
+
+        if 'buffer' not in node.custom_properties: return False
+        if not node.get_property('scenario'): return False
+        if 'hedgerows--' in node.name: return False
+        return True
+
+    def add_scenario_buffer(self, import_node):
+        """
+        Injects gridded base and buffer nodes above import in scenario branch:
+        import -> preprocess (base) -> buffer (gridded)
+        Base only depends on import so is shared by all scenarios, leaving only buffer to be done per scenario
+        """
+
+        target_branch = import_node.custom_properties['branch']
+        buffer = import_node.custom_properties.pop('buffer')
+        buffer_str = self.get_string_buffer_distance(buffer)
+
+        base_node = self.create_node(
+            name=f"{import_node.name}--preprocess-base",
+            title=f"{import_node.title} - Preprocess base",
+            input=import_node.output,
+            action='preprocess',
+            status='unprocessed'
+        )
+
+        base_node.output = self.get_output(base_node)
+        base_node.custom_properties['branch'] = target_branch
+        base_node.custom_properties['base'] = True
+        if self.snapgrid: base_node.custom_properties['snapgrid'] = self.snapgrid
+
+        self.insert_parent(import_node, base_node)
+
+        buffer_node = self.create_node(
+            name=f"{import_node.name}{self.get_suffix_buffer(buffer)}--gridded",
+            title=f"{import_node.title} - Buffer {buffer_str}m",
+            node_type='process',
+            input=base_node.output,
+            action='buffer',
+        )
+
+        buffer_node.custom_properties = import_node.custom_properties.copy()
+        buffer_node.custom_properties['buffer'] = buffer
+        buffer_node.custom_properties['gridded'] = True
+        buffer_node.output = self.get_output(buffer_node)
+
+        self.insert_parent(base_node, buffer_node)
+
+    def get_clip_margin(self, node):
+        """
+        Gets margin in metres that clipped dataset needs around clip area
+        Buffers and distance exclusions pull in features from outside clip area
+        """
+
+        margin = 0
+        for key in ['buffer', 'distance']:
+            if key in node.custom_properties:
+                try:
+                    margin = max(margin, float(node.custom_properties[key]))
+                except (TypeError, ValueError):
+                    self.log.warning(f"Unable to resolve {key} '{node.custom_properties[key]}' for {node.name} as number, using no margin")
+
+        return margin + OpenSiteConstants.CLIP_PUSHDOWN_MARGIN
+
+    def get_clipped_output(self, output, suffix, margin):
+        """
+        Gets output for clipped version of node
+        Clipped tables contain only clip area so must never share output with unclipped builds
+        """
+
+        clipped_hash = hashlib.md5(f"{output}{suffix}--margin-{self.get_string_buffer_distance(margin)}".encode()).hexdigest()
+
+        for extension in ['.gpkg', '.json']:
+            if output.endswith(extension):
+                return f"{self.TABLENAME_PREFIX.replace('_', '-')}{clipped_hash[0:16]}{extension}"
+
+        return f"{self.TABLENAME_PREFIX}{clipped_hash}"
+
+    def add_clip_pushdown(self):
+        """
+        Pushes clip area down into data branches that have 'clip' set
+        - Imports only import features within clip area bounds plus margin for buffers and distances
+        - OSM runners run on area extract of OSM file
+        - Preprocess and amalgamate only process grid squares touching clip area
+        Final clip node in output branch still performs exact clip
+        """
+
+        for branch in list(self.root.children):
+
+            if branch.node_type != 'branch': continue
+            if 'clip' not in branch.custom_properties.get('yml', {}): continue
+
+            clip = branch.custom_properties['yml']['clip']
+            suffix = self.get_suffix_clip(clip)
+
+            self.log.info(f"Pushing clip '{';'.join(clip)}' down into branch {branch.name}")
+
+            def walk(node):
+                yield node
+                for child in node.children: yield from walk(child)
+
+            branch_nodes = list(walk(branch))
+
+            # OSM runners produce one file used by many datasets so use largest margin in branch
+            branch_margin = max([self.get_clip_margin(node) for node in branch_nodes if node.action in ['buffer', 'distance']], \
+                                default=OpenSiteConstants.CLIP_PUSHDOWN_MARGIN)
+
+            for import_node in [node for node in branch_nodes if node.action == 'import']:
+
+                runner = next((child for child in import_node.children if child.action == 'run' and child.node_type == 'osm-runner'), None)
+
+                # Rename outputs of import and all derived nodes up to amalgamation
+                parent = self.find_parent(import_node.urn)
+                chain = [import_node]
+                while parent and parent.action in ['buffer', 'distance', 'preprocess']:
+                    chain.append(parent)
+                    parent = self.find_parent(parent.urn)
+
+                # Buffer or distance in chain determines margin for whole chain
+                # Imports from OSM runner hold all of runner's extract so are named by margin of extract,
+                # ensuring each clipped import table is only ever loaded by one runner
+                if runner: margin = branch_margin
+                else: margin = max([self.get_clip_margin(node) for node in chain if node.action in ['buffer', 'distance']], \
+                                   default=OpenSiteConstants.CLIP_PUSHDOWN_MARGIN)
+
+                previous_output = None
+                for node in chain:
+                    if previous_output: node.input = previous_output
+                    node.output = self.get_clipped_output(node.output, suffix, margin)
+                    node.custom_properties['clip'] = clip
+                    node.custom_properties['clip_margin'] = margin
+                    previous_output = node.output
+
+                # Clipped imports need boundaries to determine clip area bounds
+                # OSM runners run on cached extract of clip area rather than full OSM file
+                if runner:
+                    runner.output = self.get_clipped_output(runner.output, suffix, branch_margin)
+                    runner.custom_properties['clip'] = clip
+                    runner.custom_properties['clip_margin'] = branch_margin
+                    for index, child in enumerate(runner.children):
+                        if child.node_type == 'osm-downloader':
+                            extractor = self.create_osmextractor_node(child, clip, branch_margin)
+                            runner.children[index] = extractor
+                            extractor.parent = runner
+                            runner.custom_properties['osm_extract'] = extractor.output
+                            break
+                    import_node.input = f"{OpenSiteConstants.OSM_SUBFOLDER}/{runner.output}"
+                else:
+                    import_node.children.append(self.create_osmboundaries_nodes())
+
+            for node in branch_nodes:
+                if node.action == 'amalgamate': node.custom_properties['clip'] = clip
+
+    def add_osm_tables(self):
+        """
+        Sets tables of OSM runners, ie. import table native OSM extractor loads each YML's layer into
+        Runners with same output are run once so each gets tables of every import fed by that output
+        Runners without concatenator, eg. for OSM boundaries, already have their tables set
+        """
+
+        runners = {}
+        for runner_dict in self.find_nodes_by_props({'node_type': 'osm-runner'}):
+            runner = self.find_node_by_urn(runner_dict['urn'])
+            if not any(child.node_type == 'osm-concatenator' for child in runner.children): continue
+            runners.setdefault(runner.output, []).append(runner)
+
+        for runner_output, shared_runners in runners.items():
+            tables = {}
+            for runner in shared_runners:
+                importer = self.find_parent(runner.urn)
+                if not importer: continue
+                for concat_node in [child for child in runner.children if child.node_type == 'osm-concatenator']:
+                    for yml_node in concat_node.children:
+                        if not yml_node.input: continue
+                        if tables.get(yml_node.output, importer.output) != importer.output:
+                            self.log.warning(f"{yml_node.output} of {runner_output} is imported into both {tables[yml_node.output]} and {importer.output}, using {importer.output}")
+                        tables[yml_node.output] = importer.output
+
+            for runner in shared_runners: runner.custom_properties['tables'] = dict(tables)
+
     def add_outputs(self):
         """
         Synthesizes output branches as independent siblings to data branches.
@@ -1056,20 +1323,35 @@ class OpenSiteGraph(Graph):
 
         # 1. Prepare format lists
         formats = self.outputformats.copy()
-        if 'gpkg' in formats:
-            formats.remove('gpkg')
-            formats.insert(0, 'gpkg')
+        if self.preview:
+            skipped_formats = [f for f in formats if f in OpenSiteConstants.PREVIEW_SKIP_FORMATS]
+            if skipped_formats: self.log.info(f"Preview build so skipping slow output formats: {', '.join(skipped_formats)}")
+            formats = [f for f in formats if f not in OpenSiteConstants.PREVIEW_SKIP_FORMATS]
+        # PMTiles are converted from mbtiles so must follow them
+        if 'pmtiles' in formats:
+            formats.remove('pmtiles')
+            formats.append('pmtiles')
 
         global_format_keys = {'web', 'qgis'}
         local_formats = [f for f in formats if f not in global_format_keys]
         global_formats = [f for f in formats if f in global_format_keys]
 
+        # Raster formats rasterise layers that feed amalgamate directly so don't wait for vector amalgamation
+        raster_format_keys = {'tif'}
+        raster_formats = [f for f in local_formats if f in raster_format_keys]
+        local_formats = [f for f in local_formats if f not in raster_format_keys]
+
         # Identify existing main branches (children of root)
         # We take a snapshot of children to avoid modifying the list while iterating
         current_branches = list(self.root.children)
         
         global_branch_custom_properties = {'structure': self.get_structure(current_branches)}
 
+        # If PMTiles are created, web map can load layers from them without tileserver
+        if 'pmtiles' in local_formats:
+            for branchstructure in global_branch_custom_properties['structure']:
+                branchstructure['pmtiles'] = f"./{OpenSiteConstants.OPENSITEENERGY_SHORTNAME}-pmtiles.json"
+
         for branch_node in current_branches:
 
             branch_code = branch_node.name
@@ -1122,7 +1404,7 @@ class OpenSiteGraph(Graph):
                 )
 
                 node_hash = hashlib.md5(f"{am_node.output}--postprocess".encode()).hexdigest()
-                postprocess_output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX}{node_hash}"
+                postprocess_output = f"{self.TABLENAME_PREFIX}{node_hash}"
 
                 # 3. Postprocess
                 postprocess_name = f"{cloned_am.name}----postprocess"
@@ -1146,7 +1428,7 @@ class OpenSiteGraph(Graph):
                 # Clip
                 if 'clip' in branch_node.custom_properties['yml']:
                     node_hash = hashlib.md5(f"{postprocess_output}--clip".encode()).hexdigest()
-                    clip_output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX}{node_hash}"
+                    clip_output = f"{self.TABLENAME_PREFIX}{node_hash}"
                     clip_name = f"{postprocess_name}{self.get_suffix_clip(branch_node.custom_properties['yml']['clip'])}"
                     clip_title = ";".join(branch_node.custom_properties['yml']['clip'])
                     clip_node = self.create_node(
@@ -1168,8 +1450,60 @@ class OpenSiteGraph(Graph):
                     current_chain_head = clip_node
                     outputs_input = clip_output
 
+                # 4. Generalised level of detail (LOD) tables for mbtiles and file formats that don't need full detail
+                # Each LOD table is generalised from previous, finer LOD table as this is much quicker than from full table
+                # Chain is only linked below final table when first format using it is added (see get_dependency)
+                generalise_nodes = []
+                if ('mbtiles' in local_formats) or (set(local_formats) & set(OpenSiteConstants.GENERALISE_FORMATS.keys())):
+                    generalised = {}
+                    generalise_input = outputs_input
+                    for tolerance in OpenSiteConstants.GENERALISE_TOLERANCES:
+                        node_hash = hashlib.md5(f"{outputs_input}--generalise-{tolerance}".encode()).hexdigest()
+                        generalise_output = f"{self.TABLENAME_PREFIX}{node_hash}"
+                        generalise_node = self.create_node(
+                            name=f"{current_logic_name}--generalise-{tolerance:g}",
+                            title=f"{current_chain_head.title} - Generalise - {tolerance:g}",
+                            action='generalise',
+                            input=generalise_input,
+                            output=generalise_output,
+                            custom_properties={**branch_node_custom_properties, 'tolerance': tolerance}
+                        )
+                        if generalise_nodes:
+                            generalise_node.children.append(generalise_nodes[-1])
+                            generalise_nodes[-1].parent = generalise_node
+                        generalise_nodes.append(generalise_node)
+                        generalised[tolerance] = generalise_output
+                        generalise_input = generalise_output
+                    output_custom_properties['generalised'] = generalised
+
                 # 5. Local Formats (gpkg, geojson, etc.)
+                # Every format is exported directly from final table, or from LOD tables, so formats fan out and run in parallel
+                # Only mbtiles and formats exported from LOD table wait for generalisation, others depend on final table only
+                # First format to depend on node depends on node itself, others on clones of it without children 
+                # as clones share global urn with node so wait for it to complete
+                final_node = current_chain_head
+                used_urns = set()
+
+                def get_dependency(node):
+                    if node.urn not in used_urns:
+                        used_urns.add(node.urn)
+                        if generalise_nodes and (node is generalise_nodes[-1]):
+                            dependency = get_dependency(final_node)
+                            generalise_nodes[0].children.append(dependency)
+                            dependency.parent = generalise_nodes[0]
+                        return node
+                    return self.create_node(
+                        name=node.name,
+                        title=node.title,
+                        format=node.format,
+                        action=node.action,
+                        input=node.input,
+                        output=node.output,
+                        custom_properties=dict(node.custom_properties)
+                    )
+
                 clean_filename_base = current_logic_name.replace("----postprocess", "")
+                fmt_nodes = {}
                 for fmt in local_formats:
                     fmt_node = self.create_node(
                         name=f"{current_logic_name}--output-{fmt}",
@@ -1179,20 +1513,63 @@ class OpenSiteGraph(Graph):
                         input=outputs_input,
                         custom_properties=output_custom_properties
                     )
-                    fmt_node.children.append(current_chain_head)
-                    current_chain_head.parent = fmt_node
-                    
                     fmt_node.output = f"{clean_filename_base}.{fmt}"
-
-                    # We use 'gpkg' files as base to convert specific file formats using ogr2ogr
-                    # so set input of all non-gpkg output nodes to output of 'gpkg' output node 
-                    if fmt in ['geojson', 'shp']: fmt_node.input = f"{clean_filename_base}.gpkg"
-
-                    current_chain_head = fmt_node
-
-                # Link the end of this pipeline to the branch collector
-                collector_node.children.append(current_chain_head)
-                current_chain_head.parent = collector_node
+                    uses_generalised = (fmt == 'mbtiles') and bool(generalise_nodes)
+
+                    if fmt in OpenSiteConstants.GENERALISE_FORMATS:
+                        generalised_table = self.db.get_generalised_table(output_custom_properties.get('generalised', {}), OpenSiteConstants.GENERALISE_FORMATS[fmt])
+                        if generalised_table: 
+                            fmt_node.input = generalised_table
+                            uses_generalised = True
+
+                    # PMTiles are only format converted from another format's file
+                    if fmt == 'pmtiles': fmt_node.input = f"{clean_filename_base}.mbtiles"
+
+                    if (fmt == 'pmtiles') and ('mbtiles' in fmt_nodes):
+                        dependency = fmt_nodes.pop('mbtiles')
+                    elif uses_generalised:
+                        dependency = get_dependency(generalise_nodes[-1])
+                    else:
+                        dependency = get_dependency(final_node)
+
+                    fmt_node.children.append(dependency)
+                    dependency.parent = fmt_node
+                    fmt_nodes[fmt] = fmt_node
+
+                # Link the end of every format pipeline to the branch collector
+                for pipeline_head in (list(fmt_nodes.values()) or [final_node]):
+                    collector_node.children.append(pipeline_head)
+                    pipeline_head.parent = collector_node
+
+                # Raster formats depend on same nodes as original amalgamate node, not on its output
+                # As with amalgamate, we clone these nodes - clones share global urn with originals so run once
+                for fmt in raster_formats:
+                    raster_custom_properties = branch_node_custom_properties.copy()
+                    if 'clip' in branch_node.custom_properties['yml']:
+                        raster_custom_properties['clip'] = branch_node.custom_properties['yml']['clip']
+                    raster_node = self.create_node(
+                        name=f"{current_logic_name}--output-{fmt}",
+                        title=f"{cloned_am.title} - Output to {fmt}",
+                        format=fmt,
+                        action='output',
+                        input=am_node.input,
+                        output=f"{clean_filename_base}.{fmt}",
+                        custom_properties=raster_custom_properties
+                    )
+                    for am_child in am_node.children:
+                        cloned_child = self.create_node(
+                            name=f"{branch_code}--{am_child.name}",
+                            title=f"{branch_code} - {am_child.title}",
+                            format=am_child.format,
+                            action=am_child.action,
+                            input=am_child.input,
+                            output=am_child.output,
+                            custom_properties=dict(am_child.custom_properties)
+                        )
+                        raster_node.children.append(cloned_child)
+                        cloned_child.parent = raster_node
+                    collector_node.children.append(raster_node)
+                    raster_node.parent = collector_node
 
             # Global Formats (web/qgis)
             # These wrap around the collector, effectively becoming the top of the branch
@@ -1244,6 +1621,9 @@ class OpenSiteGraph(Graph):
         structure = []
         defaultcolor = 'darkgrey'
 
+        # Bounds of clipping master are same for every branch so only query once
+        master_bounds = self.db.get_table_bounds(OpenSiteConstants.OPENSITE_CLIPPINGMASTER, OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_OUTPUT)
+
         for branch in branches:
 
             branch_code = branch.name
@@ -1256,7 +1636,7 @@ class OpenSiteGraph(Graph):
                 'blade-radius': branch.custom_properties['blade-radius'],
             }
             suffix, clip = '', None
-            bounds = self.db.get_table_bounds(OpenSiteConstants.OPENSITE_CLIPPINGMASTER, OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_OUTPUT)
+            bounds = master_bounds
             if 'clip' in branch.custom_properties['yml']:
                 clip = branch.custom_properties['yml']['clip']
                 title += f" clipped to '{';'.join(clip)}'"
@@ -1350,7 +1730,6 @@ class OpenSiteGraph(Graph):
         shutil.copy(OpenSiteConstants.OSM_BOUNDARIES_YML, build_osm_boundaries_yml_path)
 
         osm_downloaders = self.find_nodes_by_props({'node_type': 'osm-downloader'})
-        osm_default = self._defaults['osm']
 
         # If no clipping required on current graph, add to general output branch on all branches
         # If clipping required on current graph, add before actual clipping
@@ -1378,41 +1757,130 @@ class OpenSiteGraph(Graph):
 
         for node_urn_to_amend in node_urns_to_amend:
             node = self.find_node_by_urn(node_urn_to_amend)
-            
-            osm_downloader = self.create_node(
-                name=f"osm-downloader--{osm_default}",
-                title="Download OSM for clipping boundaries",
-                node_type="osm-downloader",
-                format="OSM",
-                input=osm_default,
-                action="download",
-                output=f"{OpenSiteConstants.OSM_SUBFOLDER}/{os.path.basename(osm_default)}",
-                custom_properties={"osm": osm_default}
-            )
+            node.children.append(self.create_osmboundaries_nodes())
 
-            osm_runner = self.create_node(
-                name=f"osm-runner--{osm_default}",
-                title="Run osm-export-tool to create clipping boundaries",
-                node_type="osm-runner",
-                input=OpenSiteConstants.OSM_BOUNDARIES_YML,
-                action="run",
-                output=OpenSiteConstants.OSM_BOUNDARIES_YML.replace('.yml', '.gpkg'),
-                custom_properties={"osm": osm_default},
-                children=[osm_downloader]
-            )
+    def create_osmboundaries_nodes(self):
+        """
+        Creates chain of nodes that downloads, extracts and imports OSM boundaries
+        Returns top-level importer node
+        """
 
-            osm_importer = self.create_node(
-                name=OpenSiteConstants.OSM_BOUNDARIES,
-                title="Import OSM clipping boundaries",
-                node_type="source",
-                input=f"{OpenSiteConstants.OSM_SUBFOLDER}/{OpenSiteConstants.OSM_BOUNDARIES}.gpkg",
-                action="import",
-                output=OpenSiteConstants.OPENSITE_OSMBOUNDARIES,
-                custom_properties={"osm": osm_default},
-                children=[osm_runner]
-            )
+        osm_default = self._defaults['osm']
+
+        osm_downloader = self.create_node(
+            name=f"osm-downloader--{osm_default}",
+            title="Download OSM for clipping boundaries",
+            node_type="osm-downloader",
+            format="OSM",
+            input=osm_default,
+            action="download",
+            output=f"{OpenSiteConstants.OSM_SUBFOLDER}/{os.path.basename(osm_default)}",
+            custom_properties={"osm": osm_default}
+        )
+
+        osm_runner = self.create_node(
+            name=f"osm-runner--{osm_default}",
+            title="Run osm-export-tool to create clipping boundaries",
+            node_type="osm-runner",
+            input=OpenSiteConstants.OSM_BOUNDARIES_YML,
+            action="run",
+            output=OpenSiteConstants.OSM_BOUNDARIES_YML.replace('.yml', f".{self.get_osm_runner_extension()}"),
+            custom_properties={
+                "osm": osm_default, 
+                "tables": {f"{OpenSiteConstants.OSM_SUBFOLDER}/{OpenSiteConstants.OSM_BOUNDARIES_YML}": OpenSiteConstants.OPENSITE_OSMBOUNDARIES}
+            },
+            children=[osm_downloader]
+        )
+
+        osm_importer = self.create_node(
+            name=OpenSiteConstants.OSM_BOUNDARIES,
+            title="Import OSM clipping boundaries",
+            node_type="source",
+            input=f"{OpenSiteConstants.OSM_SUBFOLDER}/{OpenSiteConstants.OSM_BOUNDARIES}.{self.get_osm_runner_extension()}",
+            action="import",
+            output=OpenSiteConstants.OPENSITE_OSMBOUNDARIES,
+            custom_properties={"osm": osm_default},
+            children=[osm_runner]
+        )
+
+        return osm_importer
 
-            node.children.append(osm_importer)
+    def create_osmextractor_node(self, osm_downloader, clip, margin):
+        """
+        Creates node that derives extract of OSM file covering clip area plus margin, with OSM downloader as child
+        Extract depends on boundaries to determine clip area bounds
+        Returns extractor node
+        """
+
+        osm_url = osm_downloader.custom_properties['osm']
+        osm_basename = os.path.basename(osm_url).rsplit('.osm.pbf', 1)[0]
+        area_key = json.dumps({'clip': sorted(area.lower() for area in clip), 'margin': margin})
+        area_hash = hashlib.md5(area_key.encode()).hexdigest()[0:16]
+
+        osm_extractor = self.create_node(
+            name=f"osm-extractor--{osm_url}--{area_hash}",
+            title=f"Extract OSM for {';'.join(clip)} - {os.path.basename(osm_url)}",
+            node_type="osm-extractor",
+            format="OSM",
+            input=osm_downloader.output,
+            action="extract",
+            output=self.get_osm_path(f"{osm_basename}-{area_hash}.osm.pbf"),
+            custom_properties={"osm": osm_url, "clip": clip, "clip_margin": margin},
+            children=[osm_downloader, self.create_osmboundaries_nodes()]
+        )
+        osm_downloader.parent = osm_extractor
+
+        return osm_extractor
+
+    def add_storage_policies(self):
+        """
+        Adds storage policy, ie. 'storage' section of site YAML or defaults, to every node that creates table
+        Nodes outside site branches, eg. output nodes, use storage policy from defaults
+        Where nodes share output, node that runs determines storage of shared table
+        """
+
+        def walk(node, storage):
+            if storage and (node.action in OpenSiteConstants.STORAGE_STAGES) and ('storage' not in node.custom_properties):
+                node.custom_properties['storage'] = storage
+            for child in node.children: walk(child, storage)
+
+        for branch in self.root.children:
+            storage = branch.custom_properties.get('storage') if branch.node_type == 'branch' else None
+            walk(branch, storage or self._defaults.get('storage'))
+
+    def add_spatial_engines(self):
+        """
+        Adds spatial engine, ie. 'engine' property of site YAML or defaults, to every buffer, preprocess and clip node
+        Nodes outside site branches, eg. output nodes, use engine from defaults
+        Nodes without engine use SPATIAL_ENGINE
+        """
+
+        def walk(node, engine):
+            if (node.action in OpenSiteConstants.SPATIAL_ENGINE_STAGES) and ('engine' not in node.custom_properties):
+                node.custom_properties['engine'] = engine
+            for child in node.children: walk(child, engine)
+
+        for branch in self.root.children:
+            engine = branch.custom_properties.get('engine') if branch.node_type == 'branch' else None
+            engine = engine or self._defaults.get('engine')
+            if not engine: continue
+            if engine not in OpenSiteConstants.SPATIAL_ENGINES:
+                self.log.warning(f"Unknown spatial engine '{engine}' for {branch.name}, should be one of {OpenSiteConstants.SPATIAL_ENGINES}")
+                continue
+            walk(branch, engine)
+
+    def add_preview(self):
+        """
+        Sets 'preview' property of every node if preview build
+        """
+
+        if not self.preview: return
+
+        def walk(node):
+            node.custom_properties['preview'] = True
+            for child in node.children: walk(child)
+
+        for branch in self.root.children: walk(branch)
 
     def add_installers(self):
         """
@@ -1425,6 +1893,13 @@ class OpenSiteGraph(Graph):
         osm_default = self._defaults['osm']
         current_branches = list(self.root.children)
 
+        branch_clips = set()
+        for branch_node in current_branches:
+            if branch_node.node_type != 'branch' or branch_node.custom_properties.get('branch_type') == 'outputs': continue
+            clip = branch_node.custom_properties.get('yml', {}).get('clip')
+            branch_clips.add(json.dumps(sorted(area.lower() for area in clip)) if clip else None)
+        basemap_clip = json.loads(branch_clips.pop()) if (len(branch_clips) == 1 and None not in branch_clips) else None
+
         node_urns_to_amend = []
         for branch_node in current_branches:
             if  ('branch_type' not in branch_node.custom_properties) or \
@@ -1456,8 +1931,35 @@ class OpenSiteGraph(Graph):
                 children=[osm_downloader_download_first]
             )
 
+            # If every branch is clipped to same area, generate basemap from extract of that area
+            if basemap_clip:
+                osm_extractor = self.create_osmextractor_node(osm_downloader_download_first, basemap_clip, OpenSiteConstants.CLIP_PUSHDOWN_MARGIN)
+                tileserver_installer.children = [osm_extractor]
+                tileserver_installer.custom_properties['osm_extract'] = osm_extractor.output
+
             node.children.append(tileserver_installer)
 
+            # Basemap is generated on I/O pool while constraint layers are built and only web output, 
+            # which links basemap into tileserver release, waits for it - using clone of installer without 
+            # children as clones share global urn with installer so wait for it to complete
+            def walk(current):
+                for child in list(current.children):
+                    if child.format == 'web' and child.action == 'output':
+                        installer_clone = self.create_node(
+                            name=tileserver_installer.name,
+                            title=tileserver_installer.title,
+                            format=tileserver_installer.format,
+                            input=tileserver_installer.input,
+                            action=tileserver_installer.action,
+                            output=tileserver_installer.output,
+                            custom_properties=dict(tileserver_installer.custom_properties)
+                        )
+                        child.children.append(installer_clone)
+                        installer_clone.parent = child
+                    if child is not tileserver_installer: walk(child)
+
+            walk(node)
+
     def compute_amalgamation_outputs(self, node=None):
         """
         Computes outputs of all amalgamation nodes recursively by 
@@ -1488,7 +1990,7 @@ class OpenSiteGraph(Graph):
                 node_hash = hashlib.md5(hash_payload.encode()).hexdigest()
                 
                 # Set the output field
-                node.output = f"{OpenSiteConstants.DATABASE_GENERAL_PREFIX}{node_hash}"
+                node.output = f"{self.TABLENAME_PREFIX}{node_hash}"
 
     def add_global_urns(self, node=None):
         """
@@ -4,6 +4,7 @@ import subprocess
 from pathlib import Path
 from opensite.constants import OpenSiteConstants
 from opensite.logging.base import LoggingBase
+from opensite.postgis.opensite import OpenSitePostGIS
 
 class OutputBase:
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
@@ -14,6 +15,9 @@ class OutputBase:
         self.overwrite = overwrite
         self.shared_lock = shared_lock
         self.shared_metadata = shared_metadata if shared_metadata is not None else {}
+        # Grid squares where input table has changed since output was last created
+        # Outputs that support it can use this to only update changed areas
+        self.dirty_gridsquare_ids = None
 
     def get_layer_from_file_path(self, filename):
         """
@@ -27,6 +31,15 @@ class OutputBase:
         """Main entry point for the process."""
         raise NotImplementedError("Subclasses must implement run()")
 
+    def get_output_folder(self, folder):
+        """
+        Gets output folder for node - preview builds use equivalent folder in PREVIEW_OUTPUT_FOLDER
+        so preview outputs never replace outputs of full builds
+        """
+
+        if not self.node.custom_properties.get('preview'): return Path(folder)
+        return OpenSiteConstants.PREVIEW_OUTPUT_FOLDER / Path(folder).relative_to(OpenSiteConstants.OUTPUT_FOLDER)
+
     def ensure_output_dir(self, file_path):
         """Utility to make sure the destination exists."""
         Path(file_path).parent.mkdir(parents=True, exist_ok=True)
@@ -77,6 +90,35 @@ class OutputBase:
             self.log.error(f"ogr2ogr Conversion Error: {e} Subprocess cmd: {cmd}")
             return False
 
+    def export_node_input_table(self, layer_creation_options=None, driver=None, secondary_extensions=None):
+        """
+        Exports node.input table (or fallback table if export of node.input fails) to node.output file
+        layer_creation_options and driver are passed to ogr2ogr (see OpenSitePostGIS.export_spatial_data)
+        secondary_extensions lists extensions of other files written alongside output, eg. ['dbf', 'prj', 'shx'] for SHP,
+        which are exported to temp names and moved with output file
+        """
+
+        temp_output_path = Path(self.base_path) / ('tmp-' + self.node.output)
+        final_output_path = Path(self.base_path) / self.node.output
+        temp_paths = [temp_output_path] + [temp_output_path.with_suffix(f".{extension}") for extension in (secondary_extensions or [])]
+        final_paths = [final_output_path] + [final_output_path.with_suffix(f".{extension}") for extension in (secondary_extensions or [])]
+        postgis = OpenSitePostGIS(self.log_level)
+
+        for table in [self.node.input, self.node.custom_properties.get('fallback')]:
+            if not table: continue
+            for temp_path in temp_paths:
+                if temp_path.exists(): temp_path.unlink()
+            if postgis.export_spatial_data(table, self.get_layer_from_file_path(self.node.output), temp_output_path, layer_creation_options, driver):
+                self.log.info(f"Exported temp file {temp_output_path.name} successfully, copying to {final_output_path.name}")
+                for temp_path, final_path in zip(temp_paths, final_paths):
+                    if temp_path.exists(): os.replace(temp_path, final_path)
+                return True
+
+        for temp_path in temp_paths:
+            if temp_path.exists(): temp_path.unlink()
+        self.log.error(f"Failed to export {self.node.input} to {self.node.output}")
+        return False
+
     def convert_node_input_to_output_files(self, node):
         """
         Converts node.input file to node.output file
@@ -4,16 +4,33 @@ from pathlib import Path
 from opensite.output.base import OutputBase
 from opensite.constants import OpenSiteConstants
 from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.opensite import OpenSitePostGIS
 
 class OpenSiteOutputGeoJSON(OutputBase):
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteOutputGeoJSON", log_level, shared_lock)
-        self.base_path = OpenSiteConstants.OUTPUT_LAYERS_FOLDER
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
     
     def run(self):
         """
         Runs GeoJSON output
+        If input is generalised table, exports it directly with reduced coordinate precision
+        otherwise converts GPKG file
         """
 
-        return self.convert_node_input_to_output_files(self.node)
\ No newline at end of file
+        if not self.node.input.startswith(OpenSiteConstants.DATABASE_GENERAL_PREFIX):
+            return self.convert_node_input_to_output_files(self.node)
+
+        temp_output_path = Path(self.base_path) / ('tmp-' + self.node.output)
+        final_output_path = Path(self.base_path) / self.node.output
+        if temp_output_path.exists(): temp_output_path.unlink()
+
+        postgis = OpenSitePostGIS(self.log_level)
+        layer_creation_options = [f"COORDINATE_PRECISION={OpenSiteConstants.GENERALISE_GEOJSON_PRECISION}"]
+        if not postgis.export_spatial_data(self.node.input, self.get_layer_from_file_path(self.node.output), temp_output_path, layer_creation_options):
+            self.log.error(f"Failed to export {self.node.input} to {self.node.output}")
+            return False
+
+        os.replace(temp_output_path, final_output_path)
+        return True
@@ -12,7 +12,7 @@ class OpenSiteOutputJSON(OutputBase):
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteOutputJSON", log_level, shared_lock)
-        self.base_path = OpenSiteConstants.OUTPUT_FOLDER
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_FOLDER)
         self.postgis = OpenSitePostGIS(self.log_level)
     
     def run(self):
@@ -1,7 +1,11 @@
 import json
 import logging
+import math
 import os
+import shutil
+import sqlite3
 import subprocess
+import tempfile
 from pathlib import Path
 from psycopg2 import sql, Error
 from opensite.output.base import OutputBase
@@ -13,27 +17,428 @@ class OpenSiteOutputMbtiles(OutputBase):
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteOutputMbtiles", log_level, shared_lock)
-        self.base_path = OpenSiteConstants.OUTPUT_LAYERS_FOLDER
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
         self.postgis = OpenSitePostGIS(log_level)
 
-    def run(self):
+    def get_tile_xy(self, lon, lat, zoom):
         """
-        Runs Mbtiles output
-        Creates grid clipped version of file to improve rendering and performance when used as mbtiles
+        Gets XYZ tile containing lon, lat at zoom
         """
 
-        tmp_output = f"tmp-{self.node.output.replace('.mbtiles', '.geojson')}" 
-        tmp_output_path = Path(self.base_path) / tmp_output
-        final_temp_path = Path(self.base_path) / f"tmp-{self.node.output}"
+        lat = max(min(lat, 85.0511), -85.0511)
+        n = 2 ** zoom
+        x = int((lon + 180.0) / 360.0 * n)
+        y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+        return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+    def get_tile_bounds(self, x, y, zoom):
+        """
+        Gets bounds of XYZ tile in EPSG:4326 as (left, bottom, right, top)
+        """
+
+        n = 2 ** zoom
+        def tile_lat(tile_y): return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+        return (x / n * 360.0 - 180.0, tile_lat(y + 1), (x + 1) / n * 360.0 - 180.0, tile_lat(y))
+
+    def get_dirty_tiles(self):
+        """
+        Gets XYZ tiles at MBTILES_INCREMENTAL_SPLIT_ZOOM covering grid squares where input has changed
+        """
+
+        split_zoom = OpenSiteConstants.MBTILES_INCREMENTAL_SPLIT_ZOOM
+        grid, _ = self.postgis.get_processing_grid(self.node.custom_properties.get('preview', False))
+        dbparams = {
+            "crs_output": sql.Literal(int(self.get_crs_output())),
+            "grid": sql.Identifier(grid),
+            "gridsquare_ids": sql.Literal(list(self.dirty_gridsquare_ids)),
+        }
+
+        results = self.postgis.fetch_all(sql.SQL("""
+        SELECT ST_XMin(geom) AS left, ST_YMin(geom) AS bottom, ST_XMax(geom) AS right, ST_YMax(geom) AS top 
+        FROM (SELECT ST_Transform(geom, {crs_output}) AS geom FROM {grid} WHERE id = ANY({gridsquare_ids}::int[])) gridsquares
+        """).format(**dbparams))
+
+        dirty_tiles = set()
+        for row in results:
+            left, top = self.get_tile_xy(row['left'], row['top'], split_zoom)
+            right, bottom = self.get_tile_xy(row['right'], row['bottom'], split_zoom)
+            for x in range(left, right + 1):
+                for y in range(top, bottom + 1):
+                    dirty_tiles.add((x, y))
+
+        return dirty_tiles
+
+    def get_tiles_region(self, tiles):
+        """
+        Gets SQL geometry in default CRS covering tiles at MBTILES_INCREMENTAL_SPLIT_ZOOM
+        Each tile is expanded by eighth of tile so features in tile buffers are included
+        """
+
+        polygons = []
+        for x, y in sorted(tiles):
+            left, bottom, right, top = self.get_tile_bounds(x, y, OpenSiteConstants.MBTILES_INCREMENTAL_SPLIT_ZOOM)
+            margin_x, margin_y = (right - left) / 8, (top - bottom) / 8
+            left, bottom, right, top = left - margin_x, bottom - margin_y, right + margin_x, top + margin_y
+            polygons.append(f"(({left} {bottom}, {right} {bottom}, {right} {top}, {left} {top}, {left} {bottom}))")
+
+        return sql.SQL("ST_Transform(ST_GeomFromText({wkt}, {crs_output}), {crs})").format(
+            wkt=sql.Literal(f"MULTIPOLYGON({', '.join(polygons)})"),
+            crs_output=sql.Literal(int(self.get_crs_output())),
+            crs=sql.Literal(int(self.get_crs_default())))
+
+    def get_max_zoom(self):
+        """
+        Gets maximum zoom of mbtiles
+        Preview builds stop at lower zoom as most tippecanoe time is spent on highest zooms
+        """
+
+        if self.node.custom_properties.get('preview'): return min(OpenSiteConstants.MBTILES_MAX_ZOOM, OpenSiteConstants.PREVIEW_MBTILES_MAX_ZOOM)
+        return OpenSiteConstants.MBTILES_MAX_ZOOM
+
+    def get_zoom_table(self, zoom):
+        """
+        Gets table to create tiles at zoom from, ie. generalised table for zoom band containing zoom
+        or input table if there is no suitable generalised table
+        """
+
+        generalised = self.node.custom_properties.get('generalised')
+        if not generalised: return self.node.input
+
+        bands = [band for band in OpenSiteConstants.MBTILES_GENERALISE_BANDS if band[0] <= zoom]
+        if not bands: return self.node.input
+
+        return self.postgis.get_generalised_table(generalised, max(bands)[1]) or self.node.input
+
+    def get_zoom_bands(self, minzoom, maxzoom):
+        """
+        Gets list of (minzoom, maxzoom, table) zoom bands covering minzoom to maxzoom
+        Consecutive zooms using same table are combined into single band
+        """
+
+        bands = []
+        for zoom in range(minzoom, maxzoom + 1):
+            table = self.get_zoom_table(zoom)
+            if bands and bands[-1][2] == table: bands[-1] = (bands[-1][0], zoom, table)
+            else: bands.append((zoom, zoom, table))
+
+        return bands
+
+    def merge_zoom_bands(self, mbtiles_path, band_mbtiles_paths):
+        """
+        Adds tiles of other zoom bands from band_mbtiles_paths to mbtiles_path 
+        and updates zoom range in metadata of mbtiles_path to cover all bands
+        """
+
+        conn = sqlite3.connect(str(mbtiles_path))
+        try:
+            for band_mbtiles_path in band_mbtiles_paths:
+                conn.execute("ATTACH DATABASE ? AS band", (str(band_mbtiles_path), ))
+                conn.execute("INSERT INTO main.tiles (zoom_level, tile_column, tile_row, tile_data) \
+                              SELECT zoom_level, tile_column, tile_row, tile_data FROM band.tiles")
+                conn.commit()
+                conn.execute("DETACH DATABASE band")
+
+            minzoom, maxzoom = conn.execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles").fetchone()
+            conn.execute("UPDATE metadata SET value = ? WHERE name = 'minzoom'", (str(minzoom), ))
+            conn.execute("UPDATE metadata SET value = ? WHERE name = 'maxzoom'", (str(maxzoom), ))
+
+            result = conn.execute("SELECT value FROM metadata WHERE name = 'json'").fetchone()
+            if result:
+                metadata_json = json.loads(result[0])
+                for vector_layer in metadata_json.get('vector_layers', []):
+                    vector_layer['minzoom'], vector_layer['maxzoom'] = minzoom, maxzoom
+                conn.execute("UPDATE metadata SET value = ? WHERE name = 'json'", (json.dumps(metadata_json), ))
+
+            conn.commit()
+        finally:
+            conn.close()
+
+    def is_mergeable(self, mbtiles_path):
+        """
+        Checks whether existing mbtiles stores tiles in plain 'tiles' table so tiles can be replaced in place
+        """
+
+        try:
+            with sqlite3.connect(str(mbtiles_path)) as conn:
+                result = conn.execute("SELECT type FROM sqlite_master WHERE name = 'tiles'").fetchone()
+                return (result is not None) and (result[0] == 'table')
+        except sqlite3.Error:
+            return False
+
+    def ensure_features(self, geojson_path):
+        """
+        Check for no features as GeoJSON with no features causes problem for tippecanoe
+        If no features, add dummy point so Tippecanoe creates mbtiles
+        """
+
+        geojson_path_str = str(geojson_path)
+        if os.path.getsize(geojson_path_str) < 1000:
+            with open(geojson_path_str, "r") as json_file: geojson_content = json.load(json_file)
+            if ('features' not in geojson_content) or (len(geojson_content['features']) == 0):
+                geojson_content['features'] = \
+                [
+                    {
+                        "type":"Feature", 
+                        "properties": {}, 
+                        "geometry": 
+                        {
+                            "type": "Point", 
+                            "coordinates": [0,0]
+                        }
+                    }
+                ]
+                with open(geojson_path_str, "w") as json_file: json.dump(geojson_content, json_file)
+
+    def has_features(self, table):
+        """
+        Checks whether table has any features
+        """
+
+        results = self.postgis.fetch_all(sql.SQL("SELECT EXISTS (SELECT 1 FROM {table}) AS has_features").format(table=sql.Identifier(table)))
+        return bool(results) and results[0]['has_features']
+
+    def create_tiles(self, table, geojson_path, mbtiles_path, dataset_name, minzoom, maxzoom):
+        """
+        Creates mbtiles for zoom range from table
+        If MBTILES_STREAMING, features are streamed from PostGIS straight into tippecanoe
+        otherwise table is exported to temporary GeoJSON file first
+        Tables without features are always exported to file as tippecanoe needs dummy feature (see ensure_features)
+        """
+
+        if OpenSiteConstants.MBTILES_STREAMING and self.has_features(table):
+            self.run_tippecanoe(None, mbtiles_path, dataset_name, minzoom, maxzoom, stream_table=table)
+            return True
+
+        if not self.postgis.export_spatial_data(table, dataset_name, str(geojson_path)): return False
+        try:
+            self.run_tippecanoe(geojson_path, mbtiles_path, dataset_name, minzoom, maxzoom)
+        finally:
+            if Path(geojson_path).exists(): os.remove(str(geojson_path))
+
+        return True
+
+    def run_streaming(self, table, dataset_name, cmd, mbtiles_path):
+        """
+        Runs tippecanoe command cmd with features of table streamed through pipe as newline-delimited GeoJSON
+        so export and tiling overlap and no temporary GeoJSON file is written
+        Raises CalledProcessError if either export or tippecanoe fails, after removing any partial mbtiles
+        """
+
+        export_cmd = self.postgis.get_export_command(table, dataset_name, "/vsistdout/", driver="GeoJSONSeq")
+
+        # Export errors go to temporary file rather than pipe so exporter never blocks on full stderr pipe
+        with tempfile.TemporaryFile() as export_stderr:
+            exporter = subprocess.Popen(export_cmd, stdout=subprocess.PIPE, stderr=export_stderr)
+            try:
+                tippecanoe = subprocess.Popen(cmd, stdin=exporter.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+            except Exception:
+                exporter.kill()
+                exporter.wait()
+                raise
+
+            # Close our end of pipe so exporter gets SIGPIPE if tippecanoe exits early
+            exporter.stdout.close()
+            tippecanoe_stdout, tippecanoe_stderr = tippecanoe.communicate()
+            if tippecanoe.returncode != 0 and exporter.poll() is None: exporter.kill()
+            exporter.wait()
+
+            export_stderr.seek(0)
+            export_error = export_stderr.read().decode('utf-8', errors='replace')
+
+        if tippecanoe.returncode == 0 and exporter.returncode == 0: return
+
+        # Tiles from failed or truncated stream are incomplete so never keep them
+        if Path(mbtiles_path).exists(): Path(mbtiles_path).unlink()
+
+        if tippecanoe.returncode != 0:
+            raise subprocess.CalledProcessError(tippecanoe.returncode, cmd, output=tippecanoe_stdout, stderr=tippecanoe_stderr)
+        raise subprocess.CalledProcessError(exporter.returncode, export_cmd, stderr=export_error)
+
+    def run_tippecanoe(self, geojson_path, mbtiles_path, dataset_name, minzoom, maxzoom, stream_table=None):
+        """
+        Runs tippecanoe on GeoJSON file to create mbtiles for zoom range
+        If stream_table set, features of stream_table are streamed into tippecanoe instead (see run_streaming)
+        """
+
+        if stream_table is None: self.ensure_features(geojson_path)
+
+        # Dropping and coalescing small features is normally only used if tippecanoe fails
+        # but for very large datasets use from outset to avoid expensive failed first run
+        stats = self.postgis.get_table_stats(self.node.input)
+        heavy = stats is not None and stats['total_vertices'] > OpenSiteConstants.MBTILES_HEAVY_VERTICES
+
+        cmd = [
+            "tippecanoe", 
+            f"-Z{minzoom}", f"-z{maxzoom}", 
+            "-B8",
+            "-X", 
+            "--generate-ids", 
+            "--force", 
+            "-n", dataset_name, 
+            "-l", dataset_name, 
+            "-o", str(mbtiles_path) 
+        ]
+
+        # Streamed input is line-delimited so tippecanoe can read it in parallel
+        if stream_table is None:    cmd.insert(cmd.index("-o"), str(geojson_path))
+        else:                       cmd.insert(cmd.index("-o"), "-P")
+
+        def execute():
+            if stream_table is None:    subprocess.run(cmd, capture_output=True, text=True, check=True)
+            else:                       self.run_streaming(stream_table, dataset_name, cmd, mbtiles_path)
+
+        def add_drop_options():
+            idx = cmd.index("-X")
+            cmd.insert(idx + 1, "--drop-smallest-as-needed")
+            cmd.insert(idx + 1, "--coalesce-smallest-as-needed")
+
+        if heavy:
+            self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] {stats['total_vertices']} vertices so dropping and coalescing smallest features as needed")
+            add_drop_options()
+
+        source_name = f"streamed {stream_table}" if stream_table else Path(geojson_path).name
+        self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] Running tippecanoe on {source_name} to create {Path(mbtiles_path).name}")
+
+        try:
+            execute()
+        except subprocess.CalledProcessError as e:
+            # If initial tippecanoe fails (rare), modify and retry
+            if heavy: raise
+            add_drop_options()
+            execute()
+
+    def merge_tiles(self, mbtiles_path, low_mbtiles_path, high_mbtiles_path, dirty_tiles):
+        """
+        Replaces tiles in mbtiles_path:
+        - All tiles below MBTILES_INCREMENTAL_SPLIT_ZOOM are replaced with tiles from low_mbtiles_path 
+        - Tiles at or above MBTILES_INCREMENTAL_SPLIT_ZOOM within dirty_tiles are replaced with tiles from high_mbtiles_path
+        MBTiles rows are TMS so are flipped before comparing with XYZ dirty_tiles
+        """
+
+        split_zoom = OpenSiteConstants.MBTILES_INCREMENTAL_SPLIT_ZOOM
+        in_dirty_tiles = """
+        ((tile_column >> (zoom_level - :split_zoom)), ((((1 << zoom_level) - 1) - tile_row) >> (zoom_level - :split_zoom))) 
+        IN (SELECT x, y FROM dirty_tiles)"""
+
+        conn = sqlite3.connect(str(mbtiles_path))
+        try:
+            conn.execute("ATTACH DATABASE ? AS low", (str(low_mbtiles_path), ))
+            conn.execute("ATTACH DATABASE ? AS high", (str(high_mbtiles_path), ))
+            conn.execute("CREATE TEMP TABLE dirty_tiles (x INTEGER, y INTEGER, PRIMARY KEY (x, y))")
+            conn.executemany("INSERT INTO dirty_tiles (x, y) VALUES (?, ?)", sorted(dirty_tiles))
+            conn.execute("DELETE FROM main.tiles WHERE zoom_level < :split_zoom", {'split_zoom': split_zoom})
+            conn.execute("INSERT INTO main.tiles (zoom_level, tile_column, tile_row, tile_data) \
+                          SELECT zoom_level, tile_column, tile_row, tile_data FROM low.tiles WHERE zoom_level < :split_zoom", {'split_zoom': split_zoom})
+            conn.execute(f"DELETE FROM main.tiles WHERE zoom_level >= :split_zoom AND {in_dirty_tiles}", {'split_zoom': split_zoom})
+            conn.execute(f"INSERT INTO main.tiles (zoom_level, tile_column, tile_row, tile_data) \
+                           SELECT zoom_level, tile_column, tile_row, tile_data FROM high.tiles WHERE zoom_level >= :split_zoom AND {in_dirty_tiles}", {'split_zoom': split_zoom})
+            conn.commit()
+        finally:
+            conn.close()
+
+    def run_incremental(self):
+        """
+        Updates existing mbtiles where input has changed in some grid squares only
+        - Tiles at or above MBTILES_INCREMENTAL_SPLIT_ZOOM are only regenerated within tile range of changed grid squares
+        - Tiles below MBTILES_INCREMENTAL_SPLIT_ZOOM are regenerated from whole dataset
+        Both sets of tiles are created in same zoom bands as full build (see get_zoom_bands) so updated mbtiles matches new build
+        """
+
+        split_zoom, max_zoom = OpenSiteConstants.MBTILES_INCREMENTAL_SPLIT_ZOOM, self.get_max_zoom()
+        if not (OpenSiteConstants.MBTILES_MIN_ZOOM < split_zoom <= max_zoom): return False
+
+        dataset_name = self.node.output.replace('.mbtiles', '')
         final_output_path = Path(self.base_path) / self.node.output
-        grid_table = OpenSiteConstants.OPENSITE_GRIDOUTPUT
+        merge_temp_path = Path(self.base_path) / f"tmp-merge-{self.node.output}"
+        low_bands = self.get_zoom_bands(OpenSiteConstants.MBTILES_MIN_ZOOM, split_zoom - 1)
+        low_geojson_paths = [Path(self.base_path) / f"tmp-low-{index}-{dataset_name}.geojson" for index in range(len(low_bands))]
+        low_mbtiles_paths = [Path(self.base_path) / f"tmp-low-{index}-{self.node.output}" for index in range(len(low_bands))]
+        high_bands = self.get_zoom_bands(split_zoom, max_zoom)
+        high_geojson_paths = [Path(self.base_path) / f"tmp-high-{index}-{dataset_name}.geojson" for index in range(len(high_bands))]
+        high_mbtiles_paths = [Path(self.base_path) / f"tmp-high-{index}-{self.node.output}" for index in range(len(high_bands))]
         scratch_table_1 = f"tmp_1_{self.node.input}_{self.node.urn}"
         refined_grid = f"customgrid_{self.node.input}_{self.node.urn}"
+        temp_paths = [merge_temp_path] + low_geojson_paths + low_mbtiles_paths + high_geojson_paths + high_mbtiles_paths
+
+        def cleanup():
+            for path in temp_paths:
+                if path.exists(): path.unlink()
+
+        if not self.is_mergeable(final_output_path):
+            self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] Existing {final_output_path.name} does not allow tiles to be replaced, recreating it")
+            return False
+
+        try:
+            cleanup()
+
+            dirty_tiles = self.get_dirty_tiles()
+            self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] Input changed in {len(self.dirty_gridsquare_ids)} grid square(s), regenerating {len(dirty_tiles)} tile range(s) at zoom {OpenSiteConstants.MBTILES_INCREMENTAL_SPLIT_ZOOM}+")
+
+            # High zoom tiles: gridify and export only features around changed tiles
+            region = self.get_tiles_region(dirty_tiles)
+            for index, (band_minzoom, band_maxzoom, band_table) in enumerate(high_bands):
+                if not self.create_gridded_table(scratch_table_1, refined_grid, region, band_table): 
+                    cleanup()
+                    return False
+                created = self.create_tiles(scratch_table_1, high_geojson_paths[index], high_mbtiles_paths[index], dataset_name, band_minzoom, band_maxzoom)
+                self.postgis.drop_table(scratch_table_1)
+                self.postgis.drop_table(refined_grid)
+                if not created:
+                    cleanup()
+                    return False
+
+            # Low zoom tiles: whole dataset but only few tiles
+            for index, (band_minzoom, band_maxzoom, band_table) in enumerate(low_bands):
+                if not self.create_tiles(band_table, low_geojson_paths[index], low_mbtiles_paths[index], dataset_name, band_minzoom, band_maxzoom):
+                    cleanup()
+                    return False
+
+            if len(high_bands) > 1: self.merge_zoom_bands(high_mbtiles_paths[-1], high_mbtiles_paths[:-1])
+            if len(low_bands) > 1: self.merge_zoom_bands(low_mbtiles_paths[-1], low_mbtiles_paths[:-1])
+
+            # Merge into copy of existing file so existing file is untouched if merge fails
+            shutil.copyfile(str(final_output_path), str(merge_temp_path))
+            self.merge_tiles(merge_temp_path, low_mbtiles_paths[-1], high_mbtiles_paths[-1], dirty_tiles)
+            os.replace(str(merge_temp_path), str(final_output_path))
+            cleanup()
+
+            self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] COMPLETED incremental update of {final_output_path.name}")
+            return True
+
+        except subprocess.CalledProcessError as e:
+            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Tippecanoe error during incremental update {e.stderr}")
+        except (Error, sqlite3.Error) as e:
+            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Database error during incremental update: {e}")
+        except Exception as e:
+            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Unexpected error during incremental update: {e}")
+
+        cleanup()
+        return False
+
+    def create_gridded_table(self, scratch_table_1, refined_grid, region=None, input_table=None):
+        """
+        Creates grid clipped version of input (or input_table if set) in scratch_table_1 using data-size-dependent grid
+        If region set, only output grid squares intersecting region are used
+        """
+
+        grid_table = OpenSiteConstants.OPENSITE_GRIDOUTPUT
+        input_table = input_table or self.node.input
+
+        # Grid squares are only split if they contain more than cutoff vertices
+        # so if whole dataset is below cutoff, skip splitting altogether
+        cutoff, max_depth = OpenSiteConstants.MBTILES_GRID_CUTOFF_VERTICES, 3
+        stats = self.postgis.get_table_stats(input_table)
+        if stats and stats['total_vertices'] <= cutoff:
+            self.log.debug(f"[OpenSiteOutputMbtiles] [{self.node.name}] Only {stats['total_vertices']} vertices so using unsplit output grid")
+            max_depth = 0
 
         dbparams = {
+            "cutoff": sql.Literal(cutoff),
+            "max_depth": sql.Literal(max_depth),
             "crs": sql.Literal(self.get_crs_default()),
             "grid": sql.Identifier(grid_table),
-            "input": sql.Identifier(self.node.input),
+            "grid_filter": sql.SQL("TRUE") if region is None else sql.SQL("ST_Intersects(geom, {region})").format(region=region),
+            "input": sql.Identifier(input_table),
             "scratch1": sql.Identifier(scratch_table_1),
             "scratch1_index": sql.Identifier(f"{scratch_table_1}_idx"),
             "refined_grid": sql.Identifier(refined_grid),
@@ -43,9 +448,6 @@ class OpenSiteOutputMbtiles(OutputBase):
         # Drop scratch table and custom grid
         self.postgis.drop_table(scratch_table_1)
         self.postgis.drop_table(refined_grid)
-
-        if tmp_output_path.exists(): tmp_output_path.unlink()
-
         query_refined_grid = sql.SQL("""
 SET work_mem = '1GB';
 SET temp_buffers = '2GB';
@@ -53,8 +455,8 @@ SET max_parallel_workers_per_gather = 4;
 
 DO $$
 DECLARE
-    cutoff INT := 600000;
-    max_depth INT := 3;
+    cutoff INT := {cutoff};
+    max_depth INT := {max_depth};
     current_depth INT := 0;
     cells_remaining INT;
 BEGIN
@@ -62,7 +464,7 @@ BEGIN
     DROP TABLE IF EXISTS private_grid_workspace;
     CREATE TEMP TABLE private_grid_workspace AS 
     SELECT geom, id as coarse_id, 0 as depth, FALSE as finalized 
-    FROM {grid};
+    FROM {grid} WHERE {grid_filter};
 
     CREATE INDEX idx_workspace_gist ON private_grid_workspace USING GIST (geom);
 
@@ -242,63 +644,65 @@ END $$;
         try:
             self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] Cutting up output into grid squares")
 
-            dataset_name = self.node.output.replace('.mbtiles', '')
             # Create data-size-dependent grid so Tippecanoe/Maplibre don't 'blotch' up features
             self.postgis.execute_query(query_refined_grid)
             self.postgis.execute_query(query_refined_grid_index)
             self.postgis.execute_query(query_scratch_table_1_gridify)
             self.postgis.execute_query(query_scratch_table_1_index)
-            self.postgis.export_spatial_data(scratch_table_1, dataset_name, str(tmp_output_path))
-            # self.postgis.drop_table(scratch_table_1)
-            # self.postgis.drop_table(refined_grid)
-
-            # Check for no features as GeoJSON with no features causes problem for tippecanoe
-            # If no features, add dummy point so Tippecanoe creates mbtiles
-
-            tmp_output_path_str = str(tmp_output_path)
-            if os.path.getsize(tmp_output_path_str) < 1000:
-                with open(tmp_output_path_str, "r") as json_file: geojson_content = json.load(json_file)
-                if ('features' not in geojson_content) or (len(geojson_content['features']) == 0):
-                    geojson_content['features'] = \
-                    [
-                        {
-                            "type":"Feature", 
-                            "properties": {}, 
-                            "geometry": 
-                            {
-                                "type": "Point", 
-                                "coordinates": [0,0]
-                            }
-                        }
-                    ]
-                    with open(tmp_output_path_str, "w") as json_file: json.dump(geojson_content, json_file)
-
-            # Run Tippecanoe
-            cmd = [
-                "tippecanoe", 
-                "-Z4", "-z15", 
-                "-B8",
-                "-X", 
-                "--generate-ids", 
-                "--force", 
-                "-n", dataset_name, 
-                "-l", dataset_name, 
-                tmp_output_path_str, 
-                "-o", str(final_temp_path) 
-            ]
-
-            self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] Running tippecanoe on {tmp_output_path_str} to create {final_temp_path.name}")
+            return True
 
-            try:
-                subprocess.run(cmd, capture_output=True, text=True, check=True)
-            except subprocess.CalledProcessError as e:
-                # If initial tippecanoe fails (rare), modify and retry
-                idx = cmd.index("-X")
-                cmd.insert(idx + 1, "--drop-smallest-as-needed")
-                cmd.insert(idx + 1, "--coalesce-smallest-as-needed")
-                subprocess.run(cmd, capture_output=True, text=True, check=True)
+        except Error as e:
+            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] PostGIS error during gridify: {e}")
+            return False
 
-            if tmp_output_path.exists(): os.remove(str(tmp_output_path))
+    def run(self):
+        """
+        Runs Mbtiles output
+        Creates grid clipped version of file to improve rendering and performance when used as mbtiles
+        Tiles are created in zoom bands, each from generalised table detailed enough for band (see get_zoom_bands)
+        Highest band is created from grid clipped table and lower bands are merged into it
+        If only some grid squares of input have changed, existing mbtiles is updated incrementally
+        """
+
+        dataset_name = self.node.output.replace('.mbtiles', '')
+        final_temp_path = Path(self.base_path) / f"tmp-{self.node.output}"
+        final_output_path = Path(self.base_path) / self.node.output
+        scratch_table_1 = f"tmp_1_{self.node.input}_{self.node.urn}"
+        refined_grid = f"customgrid_{self.node.input}_{self.node.urn}"
+
+        if self.dirty_gridsquare_ids and final_output_path.exists():
+            if self.run_incremental(): return True
+            self.log.warning(f"[OpenSiteOutputMbtiles] [{self.node.name}] Incremental update not possible, recreating whole mbtiles")
+
+        bands = self.get_zoom_bands(OpenSiteConstants.MBTILES_MIN_ZOOM, self.get_max_zoom())
+        band_geojson_paths = [Path(self.base_path) / f"tmp-band-{index}-{dataset_name}.geojson" for index in range(len(bands))]
+        band_mbtiles_paths = [Path(self.base_path) / f"tmp-band-{index}-{self.node.output}" for index in range(len(bands))]
+        temp_paths = band_geojson_paths + band_mbtiles_paths
+
+        def cleanup():
+            for path in temp_paths:
+                if path.exists(): path.unlink()
+
+        try:
+            cleanup()
+
+            for index, (band_minzoom, band_maxzoom, band_table) in enumerate(bands):
+                self.log.info(f"[OpenSiteOutputMbtiles] [{self.node.name}] Creating zoom {band_minzoom}-{band_maxzoom} tiles from {band_table}")
+
+                # Highest zoom band is created from grid clipped table to improve rendering
+                if index == len(bands) - 1:
+                    if not self.create_gridded_table(scratch_table_1, refined_grid, input_table=band_table): 
+                        cleanup()
+                        return False
+                    band_table = scratch_table_1
+
+                if not self.create_tiles(band_table, band_geojson_paths[index], band_mbtiles_paths[index], dataset_name, band_minzoom, band_maxzoom):
+                    cleanup()
+                    return False
+
+            if len(bands) > 1: self.merge_zoom_bands(band_mbtiles_paths[-1], band_mbtiles_paths[:-1])
+            os.replace(str(band_mbtiles_paths[-1]), str(final_temp_path))
+            cleanup()
 
             self.log.info(f"Created temp file {final_temp_path.name} successfully, copying to {final_output_path.name}")
             os.replace(str(final_temp_path), str(final_output_path))
@@ -308,13 +712,13 @@ END $$;
             return True
 
         except subprocess.CalledProcessError as e:
-            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Tippecanoe error {cmd} {e.stderr}")
-            return False
+            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Tippecanoe error {e.cmd} {e.stderr}")
         except Error as e:
             self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] PostGIS error during gridify: {e}")
-            return False
+        except sqlite3.Error as e:
+            self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Database error merging zoom bands: {e}")
         except Exception as e:
             self.log.error(f"[OpenSiteOutputMbtiles] [{self.node.name}] Unexpected error: {e}")
-            return False
 
-        return False
\ No newline at end of file
+        cleanup()
+        return False
@@ -0,0 +1,345 @@
+import gzip
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from psycopg2 import sql, Error
+from opensite.output.mbtiles import OpenSiteOutputMbtiles
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.base import PostGISBase
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class OpenSiteOutputMVT(OpenSiteOutputMbtiles):
+    """
+    In-database mbtiles engine
+    Tiles are generated directly by PostGIS using ST_AsMVT, several tiles per query on parallel connections,
+    and written to mbtiles SQLite file in batches so no intermediate GeoJSON or tippecanoe run is needed
+    Only tiles within output grid squares containing features are queried and empty tiles are never written
+    """
+
+    def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
+        super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
+        self.log = OpenSiteLogger("OpenSiteOutputMVT", log_level, shared_lock)
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
+        self.postgis = OpenSitePostGIS(log_level)
+        self.thread_local = threading.local()
+        self.thread_connections = []
+        self.thread_connections_lock = threading.Lock()
+
+    def get_thread_postgis(self):
+        """
+        Gets PostGIS connection of current thread
+        Each thread uses its own connection as connection pool is not thread-safe
+        """
+
+        postgis = getattr(self.thread_local, 'postgis', None)
+        if postgis is None:
+            postgis = PostGISBase(self.log_level, use_pool=False)
+            self.thread_local.postgis = postgis
+            with self.thread_connections_lock: self.thread_connections.append(postgis)
+        return postgis
+
+    def close_thread_connections(self):
+        """
+        Closes PostGIS connections of all worker threads
+        """
+
+        with self.thread_connections_lock:
+            for postgis in self.thread_connections: postgis.close_connection()
+            self.thread_connections = []
+        self.thread_local = threading.local()
+
+    def get_data_gridsquares(self, table):
+        """
+        Gets bounds in output CRS of output grid squares containing features of table
+        Tiles outside these grid squares are empty so are never queried
+        """
+
+        dbparams = {
+            "crs_output": sql.Literal(int(self.get_crs_output())),
+            "grid": sql.Identifier(OpenSiteConstants.OPENSITE_GRIDOUTPUT),
+            "table": sql.Identifier(table),
+        }
+
+        return self.postgis.fetch_all(sql.SQL("""
+        SELECT ST_XMin(geom) AS left, ST_YMin(geom) AS bottom, ST_XMax(geom) AS right, ST_YMax(geom) AS top
+        FROM
+        (
+            SELECT ST_Transform(grid.geom, {crs_output}) AS geom FROM {grid} grid
+            WHERE EXISTS (SELECT 1 FROM {table} layer WHERE ST_Intersects(layer.geom, grid.geom))
+        ) gridsquares
+        """).format(**dbparams))
+
+    def get_dirty_gridsquare_bounds(self):
+        """
+        Gets bounds in output CRS of processing grid squares where input has changed
+        """
+
+        grid, _ = self.postgis.get_processing_grid(self.node.custom_properties.get('preview', False))
+        dbparams = {
+            "crs_output": sql.Literal(int(self.get_crs_output())),
+            "grid": sql.Identifier(grid),
+            "gridsquare_ids": sql.Literal(list(self.dirty_gridsquare_ids)),
+        }
+
+        return self.postgis.fetch_all(sql.SQL("""
+        SELECT ST_XMin(geom) AS left, ST_YMin(geom) AS bottom, ST_XMax(geom) AS right, ST_YMax(geom) AS top
+        FROM (SELECT ST_Transform(geom, {crs_output}) AS geom FROM {grid} WHERE id = ANY({gridsquare_ids}::int[])) gridsquares
+        """).format(**dbparams))
+
+    def get_gridsquare_tiles(self, gridsquares, zoom, margin=0):
+        """
+        Gets XYZ tiles at zoom covering bounds of gridsquares, extended by margin tiles on every side
+        """
+
+        n, tiles = 2 ** zoom, set()
+        for row in gridsquares:
+            left, top = self.get_tile_xy(row['left'], row['top'], zoom)
+            right, bottom = self.get_tile_xy(row['right'], row['bottom'], zoom)
+            for x in range(max(left - margin, 0), min(right + margin, n - 1) + 1):
+                for y in range(max(top - margin, 0), min(bottom + margin, n - 1) + 1):
+                    tiles.add((x, y))
+
+        return tiles
+
+    def get_tile_batches(self, table, zoom, tiles):
+        """
+        Splits tiles into batches of MVT_TILES_PER_QUERY tiles, each generated by single query
+        Tiles are sorted so each batch covers compact area and shares index pages
+        """
+
+        tiles, size = sorted(tiles), OpenSiteConstants.MVT_TILES_PER_QUERY
+        return [(table, zoom, tiles[index:index + size]) for index in range(0, len(tiles), size)]
+
+    def create_tile_batch(self, table, zoom, tiles, layer_name):
+        """
+        Creates vector tiles for batch of XYZ tiles at zoom from table in single query
+        Features are clipped to tile in default CRS before being projected so large polygons are never projected in full
+        Returns list of (zoom_level, tile_column, tile_row, tile_data) rows for mbtiles with TMS rows and gzipped tiles
+        Tiles without features are not returned
+        """
+
+        postgis = self.get_thread_postgis()
+        extent, buffer = OpenSiteConstants.MVT_EXTENT, OpenSiteConstants.MVT_BUFFER
+        dbparams = {
+            "crs": sql.Literal(int(self.get_crs_default())),
+            "table": sql.Identifier(table),
+            "zoom": sql.Literal(zoom),
+            "xs": sql.Literal([x for x, _ in tiles]),
+            "ys": sql.Literal([y for _, y in tiles]),
+            "layer_name": sql.Literal(layer_name),
+            "extent": sql.Literal(extent),
+            "buffer": sql.Literal(buffer),
+            # Clip box is tile plus tile buffer plus extra margin for curvature of projected tile edges
+            "margin": sql.Literal(2 * buffer / extent),
+        }
+
+        results = postgis.fetch_all(sql.SQL("""
+        SELECT tiles.x, tiles.y, ST_AsMVT(mvt, {layer_name}, {extent}, 'geom') AS tile
+        FROM
+        (
+            SELECT
+                x, y,
+                ST_TileEnvelope({zoom}, x, y) AS envelope,
+                ST_Envelope(ST_Transform(ST_TileEnvelope({zoom}, x, y, margin => {margin}), {crs})) AS clip_box
+            FROM unnest({xs}::int[], {ys}::int[]) AS t(x, y)
+        ) tiles
+        CROSS JOIN LATERAL
+        (
+            SELECT ST_AsMVTGeom(ST_Transform(ST_ClipByBox2D(layer.geom, Box2D(tiles.clip_box)), 3857), tiles.envelope, {extent}, {buffer}, true) AS geom
+            FROM {table} layer WHERE layer.geom && tiles.clip_box
+        ) mvt
+        WHERE mvt.geom IS NOT NULL
+        GROUP BY tiles.x, tiles.y
+        """).format(**dbparams))
+
+        rows = []
+        for row in results:
+            tile = bytes(row['tile']) if row['tile'] is not None else b''
+            if not tile: continue
+            rows.append((zoom, row['x'], (2 ** zoom - 1) - row['y'], gzip.compress(tile)))
+
+        return rows
+
+    def create_mbtiles(self, mbtiles_path):
+        """
+        Creates empty mbtiles with plain 'tiles' table so tiles can later be replaced in place
+        """
+
+        if Path(mbtiles_path).exists(): Path(mbtiles_path).unlink()
+        conn = sqlite3.connect(str(mbtiles_path))
+        try:
+            conn.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+            conn.execute("CREATE UNIQUE INDEX name ON metadata (name)")
+            conn.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+            conn.execute("CREATE UNIQUE INDEX tile_index ON tiles (zoom_level, tile_column, tile_row)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def write_metadata(self, mbtiles_path, dataset_name):
+        """
+        Writes mbtiles metadata matching that written by tippecanoe so styles and tileserver config work with either engine
+        Zoom range is taken from tiles actually written
+        """
+
+        bounds = self.postgis.get_table_bounds(self.node.input, OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_OUTPUT)
+        if not bounds or bounds['left'] is None: bounds = {'left': -180.0, 'bottom': -85.0511, 'right': 180.0, 'top': 85.0511}
+
+        conn = sqlite3.connect(str(mbtiles_path))
+        try:
+            minzoom, maxzoom = conn.execute("SELECT MIN(zoom_level), MAX(zoom_level) FROM tiles").fetchone()
+            if minzoom is None: minzoom, maxzoom = OpenSiteConstants.MBTILES_MIN_ZOOM, self.get_max_zoom()
+
+            vector_layer = {'id': dataset_name, 'description': '', 'minzoom': minzoom, 'maxzoom': maxzoom, 'fields': {}}
+            metadata = {
+                'name': dataset_name,
+                'description': dataset_name,
+                'version': '2',
+                'type': 'overlay',
+                'format': 'pbf',
+                'generator': 'opensite ST_AsMVT',
+                'minzoom': str(minzoom),
+                'maxzoom': str(maxzoom),
+                'bounds': f"{bounds['left']:.6f},{bounds['bottom']:.6f},{bounds['right']:.6f},{bounds['top']:.6f}",
+                'center': f"{(bounds['left'] + bounds['right']) / 2:.6f},{(bounds['bottom'] + bounds['top']) / 2:.6f},{minzoom}",
+                'json': json.dumps({'vector_layers': [vector_layer]}),
+            }
+
+            conn.executemany("INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)", list(metadata.items()))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def write_tiles(self, mbtiles_path, batches, layer_name, delete_tiles=None):
+        """
+        Creates tiles for all batches on MVT_WORKERS parallel connections and writes them to mbtiles_path
+        Tiles are inserted in transactions of MVT_INSERT_BATCH tiles as batches complete
+        If delete_tiles set, these (zoom, x, y) XYZ tiles are removed first in same transaction as first inserts
+        Returns number of tiles written
+        """
+
+        conn = sqlite3.connect(str(mbtiles_path))
+        written, pending = 0, []
+
+        def flush():
+            conn.executemany("INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)", pending)
+            conn.commit()
+            pending.clear()
+
+        try:
+            if delete_tiles:
+                conn.executemany("DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", \
+                                 [(zoom, x, (2 ** zoom - 1) - y) for zoom, x, y in sorted(delete_tiles)])
+
+            with ThreadPoolExecutor(max_workers=OpenSiteConstants.MVT_WORKERS) as executor:
+                futures = [executor.submit(self.create_tile_batch, table, zoom, tiles, layer_name) for table, zoom, tiles in batches]
+                try:
+                    for future in as_completed(futures):
+                        rows = future.result()
+                        pending.extend(rows)
+                        written += len(rows)
+                        if len(pending) >= OpenSiteConstants.MVT_INSERT_BATCH: flush()
+                except Exception:
+                    for future in futures: future.cancel()
+                    raise
+
+            flush()
+            return written
+
+        finally:
+            conn.close()
+            self.close_thread_connections()
+
+    def run_incremental(self):
+        """
+        Updates existing mbtiles where input has changed in some grid squares only
+        At every zoom, tiles covering changed grid squares (plus one tile to include tile buffers) are deleted and regenerated
+        """
+
+        dataset_name = self.node.output.replace('.mbtiles', '')
+        final_output_path = Path(self.base_path) / self.node.output
+        merge_temp_path = Path(self.base_path) / f"tmp-merge-{self.node.output}"
+
+        if not self.is_mergeable(final_output_path):
+            self.log.info(f"[OpenSiteOutputMVT] [{self.node.name}] Existing {final_output_path.name} does not allow tiles to be replaced, recreating it")
+            return False
+
+        try:
+            gridsquares = self.get_dirty_gridsquare_bounds()
+            batches, dirty_tiles = [], set()
+            for band_minzoom, band_maxzoom, band_table in self.get_zoom_bands(OpenSiteConstants.MBTILES_MIN_ZOOM, self.get_max_zoom()):
+                for zoom in range(band_minzoom, band_maxzoom + 1):
+                    tiles = self.get_gridsquare_tiles(gridsquares, zoom, margin=1)
+                    dirty_tiles.update((zoom, x, y) for x, y in tiles)
+                    batches += self.get_tile_batches(band_table, zoom, tiles)
+
+            self.log.info(f"[OpenSiteOutputMVT] [{self.node.name}] Input changed in {len(self.dirty_gridsquare_ids)} grid square(s), regenerating {len(dirty_tiles)} tile(s)")
+
+            # Update copy of existing file so existing file is untouched if update fails
+            shutil.copyfile(str(final_output_path), str(merge_temp_path))
+            self.write_tiles(merge_temp_path, batches, dataset_name, delete_tiles=dirty_tiles)
+            self.write_metadata(merge_temp_path, dataset_name)
+            os.replace(str(merge_temp_path), str(final_output_path))
+
+            self.log.info(f"[OpenSiteOutputMVT] [{self.node.name}] COMPLETED incremental update of {final_output_path.name}")
+            return True
+
+        except Error as e:
+            self.log.error(f"[OpenSiteOutputMVT] [{self.node.name}] PostGIS error during incremental update: {e}")
+        except sqlite3.Error as e:
+            self.log.error(f"[OpenSiteOutputMVT] [{self.node.name}] Database error during incremental update: {e}")
+        except Exception as e:
+            self.log.error(f"[OpenSiteOutputMVT] [{self.node.name}] Unexpected error during incremental update: {e}")
+
+        if merge_temp_path.exists(): merge_temp_path.unlink()
+        return False
+
+    def run(self):
+        """
+        Runs Mbtiles output using PostGIS ST_AsMVT
+        Tiles are created in zoom bands, each from generalised table detailed enough for band (see get_zoom_bands)
+        If only some grid squares of input have changed, existing mbtiles is updated incrementally
+        """
+
+        dataset_name = self.node.output.replace('.mbtiles', '')
+        final_temp_path = Path(self.base_path) / f"tmp-{self.node.output}"
+        final_output_path = Path(self.base_path) / self.node.output
+
+        if self.dirty_gridsquare_ids and final_output_path.exists():
+            if self.run_incremental(): return True
+            self.log.warning(f"[OpenSiteOutputMVT] [{self.node.name}] Incremental update not possible, recreating whole mbtiles")
+
+        try:
+            batches, gridsquares_by_table = [], {}
+            for band_minzoom, band_maxzoom, band_table in self.get_zoom_bands(OpenSiteConstants.MBTILES_MIN_ZOOM, self.get_max_zoom()):
+                if band_table not in gridsquares_by_table: gridsquares_by_table[band_table] = self.get_data_gridsquares(band_table)
+                for zoom in range(band_minzoom, band_maxzoom + 1):
+                    batches += self.get_tile_batches(band_table, zoom, self.get_gridsquare_tiles(gridsquares_by_table[band_table], zoom))
+
+            self.log.info(f"[OpenSiteOutputMVT] [{self.node.name}] Creating tiles in {len(batches)} batch(es) using {OpenSiteConstants.MVT_WORKERS} connection(s)")
+
+            self.create_mbtiles(final_temp_path)
+            written = self.write_tiles(final_temp_path, batches, dataset_name)
+            self.write_metadata(final_temp_path, dataset_name)
+
+            self.log.info(f"Created temp file {final_temp_path.name} with {written} tile(s) successfully, copying to {final_output_path.name}")
+            os.replace(str(final_temp_path), str(final_output_path))
+
+            self.log.info(f"[OpenSiteOutputMVT] [{self.node.name}] COMPLETED")
+            return True
+
+        except Error as e:
+            self.log.error(f"[OpenSiteOutputMVT] [{self.node.name}] PostGIS error creating tiles: {e}")
+        except sqlite3.Error as e:
+            self.log.error(f"[OpenSiteOutputMVT] [{self.node.name}] Database error writing tiles: {e}")
+        except Exception as e:
+            self.log.error(f"[OpenSiteOutputMVT] [{self.node.name}] Unexpected error: {e}")
+
+        if final_temp_path.exists(): final_temp_path.unlink()
+        return False
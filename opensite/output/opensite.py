@@ -7,17 +7,22 @@ from opensite.logging.opensite import OpenSiteLogger
 from opensite.postgis.opensite import OpenSitePostGIS
 from opensite.output.geojson import OpenSiteOutputGeoJSON
 from opensite.output.gpkg import OpenSiteOutputGPKG
+from opensite.output.fgb import OpenSiteOutputFGB
+from opensite.output.parquet import OpenSiteOutputParquet
 from opensite.output.mbtiles import OpenSiteOutputMbtiles
+from opensite.output.mvt import OpenSiteOutputMVT
+from opensite.output.pmtiles import OpenSiteOutputPMTiles
 from opensite.output.shp import OpenSiteOutputSHP
 from opensite.output.json import OpenSiteOutputJSON
 from opensite.output.qgis import OpenSiteOutputQGIS
+from opensite.output.raster import OpenSiteOutputRaster
 from opensite.output.web import OpenSiteOutputWeb
 
 class OpenSiteOutput(OutputBase):
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteOutput", log_level, shared_lock)
-        self.base_path = OpenSiteConstants.OUTPUT_LAYERS_FOLDER
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
     
     def run(self):
         """
@@ -25,26 +30,45 @@ class OpenSiteOutput(OutputBase):
         """
 
         # For some formats, we ignore registry and always export
-        ignore_output_registry_formats = ['json', 'qgis', 'web']
+        # Raster output has list of input tables and reuses cached layer rasters itself
+        ignore_output_registry_formats = ['json', 'qgis', 'web', 'tif']
 
         outputObject = None
+        input_hashes = None
+        dirty_gridsquare_ids = None
 
         if self.node.format not in ignore_output_registry_formats:
 
             input = self.node.input
             full_path = Path(self.base_path / self.node.output).resolve()
 
+            postgis = OpenSitePostGIS(self.log_level)
+
             # For file conversions, input will be file not database
             if not input.startswith(OpenSiteConstants.DATABASE_GENERAL_PREFIX):
                 input = str(Path(self.base_path / self.node.input).resolve())
+            else:
+                # Grid square hashes of input table allow us to detect changes to input table
+                input_hashes = postgis.get_gridsquare_hashes(input)
+                if input_hashes is not None: input_hashes = {input: input_hashes}
 
-            postgis = OpenSitePostGIS(self.log_level)
             # If not overwriting, file exists and there is 'last exported' entry for input table and output path, then do nothing 
+            # unless input table has changed since last export
             if postgis.check_export_exists(input, str(full_path)):
                 if not self.overwrite:
                     if full_path.exists():
-                        self.log.info(f"{self.node.output} already exists and was exported from {self.node.input} so skipping export")
-                        return True
+                        if input_hashes is not None:
+                            dirty_gridsquare_ids = postgis.get_dirty_gridsquares(str(full_path), input_hashes)
+                            # Files exported before lineage was recorded are assumed to be up to date
+                            if dirty_gridsquare_ids is None:
+                                postgis.set_gridsquare_lineage(str(full_path), input_hashes)
+                                dirty_gridsquare_ids = set()
+
+                        if not dirty_gridsquare_ids:
+                            self.log.info(f"{self.node.output} already exists and was exported from {self.node.input} so skipping export")
+                            return True
+
+                        self.log.info(f"{self.node.input} has changed in {len(dirty_gridsquare_ids)} grid square(s) since {self.node.output} was exported, updating export")
 
         if self.node.format == 'geojson':
             outputObject = OpenSiteOutputGeoJSON(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
@@ -52,8 +76,23 @@ class OpenSiteOutput(OutputBase):
         if self.node.format == "gpkg":
             outputObject = OpenSiteOutputGPKG(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
 
+        if self.node.format == 'fgb':
+            outputObject = OpenSiteOutputFGB(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
+
+        if self.node.format == 'parquet':
+            outputObject = OpenSiteOutputParquet(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
+
         if self.node.format == 'mbtiles':
-            outputObject = OpenSiteOutputMbtiles(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
+            if OpenSiteConstants.MBTILES_ENGINE == 'postgis':
+                outputObject = OpenSiteOutputMVT(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
+            else:
+                outputObject = OpenSiteOutputMbtiles(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
+
+        if self.node.format == 'pmtiles':
+            outputObject = OpenSiteOutputPMTiles(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
+
+        if self.node.format == 'tif':
+            outputObject = OpenSiteOutputRaster(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
 
         if self.node.format == 'shp':
             outputObject = OpenSiteOutputSHP(self.node, self.log_level, self.overwrite, self.shared_lock, self.shared_metadata)
@@ -69,12 +108,15 @@ class OpenSiteOutput(OutputBase):
 
         if outputObject:
 
+            if dirty_gridsquare_ids: outputObject.dirty_gridsquare_ids = sorted(dirty_gridsquare_ids)
+
             run_status = outputObject.run()
 
             if self.node.format not in ignore_output_registry_formats:
                 # If export was successful, add to export log table
                 if run_status:
                     postgis.update_export_log(str(input), str(full_path))
+                    if input_hashes is not None: postgis.set_gridsquare_lineage(str(full_path), input_hashes)
 
             return run_status
 
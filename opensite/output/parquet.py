@@ -0,0 +1,19 @@
+import logging
+from opensite.output.base import OutputBase
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+
+class OpenSiteOutputParquet(OutputBase):
+    def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
+        super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
+        self.log = OpenSiteLogger("OpenSiteOutputParquet", log_level, shared_lock)
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
+    
+    def run(self):
+        """
+        Runs GeoParquet output
+        Rows are sorted spatially into zstd-compressed row groups with bounding box covering column
+        so readers can skip row groups outside area of interest
+        """
+
+        return self.export_node_input_table(OpenSiteConstants.PARQUET_LAYER_CREATION_OPTIONS, driver='Parquet')
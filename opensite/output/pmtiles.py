@@ -0,0 +1,105 @@
+import json
+import logging
+import os
+import sqlite3
+from pathlib import Path
+from opensite.output.base import OutputBase
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+
+class OpenSiteOutputPMTiles(OutputBase):
+    """
+    Converts mbtiles to single-file PMTiles archive
+    Tiles are written in tile ID order so archive is clustered and any tile can be read
+    with at most a few HTTP Range requests, so archive can be served by any static file host
+    """
+
+    def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
+        super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
+        self.log = OpenSiteLogger("OpenSiteOutputPMTiles", log_level, shared_lock)
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
+
+    def get_metadata(self, conn):
+        """
+        Gets mbtiles metadata as dict
+        Vector layers held as JSON string in mbtiles 'json' field are moved to top level as expected by PMTiles readers
+        """
+
+        metadata = {name: value for name, value in conn.execute("SELECT name, value FROM metadata")}
+        if 'json' in metadata:
+            try:
+                metadata.update(json.loads(metadata.pop('json')))
+            except ValueError:
+                self.log.warning(f"[OpenSiteOutputPMTiles] [{self.node.name}] Unable to parse mbtiles 'json' metadata, ignoring it")
+
+        return metadata
+
+    def convert(self, mbtiles_path, pmtiles_path):
+        """
+        Converts mbtiles_path to PMTiles archive at pmtiles_path
+        Identical tiles, eg. tiles completely inside polygon, are stored once
+        """
+
+        from pmtiles.convert import mbtiles_to_header_json
+        from pmtiles.tile import zxy_to_tileid, tileid_to_zxy
+        from pmtiles.writer import write
+
+        conn = sqlite3.connect(str(mbtiles_path))
+        try:
+            metadata = self.get_metadata(conn)
+
+            # MBTiles rows are TMS so are flipped to get XYZ tile IDs
+            tile_ids = sorted(zxy_to_tileid(zoom, x, (1 << zoom) - 1 - row) \
+                              for zoom, x, row in conn.execute("SELECT zoom_level, tile_column, tile_row FROM tiles"))
+            if not tile_ids:
+                self.log.error(f"[OpenSiteOutputPMTiles] [{self.node.name}] {Path(mbtiles_path).name} has no tiles, unable to create {Path(pmtiles_path).name}")
+                return False
+
+            with write(str(pmtiles_path)) as writer:
+                for tile_id in tile_ids:
+                    zoom, x, y = tileid_to_zxy(tile_id)
+                    data = conn.execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", \
+                                        (zoom, x, (1 << zoom) - 1 - y)).fetchone()[0]
+                    writer.write_tile(tile_id, data)
+
+                header, metadata = mbtiles_to_header_json(metadata)
+                writer.finalize(header, metadata)
+
+            return True
+
+        finally:
+            conn.close()
+
+    def run(self):
+        """
+        Runs PMTiles output
+        Input is mbtiles file created by mbtiles output node
+        """
+
+        input_path = Path(self.base_path) / self.node.input
+        output_path = Path(self.base_path) / self.node.output
+        temp_output_path = Path(self.base_path) / f"tmp-{self.node.output}"
+
+        if not input_path.exists():
+            self.log.error(f"[OpenSiteOutputPMTiles] [{self.node.name}] {input_path.name} does not exist, unable to create {output_path.name}")
+            return False
+
+        self.log.info(f"[OpenSiteOutputPMTiles] [{self.node.name}] Converting {input_path.name} to {output_path.name}")
+
+        try:
+            if temp_output_path.exists(): temp_output_path.unlink()
+            if not self.convert(input_path, temp_output_path):
+                if temp_output_path.exists(): temp_output_path.unlink()
+                return False
+
+            os.replace(str(temp_output_path), str(output_path))
+            self.log.info(f"[OpenSiteOutputPMTiles] [{self.node.name}] COMPLETED")
+            return True
+
+        except sqlite3.Error as e:
+            self.log.error(f"[OpenSiteOutputPMTiles] [{self.node.name}] Database error reading {input_path.name}: {e}")
+        except Exception as e:
+            self.log.error(f"[OpenSiteOutputPMTiles] [{self.node.name}] Unexpected error: {e}")
+
+        if temp_output_path.exists(): temp_output_path.unlink()
+        return False
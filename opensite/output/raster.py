@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import math
+import os
+import subprocess
+import uuid
+import numpy as np
+import rasterio
+import shapely
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from psycopg2 import sql
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+from rasterio.windows import Window, bounds as window_bounds, transform as window_transform
+from opensite.output.base import OutputBase
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.base import PostGISBase
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class OpenSiteOutputRaster(OutputBase):
+    """
+    Raster engine for feasibility masks
+    Rasterises each input layer onto shared grid and combines layers using bitwise OR
+    so avoids vector union of layers entirely - pixel is 1 where any constraint applies
+    """
+
+    def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
+        super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
+        self.log = OpenSiteLogger("OpenSiteOutputRaster", log_level, shared_lock)
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
+        self.postgis = OpenSitePostGIS(log_level)
+
+    def get_profile(self, transform, width, height):
+        """
+        Gets rasterio profile of tiled, compressed single bit GeoTIFF on grid
+        """
+
+        return {
+            'driver': 'GTiff',
+            'width': width,
+            'height': height,
+            'count': 1,
+            'dtype': 'uint8',
+            'crs': OpenSiteConstants.CRS_DEFAULT,
+            'transform': transform,
+            'tiled': True,
+            'blockxsize': OpenSiteConstants.RASTER_BLOCK_SIZE,
+            'blockysize': OpenSiteConstants.RASTER_BLOCK_SIZE,
+            'compress': 'deflate',
+            'nbits': 1,
+            'BIGTIFF': 'IF_SAFER',
+        }
+
+    def get_grid(self):
+        """
+        Gets (transform, width, height) of grid covering clipping areas or, if none, clipping master
+        Bounds are snapped outwards to multiples of RASTER_RESOLUTION so every raster shares same grid
+        """
+
+        clip = self.node.custom_properties.get('clip')
+        if clip: extent = self.postgis.get_areas_bounds(clip, OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_DEFAULT)
+        else: extent = self.postgis.get_table_bounds(OpenSiteConstants.OPENSITE_CLIPPINGMASTER, OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_DEFAULT)
+        if not extent or extent['left'] is None: return None
+
+        resolution = OpenSiteConstants.RASTER_RESOLUTION
+        left = math.floor(extent['left'] / resolution) * resolution
+        bottom = math.floor(extent['bottom'] / resolution) * resolution
+        right = math.ceil(extent['right'] / resolution) * resolution
+        top = math.ceil(extent['top'] / resolution) * resolution
+
+        width, height = round((right - left) / resolution), round((top - bottom) / resolution)
+        return from_origin(left, top, resolution, resolution), width, height
+
+    def get_windows(self, width, height):
+        """
+        Gets processing windows covering grid
+        """
+
+        size = OpenSiteConstants.RASTER_WINDOW_SIZE
+        return [Window(col, row, min(size, width - col), min(size, height - row)) \
+                for row in range(0, height, size) for col in range(0, width, size)]
+
+    def get_layer_hash(self, table):
+        """
+        Gets single hash of table contents from its grid square hashes
+        Returns None if table has no grid square hashes
+        """
+
+        hashes = self.postgis.get_gridsquare_hashes(table)
+        if hashes is None: return None
+        return hashlib.md5(json.dumps(sorted(hashes.items())).encode()).hexdigest()
+
+    def get_layer_path(self, table, transform, width, height):
+        """
+        Gets path of cached raster of table on grid
+        """
+
+        grid_hash = hashlib.md5(json.dumps([list(transform)[:6], width, height]).encode()).hexdigest()
+        return OpenSiteConstants.RASTER_CACHE_FOLDER / f"{table}-{grid_hash[:12]}.tif"
+
+    def rasterise_layer(self, table, layer_hash, transform, width, height):
+        """
+        Rasterises table to cached GeoTIFF on grid, one window at a time
+        Cached raster is reused if it was created from same table contents
+        Returns path of raster or None if rasterisation failed
+        """
+
+        layer_path = self.get_layer_path(table, transform, width, height)
+
+        if layer_hash is not None and layer_path.exists():
+            with rasterio.open(layer_path) as src:
+                if src.tags().get('opensite_hash') == layer_hash:
+                    self.log.debug(f"Raster of {table} already exists and table has not changed, reusing it")
+                    return layer_path
+
+        self.log.info(f"Rasterising {table} at {OpenSiteConstants.RASTER_RESOLUTION}m resolution")
+
+        # Layer rasters are cached and shared between outputs so several processes may rasterise same layer at once
+        # - each writes to its own temporary file and last to finish replaces cached raster
+        temp_layer_path = layer_path.with_name(f"tmp-{os.getpid()}-{uuid.uuid4().hex}-{layer_path.name}")
+
+        # Each thread uses its own connection as connection pool is not thread-safe
+        postgis = PostGISBase(self.log_level)
+
+        try:
+            with rasterio.open(temp_layer_path, 'w', **self.get_profile(transform, width, height)) as dst:
+                for window in self.get_windows(width, height):
+                    left, bottom, right, top = window_bounds(window, transform)
+                    dbparams = {
+                        'table': sql.Identifier(table),
+                        'envelope': sql.SQL("ST_MakeEnvelope({}, {}, {}, {}, {})").format( \
+                            sql.Literal(left), sql.Literal(bottom), sql.Literal(right), sql.Literal(top), \
+                            sql.Literal(postgis.extract_crs_as_number(OpenSiteConstants.CRS_DEFAULT))),
+                    }
+
+                    # Clipping to window keeps large polygons from being fetched in full for every window
+                    results = postgis.fetch_all(sql.SQL("""
+                    SELECT ST_AsBinary(ST_ClipByBox2D(geom, {envelope})) AS wkb FROM {table} WHERE geom && {envelope}
+                    """).format(**dbparams))
+
+                    geometries = [geometry for geometry in shapely.from_wkb([bytes(row['wkb']) for row in results if row['wkb'] is not None]) \
+                                  if not geometry.is_empty]
+                    if not geometries: continue
+
+                    data = rasterize(((geometry, 1) for geometry in geometries), out_shape=(int(window.height), int(window.width)), \
+                                     transform=window_transform(window, transform), fill=0, dtype='uint8')
+                    dst.write(data, 1, window=window)
+
+                if layer_hash is not None: dst.update_tags(opensite_hash=layer_hash)
+
+            os.replace(temp_layer_path, layer_path)
+            return layer_path
+
+        except Exception as e:
+            self.log.error(f"Error rasterising {table}: {e}")
+            if temp_layer_path.exists(): temp_layer_path.unlink()
+            return None
+
+        finally:
+            postgis.close_connection()
+
+    def combine_window(self, layer_paths, mask_path, window):
+        """
+        Combines window of layer rasters using bitwise OR and, if mask set, bitwise AND with mask
+        """
+
+        combined = np.zeros((int(window.height), int(window.width)), dtype='uint8')
+        for layer_path in layer_paths:
+            with rasterio.open(layer_path) as src:
+                np.bitwise_or(combined, src.read(1, window=window), out=combined)
+
+        if mask_path:
+            with rasterio.open(mask_path) as src:
+                np.bitwise_and(combined, src.read(1, window=window), out=combined)
+
+        return combined
+
+    def polygonise(self, raster_path, output_path):
+        """
+        Polygonises non-zero pixels of raster to GPKG in output CRS
+        """
+
+        temp_polygonised_path = raster_path.with_name(raster_path.stem + '-polygonised.gpkg')
+        temp_output_path = Path(self.base_path) / ('tmp-' + output_path.name)
+        for path in [temp_polygonised_path, temp_output_path]:
+            if path.exists(): path.unlink()
+
+        layer_name = self.get_layer_from_file_path(output_path)
+        cmds = [
+            ["gdal_polygonize.py", "-q", "-mask", str(raster_path), str(raster_path), "-b", "1", "-f", "GPKG", str(temp_polygonised_path), layer_name, "value"],
+            ["ogr2ogr", "-t_srs", OpenSiteConstants.CRS_OUTPUT, "-nln", layer_name, str(temp_output_path), str(temp_polygonised_path)],
+        ]
+
+        try:
+            for cmd in cmds:
+                subprocess.run(cmd, capture_output=True, text=True, check=True)
+            os.replace(temp_output_path, output_path)
+            return True
+
+        except subprocess.CalledProcessError as e:
+            self.log.error(f"Polygonisation error: {e} Subprocess cmd: {cmd}")
+            return False
+
+        finally:
+            if temp_polygonised_path.exists(): temp_polygonised_path.unlink()
+
+    def run(self):
+        """
+        Runs raster output
+        Input is list of layer tables rather than amalgamated table
+        """
+
+        tables = self.node.input if isinstance(self.node.input, list) else [self.node.input]
+        final_output_path = Path(self.base_path) / self.node.output
+        temp_output_path = Path(self.base_path) / ('tmp-' + self.node.output)
+
+        missing_tables = [table for table in tables if not self.postgis.table_exists(table)]
+        if missing_tables:
+            self.log.error(f"Input tables {missing_tables} do not exist, unable to create {self.node.output}")
+            return False
+
+        grid = self.get_grid()
+        if grid is None:
+            self.log.error(f"Unable to determine extent of raster grid for {self.node.output}")
+            return False
+        transform, width, height = grid
+
+        OpenSiteConstants.RASTER_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+
+        # Clip mask table is content-addressed by its areas so its name doubles as its hash
+        layers = [(table, self.get_layer_hash(table)) for table in tables]
+        mask_table = None
+        if self.node.custom_properties.get('clip'):
+            mask_table = self.postgis.create_clip_mask(self.node.custom_properties['clip'])
+            if mask_table is None: return False
+            layers.append((mask_table, mask_table))
+
+        self.log.info(f"Creating {self.node.output} from {len(tables)} layer(s) on {width}x{height} grid")
+
+        with ThreadPoolExecutor(max_workers=OpenSiteConstants.RASTER_WORKERS) as executor:
+            layer_paths = list(executor.map(lambda layer: self.rasterise_layer(layer[0], layer[1], transform, width, height), layers))
+            if None in layer_paths:
+                self.log.error(f"Failed to rasterise all layers, unable to create {self.node.output}")
+                return False
+
+            mask_path = layer_paths.pop() if mask_table else None
+
+            if temp_output_path.exists(): temp_output_path.unlink()
+            windows = self.get_windows(width, height)
+            with rasterio.open(temp_output_path, 'w', **self.get_profile(transform, width, height)) as dst:
+                for window, data in zip(windows, executor.map(lambda window: self.combine_window(layer_paths, mask_path, window), windows)):
+                    dst.write(data, 1, window=window)
+
+        os.replace(temp_output_path, final_output_path)
+        self.log.info(f"Created raster {self.node.output}")
+
+        if OpenSiteConstants.RASTER_POLYGONISE:
+            polygonised_path = final_output_path.with_name(final_output_path.stem + '-raster.gpkg')
+            self.log.info(f"Polygonising {self.node.output} to {polygonised_path.name}")
+            if not self.polygonise(final_output_path, polygonised_path): return False
+
+        return True
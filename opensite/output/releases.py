@@ -0,0 +1,163 @@
+import logging
+import os
+import shutil
+import subprocess
+from datetime import datetime, timezone
+from pathlib import Path
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+
+class OpenSiteTileserverReleases:
+    """
+    Versioned releases of tileserver data and styles
+
+    Each build is written to its own folder in TILESERVER_RELEASES_FOLDER and published by atomically
+    switching TILESERVER_CURRENT_LINK symlink to it. Tileserver config file is symlink to config file
+    of current release so tileserver always sees complete, consistent set of config, styles and mbtiles
+    Preview builds have their own releases, current link and config file in PREVIEW_TILESERVER_FOLDER
+    Mbtiles are hard linked (or reflinked) into release rather than copied so releases take almost no extra space
+    Output mbtiles are only ever replaced by new files, never modified in place, so published releases never change
+    """
+
+    def __init__(self, log_level=logging.INFO, shared_lock=None, preview=False):
+        self.log = OpenSiteLogger("OpenSiteTileserverReleases", log_level, shared_lock)
+        if preview:
+            self.releases_folder = Path(OpenSiteConstants.PREVIEW_TILESERVER_FOLDER) / Path(OpenSiteConstants.TILESERVER_RELEASES_FOLDER).name
+            self.current_link = Path(OpenSiteConstants.PREVIEW_TILESERVER_FOLDER) / Path(OpenSiteConstants.TILESERVER_CURRENT_LINK).name
+            self.config_file = Path(OpenSiteConstants.PREVIEW_TILESERVER_FOLDER) / Path(OpenSiteConstants.TILESERVER_CONFIG_FILE).name
+        else:
+            self.releases_folder = Path(OpenSiteConstants.TILESERVER_RELEASES_FOLDER)
+            self.current_link = Path(OpenSiteConstants.TILESERVER_CURRENT_LINK)
+            self.config_file = Path(OpenSiteConstants.TILESERVER_CONFIG_FILE)
+
+    def get_releases(self):
+        """
+        Gets release folders, oldest first
+        """
+
+        if not self.releases_folder.exists(): return []
+        return sorted(path for path in self.releases_folder.iterdir() if path.is_dir() and not path.name.startswith('tmp-'))
+
+    def get_current_release(self):
+        """
+        Gets folder of current release or None if no release has been published
+        """
+
+        if not self.current_link.is_symlink(): return None
+        return (self.current_link.parent / os.readlink(self.current_link)).resolve()
+
+    def create_release(self):
+        """
+        Creates empty release folder with 'data' and 'styles' subfolders
+        Release is created with 'tmp-[process id]-' prefix and only renamed to final name when published
+        so unpublished releases of builds still running can be told apart from those left by failed builds
+        """
+
+        release_name = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S-%f")
+        release_folder = self.releases_folder / f"tmp-{os.getpid()}-{release_name}"
+        for subfolder in ['data', 'styles']: (release_folder / subfolder).mkdir(parents=True, exist_ok=True)
+        self.log.info(f"Creating tileserver release {release_name}")
+        return release_folder
+
+    def add_file(self, source_path, release_path):
+        """
+        Adds file to release using hard link, falling back to reflink where supported or copy
+        """
+
+        release_path = Path(release_path)
+        if release_path.exists(): release_path.unlink()
+
+        try:
+            os.link(source_path, release_path)
+            return
+        except OSError:
+            pass
+
+        # 'cp --reflink=auto' shares blocks on copy-on-write filesystems and copies otherwise
+        try:
+            subprocess.run(["cp", "--reflink=auto", str(source_path), str(release_path)], capture_output=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            shutil.copy2(source_path, release_path)
+
+    def switch_link(self, link_path, target):
+        """
+        Atomically points symlink at link_path to relative target, replacing any existing file or symlink
+        """
+
+        link_path = Path(link_path)
+        temp_link_path = link_path.with_name(f"tmp-{link_path.name}")
+        if temp_link_path.is_symlink() or temp_link_path.exists(): temp_link_path.unlink()
+        os.symlink(target, temp_link_path)
+        os.replace(temp_link_path, link_path)
+
+    def publish(self, release_folder):
+        """
+        Publishes completed release folder by switching current release symlink to it
+        Old releases beyond TILESERVER_KEEP_RELEASES are then removed
+        Returns published release folder
+        """
+
+        release_folder = Path(release_folder)
+        published_folder = release_folder.with_name(release_folder.name.split('-', 2)[2])
+        os.replace(release_folder, published_folder)
+
+        # Relative links keep working when tileserver folder is mounted elsewhere, eg. in Docker
+        self.switch_link(self.current_link, os.path.relpath(published_folder, self.current_link.parent))
+        self.switch_link(self.config_file, os.path.relpath(self.current_link / 'config.json', self.config_file.parent))
+        self.log.info(f"Published tileserver release {published_folder.name}")
+
+        self.prune()
+        return published_folder
+
+    def rollback(self):
+        """
+        Switches current release symlink back to release before current release
+        Returns release folder switched to or None if there is no earlier release
+        """
+
+        releases, current = self.get_releases(), self.get_current_release()
+        earlier = [release for release in releases if current is None or release.name < current.name]
+        if not earlier:
+            self.log.error("No earlier tileserver release to roll back to")
+            return None
+
+        self.switch_link(self.current_link, os.path.relpath(earlier[-1], self.current_link.parent))
+        self.log.info(f"Rolled back tileserver from release {current.name if current else 'none'} to {earlier[-1].name}")
+        return earlier[-1]
+
+    def is_abandoned(self, release_folder):
+        """
+        Checks whether unpublished release folder was left behind by build process that is no longer running
+        """
+
+        try:
+            pid = int(release_folder.name.split('-', 2)[1])
+        except (IndexError, ValueError):
+            return True
+
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+
+        return False
+
+    def prune(self):
+        """
+        Removes oldest releases so at most TILESERVER_KEEP_RELEASES releases remain, never removing current release
+        Also removes unpublished releases left behind by failed builds, leaving those of builds still running
+        """
+
+        current = self.get_current_release()
+        if self.releases_folder.exists():
+            for path in self.releases_folder.iterdir():
+                if path.is_dir() and path.name.startswith('tmp-') and self.is_abandoned(path):
+                    self.log.info(f"Removing unpublished tileserver release {path.name}")
+                    shutil.rmtree(path, ignore_errors=True)
+
+        releases = [release for release in self.get_releases() if release != current]
+        for release in releases[:max(len(releases) - (OpenSiteConstants.TILESERVER_KEEP_RELEASES - 1), 0)]:
+            self.log.info(f"Removing old tileserver release {release.name}")
+            shutil.rmtree(release, ignore_errors=True)
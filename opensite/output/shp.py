@@ -7,11 +7,16 @@ class OpenSiteOutputSHP(OutputBase):
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteOutputSHP", log_level, shared_lock)
-        self.base_path = OpenSiteConstants.OUTPUT_LAYERS_FOLDER
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER)
     
     def run(self):
         """
         Runs SHP output
+        If input is table, exports it directly, otherwise converts input file
         """
 
-        return self.convert_node_input_to_output_files(self.node)
\ No newline at end of file
+        if not self.node.input.startswith(OpenSiteConstants.DATABASE_GENERAL_PREFIX):
+            return self.convert_node_input_to_output_files(self.node)
+
+        # Shapefile is set of files sharing same name so every file is exported to temp name and then moved
+        return self.export_node_input_table(secondary_extensions=['dbf', 'prj', 'shx', 'cpg'])
@@ -1,3 +1,4 @@
+import copy
 import json
 import logging
 import os
@@ -7,22 +8,24 @@ from opensite.output.base import OutputBase
 from opensite.constants import OpenSiteConstants
 from opensite.logging.opensite import OpenSiteLogger
 from opensite.postgis.opensite import OpenSitePostGIS
+from opensite.output.releases import OpenSiteTileserverReleases
 
 class OpenSiteOutputWeb(OutputBase):
     def __init__(self, node, log_level=logging.INFO, overwrite=False, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, overwrite=overwrite, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteOutputWeb", log_level, shared_lock)
-        self.base_path = OpenSiteConstants.OUTPUT_FOLDER
+        self.base_path = self.get_output_folder(OpenSiteConstants.OUTPUT_FOLDER)
         self.postgis = OpenSitePostGIS(self.log_level)
+        self.releases = OpenSiteTileserverReleases(self.log_level, shared_lock, preview=bool(self.node.custom_properties.get('preview')))
     
     def flatten(self, items):
         """Produces flat list from hierarchy of objects with property 'children'"""
 
         return [item for i in items for item in [i] + self.flatten(i.get('children', []))]
 
-    def output_tileserver_files(self, basemap_mbtiles=None):
+    def output_tileserver_files(self, release_folder, basemap_mbtiles=None):
         """
-        Outputs mtbiles styles files and copies mbtiles to tileserver data folder
+        Outputs mbtiles styles files, tileserver config and links to mbtiles into tileserver release_folder
         """
 
         # ===============================================
@@ -66,7 +69,7 @@ class OpenSiteOutputWeb(OutputBase):
 
             fonts_url = OpenSiteConstants.TILESERVER_URL + '/fonts/{fontstack}/{range}.pbf'
             openmaptiles_style_file_src = str(OpenSiteConstants.TILESERVER_FOLDER_SRC / 'openmaptiles.json')
-            openmaptiles_style_file_dst = str(OpenSiteConstants.TILESERVER_STYLES_FOLDER / 'openmaptiles.json')
+            openmaptiles_style_file_dst = str(release_folder / 'styles' / 'openmaptiles.json')
             openmaptiles_style_json = json.load(open(openmaptiles_style_file_src, 'r', encoding='utf-8'))
             openmaptiles_style_json['sources']['openmaptiles']['url'] = OpenSiteConstants.TILESERVER_URL + "/data/openmaptiles.json"
             openmaptiles_style_json['glyphs'] = fonts_url
@@ -92,13 +95,13 @@ class OpenSiteOutputWeb(OutputBase):
 
                 for dataset in branch_datasets:
 
-                    self.log.info(f"Copying {dataset['dataset']}.mbtiles to {str(OpenSiteConstants.TILESERVER_DATA_FOLDER)}")
+                    self.log.info(f"Adding {dataset['dataset']}.mbtiles to tileserver release {release_folder.name}")
 
                     mbtiles_basename    = f"{dataset['dataset']}.mbtiles"
-                    mbtiles_src         = str(OpenSiteConstants.OUTPUT_LAYERS_FOLDER / mbtiles_basename)
-                    mbtiles_dest        = str(OpenSiteConstants.TILESERVER_DATA_FOLDER / mbtiles_basename)
+                    mbtiles_src         = self.get_output_folder(OpenSiteConstants.OUTPUT_LAYERS_FOLDER) / mbtiles_basename
+                    mbtiles_dest        = release_folder / 'data' / mbtiles_basename
 
-                    shutil.copy(mbtiles_src, mbtiles_dest)
+                    self.releases.add_file(mbtiles_src, mbtiles_dest)
 
                     self.log.info(f"Creating tileserver-gl style file for: {dataset['dataset']}")
 
@@ -117,7 +120,7 @@ class OpenSiteOutputWeb(OutputBase):
                     }
 
                     style_opacity   = 0.8 if dataset['level'] == 1 else 0.5
-                    style_file      = str(OpenSiteConstants.TILESERVER_STYLES_FOLDER / f"{dataset['dataset']}.json")
+                    style_file      = str(release_folder / 'styles' / f"{dataset['dataset']}.json")
                     style_json      = \
                     {
                         "version":  8,
@@ -161,10 +164,20 @@ class OpenSiteOutputWeb(OutputBase):
 
                     firstdataset = False
 
-            json.dump(opensite_style_json, open(str(OpenSiteConstants.TILESERVER_MAIN_STYLE_FILE), 'w', encoding='utf-8'), indent=4)
+            json.dump(opensite_style_json, open(str(release_folder / 'styles' / OpenSiteConstants.TILESERVER_MAIN_STYLE_FILE.name), 'w', encoding='utf-8'), indent=4)
+
+            pmtiles_style = self.node.custom_properties['structure'][0].get('pmtiles')
+            if pmtiles_style: self.output_pmtiles_style(opensite_style_json, pmtiles_style)
+
+            # Basemap is created once by installer outside releases so link it into release
+            if basemap_mbtiles and (OpenSiteConstants.TILESERVER_DATA_FOLDER / basemap_mbtiles).exists():
+                self.releases.add_file(OpenSiteConstants.TILESERVER_DATA_FOLDER / basemap_mbtiles, release_folder / 'data' / basemap_mbtiles)
 
             # Creating final tileserver-gl config file
+            # Tileserver loads config through symlink in folder of current release link so paths are relative to that folder
 
+            config_folder = self.releases.config_file.parent
+            current_release = self.releases.current_link.name
             config_json = \
             {
                 "options": \
@@ -172,17 +185,17 @@ class OpenSiteOutputWeb(OutputBase):
                     "paths": \
                     {
                         "root":     "",
-                        "fonts":    "fonts",
-                        "sprites":  "sprites",
-                        "styles":   "styles",
-                        "mbtiles":  "data"
+                        "fonts":    os.path.relpath(OpenSiteConstants.TILESERVER_FONTS_FOLDER, config_folder),
+                        "sprites":  os.path.relpath(OpenSiteConstants.TILESERVER_SPRITES_DEST, config_folder),
+                        "styles":   f"{current_release}/styles",
+                        "mbtiles":  f"{current_release}/data"
                     }
                 },
                 "styles":   styles,
                 "data":     data
             }
 
-            json.dump(config_json, open(str(OpenSiteConstants.TILESERVER_CONFIG_FILE), 'w', encoding='utf-8'), indent=4)
+            json.dump(config_json, open(str(release_folder / 'config.json'), 'w', encoding='utf-8'), indent=4)
 
             return True
 
@@ -190,16 +203,26 @@ class OpenSiteOutputWeb(OutputBase):
             self.log.error(f"General error when generating openmaptiles.json: {e}")
             return False
 
-    def clear_folder(self, folder_path, exceptions=[]):
+    def output_pmtiles_style(self, opensite_style_json, pmtiles_style):
         """
-        Clears folder avoiding exceptions
+        Outputs copy of main style that loads dataset layers from PMTiles files in output layers folder
+        so web map can show layers without tileserver. Basemap, fonts and sprites still come from tileserver
+        PMTiles urls are relative to web page and are made absolute by web page when style is loaded
         """
 
-        for entry in os.scandir(folder_path):
-            if entry.is_file() or entry.is_symlink():
-                filename = os.path.basename(entry.path)
-                if filename not in exceptions:
-                    os.remove(entry.path)
+        pmtiles_style_json = copy.deepcopy(opensite_style_json)
+        layers_folder = Path(OpenSiteConstants.OUTPUT_LAYERS_FOLDER).relative_to(OpenSiteConstants.OUTPUT_FOLDER)
+
+        for source_name, source in pmtiles_style_json['sources'].items():
+            if source_name in ['openmaptiles', 'attribution']: continue
+            pmtiles_path = Path(self.base_path) / layers_folder / f"{source_name}.pmtiles"
+            if not pmtiles_path.exists():
+                self.log.warning(f"{pmtiles_path.name} does not exist, web map will load {source_name} from tileserver")
+                continue
+            source['url'] = f"pmtiles://{layers_folder.as_posix()}/{pmtiles_path.name}"
+
+        self.log.info(f"Creating PMTiles style file {Path(pmtiles_style).name}")
+        json.dump(pmtiles_style_json, open(str(Path(self.base_path) / Path(pmtiles_style).name), 'w', encoding='utf-8'), indent=4)
 
     def run(self):
         """
@@ -211,7 +234,7 @@ class OpenSiteOutputWeb(OutputBase):
             self.log.info("Outputting main web page")
 
             # Copy main web index page to output folder
-            shutil.copy('tileserver/index.html', str(Path(OpenSiteConstants.OUTPUT_FOLDER) / self.node.output))
+            shutil.copy('tileserver/index.html', str(Path(self.base_path) / self.node.output))
 
             self.log.info("Outputting tileserver mbtiles stylesheets")
 
@@ -222,16 +245,17 @@ class OpenSiteOutputWeb(OutputBase):
             # All branches share same 'osm-default' path used to 
             # generate basemap so okay to use first branch to get path
             osm_basemap_mbtiles_file = os.path.basename(self.node.custom_properties['structure'][0]['osm-default']).replace('.osm.pbf', '.mbtiles')
-            osm_basemap_tmp_mbtiles_file = 'tmp-' + osm_basemap_mbtiles_file
-            
-            self.log.info("Deleting non-basemap mbtiles from tileserver data folder")
-            self.clear_folder(str(OpenSiteConstants.TILESERVER_DATA_FOLDER), exceptions=[osm_basemap_mbtiles_file, osm_basemap_tmp_mbtiles_file])
 
-            self.log.info("Deleting style files from tileserver styles folder")
-            self.clear_folder(str(OpenSiteConstants.TILESERVER_STYLES_FOLDER))
+            # Each build is written to new release folder and only published once all files are ready
+            # so tileserver never sees partially written set of config, styles and mbtiles
+            release_folder = self.releases.create_release()
 
             self.log.info("Generating tileserver files")
-            self.output_tileserver_files(osm_basemap_mbtiles_file)
+            if not self.output_tileserver_files(release_folder, osm_basemap_mbtiles_file):
+                shutil.rmtree(release_folder, ignore_errors=True)
+                return False
+
+            self.releases.publish(release_folder)
 
             return True
         
@@ -225,6 +225,20 @@ class PostGISBase:
         finally:
             self.return_connection(conn)
 
+    def get_column_names(self, table_name, schema='public'):
+        """
+        Returns list of column names of specified table
+        """
+
+        query = sql.SQL("""
+        SELECT column_name FROM information_schema.columns 
+        WHERE table_schema = {schema_lit} AND table_name = {table_lit} 
+        ORDER BY ordinal_position
+        """).format(schema_lit = sql.Literal(schema), table_lit = sql.Literal(table_name))
+
+        results = self.fetch_all(query)
+        return [row['column_name'] for row in results]
+
     def get_ogr_connection_string(self):
         """
         Returns the connection string formatted specifically for GDAL/OGR tools.
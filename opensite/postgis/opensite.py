@@ -1,3 +1,5 @@
+import gzip
+import hashlib
 import json
 import logging
 import os
@@ -8,6 +10,15 @@ from opensite.constants import OpenSiteConstants
 from opensite.postgis.base import PostGISBase
 from opensite.logging.opensite import OpenSiteLogger
 
+# In-process cache of area bounds, keyed on normalised area list and CRSs
+AREAS_BOUNDS_CACHE = {}
+
+# In-process cache of gazetteer lookups, ie. area ids keyed on normalised area list and list of area names
+GAZETTEER_CACHE = {}
+
+# In-process cache of optional PostGIS functions available in database
+POSTGIS_FUNCTIONS_CACHE = {}
+
 class OpenSitePostGIS(PostGISBase):
 
     OPENSITE_REGISTRY       = OpenSiteConstants.OPENSITE_REGISTRY
@@ -16,9 +27,17 @@ class OpenSitePostGIS(PostGISBase):
     OPENSITE_CLIPPINGMASTER = OpenSiteConstants.OPENSITE_CLIPPINGMASTER
     OPENSITE_GRIDPROCESSING = OpenSiteConstants.OPENSITE_GRIDPROCESSING
     OPENSITE_GRIDBUFFEDGES  = OpenSiteConstants.OPENSITE_GRIDBUFFEDGES
+    OPENSITE_GRIDPROCESSINGPREVIEW = OpenSiteConstants.OPENSITE_GRIDPROCESSINGPREVIEW
+    OPENSITE_GRIDBUFFEDGESPREVIEW  = OpenSiteConstants.OPENSITE_GRIDBUFFEDGESPREVIEW
     OPENSITE_GRIDOUTPUT     = OpenSiteConstants.OPENSITE_GRIDOUTPUT
     OPENSITE_OSMBOUNDARIES  = OpenSiteConstants.OPENSITE_OSMBOUNDARIES
-    
+    OPENSITE_CLIPMASK_PREFIX = OpenSiteConstants.OPENSITE_CLIPMASK_PREFIX
+    OPENSITE_GRIDHASHES     = OpenSiteConstants.OPENSITE_GRIDHASHES
+    OPENSITE_GRIDLINEAGE    = OpenSiteConstants.OPENSITE_GRIDLINEAGE
+    OPENSITE_STATS          = OpenSiteConstants.OPENSITE_STATS
+    OPENSITE_GAZETTEER      = OpenSiteConstants.OPENSITE_GAZETTEER
+    OPENSITE_GAZETTEERPARTS = OpenSiteConstants.OPENSITE_GAZETTEERPARTS
+
     def __init__(self, log_level=logging.INFO, use_pool=True):
         super().__init__(log_level, use_pool)
         self.log = OpenSiteLogger("OpenSitePostGIS", log_level)
@@ -102,6 +121,54 @@ class OpenSitePostGIS(PostGISBase):
         CREATE INDEX IF NOT EXISTS idx_{self.OPENSITE_OUTPUTS}_output ON {self.OPENSITE_OUTPUTS} (output);
         """)
 
+        self.log.debug(f"Creating {self.OPENSITE_GRIDHASHES} table")
+
+        # Content hash of every grid square of every gridded table
+        self.execute_query(f"""
+        CREATE TABLE IF NOT EXISTS {self.OPENSITE_GRIDHASHES} (
+            table_id TEXT NOT NULL,
+            gridsquare_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            PRIMARY KEY (table_id, gridsquare_id)
+        );
+        """)
+
+        self.log.debug(f"Creating {self.OPENSITE_GRIDLINEAGE} table")
+
+        # Grid square content hashes of inputs at time each table or file was last built
+        # Used to determine which grid squares need recomputing when inputs change
+        self.execute_query(f"""
+        CREATE TABLE IF NOT EXISTS {self.OPENSITE_GRIDLINEAGE} (
+            table_id TEXT NOT NULL,
+            input_id TEXT NOT NULL,
+            gridsquare_id INTEGER NOT NULL,
+            content_hash TEXT NOT NULL,
+            PRIMARY KEY (table_id, input_id, gridsquare_id)
+        );
+        """)
+
+        self.log.debug(f"Creating {self.OPENSITE_STATS} table")
+
+        # Geometry statistics of every data table, recorded when table is finalised
+        # gridsquare_vertices holds vertex count per processing grid square, eg. {"12": 35000, ...}
+        self.execute_query(f"""
+        CREATE TABLE IF NOT EXISTS {self.OPENSITE_STATS} (
+            table_id TEXT PRIMARY KEY,
+            feature_count BIGINT NOT NULL,
+            total_vertices BIGINT NOT NULL,
+            max_vertices INTEGER NOT NULL,
+            srid INTEGER,
+            xmin DOUBLE PRECISION,
+            ymin DOUBLE PRECISION,
+            xmax DOUBLE PRECISION,
+            ymax DOUBLE PRECISION,
+            gridsquare_vertices JSONB,
+            invalid_count BIGINT NOT NULL,
+            empty_count BIGINT NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+        """)
+
     def sync_registry(self):
         """
         Synchronizes registry, physical tables, and branch metadata.
@@ -125,15 +192,24 @@ class OpenSitePostGIS(PostGISBase):
             self.OPENSITE_CLIPPINGMASTER,
             self.OPENSITE_GRIDPROCESSING,
             self.OPENSITE_GRIDBUFFEDGES,
+            self.OPENSITE_GRIDPROCESSINGPREVIEW,
+            self.OPENSITE_GRIDBUFFEDGESPREVIEW,
             self.OPENSITE_GRIDOUTPUT,
             self.OPENSITE_OSMBOUNDARIES,
+            self.OPENSITE_GRIDHASHES,
+            self.OPENSITE_GRIDLINEAGE,
+            self.OPENSITE_STATS,
+            self.OPENSITE_GAZETTEER,
+            self.OPENSITE_GAZETTEERPARTS,
             'spatial_ref_sys', 
             'geography_columns', 
             'geometry_columns', 
             'raster_columns', 
             'raster_overview'
         }
-        physical_tables = {t for t in self.get_table_names() if t not in protected_tables}
+        # Cached clip masks are keyed on area list rather than node so are never in registry
+        protected_prefixes = (self.OPENSITE_CLIPMASK_PREFIX, )
+        physical_tables = {t for t in self.get_table_names() if (t not in protected_tables) and (not t.startswith(protected_prefixes))}
 
         # --- Step A & B: Clean the Registry ---
         for entry in registry_entries:
@@ -153,6 +229,24 @@ class OpenSitePostGIS(PostGISBase):
                 self.execute_query(sql.SQL("DELETE FROM {registry} WHERE table_id = {table_id_literal}").format(**dbparams))
                 registry_names.discard(table_id)
 
+        # --- Step B2: Remove unlogged tables emptied by crash recovery so they're rebuilt ---
+        # Genuinely empty unlogged tables are also rebuilt but these are cheap to rebuild
+        dbparams['registry_names'] = sql.Literal(list(registry_names))
+        unlogged_tables = self.fetch_all(sql.SQL("""
+        SELECT c.relname FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relpersistence = 'u' AND c.relname = ANY({registry_names})
+        """).format(**dbparams))
+        for row in unlogged_tables:
+            table_id = row['relname']
+            dbparams['table'] = sql.Identifier(table_id)
+            dbparams['table_id_literal'] = sql.Literal(table_id)
+            if self.fetch_all(sql.SQL("SELECT 1 FROM {table} LIMIT 1").format(**dbparams)): continue
+            self.log.warning(f"Removing empty unlogged table so it is rebuilt: {table_id}")
+            self.execute_query(sql.SQL("DROP TABLE IF EXISTS {table}; DELETE FROM {registry} WHERE table_id = {table_id_literal}").format(**dbparams))
+            registry_names.discard(table_id)
+            physical_tables.discard(table_id)
+
         # --- Step C: Clean the Database (Untracked Tables) ---
         for table_id in physical_tables:
             if table_id not in registry_names :
@@ -160,6 +254,18 @@ class OpenSitePostGIS(PostGISBase):
                 self.log.warning(f"Dropping untracked table: {table_id}")
                 self.execute_query(sql.SQL("DROP TABLE IF EXISTS {table}").format(**dbparams))
 
+        # --- Step C2: Clean grid square hashes, lineage and statistics of tables no longer in registry ---
+        # Lineage of exported files is keyed on file path so is left untouched
+        dbparams['gridhashes'] = sql.Identifier(self.OPENSITE_GRIDHASHES)
+        dbparams['gridlineage'] = sql.Identifier(self.OPENSITE_GRIDLINEAGE)
+        dbparams['stats'] = sql.Identifier(self.OPENSITE_STATS)
+        dbparams['general_prefix'] = sql.Literal(OpenSiteConstants.DATABASE_GENERAL_PREFIX.replace('_', r'\_') + '%')
+        self.execute_query(sql.SQL("""
+        DELETE FROM {gridhashes} h WHERE NOT EXISTS (SELECT 1 FROM {registry} r WHERE r.table_id = h.table_id);
+        DELETE FROM {stats} s WHERE NOT EXISTS (SELECT 1 FROM {registry} r WHERE r.table_id = s.table_id);
+        DELETE FROM {gridlineage} l WHERE l.table_id LIKE {general_prefix} AND NOT EXISTS (SELECT 1 FROM {registry} r WHERE r.table_id = l.table_id);
+        """).format(**dbparams))
+
         # --- Step D: Clean the Branches ---
         # We look for branch_name in {self.OPENSITE_BRANCH} that no longer has 
         # ANY associated records in {self.OPENSITE_REGISTRY}
@@ -283,13 +389,13 @@ class OpenSitePostGIS(PostGISBase):
             self.log.error(f"PostGIS Import Error: {os.path.basename(spatial_data_file)} {e.stderr}")
             return False
 
-    def export_spatial_data(self, spatial_data_table, spatial_data_layer_name, spatial_data_file):
+    def get_export_command(self, spatial_data_table, spatial_data_layer_name, spatial_data_file, layer_creation_options=None, driver=None):
         """
-        Generic export function for standardised export of spatial data files
+        Gets ogr2ogr command for standardised export of spatial data
+        driver is optional ogr2ogr output format, eg. 'GeoJSONSeq', otherwise format is deduced from file extension
+        layer_creation_options is optional list of ogr2ogr layer creation options, eg. ['COORDINATE_PRECISION=6']
         """
 
-        crs_output = OpenSiteConstants.CRS_OUTPUT
-
         # Base ogr2ogr Command
         cmd = [
             "ogr2ogr",
@@ -305,6 +411,20 @@ class OpenSitePostGIS(PostGISBase):
             "-t_srs", OpenSiteConstants.CRS_OUTPUT
         ]
 
+        if driver: cmd += ["-f", driver]
+        for layer_creation_option in (layer_creation_options or []): cmd += ["-lco", layer_creation_option]
+
+        return cmd
+
+    def export_spatial_data(self, spatial_data_table, spatial_data_layer_name, spatial_data_file, layer_creation_options=None, driver=None):
+        """
+        Generic export function for standardised export of spatial data files
+        layer_creation_options is optional list of ogr2ogr layer creation options, eg. ['COORDINATE_PRECISION=6']
+        driver is optional ogr2ogr output format, otherwise format is deduced from file extension
+        """
+
+        cmd = self.get_export_command(spatial_data_table, spatial_data_layer_name, spatial_data_file, layer_creation_options, driver)
+
         self.log.info(f"Exporting table '{spatial_data_table}' to file {os.path.basename(spatial_data_file)}")
 
         try:
@@ -318,92 +438,367 @@ class OpenSitePostGIS(PostGISBase):
             self.log.error(f"PostGIS Export Error: {spatial_data_table} {e.stderr} {cmd}")
             return False
         
-    def get_areas_bounds(self, areas, crs_input=OpenSiteConstants.CRS_DEFAULT, crs_output=OpenSiteConstants.CRS_OUTPUT):
+    def normalise_areas(self, areas):
         """
-        Get collective bounds of geometries for a list of area names
+        Normalises list of area names to alphabetically-ordered, lowercase, deduplicated list of OSM names
+        Used as key for cached clip masks and bounds
         """
 
-        # Normalize the list of names using your conversion map
-        processed_areas = []
+        name_convert = {key.lower(): value for key, value in OpenSiteConstants.OSM_NAME_CONVERT.items()}
+        normalised = set()
         for area in areas:
-            if area in OpenSiteConstants.OSM_NAME_CONVERT:
-                area = OpenSiteConstants.OSM_NAME_CONVERT[area]
-            processed_areas.append(area)
+            area = str(area).strip().lower()
+            if area in name_convert: area = name_convert[area]
+            normalised.add(area.lower())
+
+        return sorted(normalised)
+
+    def get_slug_sql(self, value):
+        """
+        Gets SQL expression converting text value to slug, eg. 'East Sussex' -> 'east-sussex'
+        """
+
+        return sql.SQL("NULLIF(TRIM(BOTH '-' FROM REGEXP_REPLACE(LOWER({value}), '[^a-z0-9]+', '-', 'g')), '')").format(value=value)
+
+    def create_gazetteer(self, rebuild=False):
+        """
+        Creates gazetteer of OSM boundaries if it doesn't already exist, so area names are resolved by index probe
+        - OPENSITE_GAZETTEER has one row per boundary with canonical slug, aliases (lowercase names and slugs),
+          containing country, precomputed envelope and valid geometry
+        - OPENSITE_GAZETTEERPARTS has subdivided geometries of every boundary
+        Should be rebuilt whenever boundaries are reimported
+        Returns True if gazetteer exists or was created
+        """
+
+        if not rebuild and self.table_exists(self.OPENSITE_GAZETTEER): return True
+        if not self.table_exists(self.OPENSITE_OSMBOUNDARIES): return False
+
+        # Get list of all possible OSM country names from OSM_NAME_CONVERT
+        countries = sorted(set(OpenSiteConstants.OSM_NAME_CONVERT.values()))
 
-        # Prepare parameters
-        # We use a literal tuple/list for the SQL 'ANY' comparison
         dbparams = {
-            "crs_input": sql.Literal(self.extract_crs_as_number(crs_input)),
-            "crs_output": sql.Literal(self.extract_crs_as_number(crs_output)),
-            'table': sql.Identifier(OpenSiteConstants.OPENSITE_OSMBOUNDARIES),
-            'areas': sql.Literal(processed_areas)
+            "crs": sql.Literal(self.extract_crs_as_number(OpenSiteConstants.CRS_DEFAULT)),
+            "max_vertices": sql.Literal(OpenSiteConstants.CLIP_MASK_MAX_VERTICES),
+            "countries": sql.Literal(countries),
+            "boundaries": sql.Identifier(self.OPENSITE_OSMBOUNDARIES),
+            "gazetteer": sql.Identifier(self.OPENSITE_GAZETTEER),
+            "gazetteer_literal": sql.Literal(self.OPENSITE_GAZETTEER),
+            "gazetteer_pkey": sql.Identifier(f"{self.OPENSITE_GAZETTEER}_pkey"),
+            "gazetteer_slug_index": sql.Identifier(f"{self.OPENSITE_GAZETTEER}_slug_idx"),
+            "gazetteer_aliases_index": sql.Identifier(f"{self.OPENSITE_GAZETTEER}_aliases_idx"),
+            "gazetteer_trigram_index": sql.Identifier(f"{self.OPENSITE_GAZETTEER}_slug_trgm_idx"),
+            "parts": sql.Identifier(self.OPENSITE_GAZETTEERPARTS),
+            "parts_index": sql.Identifier(f"{self.OPENSITE_GAZETTEERPARTS}_idx"),
+            "parts_area_index": sql.Identifier(f"{self.OPENSITE_GAZETTEERPARTS}_area_id_idx"),
         }
+        dbparams['slug_name'] = self.get_slug_sql(sql.SQL("COALESCE(b.name, b.council_name)"))
+        dbparams['slug_council_name'] = self.get_slug_sql(sql.SQL("b.council_name"))
+        dbparams['drop'] = sql.SQL("DROP TABLE IF EXISTS {gazetteer}; DROP TABLE IF EXISTS {parts};").format(**dbparams) if rebuild else sql.SQL('')
 
-        # Use ILIKE ANY to match any string in the list
-        query_maxbounds = sql.SQL("""
-        SELECT 
-            ST_XMin(extent_output_crs) AS left,
-            ST_YMin(extent_output_crs) AS bottom,
-            ST_XMax(extent_output_crs) AS right,
-            ST_YMax(extent_output_crs) AS top
-        FROM 
+        # Processes may build gazetteer in parallel so advisory lock ensures only one process builds it
+        # - other processes wait for lock and then find gazetteer already exists
+        # Containing country is country with largest overlap, computed using subdivided geometries
+        # Boundaries with only council name, eg. some unitary authorities, are included and use it as slug
+        query_create_gazetteer = sql.SQL("""
+        SELECT pg_advisory_xact_lock(hashtext({gazetteer_literal}));
+        {drop}
+        CREATE TABLE IF NOT EXISTS {parts} AS 
+            SELECT ogc_fid AS area_id, ST_Subdivide(ST_CollectionExtract(ST_MakeValid(geom), 3), {max_vertices})::geometry(Polygon, {crs}) AS geom 
+            FROM {boundaries} WHERE COALESCE(name, council_name) IS NOT NULL;
+        CREATE INDEX IF NOT EXISTS {parts_index} ON {parts} USING GIST (geom);
+        CREATE INDEX IF NOT EXISTS {parts_area_index} ON {parts} (area_id);
+        ANALYZE {parts};
+        CREATE TABLE IF NOT EXISTS {gazetteer} AS 
+            WITH area_countries AS 
             (
-            SELECT ST_Transform(ST_SetSRID(ST_Extent(geom), {crs_input}), {crs_output}) AS extent_output_crs 
-            FROM {table} 
-            WHERE name ILIKE ANY ({areas}) OR council_name ILIKE ANY ({areas})
-            ) AS subquery
+                SELECT DISTINCT ON (area.area_id) area.area_id, country.name AS country 
+                FROM {parts} area 
+                JOIN {parts} country_part ON ST_Intersects(area.geom, country_part.geom) 
+                JOIN {boundaries} country ON country.ogc_fid = country_part.area_id AND country.name = ANY({countries}) 
+                GROUP BY area.area_id, country.name 
+                ORDER BY area.area_id, SUM(ST_Area(ST_Intersection(area.geom, country_part.geom))) DESC
+            )
+            SELECT 
+                b.ogc_fid AS area_id, 
+                {slug_name} AS slug, 
+                b.name, 
+                b.council_name, 
+                b.admin_level, 
+                area_countries.country, 
+                ARRAY(SELECT DISTINCT alias FROM unnest(ARRAY[LOWER(b.name), LOWER(b.council_name), {slug_name}, {slug_council_name}]) alias WHERE alias <> '') AS aliases, 
+                ST_Envelope(b.geom) AS envelope, 
+                ST_Multi(ST_CollectionExtract(ST_MakeValid(b.geom), 3))::geometry(MultiPolygon, {crs}) AS geom 
+            FROM {boundaries} b LEFT JOIN area_countries ON area_countries.area_id = b.ogc_fid 
+            WHERE COALESCE(b.name, b.council_name) IS NOT NULL;
+        CREATE UNIQUE INDEX IF NOT EXISTS {gazetteer_pkey} ON {gazetteer} (area_id);
+        CREATE INDEX IF NOT EXISTS {gazetteer_slug_index} ON {gazetteer} (slug);
+        CREATE INDEX IF NOT EXISTS {gazetteer_aliases_index} ON {gazetteer} USING GIN (aliases);
+        ANALYZE {gazetteer};
+        """).format(**dbparams)
+
+        # Trigram index only used for suggesting area names so not created if pg_trgm extension unavailable
+        query_create_trigram_index = sql.SQL("""
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS {gazetteer_trigram_index} ON {gazetteer} USING GIN (slug gin_trgm_ops);
         """).format(**dbparams)
 
         try:
-            results = self.fetch_all(query_maxbounds)
-            
-            # Check if we actually found anything
-            if not results or results[0]['left'] is None:
+            self.log.info(f"Creating gazetteer {self.OPENSITE_GAZETTEER} from {self.OPENSITE_OSMBOUNDARIES}")
+            self.execute_query(query_create_gazetteer)
+            AREAS_BOUNDS_CACHE.clear()
+            GAZETTEER_CACHE.clear()
+        except Exception as e:
+            self.log.error(f"PostGIS error while creating gazetteer: {e}")
+            return False
+
+        # Clip masks are built from gazetteer geometries so are stale once boundaries are reimported
+        if rebuild: self.drop_clip_masks()
+
+        try:
+            self.execute_query(query_create_trigram_index)
+        except Exception as e:
+            self.log.warning(f"Unable to create trigram index on gazetteer, area suggestions will not be available: {e}")
+
+        return True
+
+    def get_area_ids(self, areas):
+        """
+        Gets gazetteer area ids of all boundaries matching list of area names
+        Results are memoised per process, misses aren't cached as boundaries may not have been imported yet
+        """
+
+        processed_areas = self.normalise_areas(areas)
+        cache_key = ('area_ids', tuple(processed_areas))
+        if cache_key in GAZETTEER_CACHE: return list(GAZETTEER_CACHE[cache_key])
+
+        if not self.create_gazetteer(): return []
+
+        dbparams = {
+            'gazetteer': sql.Identifier(self.OPENSITE_GAZETTEER),
+            'areas': sql.Literal(processed_areas),
+        }
+
+        results = self.fetch_all(sql.SQL("SELECT area_id FROM {gazetteer} WHERE aliases && {areas}::text[] ORDER BY area_id").format(**dbparams))
+        area_ids = [row['area_id'] for row in results]
+        if area_ids: GAZETTEER_CACHE[cache_key] = area_ids
+
+        return list(area_ids)
+
+    def get_area_names(self):
+        """
+        Gets sorted list of names of all boundaries, excluding admin level 4 (countries), for use as clipping areas
+        Results are memoised per process
+        Gazetteer is only built when boundaries are imported so returns empty list until it exists
+        """
+
+        if 'area_names' in GAZETTEER_CACHE: return list(GAZETTEER_CACHE['area_names'])
+
+        if not self.table_exists(self.OPENSITE_GAZETTEER): return []
+
+        query_area_names = sql.SQL("""
+        SELECT DISTINCT all_names.name FROM 
+        (
+            SELECT name FROM {gazetteer} WHERE name <> '' AND admin_level <> '4' UNION 
+            SELECT council_name name FROM {gazetteer} WHERE council_name <> '' AND admin_level <> '4' 
+        ) all_names ORDER BY all_names.name""").format(gazetteer=sql.Identifier(self.OPENSITE_GAZETTEER))
+
+        GAZETTEER_CACHE['area_names'] = [row['name'] for row in self.fetch_all(query_area_names)]
+        return list(GAZETTEER_CACHE['area_names'])
+
+    def search_areas(self, text, limit=5):
+        """
+        Gets names of boundaries most similar to text, eg. to suggest alternatives for area names that can't be found
+        Returns empty list if gazetteer doesn't exist yet or pg_trgm extension unavailable
+        """
+
+        if not self.table_exists(self.OPENSITE_GAZETTEER): return []
+
+        dbparams = {
+            'gazetteer': sql.Identifier(self.OPENSITE_GAZETTEER),
+            'text': sql.Literal(str(text)),
+            'limit': sql.Literal(limit),
+        }
+        dbparams['slug_text'] = self.get_slug_sql(dbparams['text'])
+
+        query_search = sql.SQL("""
+        SELECT name FROM 
+        (
+            SELECT COALESCE(name, council_name) AS name, MAX(similarity(slug, {slug_text})) AS score FROM {gazetteer} 
+            WHERE slug % {slug_text} GROUP BY COALESCE(name, council_name)
+        ) matches ORDER BY score DESC, name LIMIT {limit}""").format(**dbparams)
+
+        try:
+            return [row['name'] for row in self.fetch_all(query_search)]
+        except Exception as e:
+            self.log.debug(f"Unable to search gazetteer for '{text}': {e}")
+            return []
+
+    def get_areas_bounds(self, areas, crs_input=OpenSiteConstants.CRS_DEFAULT, crs_output=OpenSiteConstants.CRS_OUTPUT, margin=0):
+        """
+        Get collective bounds of geometries for a list of area names
+        Optional margin is in units of crs_input and is added before transforming to crs_output
+        Results are memoised per process as same bounds are requested repeatedly per branch
+        """
+
+        processed_areas = self.normalise_areas(areas)
+        cache_key = (tuple(processed_areas), str(crs_input), str(crs_output), margin)
+        if cache_key in AREAS_BOUNDS_CACHE: return dict(AREAS_BOUNDS_CACHE[cache_key])
+
+        try:
+            # Don't cache misses as boundaries table may not have been imported yet
+            area_ids = self.get_area_ids(processed_areas)
+            if not area_ids:
                 self.log.debug(f"Unable to find any clipping areas from list {areas} in boundary database")
                 return None
 
-            return results[0]
+            dbparams = {
+                "crs_input": sql.Literal(self.extract_crs_as_number(crs_input)),
+                "crs_output": sql.Literal(self.extract_crs_as_number(crs_output)),
+                'gazetteer': sql.Identifier(self.OPENSITE_GAZETTEER),
+                'area_ids': sql.Literal(area_ids),
+                'margin': sql.Literal(margin)
+            }
+
+            query_maxbounds = sql.SQL("""
+            SELECT 
+                ST_XMin(extent_output_crs) AS left,
+                ST_YMin(extent_output_crs) AS bottom,
+                ST_XMax(extent_output_crs) AS right,
+                ST_YMax(extent_output_crs) AS top
+            FROM 
+                (
+                SELECT ST_Transform(ST_Expand(ST_SetSRID(ST_Extent(envelope)::geometry, {crs_input}), {margin}), {crs_output}) AS extent_output_crs 
+                FROM {gazetteer} 
+                WHERE area_id = ANY({area_ids}::int[])
+                ) AS subquery
+            """).format(**dbparams)
+
+            results = self.fetch_all(query_maxbounds)
+            if not results or results[0]['left'] is None: return None
+
+            AREAS_BOUNDS_CACHE[cache_key] = dict(results[0])
+            return dict(results[0])
             
         except Exception as e:
             self.log.error(f"PostGIS error while fetching multi-area bounds: {e}")
             return None
 
+    def get_missing_areas(self, areas):
+        """
+        Returns list of normalised area names that can't be found in boundaries table
+        """
+
+        processed_areas = self.normalise_areas(areas)
+
+        if not self.create_gazetteer(): return processed_areas
+
+        dbparams = {
+            'gazetteer': sql.Identifier(self.OPENSITE_GAZETTEER),
+            'areas': sql.Literal(processed_areas)
+        }
+
+        query_missing_areas = sql.SQL("""
+        SELECT area FROM unnest({areas}::text[]) area 
+        WHERE NOT EXISTS (SELECT 1 FROM {gazetteer} WHERE aliases @> ARRAY[area])
+        """).format(**dbparams)
+
+        return [row['area'] for row in self.fetch_all(query_missing_areas)]
+
+    def get_clip_mask_table(self, areas):
+        """
+        Gets name of cached clip mask table for list of areas
+        Same list of areas, in whatever order or case, always gives same table
+        """
+
+        areas_hash = hashlib.md5(json.dumps(self.normalise_areas(areas)).encode()).hexdigest()
+        return f"{self.OPENSITE_CLIPMASK_PREFIX}{areas_hash}"
+
+    def drop_clip_masks(self):
+        """
+        Drops all cached clip masks so they're recreated from current gazetteer when next needed
+        """
+
+        for table in self.get_table_names():
+            if not table.startswith(self.OPENSITE_CLIPMASK_PREFIX): continue
+            self.log.info(f"Dropping stale clip mask {table}")
+            self.execute_query(sql.SQL("DROP TABLE IF EXISTS {table}").format(table=sql.Identifier(table)))
+
+    def create_clip_mask(self, areas):
+        """
+        Creates subdivided and indexed clip mask for list of areas if it doesn't already exist
+        Mask is built once and reused by every clipped layer using same list of areas
+        Returns name of mask table or None if unable to create it
+        """
+
+        mask_table = self.get_clip_mask_table(areas)
+        if self.table_exists(mask_table): return mask_table
+
+        missing_areas = self.get_missing_areas(areas)
+        if missing_areas:
+            self.log.error(f"Unable to find clipping areas {missing_areas} in boundaries database, unable to create clip mask")
+            for missing_area in missing_areas:
+                suggestions = self.search_areas(missing_area)
+                if suggestions: self.log.error(f"Closest matches to '{missing_area}': {', '.join(suggestions)}")
+            return None
+
+        dbparams = {
+            "crs": sql.Literal(self.extract_crs_as_number(OpenSiteConstants.CRS_DEFAULT)),
+            "area_ids": sql.Literal(self.get_area_ids(areas)),
+            "max_vertices": sql.Literal(OpenSiteConstants.CLIP_MASK_MAX_VERTICES),
+            "gazetteer": sql.Identifier(self.OPENSITE_GAZETTEER),
+            "mask": sql.Identifier(mask_table),
+            "mask_literal": sql.Literal(mask_table),
+            "mask_index": sql.Identifier(f"{mask_table}_idx"),
+        }
+
+        # Clip nodes run in parallel so advisory lock ensures only one process builds mask 
+        # - other processes wait for lock and then find mask already exists
+        # Gazetteer geometries are already valid polygons
+        query_create_mask = sql.SQL("""
+        SELECT pg_advisory_xact_lock(hashtext({mask_literal}));
+        CREATE TABLE IF NOT EXISTS {mask} AS 
+            SELECT ST_Subdivide(dissolved.geom, {max_vertices})::geometry(Polygon, {crs}) AS geom 
+            FROM 
+            (
+                SELECT (ST_Dump(ST_Union(geom))).geom AS geom 
+                FROM {gazetteer} 
+                WHERE area_id = ANY({area_ids}::int[])
+            ) dissolved;
+        CREATE INDEX IF NOT EXISTS {mask_index} ON {mask} USING GIST (geom);
+        ANALYZE {mask};
+        """).format(**dbparams)
+
+        try:
+            self.log.info(f"Creating clip mask {mask_table} for areas {self.normalise_areas(areas)}")
+            self.execute_query(query_create_mask)
+            return mask_table
+        except Exception as e:
+            self.log.error(f"PostGIS error while creating clip mask {mask_table}: {e}")
+            return None
+
     def get_country_from_area(self, area):
         """
-        Determine country that single area is in using OPENSITE_OSMBOUNDARIES
+        Determine country that single area is in using containing country precomputed in gazetteer
+        Where several boundaries share area name, country of highest level boundary is used
         """
 
-        # Get list of all possible OSM country names from OSM_NAME_CONVERT
-        countries = [OpenSiteConstants.OSM_NAME_CONVERT[country] for country in OpenSiteConstants.OSM_NAME_CONVERT.keys()]
+        area_ids = self.get_area_ids([area])
+        if not area_ids: return None
 
         dbparams = \
         {
-            'area':         sql.Literal(area),
-            'boundaries':   sql.Identifier(OpenSiteConstants.OPENSITE_OSMBOUNDARIES),
-            'countries':    sql.Literal(countries),
+            'gazetteer':    sql.Identifier(self.OPENSITE_GAZETTEER),
+            'area_ids':     sql.Literal(area_ids),
         }
 
-        query_find_containing_countries = sql.SQL("""
-        WITH primaryarea AS
-        (
-            SELECT geom FROM {boundaries} WHERE (name ILIKE {area}) OR (council_name ILIKE {area}) LIMIT 1
-        )
-        SELECT 
-            name, ST_Area(ST_Intersection(primaryarea.geom, secondaryarea.geom)) geom_intersection 
-        FROM 
-            {boundaries} secondaryarea, primaryarea 
-        WHERE 
-            name = ANY ({countries}) AND ST_Intersects(primaryarea.geom, secondaryarea.geom) 
-        ORDER BY geom_intersection DESC LIMIT 1;
+        query_country = sql.SQL("""
+        SELECT country FROM {gazetteer} 
+        WHERE area_id = ANY({area_ids}::int[]) AND country IS NOT NULL 
+        ORDER BY CASE WHEN admin_level ~ '^[0-9]+$' THEN admin_level::int END, area_id LIMIT 1
         """).format(**dbparams)
-                
-        containing_geometries = self.fetch_all(query_find_containing_countries)
 
-        if len(containing_geometries) > 0:
-            containing_country = containing_geometries[0]['name']
-            for canonical_country in OpenSiteConstants.OSM_NAME_CONVERT.keys():
-                if OpenSiteConstants.OSM_NAME_CONVERT[canonical_country] == containing_country: 
-                    return OpenSiteConstants.OSM_NAME_CONVERT[canonical_country]
+        results = self.fetch_all(query_country)
+        if results: return results[0]['country']
 
         return None
 
@@ -451,4 +846,597 @@ class OpenSitePostGIS(PostGISBase):
 
         except Exception as e:
             self.log.error(f"Failed to synchronize lineage for {input}: {e}")
-            return False
\ No newline at end of file
+            return False
+
+    def compute_gridsquare_hashes(self, table, gridsquare_ids=None):
+        """
+        Computes content hash of every grid square of gridded table, ie. {gridsquare_id: content_hash}
+        Gridded tables either have 'id' column holding processing grid square id 
+        or 'gridsquare_ids' array column for features spanning several grid squares
+        If gridsquare_ids set, only computes hashes for those grid squares
+        """
+
+        columns = self.get_column_names(table)
+        if 'gridsquare_ids' in columns:
+            query_gridsquare = sql.SQL("SELECT g.gridsquare_id, md5(ST_AsEWKB(t.geom)) geom_hash FROM {table} t CROSS JOIN LATERAL unnest(t.gridsquare_ids) g(gridsquare_id)")
+        elif 'id' in columns:
+            query_gridsquare = sql.SQL("SELECT t.id gridsquare_id, md5(ST_AsEWKB(t.geom)) geom_hash FROM {table} t")
+        else:
+            self.log.debug(f"[compute_gridsquare_hashes] {table} has no grid square column, unable to compute grid square hashes")
+            return None
+
+        dbparams = {
+            'table': sql.Identifier(table),
+            'gridsquare_ids': sql.Literal(list(gridsquare_ids) if gridsquare_ids is not None else None),
+        }
+
+        query = sql.SQL("""
+        SELECT gridsquare_id, md5(string_agg(geom_hash, '' ORDER BY geom_hash)) content_hash 
+        FROM ({query_gridsquare}) gridsquares 
+        WHERE gridsquare_id IS NOT NULL AND ({gridsquare_ids}::int[] IS NULL OR gridsquare_id = ANY({gridsquare_ids}::int[])) 
+        GROUP BY gridsquare_id""").format(query_gridsquare=query_gridsquare.format(**dbparams), **dbparams)
+
+        results = self.fetch_all(query)
+        return {row['gridsquare_id']: row['content_hash'] for row in results}
+
+    def set_gridsquare_hashes(self, table, hashes, gridsquare_ids=None):
+        """
+        Stores grid square content hashes of table
+        If gridsquare_ids set, only replaces hashes for those grid squares
+        """
+
+        dbparams = {
+            'gridhashes': sql.Identifier(self.OPENSITE_GRIDHASHES),
+            'table': sql.Literal(table),
+            'gridsquare_ids': sql.Literal(list(gridsquare_ids) if gridsquare_ids is not None else None),
+            'hash_ids': sql.Literal(list(hashes.keys())),
+            'hash_values': sql.Literal(list(hashes.values())),
+        }
+
+        self.execute_query(sql.SQL("""
+        DELETE FROM {gridhashes} WHERE table_id = {table} AND ({gridsquare_ids}::int[] IS NULL OR gridsquare_id = ANY({gridsquare_ids}::int[]));
+        INSERT INTO {gridhashes} (table_id, gridsquare_id, content_hash) 
+        SELECT {table}, gridsquare_id, content_hash FROM unnest({hash_ids}::int[], {hash_values}::text[]) AS h(gridsquare_id, content_hash)
+        ON CONFLICT (table_id, gridsquare_id) DO UPDATE SET content_hash = EXCLUDED.content_hash;
+        """).format(**dbparams))
+
+    def update_gridsquare_hashes(self, table, gridsquare_ids=None):
+        """
+        Recomputes and stores grid square content hashes of table
+        Should be called whenever gridded table is created or modified
+        """
+
+        hashes = self.compute_gridsquare_hashes(table, gridsquare_ids)
+        if hashes is None: return None
+        self.set_gridsquare_hashes(table, hashes, gridsquare_ids)
+        return hashes
+
+    def get_gridsquare_hashes(self, table):
+        """
+        Gets stored grid square content hashes of table
+        Hashes are computed and stored if table was created before hashes were recorded
+        """
+
+        dbparams = {
+            'gridhashes': sql.Identifier(self.OPENSITE_GRIDHASHES),
+            'table': sql.Literal(table),
+        }
+
+        results = self.fetch_all(sql.SQL("SELECT gridsquare_id, content_hash FROM {gridhashes} WHERE table_id = {table}").format(**dbparams))
+        if results: return {row['gridsquare_id']: row['content_hash'] for row in results}
+
+        return self.update_gridsquare_hashes(table)
+
+    def get_gridsquare_lineage(self, table):
+        """
+        Gets grid square content hashes of inputs at time table (or file) was last built, ie. {input: {gridsquare_id: content_hash}}
+        Returns None if no lineage has been recorded
+        """
+
+        dbparams = {
+            'gridlineage': sql.Identifier(self.OPENSITE_GRIDLINEAGE),
+            'table': sql.Literal(table),
+        }
+
+        results = self.fetch_all(sql.SQL("SELECT input_id, gridsquare_id, content_hash FROM {gridlineage} WHERE table_id = {table}").format(**dbparams))
+        if not results: return None
+
+        lineage = {}
+        for row in results:
+            if row['input_id'] not in lineage: lineage[row['input_id']] = {}
+            lineage[row['input_id']][row['gridsquare_id']] = row['content_hash']
+
+        return lineage
+
+    def set_gridsquare_lineage(self, table, input_hashes):
+        """
+        Stores grid square content hashes of inputs used to build table (or file)
+        input_hashes is {input: {gridsquare_id: content_hash}}
+        """
+
+        dbparams = {
+            'gridlineage': sql.Identifier(self.OPENSITE_GRIDLINEAGE),
+            'table': sql.Literal(table),
+        }
+
+        queries = [sql.SQL("DELETE FROM {gridlineage} WHERE table_id = {table};").format(**dbparams)]
+        for input, hashes in input_hashes.items():
+            # Empty inputs still need lineage row so lineage isn't treated as missing
+            if not hashes: hashes = {-1: ''}
+            queries.append(sql.SQL("""
+            INSERT INTO {gridlineage} (table_id, input_id, gridsquare_id, content_hash) 
+            SELECT {table}, {input}, gridsquare_id, content_hash FROM unnest({hash_ids}::int[], {hash_values}::text[]) AS h(gridsquare_id, content_hash);
+            """).format(input=sql.Literal(input), hash_ids=sql.Literal(list(hashes.keys())), hash_values=sql.Literal(list(hashes.values())), **dbparams))
+
+        self.execute_query(sql.Composed(queries))
+
+    def get_dirty_gridsquares(self, table, input_hashes):
+        """
+        Gets ids of grid squares where inputs have changed since table (or file) was last built
+        input_hashes is {input: {gridsquare_id: content_hash}} of current inputs
+        Returns None if no lineage has been recorded for table
+        """
+
+        lineage = self.get_gridsquare_lineage(table)
+        if lineage is None: return None
+
+        dirty = set()
+        for input in set(input_hashes.keys()) | set(lineage.keys()):
+            current, previous = input_hashes.get(input, {}), lineage.get(input, {})
+            for gridsquare_id in set(current.keys()) | set(previous.keys()):
+                if current.get(gridsquare_id) != previous.get(gridsquare_id): dirty.add(gridsquare_id)
+
+        # Remove placeholder for empty inputs
+        dirty.discard(-1)
+
+        return dirty
+
+    def has_coverage_simplify(self):
+        """
+        Checks whether ST_CoverageSimplify is available, ie. PostGIS 3.4+ built with GEOS 3.12+
+        """
+
+        if 'coverage_simplify' not in POSTGIS_FUNCTIONS_CACHE:
+            results = self.fetch_all(sql.SQL("""
+            SELECT EXISTS (SELECT 1 FROM pg_catalog.pg_proc WHERE proname = 'st_coveragesimplify') AS available, postgis_geos_version() AS geos_version
+            """))
+            geos_version = [int(part) for part in results[0]['geos_version'].split('-')[0].split('.')[:2]]
+            POSTGIS_FUNCTIONS_CACHE['coverage_simplify'] = results[0]['available'] and (geos_version >= [3, 12])
+
+        return POSTGIS_FUNCTIONS_CACHE['coverage_simplify']
+
+    def is_preview_table(self, table):
+        """
+        Checks whether table was created by preview build
+        """
+
+        return table.startswith(OpenSiteConstants.DATABASE_PREVIEW_PREFIX)
+
+    def get_processing_grid(self, preview=False):
+        """
+        Gets (processing grid, buffered edges of processing grid) tables
+        Preview builds use coarser preview processing grid
+        """
+
+        if preview: return self.OPENSITE_GRIDPROCESSINGPREVIEW, self.OPENSITE_GRIDBUFFEDGESPREVIEW
+        return self.OPENSITE_GRIDPROCESSING, self.OPENSITE_GRIDBUFFEDGES
+
+    def get_generalised_table(self, generalised, tolerance):
+        """
+        Gets generalised level of detail (LOD) table with largest tolerance not above tolerance
+        generalised is {tolerance: table} of LOD tables
+        Returns None if there is no such table, ie. full resolution table should be used
+        """
+
+        tolerances = [generalised_tolerance for generalised_tolerance in generalised.keys() if generalised_tolerance <= tolerance]
+        if not tolerances: return None
+        return generalised[max(tolerances)]
+
+    def get_storage_policy(self, storage, stage):
+        """
+        Gets storage policy for stage from storage configuration, ie. 'storage' section of site YAML or defaults
+        Policies are merged in order: built-in default, configured default, built-in stage, configured stage
+        """
+
+        storage = storage or {}
+        policy = {}
+        for source in [OpenSiteConstants.STORAGE_POLICY.get('default'), storage.get('default'), \
+                       OpenSiteConstants.STORAGE_POLICY.get(stage), storage.get(stage)]:
+            if source: policy.update(source)
+
+        if policy.get('persistence') not in ['logged', 'unlogged']:
+            self.log.warning(f"[get_storage_policy] Invalid persistence '{policy.get('persistence')}' for stage '{stage}', using 'logged'")
+            policy['persistence'] = 'logged'
+
+        return policy
+
+    def create_table(self, table, query=None, columns=None, storage=None):
+        """
+        Creates table applying storage policy (see get_storage_policy)
+        Table is either created from query, ie. CREATE TABLE ... AS [query], or from column definitions
+        query and columns are composable SQL, eg. sql.SQL("SELECT geom FROM {input}").format(...)
+        Errors are raised to caller
+        """
+
+        policy = storage or self.get_storage_policy(None, 'default')
+
+        dbparams = {
+            'table': sql.Identifier(table),
+            'query': query,
+            'columns': columns,
+            'fillfactor': sql.Literal(int(policy['fillfactor'])) if policy.get('fillfactor') else None,
+            'tablespace': sql.Identifier(policy['tablespace']) if policy.get('tablespace') else None,
+            'compression': sql.Literal(policy['compression']) if policy.get('compression') else None,
+        }
+
+        # New columns take compression method from default_toast_compression
+        # so setting it in same transaction also applies to rows written by CREATE TABLE AS
+        queries = []
+        if policy.get('compression'): queries.append(sql.SQL("SET LOCAL default_toast_compression = {compression};").format(**dbparams))
+
+        create = [sql.SQL("CREATE UNLOGGED TABLE {table}" if policy['persistence'] == 'unlogged' else "CREATE TABLE {table}").format(**dbparams)]
+        if columns is not None:             create.append(sql.SQL("({columns})").format(**dbparams))
+        if policy.get('fillfactor'):        create.append(sql.SQL("WITH (fillfactor = {fillfactor})").format(**dbparams))
+        if policy.get('tablespace'):        create.append(sql.SQL("TABLESPACE {tablespace}").format(**dbparams))
+        if query is not None:               create.append(sql.SQL("AS {query}").format(**dbparams))
+        queries.append(sql.SQL(' ').join(create) + sql.SQL(';'))
+
+        self.execute_query(sql.Composed(queries))
+
+    def finalise_table(self, table, indexes=None, cluster=OpenSiteConstants.POSTGIS_CLUSTER_METHOD, storage=None):
+        """
+        Finalises newly created (or modified) table so later steps query it efficiently
+        - Sets table LOGGED or UNLOGGED and puts indexes in tablespace according to storage policy, default is LOGGED
+        - Optionally reorders rows so nearby features are stored together, 'gist' or 'geohash'
+        - Builds indexes using increased maintenance_work_mem and parallel workers
+        - Runs ANALYZE so planner has accurate statistics
+        - Records geometry statistics of data tables (see update_table_stats)
+        indexes is list of (method, column) tuples, eg. [('gist', 'geom'), ('btree', 'id')]
+        Index names match those used elsewhere, ie. [table]_idx for spatial index, [table]_[column]_idx otherwise
+        """
+
+        if indexes is None: indexes = [('gist', 'geom')]
+        policy = storage or self.get_storage_policy(None, 'default')
+        logged = (policy['persistence'] == 'logged')
+
+        def index_name(method, column):
+            if method == 'gist' and column == 'geom': return f"{table}_idx"
+            return f"{table}_{column}_idx"
+
+        dbparams = {
+            'table': sql.Identifier(table),
+            'table_lit': sql.Literal(table),
+            'cluster_index': sql.Identifier(f"{table}_cluster_idx"),
+            'spatial_index': sql.Identifier(index_name('gist', 'geom')),
+            'maintenance_work_mem': sql.Literal(OpenSiteConstants.POSTGIS_MAINTENANCE_WORK_MEM),
+            'maintenance_workers': sql.Literal(str(int(OpenSiteConstants.POSTGIS_MAINTENANCE_WORKERS))),
+            'index_tablespace': sql.SQL(" TABLESPACE {tablespace}").format(tablespace=sql.Identifier(policy['tablespace'])) if policy.get('tablespace') else sql.SQL(''),
+        }
+
+        try:
+            results = self.fetch_all(sql.SQL("""
+            SELECT c.relpersistence FROM pg_catalog.pg_class c
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = {table_lit} AND c.relkind = 'r'
+            """).format(**dbparams))
+            if not results:
+                self.log.error(f"[finalise_table] {table} does not exist, unable to finalise")
+                return False
+            persistence = results[0]['relpersistence']
+
+            # All statements run in single transaction so SET LOCAL settings apply to every step
+            queries = [sql.SQL("""
+            SET LOCAL maintenance_work_mem = {maintenance_work_mem};
+            SET LOCAL max_parallel_maintenance_workers = {maintenance_workers};
+            """).format(**dbparams)]
+
+            # Setting persistence rewrites table so do it before clustering and index builds
+            if logged and persistence == 'u': queries.append(sql.SQL("ALTER TABLE {table} SET LOGGED;").format(**dbparams))
+            if not logged and persistence == 'p': queries.append(sql.SQL("ALTER TABLE {table} SET UNLOGGED;").format(**dbparams))
+
+            # CLUSTER rewrites table and rebuilds existing indexes so cluster before building remaining indexes
+            if cluster == 'gist' and ('gist', 'geom') in indexes:
+                queries.append(sql.SQL("""
+                CREATE INDEX IF NOT EXISTS {spatial_index} ON {table} USING GIST (geom){index_tablespace};
+                CLUSTER {table} USING {spatial_index};
+                """).format(**dbparams))
+            elif cluster == 'geohash':
+                queries.append(sql.SQL("""
+                CREATE INDEX {cluster_index} ON {table} 
+                    ((CASE WHEN ST_IsEmpty(geom) THEN NULL ELSE ST_GeoHash(ST_Transform(ST_PointOnSurface(geom), 4326), 10) END)){index_tablespace};
+                CLUSTER {table} USING {cluster_index};
+                DROP INDEX {cluster_index};
+                """).format(**dbparams))
+
+            for method, column in indexes:
+                queries.append(sql.SQL("CREATE INDEX IF NOT EXISTS {index} ON {table} USING {method} ({column}){index_tablespace};").format( \
+                    index=sql.Identifier(index_name(method, column)), method=sql.SQL(method), column=sql.Identifier(column), **dbparams))
+
+            queries.append(sql.SQL("ANALYZE {table};").format(**dbparams))
+
+            self.execute_query(sql.Composed(queries))
+            self.log.debug(f"[finalise_table] Finalised {table}")
+
+            # Scratch and internal tables are short-lived or fixed so statistics are only recorded for data tables
+            if table.startswith(OpenSiteConstants.DATABASE_GENERAL_PREFIX): self.update_table_stats(table)
+
+            return True
+
+        except Error as e:
+            self.log.error(f"[finalise_table] PostGIS error finalising {table}: {e}")
+            return False
+        except Exception as e:
+            self.log.error(f"[finalise_table] Unexpected error finalising {table}: {e}")
+            return False
+
+    def update_table_stats(self, table):
+        """
+        Computes and stores geometry statistics of table so planning decisions can be made without rescanning it
+        - Number of features, total vertices and vertices of most complex feature
+        - Extent and SRID
+        - Vertices per processing grid square, using 'id' or 'gridsquare_ids' column of gridded tables
+          or intersection with processing grid otherwise
+        - Number of invalid and empty geometries
+        Returns statistics or None if table has no geometry column or statistics couldn't be computed
+        """
+
+        columns = self.get_column_names(table)
+        if 'geom' not in columns: return None
+
+        grid, _ = self.get_processing_grid(self.is_preview_table(table))
+        dbparams = {
+            'table': sql.Identifier(table),
+            'table_lit': sql.Literal(table),
+            'stats': sql.Identifier(self.OPENSITE_STATS),
+            'grid': sql.Identifier(grid),
+        }
+
+        try:
+            results = self.fetch_all(sql.SQL("""
+            SELECT 
+                COUNT(*) AS feature_count, 
+                COALESCE(SUM(ST_NPoints(geom)), 0)::bigint AS total_vertices, 
+                COALESCE(MAX(ST_NPoints(geom)), 0) AS max_vertices, 
+                MAX(ST_SRID(geom)) AS srid, 
+                ST_XMin(ST_Extent(geom)) AS xmin, 
+                ST_YMin(ST_Extent(geom)) AS ymin, 
+                ST_XMax(ST_Extent(geom)) AS xmax, 
+                ST_YMax(ST_Extent(geom)) AS ymax, 
+                COUNT(*) FILTER (WHERE NOT ST_IsValid(geom)) AS invalid_count, 
+                COUNT(*) FILTER (WHERE ST_IsEmpty(geom)) AS empty_count 
+            FROM {table} WHERE geom IS NOT NULL
+            """).format(**dbparams))
+            stats = dict(results[0])
+
+            # Vertices of features spanning several grid squares are counted in every grid square they span
+            if 'gridsquare_ids' in columns:
+                query_histogram = sql.SQL("""
+                SELECT g.gridsquare_id, SUM(ST_NPoints(t.geom)) AS vertices 
+                FROM {table} t CROSS JOIN LATERAL unnest(t.gridsquare_ids) g(gridsquare_id) GROUP BY g.gridsquare_id""")
+            elif 'id' in columns:
+                query_histogram = sql.SQL("SELECT id AS gridsquare_id, SUM(ST_NPoints(geom)) AS vertices FROM {table} WHERE id IS NOT NULL GROUP BY id")
+            elif self.table_exists(grid) and stats['feature_count'] and stats['srid'] == int(OpenSiteConstants.CRS_DEFAULT.replace('EPSG:', '')):
+                query_histogram = sql.SQL("""
+                SELECT g.id AS gridsquare_id, SUM(ST_NPoints(t.geom)) AS vertices 
+                FROM {grid} g JOIN {table} t ON ST_Intersects(g.geom, t.geom) GROUP BY g.id""")
+            else:
+                query_histogram = None
+
+            stats['gridsquare_vertices'] = None
+            if query_histogram is not None:
+                histogram = self.fetch_all(query_histogram.format(**dbparams))
+                stats['gridsquare_vertices'] = {str(row['gridsquare_id']): int(row['vertices']) for row in histogram}
+
+            dbparams['gridsquare_vertices'] = sql.Literal(json.dumps(stats['gridsquare_vertices']) if stats['gridsquare_vertices'] is not None else None)
+            for field in ['feature_count', 'total_vertices', 'max_vertices', 'srid', 'xmin', 'ymin', 'xmax', 'ymax', 'invalid_count', 'empty_count']:
+                dbparams[field] = sql.Literal(stats[field])
+
+            self.execute_query(sql.SQL("""
+            INSERT INTO {stats} 
+            (table_id, feature_count, total_vertices, max_vertices, srid, xmin, ymin, xmax, ymax, gridsquare_vertices, invalid_count, empty_count, updated_at) 
+            VALUES 
+            ({table_lit}, {feature_count}, {total_vertices}, {max_vertices}, {srid}, {xmin}, {ymin}, {xmax}, {ymax}, {gridsquare_vertices}::jsonb, {invalid_count}, {empty_count}, CURRENT_TIMESTAMP) 
+            ON CONFLICT (table_id) DO UPDATE SET 
+                feature_count = EXCLUDED.feature_count, 
+                total_vertices = EXCLUDED.total_vertices, 
+                max_vertices = EXCLUDED.max_vertices, 
+                srid = EXCLUDED.srid, 
+                xmin = EXCLUDED.xmin, 
+                ymin = EXCLUDED.ymin, 
+                xmax = EXCLUDED.xmax, 
+                ymax = EXCLUDED.ymax, 
+                gridsquare_vertices = EXCLUDED.gridsquare_vertices, 
+                invalid_count = EXCLUDED.invalid_count, 
+                empty_count = EXCLUDED.empty_count, 
+                updated_at = EXCLUDED.updated_at
+            """).format(**dbparams))
+
+            if stats['invalid_count']:
+                self.log.warning(f"[update_table_stats] {table} has {stats['invalid_count']} invalid geometries")
+
+            self.log.debug(f"[update_table_stats] {table}: {stats['feature_count']} features, {stats['total_vertices']} vertices")
+            return stats
+
+        except Error as e:
+            self.log.warning(f"[update_table_stats] PostGIS error computing statistics for {table}: {e}")
+            return None
+        except Exception as e:
+            self.log.warning(f"[update_table_stats] Unexpected error computing statistics for {table}: {e}")
+            return None
+
+    def get_tables_stats(self, tables):
+        """
+        Gets stored geometry statistics of tables, ie. {table: stats}
+        Tables without statistics, eg. imported or created before statistics were recorded, are omitted
+        """
+
+        if not tables: return {}
+
+        dbparams = {
+            'stats': sql.Identifier(self.OPENSITE_STATS),
+            'tables': sql.Literal(list(tables)),
+        }
+
+        results = self.fetch_all(sql.SQL("SELECT * FROM {stats} WHERE table_id = ANY({tables})").format(**dbparams))
+        return {row['table_id']: dict(row) for row in results}
+
+    def get_table_stats(self, table, compute=False):
+        """
+        Gets stored geometry statistics of table, computing them if not stored and compute is True
+        Returns None if no statistics available
+        """
+
+        stats = self.get_tables_stats([table]).get(table)
+        if stats is None and compute and self.table_exists(table): stats = self.update_table_stats(table)
+        return stats
+
+    def get_database_size(self):
+        """
+        Gets total size of database in bytes
+        """
+
+        results = self.fetch_all("SELECT pg_database_size(current_database()) AS size")
+        return results[0]['size']
+
+    def get_table_sizes(self, tables):
+        """
+        Gets total size, including indexes and TOAST, of tables in bytes, ie. {table: size}
+        """
+
+        query = sql.SQL("""
+        SELECT c.relname, pg_total_relation_size(c.oid) AS size
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'public' AND c.relkind = 'r' AND c.relname = ANY({tables})
+        """).format(tables=sql.Literal(list(tables)))
+
+        results = self.fetch_all(query)
+        return {row['relname']: row['size'] for row in results}
+
+    def get_archive_paths(self, table):
+        """
+        Gets paths of compressed data file and JSON definition file used to archive table
+        """
+
+        archive_folder = Path(OpenSiteConstants.ARCHIVE_FOLDER)
+        return archive_folder / f"{table}.copy.gz", archive_folder / f"{table}.json"
+
+    def is_table_archived(self, table):
+        """
+        Checks whether table has been archived
+        Definition file is written last so its existence means archive is complete
+        """
+
+        return self.get_archive_paths(table)[1].exists()
+
+    def archive_table(self, table):
+        """
+        Moves table to compressed archive file so it can be restored later, dropping table
+        Table data is archived losslessly using binary COPY and gzip
+        """
+
+        data_path, definition_path = self.get_archive_paths(table)
+        data_path_temp = data_path.with_name(data_path.name + '.tmp')
+        dbparams = {'table': sql.Identifier(table), 'table_lit': sql.Literal(table)}
+
+        try:
+            columns = self.fetch_all(sql.SQL("""
+            SELECT a.attname AS name, format_type(a.atttypid, a.atttypmod) AS type
+            FROM pg_catalog.pg_attribute a
+            JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = {table_lit} AND a.attnum > 0 AND NOT a.attisdropped
+            ORDER BY a.attnum
+            """).format(**dbparams))
+
+            # Only single column indexes are created on data tables so they're enough to restore indexes
+            indexes = self.fetch_all(sql.SQL("""
+            SELECT am.amname AS method, a.attname AS column
+            FROM pg_catalog.pg_index i
+            JOIN pg_catalog.pg_class c ON c.oid = i.indrelid
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            JOIN pg_catalog.pg_class ic ON ic.oid = i.indexrelid
+            JOIN pg_catalog.pg_am am ON am.oid = ic.relam
+            JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum = i.indkey[0]
+            WHERE n.nspname = 'public' AND c.relname = {table_lit} AND i.indnatts = 1
+            """).format(**dbparams))
+
+            comment = self.fetch_all(sql.SQL("""
+            SELECT obj_description(c.oid, 'pg_class') AS comment
+            FROM pg_catalog.pg_class c
+            JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = {table_lit} AND c.relkind = 'r'
+            """).format(**dbparams))
+        except Error as e:
+            self.log.error(f"[archive_table] PostGIS error reading definition of {table}: {e}")
+            return False
+
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = self.get_connection()
+        try:
+            with gzip.open(data_path_temp, 'wb') as archive_file:
+                with conn.cursor() as cursor:
+                    cursor.copy_expert(sql.SQL("COPY {table} TO STDOUT (FORMAT binary)").format(**dbparams).as_string(conn), archive_file)
+            conn.commit()
+            os.replace(data_path_temp, data_path)
+
+            definition = {
+                'table': table,
+                'columns': [[column['name'], column['type']] for column in columns],
+                'indexes': [[index['method'], index['column']] for index in indexes],
+                'comment': comment[0]['comment'] if comment else None,
+            }
+            with open(definition_path, 'w') as definition_file:
+                json.dump(definition, definition_file, indent=4)
+
+        except Exception as e:
+            conn.rollback()
+            if data_path_temp.exists(): os.remove(data_path_temp)
+            self.log.error(f"[archive_table] Unable to archive {table}: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+        self.drop_table(table)
+        self.log.info(f"[archive_table] Archived {table} to {data_path.name}")
+        return True
+
+    def restore_table(self, table):
+        """
+        Restores table from compressed archive file, deleting archive once table is restored
+        """
+
+        data_path, definition_path = self.get_archive_paths(table)
+        if not self.is_table_archived(table):
+            self.log.error(f"[restore_table] No archive exists for {table}")
+            return False
+
+        with open(definition_path, 'r') as definition_file:
+            definition = json.load(definition_file)
+
+        columns = [sql.SQL("{name} {type}").format(name=sql.Identifier(name), type=sql.SQL(type)) for name, type in definition['columns']]
+        dbparams = {'table': sql.Identifier(table), 'columns': sql.SQL(', ').join(columns)}
+
+        self.drop_table(table)
+
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL("CREATE TABLE {table} ({columns})").format(**dbparams))
+                with gzip.open(data_path, 'rb') as archive_file:
+                    cursor.copy_expert(sql.SQL("COPY {table} FROM STDIN (FORMAT binary)").format(**dbparams).as_string(conn), archive_file)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            self.log.error(f"[restore_table] Unable to restore {table}: {e}")
+            return False
+        finally:
+            self.return_connection(conn)
+
+        if not self.finalise_table(table, [tuple(index) for index in definition['indexes']]): return False
+        if definition['comment']: self.add_table_comment(table, definition['comment'])
+
+        os.remove(definition_path)
+        os.remove(data_path)
+        self.log.info(f"[restore_table] Restored {table} from {data_path.name}")
+        return True
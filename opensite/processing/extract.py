@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import shutil
+import subprocess
+import logging
+from pathlib import Path
+from opensite.processing.base import ProcessBase
+from opensite.constants import OpenSiteConstants
+from opensite.hashes import get_file_hash
+from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class OpenSiteExtractor(ProcessBase):
+    def __init__(self, node, log_level=logging.INFO, shared_lock=None, shared_metadata=None):
+        super().__init__(node, log_level=log_level, shared_lock=shared_lock, shared_metadata=shared_metadata)
+        self.log = OpenSiteLogger("OpenSiteExtractor", log_level, shared_lock)
+        self.postgis = OpenSitePostGIS(log_level)
+        self.base_path = OpenSiteConstants.DOWNLOAD_FOLDER
+
+    def create_extract_osmium_tool(self, osm_file, bounds, extract_tmp_path):
+        """
+        Creates extract of OSM file covering bounds using osmium-tool
+        'smart' strategy keeps multipolygons crossing extract boundary complete
+        """
+
+        cmd = [
+            "osmium", "extract",
+            "-b", f"{bounds['left']},{bounds['bottom']},{bounds['right']},{bounds['top']}",
+            "-s", "smart",
+            "--overwrite",
+            "-o", str(extract_tmp_path),
+            str(osm_file)
+        ]
+
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+
+    def create_extract_pyosmium(self, osm_file, bounds, extract_tmp_path):
+        """
+        Creates extract of OSM file covering bounds using pyosmium
+        """
+
+        import osmium
+
+        osm_file = str(osm_file)
+        box = osmium.osm.Box(
+            osmium.osm.Location(bounds['left'], bounds['bottom']),
+            osmium.osm.Location(bounds['right'], bounds['top']))
+
+        node_ids, way_ids = osmium.index.IdSet(), osmium.index.IdSet()
+
+        for node in osmium.FileProcessor(osm_file, osmium.osm.NODE):
+            if node.location.valid() and box.contains(node.location): node_ids.set(node.id)
+
+        for way in osmium.FileProcessor(osm_file, osmium.osm.WAY):
+            if any(node_ids.get(ref.ref) for ref in way.nodes): way_ids.set(way.id)
+
+        # BackReferenceWriter adds all nodes and ways referenced by written
+        # ways and relations so geometries crossing extract boundary stay complete
+        with osmium.BackReferenceWriter(str(extract_tmp_path), ref_src=osm_file, overwrite=True) as writer:
+            for obj in osmium.FileProcessor(osm_file):
+                if obj.is_node():
+                    if node_ids.get(obj.id): writer.add(obj)
+                elif obj.is_way():
+                    if way_ids.get(obj.id): writer.add(obj)
+                elif obj.is_relation():
+                    for member in obj.members:
+                        if  (member.type == 'n' and node_ids.get(member.ref)) or \
+                            (member.type == 'w' and way_ids.get(member.ref)):
+                            writer.add(obj)
+                            break
+
+    def run(self):
+        """
+        Creates extract of OSM file covering bounds of node's clip area plus margin
+
+        For osm-extractor nodes, crucial fields are:
+
+        input:  OSM file to extract from, relative to DOWNLOAD_FOLDER
+        output: OSM extract used by later nodes, relative to DOWNLOAD_FOLDER
+
+        Extracts are cached in OSM_EXTRACTS_FOLDER keyed by hash of source OSM file and extract bounds
+        so are reused by every build with same area until source OSM file changes
+        """
+
+        osm_file = Path(self.base_path) / self.node.input
+        output_path = Path(self.base_path) / self.node.output
+
+        if not osm_file.exists():
+            self.log.error(f"[{self.node.node_type}] {osm_file.name} missing from OSM downloads folder, unable to create extract")
+            return False
+
+        clip = self.node.custom_properties['clip']
+        margin = self.node.custom_properties.get('clip_margin', 0)
+        bounds = self.postgis.get_areas_bounds(clip, OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_OUTPUT, margin)
+        if bounds is None:
+            self.log.error(f"[{self.node.node_type}] Unable to find bounds for clip area '{';'.join(clip)}'")
+            return False
+
+        extract_key = json.dumps({'osm': get_file_hash(osm_file, self.log), 'bounds': [round(bounds[side], 6) for side in ['left', 'bottom', 'right', 'top']]})
+        extract_hash = hashlib.md5(extract_key.encode('utf-8')).hexdigest()[:16]
+        extract_basename = osm_file.name.rsplit('.osm.pbf', 1)[0]
+        extract_path = OpenSiteConstants.OSM_EXTRACTS_FOLDER / f"{extract_basename}-{extract_hash}.osm.pbf"
+        extract_tmp_path = OpenSiteConstants.OSM_EXTRACTS_FOLDER / f"{extract_basename}-{extract_hash}-tmp.osm.pbf"
+
+        if extract_path.exists():
+            self.log.info(f"[{self.node.node_type}] Using cached extract {extract_path.name} for '{';'.join(clip)}'")
+        else:
+            self.log.info(f"[{self.node.node_type}] Creating extract {extract_path.name} for '{';'.join(clip)}'")
+            OpenSiteConstants.OSM_EXTRACTS_FOLDER.mkdir(parents=True, exist_ok=True)
+
+            try:
+                if shutil.which("osmium"): self.create_extract_osmium_tool(osm_file, bounds, extract_tmp_path)
+                else: self.create_extract_pyosmium(osm_file, bounds, extract_tmp_path)
+                os.replace(str(extract_tmp_path), str(extract_path))
+                self.log.info(f"[{self.node.node_type}] Created extract {extract_path.name}")
+
+            except subprocess.CalledProcessError as e:
+                if extract_tmp_path.exists(): extract_tmp_path.unlink()
+                self.log.error(f"[{self.node.node_type}] osmium extract failed for {extract_path.name}: {e.stderr}")
+                return False
+
+            except Exception as e:
+                if extract_tmp_path.exists(): extract_tmp_path.unlink()
+                self.log.error(f"[{self.node.node_type}] Unable to create extract {extract_path.name}: {e}")
+                return False
+
+        # Output is hard link to cached extract so later nodes use stable path
+        if output_path.exists() and output_path.samefile(extract_path): return True
+        if output_path.exists(): output_path.unlink()
+        try:
+            os.link(extract_path, output_path)
+        except OSError:
+            shutil.copy(extract_path, output_path)
+
+        return True
@@ -148,11 +148,66 @@ class OpenSiteImporter(ProcessBase):
             self.log.error(f"Failed to write sanitized file {file_path}: {e}")
             return False
 
+    def complete_import(self, input_file):
+        """
+        Runs post-import steps on imported table and marks table as completed
+        """
+
+        postgis = OpenSitePostGIS()
+
+        # If CKAN dataset has extra attribute 'preprocess' = 'closed_lines_to_polygons' then 
+        # custom_properties['preprocess'] == 'closed_lines_to_polygons' and perform extra processing
+        # to convert closed lines to polygons. This is typically required for some solar farms
+        if 'preprocess' in self.node.custom_properties:
+            if self.node.custom_properties['preprocess'] == 'closed_lines_to_polygons':
+                self.log.info(f"[{self.node.name}] Dataset has custom attribute 'preprocess' = 'closed_lines_to_polygons' so converting closed lines to polygons")
+                dbparams = {'table': sql.Identifier(self.node.output)}
+                postgis.execute_query(sql.SQL("""
+                UPDATE {table} SET geom = ST_CollectionExtract(ST_MakeValid(ST_BuildArea(geom)), 3)
+                WHERE ST_GeometryType(geom) LIKE '%LineString%' AND ST_IsClosed(geom)""").format(**dbparams))
+                self.log.info(f"[{self.node.name}] Converting closed lines to polygons: COMPLETED")
+
+        # Preview builds simplify imported datasets so every later stage handles far fewer vertices
+        if self.node.custom_properties.get('preview') and postgis.is_preview_table(self.node.output):
+            self.log.info(f"[{self.node.name}] Preview build so simplifying geometries with tolerance {OpenSiteConstants.PREVIEW_SIMPLIFY_TOLERANCE}")
+            dbparams = {'table': sql.Identifier(self.node.output), 'tolerance': sql.Literal(OpenSiteConstants.PREVIEW_SIMPLIFY_TOLERANCE)}
+            postgis.execute_query(sql.SQL("""
+            UPDATE {table} SET geom = ST_SimplifyPreserveTopology(geom, {tolerance}) WHERE geom IS NOT NULL""").format(**dbparams))
+
+        postgis.add_table_comment(self.node.output, self.node.name)
+
+        # Boundaries have changed so rebuild gazetteer used to look up area names
+        if self.node.output == OpenSiteConstants.OPENSITE_OSMBOUNDARIES:
+            if not postgis.create_gazetteer(rebuild=True):
+                self.log.error(f"Unable to create gazetteer from {self.node.output}")
+                return False
+
+        # We don't track internal tables in registry so if it's one, return True
+        if self.node.output.startswith(OpenSiteConstants.DATABASE_BASE): return True
+
+        # Success Gate: Only update registry now
+        if self.postgis.set_table_completed(self.node.output):
+            self.log.info(f"Import and registry update complete for {os.path.basename(input_file)} into table {self.node.output}")
+            return True
+        else:
+            # This catches the bug where the node was never registered initially
+            self.log.error(f"Import succeeded but registry record for {self.node.output} was not found.")
+            return False
+
     def run(self):
         """
         Imports spatial files into PostGIS, resolving variables if needed
         """
 
+        # Native OSM extractor has already loaded table straight into PostGIS so input is its manifest
+        if self.node.format == OpenSiteConstants.OSM_YML_FORMAT or self.node.output == OpenSiteConstants.OPENSITE_OSMBOUNDARIES:
+            if self.node.input.endswith('.json'):
+                if not self.postgis.table_exists(self.node.output):
+                    self.log.error(f"[{self.node.output}] table was not created by OSM extraction, unable to import")
+                    self.node.status = 'failed'
+                    return False
+                return self.complete_import(str(Path(self.base_path) / self.node.input))
+
         if self.postgis.table_exists(self.node.output):
             self.log.info(f"[{self.node.output}] table already exists, skipping import")
             self.node.status = 'processed'
@@ -206,6 +261,21 @@ class OpenSiteImporter(ProcessBase):
 
         for extraconfig in ["--config", "OGR_PG_ENABLE_METADATA", "NO"]: cmd.append(extraconfig)
 
+        # If clip has been pushed down to import, only import features 
+        # within clip area bounds plus margin for any buffer or distance exclusion
+        if 'clip' in self.node.custom_properties:
+            margin = self.node.custom_properties.get('clip_margin', 0)
+            bounds = self.postgis.get_areas_bounds(self.node.custom_properties['clip'], OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_DEFAULT, margin)
+            if bounds is None:
+                self.log.error(f"[{self.node.name}] Unable to find bounds of clipping area '{';'.join(self.node.custom_properties['clip'])}', unable to import")
+                self.node.status = 'failed'
+                return False
+
+            self.log.info(f"[{self.node.name}] Importing only features within clip area '{';'.join(self.node.custom_properties['clip'])}' plus {margin}m margin")
+            for extraitem in [  "-spat", str(bounds['left']), str(bounds['bottom']), str(bounds['right']), str(bounds['top']), \
+                                "-spat_srs", OpenSiteConstants.CRS_DEFAULT]: 
+                cmd.append(extraitem)
+
         # Format-Specific Logic
         if self.node.format == OpenSiteConstants.OSM_YML_FORMAT:
 
@@ -226,34 +296,8 @@ class OpenSiteImporter(ProcessBase):
             # Execute shell command
             subprocess.run(cmd, capture_output=True, text=True, check=True)
 
-            postgis = OpenSitePostGIS()
-
-            # If CKAN dataset has extra attribute 'preprocess' = 'closed_lines_to_polygons' then 
-            # custom_properties['preprocess'] == 'closed_lines_to_polygons' and perform extra processing
-            # to convert closed lines to polygons. This is typically required for some solar farms
-            if 'preprocess' in self.node.custom_properties:
-                if self.node.custom_properties['preprocess'] == 'closed_lines_to_polygons':
-                    self.log.info(f"[{self.node.name}] Dataset has custom attribute 'preprocess' = 'closed_lines_to_polygons' so converting closed lines to polygons")
-                    dbparams = {'table': sql.Identifier(self.node.output)}
-                    postgis.execute_query(sql.SQL("""
-                    UPDATE {table} SET geom = ST_CollectionExtract(ST_MakeValid(ST_BuildArea(geom)), 3)
-                    WHERE ST_GeometryType(geom) LIKE '%LineString%' AND ST_IsClosed(geom)""").format(**dbparams))
-                    self.log.info(f"[{self.node.name}] Converting closed lines to polygons: COMPLETED")
-
-            postgis.add_table_comment(self.node.output, self.node.name)
-
-            # We don't track internal tables in registry so if it's one, return True
-            if self.node.output.startswith(OpenSiteConstants.DATABASE_BASE): return True
-
-            # Success Gate: Only update registry now
-            if self.postgis.set_table_completed(self.node.output):
-                self.log.info(f"Import and registry update complete for {os.path.basename(input_file)} into table {self.node.output}")
-                return True
-            else:
-                # This catches the bug where the node was never registered initially
-                self.log.error(f"Import succeeded but registry record for {self.node.output} was not found.")
-                return False
-            
+            return self.complete_import(input_file)
+
         except subprocess.CalledProcessError as e:
 
             # If errors with ogr2ogr, there may be invalid geometries in file 
@@ -0,0 +1,293 @@
+import io
+import logging
+import numpy as np
+import shapely
+from psycopg2 import sql
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class OpenSiteInProcess:
+    """
+    In-process spatial engine that runs spatial operations in worker process using Shapely vectorised operations and STRtree
+    For small datasets, avoids fixed overhead of SQL path, ie. scratch tables, indexes and per-grid-square statements
+    Operations use same GEOS functions, with same defaults, as equivalent PostGIS functions so produce equivalent output:
+    - ST_Buffer -> shapely.buffer (quad_segs=8)
+    - ST_MakeValid -> shapely.make_valid (method='linework')
+    - ST_Dump -> dump
+    - ST_CollectionExtract(..., 3) -> extract_polygons
+    - ST_UnaryUnion(ST_Collect(...)) -> shapely.union_all
+    Input is read as WKB and output written back with single COPY
+    """
+
+    TYPE_POLYGON        = 3
+    TYPE_MULTIPOLYGON   = 6
+
+    def __init__(self, postgis=None, log_level=logging.INFO, shared_lock=None):
+        self.log = OpenSiteLogger("OpenSiteInProcess", log_level, shared_lock)
+        self.postgis = postgis or OpenSitePostGIS(log_level)
+        self.crs = int(OpenSiteConstants.CRS_DEFAULT.replace('EPSG:', ''))
+
+    def is_small(self, table):
+        """
+        Checks whether table is small enough to process in-process, ie. has at most INPROCESS_MAX_FEATURES features
+        and INPROCESS_MAX_VERTICES vertices
+        Uses geometry statistics if available, otherwise counts features up to limit so cost is bounded for large tables
+        """
+
+        stats = self.postgis.get_table_stats(table)
+        if stats is None:
+            dbparams = {
+                'table': sql.Identifier(table),
+                'limit': sql.Literal(OpenSiteConstants.INPROCESS_MAX_FEATURES + 1),
+            }
+            results = self.postgis.fetch_all(sql.SQL("""
+            SELECT COUNT(*) AS feature_count, COALESCE(SUM(ST_NPoints(geom)), 0) AS total_vertices
+            FROM (SELECT geom FROM {table} LIMIT {limit}) sample""").format(**dbparams))
+            stats = results[0]
+
+        return  (stats['feature_count'] <= OpenSiteConstants.INPROCESS_MAX_FEATURES) and \
+                (stats['total_vertices'] <= OpenSiteConstants.INPROCESS_MAX_VERTICES)
+
+    def read_geometries(self, query):
+        """
+        Runs query returning 'wkb' column of ST_AsBinary geometries and optional other columns
+        Returns geometries as array and other columns as dict of lists
+        """
+
+        results = self.postgis.fetch_all(query)
+        geometries = shapely.from_wkb([bytes(row['wkb']) if row['wkb'] is not None else None for row in results])
+        columns = {}
+        for row in results:
+            for key, value in row.items():
+                if key == 'wkb': continue
+                if key not in columns: columns[key] = []
+                columns[key].append(value)
+
+        return np.asarray(geometries, dtype=object), columns
+
+    def read_table(self, table, columns=[], envelope=None):
+        """
+        Reads geometries and columns of table
+        If envelope (xmin, ymin, xmax, ymax) set, only reads features whose bounding box intersects envelope
+        """
+
+        dbparams = {
+            'table': sql.Identifier(table),
+            'columns': sql.SQL('').join([sql.SQL("{column}, ").format(column=sql.Identifier(column)) for column in columns]),
+            'filter': sql.SQL("TRUE"),
+        }
+        if envelope is not None:
+            dbparams['filter'] = sql.SQL("geom && ST_MakeEnvelope({xmin}, {ymin}, {xmax}, {ymax}, {crs})").format( \
+                xmin=sql.Literal(envelope[0]), ymin=sql.Literal(envelope[1]), xmax=sql.Literal(envelope[2]), ymax=sql.Literal(envelope[3]), crs=sql.Literal(self.crs))
+
+        return self.read_geometries(sql.SQL("SELECT {columns}ST_AsBinary(geom) AS wkb FROM {table} WHERE {filter}").format(**dbparams))
+
+    def get_copy_value(self, value):
+        """
+        Converts value to COPY text format
+        """
+
+        if value is None: return '\\N'
+        if isinstance(value, shapely.Geometry): return shapely.to_wkb(shapely.set_srid(value, self.crs), hex=True, include_srid=True)
+        if isinstance(value, (list, tuple, np.ndarray)): return '{' + ','.join(str(item) for item in value) + '}'
+        return str(value)
+
+    def write_table(self, table, columns, records, storage=None):
+        """
+        Creates table with column definitions (composable SQL) using storage policy and writes records with single COPY
+        records is list of tuples, one value per column
+        """
+
+        self.postgis.create_table(table, columns=columns, storage=storage)
+
+        buffer = io.StringIO()
+        for record in records:
+            buffer.write('\t'.join(self.get_copy_value(value) for value in record) + '\n')
+        buffer.seek(0)
+
+        conn = self.postgis.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(sql.SQL("COPY {table} FROM STDIN").format(table=sql.Identifier(table)).as_string(conn), buffer)
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise e
+        finally:
+            self.postgis.return_connection(conn)
+
+        self.log.debug(f"[write_table] Wrote {len(records)} record(s) to {table}")
+
+    def get_envelope(self, geometries, margin=1):
+        """
+        Gets bounds of geometries expanded by margin so features touching edge of bounds are strictly inside it
+        """
+
+        xmin, ymin, xmax, ymax = shapely.total_bounds(geometries)
+        return (float(xmin) - margin, float(ymin) - margin, float(xmax) + margin, float(ymax) + margin)
+
+    def dump(self, geometries):
+        """
+        Equivalent of ST_Dump - recursively splits multi-part geometries and collections into single-part geometries
+        """
+
+        geometries = geometries[~shapely.is_missing(geometries)]
+        while True:
+            multi = shapely.get_type_id(geometries) >= 4
+            if not multi.any(): return geometries
+            geometries = np.concatenate([geometries[~multi], shapely.get_parts(geometries[multi])])
+
+    def extract_polygons(self, geometries):
+        """
+        Equivalent of ST_Dump(ST_CollectionExtract(..., 3)) - gets all single polygons within geometries
+        """
+
+        geometries = self.dump(geometries)
+        return geometries[shapely.get_type_id(geometries) == self.TYPE_POLYGON]
+
+    def to_multipolygon(self, geometry):
+        """
+        Equivalent of ST_Multi(ST_CollectionExtract(..., 3)) for single geometry
+        """
+
+        if shapely.get_type_id(geometry) == self.TYPE_MULTIPOLYGON: return geometry
+        return shapely.multipolygons(self.extract_polygons(np.asarray([geometry], dtype=object)))
+
+    def buffer(self, input_table, output_table, buffer, polygons_as_lines=False, storage=None):
+        """
+        Equivalent of buffer SQL path in OpenSiteSpatial.buffer
+        If polygons_as_lines, lines are buffered and boundaries of polygons are buffered, eg. for hedgerows
+        """
+
+        geometries, _ = self.read_table(input_table)
+
+        if polygons_as_lines:
+            dimensions = shapely.get_dimensions(geometries)
+            geometries = np.concatenate([geometries[dimensions == 1], shapely.boundary(geometries[dimensions == 2])])
+
+        buffered = shapely.buffer(geometries, buffer, quad_segs=8)
+
+        columns = sql.SQL("geom GEOMETRY")
+        self.write_table(output_table, columns, [(geometry, ) for geometry in buffered], storage=storage)
+        return len(buffered)
+
+    def preprocess(self, input_table, output_table, gridsquare_ids, storage=None, grid_table=OpenSiteConstants.OPENSITE_GRIDPROCESSING):
+        """
+        Equivalent of preprocess SQL path in OpenSiteSpatial.preprocess, without snapping to grid
+        - Dump, select polygons and make valid
+        - Union features within each grid square and cut to grid square
+        - Clip to clipping master
+        """
+
+        geometries, _ = self.read_table(input_table)
+
+        dumped = self.dump(geometries)
+        polygons = shapely.make_valid(dumped[shapely.get_type_id(dumped) == self.TYPE_POLYGON])
+        polygons = polygons[~shapely.is_missing(polygons)]
+
+        records = []
+        if len(polygons) != 0:
+            envelope = self.get_envelope(polygons)
+            dbparams = {
+                'grid': sql.Identifier(grid_table),
+                'gridsquare_ids': sql.Literal(list(gridsquare_ids)),
+            }
+            grid, grid_columns = self.read_geometries(sql.SQL("""
+            SELECT id, ST_AsBinary(geom) AS wkb FROM {grid} WHERE id = ANY({gridsquare_ids}::int[]) ORDER BY id""").format(**dbparams))
+
+            # Clipping master is clipped to envelope of data so only nearby part is read
+            # Envelope strictly contains data so containment and intersection are unchanged
+            dbparams['clip'] = sql.Identifier(OpenSiteConstants.OPENSITE_CLIPPINGMASTER)
+            dbparams['envelope'] = sql.SQL("ST_MakeEnvelope({xmin}, {ymin}, {xmax}, {ymax}, {crs})").format( \
+                xmin=sql.Literal(envelope[0]), ymin=sql.Literal(envelope[1]), xmax=sql.Literal(envelope[2]), ymax=sql.Literal(envelope[3]), crs=sql.Literal(self.crs))
+            clippers, _ = self.read_geometries(sql.SQL("""
+            SELECT ST_AsBinary(ST_Intersection(geom, {envelope})) AS wkb FROM {clip} WHERE geom && {envelope}""").format(**dbparams))
+            clipper = shapely.union_all(clippers) if len(clippers) != 0 else None
+            if clipper is not None: shapely.prepare(clipper)
+
+            # Equivalent of ST_Intersection(grid.geom, ST_UnaryUnion(ST_Collect(data.geom))) for each grid square
+            tree = shapely.STRtree(polygons)
+            for gridsquare_id, gridsquare in zip(grid_columns.get('id', []), grid):
+                indexes = tree.query(gridsquare, predicate='intersects')
+                if len(indexes) == 0: continue
+                pieces = self.extract_polygons(np.asarray([shapely.intersection(gridsquare, shapely.union_all(polygons[indexes]))], dtype=object))
+                if clipper is None or len(pieces) == 0: continue
+
+                # Pieces within clipping master are kept as they are, others are cut by it
+                contained = shapely.contains(clipper, pieces)
+                for piece in pieces[contained]: records.append((gridsquare_id, piece))
+                crossing = pieces[~contained & shapely.intersects(clipper, pieces)]
+                for piece in self.extract_polygons(shapely.intersection(crossing, clipper)): records.append((gridsquare_id, piece))
+
+        columns = sql.SQL("id INTEGER, geom GEOMETRY(Polygon, {crs})").format(crs=sql.Literal(self.crs))
+        self.write_table(output_table, columns, records, storage=storage)
+        return len(records)
+
+    def clip(self, input_table, output_table, mask_table, track_gridsquares=False, storage=None):
+        """
+        Equivalent of clip SQL path in OpenSiteSpatial.clip
+        Each feature is clipped by every subdivided polygon of mask it intersects and pieces are unioned back into one feature
+        """
+
+        geometries, columns = self.read_table(input_table, ['gridsquare_ids'] if track_gridsquares else [])
+        gridsquare_ids = columns.get('gridsquare_ids', [None] * len(geometries))
+
+        records = []
+        present = ~shapely.is_missing(geometries)
+        if present.any():
+            mask, _ = self.read_table(mask_table, envelope=self.get_envelope(geometries[present]))
+            tree = shapely.STRtree(mask)
+            input_indexes, mask_indexes = tree.query(geometries, predicate='intersects')
+            pieces = {}
+            for input_index, mask_index in zip(input_indexes, mask_indexes):
+                geometry, mask_part = geometries[input_index], mask[mask_index]
+                if shapely.within(geometry, mask_part): piece = geometry
+                else: piece = self.to_multipolygon(shapely.intersection(geometry, mask_part))
+                if shapely.is_empty(piece): continue
+                pieces.setdefault(input_index, []).append(piece)
+
+            for input_index, feature_pieces in pieces.items():
+                if len(feature_pieces) == 1: clipped = feature_pieces[0]
+                else: clipped = shapely.union_all(feature_pieces)
+                clipped = shapely.multipolygons([clipped]) if shapely.get_type_id(clipped) == self.TYPE_POLYGON else self.to_multipolygon(clipped)
+                if shapely.is_empty(clipped): continue
+                records.append(((gridsquare_ids[input_index], ) if track_gridsquares else ()) + (clipped, ))
+
+        columns = sql.SQL("{gridsquare_ids}geom GEOMETRY(MultiPolygon, {crs})").format( \
+            gridsquare_ids=sql.SQL("gridsquare_ids INTEGER[], " if track_gridsquares else ""), crs=sql.Literal(self.crs))
+        self.write_table(output_table, columns, records, storage=storage)
+        return len(records)
+
+    def compare_tables(self, table_a, table_b, tolerance=OpenSiteConstants.INPROCESS_COMPARE_TOLERANCE):
+        """
+        Compares output of two tables, eg. same operation run with PostGIS and in-process engines
+        Tables are equivalent if area of symmetric difference of their dissolved geometries
+        is at most tolerance (fraction) of area of larger table
+        Returns dict of feature counts, areas, symmetric difference area and whether equivalent
+        """
+
+        dbparams = {
+            'table_a': sql.Identifier(table_a),
+            'table_b': sql.Identifier(table_b),
+        }
+
+        results = self.postgis.fetch_all(sql.SQL("""
+        WITH
+            a AS (SELECT COUNT(*) AS features, ST_Union(geom) AS geom FROM {table_a}),
+            b AS (SELECT COUNT(*) AS features, ST_Union(geom) AS geom FROM {table_b})
+        SELECT
+            a.features AS features_a,
+            b.features AS features_b,
+            COALESCE(ST_Area(a.geom), 0) AS area_a,
+            COALESCE(ST_Area(b.geom), 0) AS area_b,
+            CASE 
+                WHEN a.geom IS NULL THEN COALESCE(ST_Area(b.geom), 0) 
+                WHEN b.geom IS NULL THEN ST_Area(a.geom) 
+                ELSE ST_Area(ST_SymDifference(a.geom, b.geom)) 
+            END AS area_difference
+        FROM a, b""").format(**dbparams))
+
+        comparison = dict(results[0])
+        comparison['equivalent'] = comparison['area_difference'] <= tolerance * max(comparison['area_a'], comparison['area_b'], 1)
+        return comparison
@@ -0,0 +1,356 @@
+import logging
+import os
+import re
+import yaml
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from psycopg2 import sql
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class OpenSiteOSMExtractor:
+    """
+    Native replacement for osm-export-tool
+    Reads osm-export-tool YML mappings, streams OSM file once with pyosmium, assembling ways and multipolygons,
+    and loads every layer straight into PostGIS with COPY, one layer per thread
+    Tables have same schema as tables created by importing osm-export-tool GPKG with ogr2ogr, ie.
+    ogc_fid primary key, osm_id, one varchar column per 'select' tag and multi-part geometry 'geom' in CRS_DEFAULT
+    """
+
+    GEOMETRY_TYPES  = {'points': 1, 'lines': 2, 'polygons': 3}
+    MULTI_TYPES     = {1: 'MultiPoint', 2: 'MultiLineString', 3: 'MultiPolygon'}
+    TOKEN_REGEX     = re.compile(r"\s*(?:(?P<string>'(?:[^']|'')*')|(?P<operator>!=|<>|=|\(|\)|,)|(?P<word>\"[^\"]+\"|[^\s=!<>(),']+))")
+    KEYWORDS        = ['AND', 'OR', 'NOT', 'IN', 'IS', 'NULL']
+
+    def __init__(self, log_level=logging.INFO, shared_lock=None):
+        self.log = OpenSiteLogger("OpenSiteOSMExtractor", log_level, shared_lock)
+        self.log_level = log_level
+
+    def tokenise(self, text):
+        """
+        Splits osm-export-tool 'where' expression into tokens
+        Returns list of (kind, value), where kind is 'string', 'operator', 'keyword' or 'word'
+        """
+
+        tokens, position = [], 0
+        text = text.strip()
+        while position < len(text):
+            match = self.TOKEN_REGEX.match(text, position)
+            if not match or match.end() == position: raise ValueError(f"Unable to parse '{text}' at position {position}")
+            position = match.end()
+            if match.group('string') is not None:   tokens.append(('string', match.group('string')[1:-1].replace("''", "'")))
+            elif match.group('operator') is not None: tokens.append(('operator', match.group('operator')))
+            elif match.group('word').upper() in self.KEYWORDS: tokens.append(('keyword', match.group('word').upper()))
+            else: tokens.append(('word', match.group('word').strip('"')))
+        return tokens
+
+    def parse_where(self, text):
+        """
+        Parses osm-export-tool 'where' expression into expression tree of tuples, eg. ('eq', 'natural', 'wood')
+        Supports =, !=, <>, IN, NOT IN, IS NULL, IS NOT NULL, AND, OR, NOT and parentheses
+        """
+
+        tokens = self.tokenise(text)
+        position = 0
+
+        def peek(offset=0):
+            return tokens[position + offset] if position + offset < len(tokens) else (None, None)
+
+        def take(kind=None, value=None):
+            nonlocal position
+            token = peek()
+            if (token[0] is None) or (kind and token[0] != kind) or (value and token[1] != value):
+                raise ValueError(f"Unexpected token {token[1]} in '{text}'")
+            position += 1
+            return token[1]
+
+        def parse_value():
+            if peek()[0] in ['string', 'word']: return take()
+            raise ValueError(f"Expected value but found {peek()[1]} in '{text}'")
+
+        def parse_values():
+            take('operator', '(')
+            values = [parse_value()]
+            while peek() == ('operator', ','):
+                take()
+                values.append(parse_value())
+            take('operator', ')')
+            return set(values)
+
+        def parse_comparison():
+            key = take('word')
+            token = take()
+            if token == '=': return ('eq', key, parse_value())
+            if token in ['!=', '<>']: return ('ne', key, parse_value())
+            if token == 'IN': return ('in', key, parse_values())
+            if token == 'NOT':
+                take('keyword', 'IN')
+                return ('notin', key, parse_values())
+            if token == 'IS':
+                if peek() == ('keyword', 'NOT'):
+                    take()
+                    take('keyword', 'NULL')
+                    return ('not', ('null', key))
+                take('keyword', 'NULL')
+                return ('null', key)
+            raise ValueError(f"Unexpected token {token} in '{text}'")
+
+        def parse_not():
+            if peek() == ('keyword', 'NOT'):
+                take()
+                return ('not', parse_not())
+            if peek() == ('operator', '('):
+                take()
+                expression = parse_or()
+                take('operator', ')')
+                return expression
+            return parse_comparison()
+
+        def parse_and():
+            expression = parse_not()
+            while peek() == ('keyword', 'AND'):
+                take()
+                expression = ('and', expression, parse_not())
+            return expression
+
+        def parse_or():
+            expression = parse_and()
+            while peek() == ('keyword', 'OR'):
+                take()
+                expression = ('or', expression, parse_and())
+            return expression
+
+        expression = parse_or()
+        if position != len(tokens): raise ValueError(f"Unexpected token {peek()[1]} in '{text}'")
+        return expression
+
+    def evaluate(self, expression, tags):
+        """
+        Evaluates expression tree against OSM tags
+        As with SQL, comparisons with missing tags are false, including != and NOT IN
+        """
+
+        operator = expression[0]
+        if operator == 'or':    return self.evaluate(expression[1], tags) or self.evaluate(expression[2], tags)
+        if operator == 'and':   return self.evaluate(expression[1], tags) and self.evaluate(expression[2], tags)
+        if operator == 'not':   return not self.evaluate(expression[1], tags)
+        value = tags.get(expression[1])
+        if operator == 'eq':    return value == expression[2]
+        if operator == 'ne':    return value is not None and value != expression[2]
+        if operator == 'in':    return value in expression[2]
+        if operator == 'notin': return value is not None and value not in expression[2]
+        if operator == 'null':  return value is None
+        return False
+
+    def get_layers(self, mapping_file, tables):
+        """
+        Gets layer definitions from osm-export-tool YML mapping file for layers that have table
+        Where no 'where' is set, osm-export-tool selects features that have any selected tag
+        """
+
+        with open(mapping_file, 'r', encoding='utf-8') as f:
+            mapping = yaml.safe_load(f) or {}
+
+        layers = {}
+        for name, definition in mapping.items():
+            # Runners of clipped branches only load layers of their own branch
+            if name not in tables:
+                self.log.info(f"[get_layers] No table for OSM layer '{name}', skipping it")
+                continue
+
+            select = definition.get('select', [])
+            where = definition.get('where', [])
+            if isinstance(where, str): where = [where]
+            if where:
+                expression = self.parse_where(where[0])
+                for item in where[1:]: expression = ('or', expression, self.parse_where(item))
+            else:
+                expression = None
+
+            layers[name] = {
+                'table': tables[name],
+                'types': [self.GEOMETRY_TYPES[type] for type in definition.get('types', list(self.GEOMETRY_TYPES.keys()))],
+                'select': select,
+                'expression': expression,
+            }
+
+        return layers
+
+    def get_column_name(self, key):
+        """
+        Converts tag key to column name in same way as ogr2ogr does by default when importing into PostGIS
+        """
+
+        return re.sub(r"['\-#]", '_', key.lower())
+
+    def get_copy_value(self, value):
+        """
+        Converts value to COPY text format
+        """
+
+        if value is None: return '\\N'
+        return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+    def matches(self, layer, tags):
+        """
+        Checks whether OSM object with tags belongs in layer
+        """
+
+        if layer['expression'] is None: return any(tags.get(key) is not None for key in layer['select'])
+        return self.evaluate(layer['expression'], tags)
+
+    def extract(self, osm_file, layers, work_folder):
+        """
+        Streams OSM file once, writing matching features of each layer to COPY file in work_folder
+        Closed ways are also assembled as areas so layers with both lines and polygons only take their polygon,
+        as osm-export-tool does, unless way is tagged area=no and so isn't assembled as area
+        Returns {layer: (copy file path, feature count)}
+        """
+
+        import osmium
+
+        outputs = {name: [Path(work_folder) / f"{Path(osm_file).name}-{name}.copy", 0] for name in layers}
+        files = {name: open(output[0], 'w', encoding='utf-8') for name, output in outputs.items()}
+        factory = osmium.geom.WKBFactory()
+
+        # Location index is file-based for large OSM files so memory use stays bounded
+        index_path = None
+        location_index = OpenSiteConstants.OSM_LOCATION_INDEX
+        if location_index.endswith('_file_array'):
+            index_path = Path(work_folder) / f"{Path(osm_file).name}.{location_index}.idx"
+            location_index = osmium.index.create_map(f"{location_index},{index_path}")
+
+        try:
+            # Areas are assembled from closed ways and multipolygon and boundary relations
+            for obj in osmium.FileProcessor(osm_file).with_locations(location_index).with_areas():
+                if not len(obj.tags): continue
+
+                if obj.is_node():       geometry_type, osm_id = 1, obj.id
+                elif obj.is_area():     geometry_type, osm_id = 3, obj.orig_id()
+                elif obj.is_way():      geometry_type, osm_id = 2, obj.id
+                else: continue
+
+                geometry = None
+                for name, layer in layers.items():
+                    if geometry_type not in layer['types'] or not self.matches(layer, obj.tags): continue
+                    if geometry_type == 2 and 3 in layer['types'] and obj.is_closed() and obj.tags.get('area') != 'no': continue
+
+                    if geometry is None:
+                        try:
+                            if geometry_type == 1:      geometry = factory.create_point(obj)
+                            elif geometry_type == 2:    geometry = factory.create_linestring(obj)
+                            else:                       geometry = factory.create_multipolygon(obj)
+                        except Exception as e:
+                            self.log.debug(f"[extract] Unable to create geometry for OSM object {osm_id}: {e}")
+                            break
+
+                    values = [osm_id] + [obj.tags.get(key) for key in layer['select']] + [geometry_type, geometry]
+                    files[name].write('\t'.join(self.get_copy_value(value) for value in values) + '\n')
+                    outputs[name][1] += 1
+
+        finally:
+            for file in files.values(): file.close()
+            if index_path is not None and index_path.exists(): index_path.unlink()
+
+        return outputs
+
+    def load(self, layer, copy_path):
+        """
+        Loads COPY file of layer into staging table and creates layer table from it,
+        making geometries valid, multi-part and transforming them to CRS_DEFAULT
+        Each call uses its own connection so layers can be loaded in parallel
+        """
+
+        postgis = OpenSitePostGIS(self.log_level)
+        table = layer['table']
+        staging = f"{table}_osm"
+        columns = [self.get_column_name(key) for key in layer['select']]
+        crs = postgis.extract_crs_as_number(OpenSiteConstants.CRS_DEFAULT)
+        geometry_type = self.MULTI_TYPES[layer['types'][0]] if len(layer['types']) == 1 else 'Geometry'
+
+        dbparams = {
+            'table': sql.Identifier(table),
+            'staging': sql.Identifier(staging),
+            'crs': sql.Literal(crs),
+            'geometry_type': sql.SQL(geometry_type),
+            'column_definitions': sql.SQL('').join([sql.SQL("{column} VARCHAR, ").format(column=sql.Identifier(column)) for column in columns]),
+            'columns': sql.SQL('').join([sql.SQL("{column}, ").format(column=sql.Identifier(column)) for column in columns]),
+        }
+
+        try:
+            postgis.drop_table(staging)
+            postgis.create_table(staging, storage=postgis.get_storage_policy(None, 'scratch'), \
+                                 columns=sql.SQL("osm_id BIGINT, {column_definitions}geometry_type SMALLINT, geom GEOMETRY").format(**dbparams))
+
+            conn = postgis.get_connection()
+            try:
+                with conn.cursor() as cursor, open(copy_path, 'r', encoding='utf-8') as f:
+                    cursor.copy_expert(sql.SQL("COPY {staging} FROM STDIN").format(**dbparams).as_string(conn), f)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                raise e
+            finally:
+                postgis.return_connection(conn)
+
+            postgis.drop_table(table)
+            postgis.create_table(table, storage=postgis.get_storage_policy(None, 'default'), query=sql.SQL("""
+            SELECT (row_number() OVER ())::integer AS ogc_fid, osm_id, {columns}geom
+            FROM
+            (
+                SELECT osm_id, {columns}ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_Transform(ST_SetSRID(geom, 4326), {crs})), geometry_type))::geometry({geometry_type}, {crs}) AS geom
+                FROM {staging}
+            ) features
+            WHERE NOT ST_IsEmpty(geom)""").format(**dbparams))
+            postgis.drop_table(staging)
+            postgis.execute_query(sql.SQL("ALTER TABLE {table} ADD PRIMARY KEY (ogc_fid);").format(**dbparams))
+
+            return postgis.finalise_table(table, [('gist', 'geom')], storage=postgis.get_storage_policy(None, 'default'))
+
+        except Exception as e:
+            self.log.error(f"[load] Unable to load OSM layer into {table}: {e}")
+            return False
+
+        finally:
+            postgis.close_connection()
+
+    def run(self, osm_file, mapping_file, tables):
+        """
+        Extracts layers in osm-export-tool YML mapping file from OSM file into tables
+        tables is {layer name: table}
+        Returns {layer name: feature count} or None if extraction failed
+        """
+
+        try:
+            layers = self.get_layers(mapping_file, tables)
+        except Exception as e:
+            self.log.error(f"[run] Unable to read mapping file {os.path.basename(str(mapping_file))}: {e}")
+            return None
+
+        if not layers:
+            self.log.error(f"[run] No layers to extract from {os.path.basename(str(mapping_file))}")
+            return None
+
+        work_folder = Path(osm_file).parent
+        self.log.info(f"[run] Extracting {len(layers)} layer(s) from {os.path.basename(osm_file)} (note: long duration)")
+
+        try:
+            outputs = self.extract(osm_file, layers, work_folder)
+        except Exception as e:
+            self.log.error(f"[run] Unable to extract layers from {os.path.basename(osm_file)}: {e}")
+            for copy_path in work_folder.glob(f"{Path(osm_file).name}-*.copy"): copy_path.unlink()
+            return None
+
+        for name, (copy_path, count) in outputs.items():
+            self.log.info(f"[run] Extracted {count} feature(s) for layer '{name}', loading into {layers[name]['table']}")
+
+        try:
+            with ThreadPoolExecutor(max_workers=OpenSiteConstants.OSM_LOAD_WORKERS) as executor:
+                results = list(executor.map(lambda name: self.load(layers[name], outputs[name][0]), list(outputs.keys())))
+        finally:
+            for copy_path, _ in outputs.values():
+                if copy_path.exists(): copy_path.unlink()
+
+        if not all(results): return None
+        return {name: count for name, (_, count) in outputs.items()}
@@ -1,4 +1,5 @@
 import os
+import json
 import subprocess
 import logging
 from pathlib import Path
@@ -6,11 +7,13 @@ from urllib.parse import urlparse
 from opensite.processing.base import ProcessBase
 from opensite.constants import OpenSiteConstants
 from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.opensite import OpenSitePostGIS
 
 class OpenSiteRunner(ProcessBase):
     def __init__(self, node, log_level=logging.INFO, shared_lock=None, shared_metadata=None):
         super().__init__(node, log_level=log_level, shared_lock=shared_lock, shared_metadata=shared_metadata)
         self.log = OpenSiteLogger("OpenSiteRunner", log_level, shared_lock)
+        self.postgis = OpenSitePostGIS(log_level)
         self.base_path = OpenSiteConstants.DOWNLOAD_FOLDER
 
     def is_url(self, url_string):
@@ -21,6 +24,63 @@ class OpenSiteRunner(ProcessBase):
         except ValueError:
             return False
     
+    def get_osm_file(self):
+        """
+        Gets OSM file to run on
+        If clip has been pushed down, this is extract of clip area created by osm-extractor node
+        """
+
+        if 'osm_extract' in self.node.custom_properties:
+            return str(OpenSiteConstants.DOWNLOAD_FOLDER / self.node.custom_properties['osm_extract'])
+        return str(self.base_path / os.path.basename(self.node.custom_properties['osm']))
+
+    def is_manifest_current(self, output_path, osm_file, tables):
+        """
+        Checks whether manifest at output_path was written by extracting same OSM file into same tables
+        """
+
+        if not output_path.exists(): return False
+
+        try:
+            with open(output_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        return (manifest.get('osm') == os.path.basename(osm_file)) and (manifest.get('tables') == tables)
+
+    def run_osm_extractor(self, mapping_file, output_path):
+        """
+        Extracts layers of mapping file straight into PostGIS tables of import nodes using native OSM extractor
+        Writes manifest of extracted layers to output_path, which import nodes use as input
+        """
+
+        from opensite.processing.osm import OpenSiteOSMExtractor
+
+        # Layer name is defined in osm-export-tool YML file topmost variable
+        tables = {}
+        for yml, table in self.node.custom_properties.get('tables', {}).items():
+            tables[self.get_top_variable(str(OpenSiteConstants.DOWNLOAD_FOLDER / yml))] = table
+
+        osm_file = self.get_osm_file()
+
+        if self.is_manifest_current(output_path, osm_file, tables) and all(self.postgis.table_exists(table) for table in tables.values()):
+            self.log.info(f"{os.path.basename(str(output_path))} already exists and all its tables exist, skipping OSM extraction")
+            return True
+
+        counts = OpenSiteOSMExtractor(self.log_level, self.shared_lock).run(osm_file, str(mapping_file), tables)
+        if counts is None:
+            self.log.error(f"[{self.node.node_type}] OSM extraction failed for {self.node.input}")
+            return False
+
+        output_tmp_path = output_path.with_name(output_path.stem + '-tmp.json')
+        with open(output_tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'osm': os.path.basename(osm_file), 'tables': tables, 'features': counts}, f, indent=2)
+        os.replace(output_tmp_path, output_path)
+
+        self.log.info(f"[{self.node.node_type}]  COMPLETED. Extracted {len(counts)} layer(s) into PostGIS")
+        return True
+
     def run(self):
         """
         Executes command line tools like osm-export-tool via subprocess
@@ -43,6 +103,14 @@ class OpenSiteRunner(ProcessBase):
         if self.is_url(self.node.input):    mapping_file = self.node.input
         else:                               mapping_file = self.base_path / self.node.input
         output_path                 = self.base_path / self.node.output
+
+        # Native OSM extractor writes manifest rather than GPKG
+        if self.node.node_type == 'osm-runner' and self.node.output.endswith('.json'):
+            if not self.is_url(mapping_file) and not mapping_file.exists():
+                self.log.error(f"Mapping file not resolved or missing: {self.node.input}")
+                return False
+            return self.run_osm_extractor(mapping_file, output_path)
+
         output_basename             = self.node.output.rsplit('.gpkg', 1)[0]
         osm_export_output_param     = self.base_path / f"{output_basename}-tmp"
         output_tmp_path             = self.base_path / f"{output_basename}-tmp.gpkg"
@@ -61,7 +129,8 @@ class OpenSiteRunner(ProcessBase):
 
         working_dir = None
         if self.node.node_type == 'osm-runner':
-            osm_file = str(self.base_path / os.path.basename(self.node.custom_properties['osm']))
+            osm_file = self.get_osm_file()
+
             cmd = [
                 "osm-export-tool",
                 "-m", str(mapping_file),
@@ -115,7 +184,7 @@ class OpenSiteRunner(ProcessBase):
             return_code = process.wait()
             
             if return_code != 0:
-                self.log.error(f"[{self.node.node_type}] Shell execution failed: {e.return_code}")
+                self.log.error(f"[{self.node.node_type}] Shell execution failed: {return_code}")
                 return False
             else:
                 os.replace(str(output_tmp_path), str(output_path))
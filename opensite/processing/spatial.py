@@ -11,9 +11,11 @@ from opensite.constants import OpenSiteConstants
 from opensite.processing.base import ProcessBase
 from opensite.logging.opensite import OpenSiteLogger
 from opensite.postgis.opensite import OpenSitePostGIS
+from opensite.processing.inprocess import OpenSiteInProcess
 from opensite.model.graph.opensite import OpenSiteGraph
 
-PROCESSINGGRID_SQUARE_IDS = None
+PROCESSINGGRID_SQUARE_IDS = {}
+PROCESSINGGRID_CLIPPED_SQUARE_IDS = {}
 
 class OpenSiteSpatial(ProcessBase):
 
@@ -24,7 +26,41 @@ class OpenSiteSpatial(ProcessBase):
         self.log = OpenSiteLogger("OpenSiteSpatial", log_level, shared_lock)
         self.base_path = OpenSiteConstants.DOWNLOAD_FOLDER
         self.postgis = OpenSitePostGIS(log_level)
+
+        self.set_processing_grid((node is not None) and node.custom_properties.get('preview', False))
         
+    def set_processing_grid(self, preview=False):
+        """
+        Sets processing grid used by spatial operations
+        Preview builds process on coarser grid so fewer, larger grid squares are processed
+        """
+
+        self.preview = preview
+        self.grid_processing, self.grid_buffered_edges = self.postgis.get_processing_grid(preview)
+        self.grid_processing_spacing = OpenSiteConstants.PREVIEW_GRID_PROCESSING_SPACING if preview else OpenSiteConstants.GRID_PROCESSING_SPACING
+
+    def get_storage(self, stage=None):
+        """
+        Get storage policy of node for stage, defaulting to stage of node's action
+        """
+
+        return self.postgis.get_storage_policy(self.node.custom_properties.get('storage'), stage or self.node.action)
+
+    def get_engine(self, table):
+        """
+        Gets spatial engine to use for operation on table, either 'postgis' or 'inprocess' (see OpenSiteInProcess)
+        Engine is set by node's 'engine' property or SPATIAL_ENGINE and if 'auto', 'inprocess' is only used for small tables
+        Returns engine and OpenSiteInProcess instance if 'inprocess'
+        """
+
+        engine = self.node.custom_properties.get('engine', OpenSiteConstants.SPATIAL_ENGINE)
+        if engine not in ['auto', 'inprocess']: return 'postgis', None
+
+        inprocess = OpenSiteInProcess(self.postgis, self.log_level, self.shared_lock)
+        if engine == 'auto' and not inprocess.is_small(table): return 'postgis', None
+
+        return 'inprocess', inprocess
+
     def get_crs_default(self):
         """
         Get default CRS as number - for use in PostGIS
@@ -92,24 +128,22 @@ class OpenSiteSpatial(ProcessBase):
         this should be called during main application initialization
         """
 
-        global PROCESSINGGRID_SQUARE_IDS
-
         if not self.import_clipping_master():
             self.log.error(f"Problem importing clipping master")
             return False
 
-        if self.postgis.table_exists(OpenSiteConstants.OPENSITE_GRIDPROCESSING):
+        if self.postgis.table_exists(self.grid_processing):
             self.log.info("Processing grid already exists")
             self.get_processing_grid_square_ids()
             return True
 
-        self.log.info(f"[create_processing_grid] Creating grid overlay with grid size {OpenSiteConstants.GRID_PROCESSING_SPACING} to reduce memory load during ST_Union")
+        self.log.info(f"[create_processing_grid] Creating grid overlay with grid size {self.grid_processing_spacing} to reduce memory load during ST_Union")
 
         dbparams = {
             "crs": sql.Literal(self.get_crs_default()),
-            "grid": sql.Identifier(OpenSiteConstants.OPENSITE_GRIDPROCESSING),
-            "grid_index": sql.Identifier(f"{OpenSiteConstants.OPENSITE_GRIDPROCESSING}_idx"),
-            "grid_spacing": sql.Literal(OpenSiteConstants.GRID_PROCESSING_SPACING),
+            "grid": sql.Identifier(self.grid_processing),
+            "grid_index": sql.Identifier(f"{self.grid_processing}_idx"),
+            "grid_spacing": sql.Literal(self.grid_processing_spacing),
             "clipping_master": sql.Identifier(OpenSiteConstants.OPENSITE_CLIPPINGMASTER)
         }
 
@@ -133,7 +167,7 @@ class OpenSiteSpatial(ProcessBase):
             self.postgis.execute_query(query_grid_create_index)
             self.get_processing_grid_square_ids()
 
-            self.log.info(f"[create_processing_grid] Finished creating grid overlay with grid size {OpenSiteConstants.GRID_PROCESSING_SPACING}")
+            self.log.info(f"[create_processing_grid] Finished creating grid overlay with grid size {self.grid_processing_spacing}")
 
             return True
         except Error as e:
@@ -148,10 +182,10 @@ class OpenSiteSpatial(ProcessBase):
         Creates buffered edges from processing grid
         """
 
-        if not self.postgis.table_exists(OpenSiteConstants.OPENSITE_GRIDPROCESSING):
+        if not self.postgis.table_exists(self.grid_processing):
             self.create_processing_grid()
 
-        if self.postgis.table_exists(OpenSiteConstants.OPENSITE_GRIDBUFFEDGES):
+        if self.postgis.table_exists(self.grid_buffered_edges):
             self.log.info("Buffered grid already exists")
             return True
 
@@ -159,9 +193,9 @@ class OpenSiteSpatial(ProcessBase):
 
         dbparams = {
             "crs": sql.Literal(self.get_crs_default()),
-            "grid": sql.Identifier(OpenSiteConstants.OPENSITE_GRIDPROCESSING),
-            "buffered_edges": sql.Identifier(OpenSiteConstants.OPENSITE_GRIDBUFFEDGES),
-            "buffered_edges_index": sql.Identifier(f"{OpenSiteConstants.OPENSITE_GRIDBUFFEDGES}_idx"),
+            "grid": sql.Identifier(self.grid_processing),
+            "buffered_edges": sql.Identifier(self.grid_buffered_edges),
+            "buffered_edges_index": sql.Identifier(f"{self.grid_buffered_edges}_idx"),
         }
 
         query_buffered_edges_create = sql.SQL("""
@@ -236,27 +270,53 @@ class OpenSiteSpatial(ProcessBase):
             self.log.error(f"[create_output_grid] Unexpected error: {e}")
             return False
 
-    def get_processing_grid_square_ids(self):
+    def get_processing_grid_square_ids(self, clip=None):
         """
         Gets ids of all squares in processing grid
+        If clip is set, only gets ids of squares touching clip area
         """
 
-        global PROCESSINGGRID_SQUARE_IDS
+        if clip: return self.get_clipped_processing_grid_square_ids(clip)
 
-        if not PROCESSINGGRID_SQUARE_IDS:
-            if not self.postgis.table_exists(OpenSiteConstants.OPENSITE_GRIDPROCESSING):
+        if self.grid_processing not in PROCESSINGGRID_SQUARE_IDS:
+            if not self.postgis.table_exists(self.grid_processing):
                 self.log.error("Processing grid does not exist, unable to retrieve grid square ids")
                 return None
             
-            results = self.postgis.fetch_all(sql.SQL("SELECT id FROM {grid}").format(grid=sql.Identifier(OpenSiteConstants.OPENSITE_GRIDPROCESSING)))
-            PROCESSINGGRID_SQUARE_IDS = [row['id'] for row in results]
+            results = self.postgis.fetch_all(sql.SQL("SELECT id FROM {grid}").format(grid=sql.Identifier(self.grid_processing)))
+            PROCESSINGGRID_SQUARE_IDS[self.grid_processing] = [row['id'] for row in results]
 
-        return PROCESSINGGRID_SQUARE_IDS
+        return PROCESSINGGRID_SQUARE_IDS[self.grid_processing]
+
+    def get_clipped_processing_grid_square_ids(self, clip):
+        """
+        Gets ids of squares in processing grid that touch clip area
+        Clipped builds then only process grid squares in proportion to their area
+        """
+
+        mask_table = self.postgis.create_clip_mask(clip)
+        if not mask_table:
+            self.log.error(f"Unable to create clip mask for '{';'.join(clip)}', unable to retrieve grid square ids")
+            return None
+
+        if (self.grid_processing, mask_table) not in PROCESSINGGRID_CLIPPED_SQUARE_IDS:
+            dbparams = {
+                "grid": sql.Identifier(self.grid_processing),
+                "mask": sql.Identifier(mask_table),
+            }
+            results = self.postgis.fetch_all(sql.SQL("""
+            SELECT grid.id FROM {grid} grid 
+            WHERE EXISTS (SELECT 1 FROM {mask} mask WHERE ST_Intersects(grid.geom, mask.geom)) 
+            ORDER BY grid.id""").format(**dbparams))
+            PROCESSINGGRID_CLIPPED_SQUARE_IDS[(self.grid_processing, mask_table)] = [row['id'] for row in results]
+
+        return PROCESSINGGRID_CLIPPED_SQUARE_IDS[(self.grid_processing, mask_table)]
 
     def buffer(self):
         """
         Adds buffer to spatial dataset 
-        Buffering is always added before dataset is split into grid squares
+        Buffering is added before dataset is split into grid squares, except for scenario buffers 
+        which are added to gridded base (see buffer_gridded)
         """
             
         if self.postgis.table_exists(self.node.output):
@@ -268,6 +328,8 @@ class OpenSiteSpatial(ProcessBase):
             self.log.error(f"[buffer] {self.node.name} is missing 'buffer' field, buffering failed")
             self.node.status = 'failed'
             return False
+
+        if self.node.custom_properties.get('gridded', False): return self.buffer_gridded()
          
         buffer = self.node.custom_properties['buffer']
         input_table = self.node.input
@@ -278,12 +340,10 @@ class OpenSiteSpatial(ProcessBase):
         dbparams = {
             "input": sql.Identifier(input_table),
             "output": sql.Identifier(output_table),
-            "output_index": sql.Identifier(f"{output_table}_idx"),
             "buffer": sql.Literal(buffer),
         }
 
-        query_buffer_create = sql.SQL("CREATE TABLE {output} AS SELECT ST_Buffer(geom, {buffer}) geom FROM {input}").format(**dbparams)
-        query_buffer_create_index = sql.SQL("CREATE INDEX {output_index} ON {output} USING GIST (geom)").format(**dbparams)
+        query_buffer_create = sql.SQL("SELECT ST_Buffer(geom, {buffer}) geom FROM {input}").format(**dbparams)
 
         # Make special exception for hedgerow as hedgerow polygons represent boundaries that should be buffered as lines
         buffer_polygons_as_lines = False
@@ -291,7 +351,6 @@ class OpenSiteSpatial(ProcessBase):
 
         if buffer_polygons_as_lines:
             query_buffer_create = sql.SQL("""
-            CREATE TABLE {output} AS 
             (
                 (SELECT ST_Buffer(geom, {buffer}) geom 
                 FROM {input} 
@@ -312,8 +371,13 @@ class OpenSiteSpatial(ProcessBase):
             # """).format(**dbparams)
 
         try:
-            self.postgis.execute_query(query_buffer_create)
-            self.postgis.execute_query(query_buffer_create_index)
+            engine, inprocess = self.get_engine(input_table)
+            if engine == 'inprocess':
+                self.log.info(f"[buffer] [{self.node.name}] Small dataset so buffering in-process")
+                inprocess.buffer(input_table, output_table, buffer, buffer_polygons_as_lines, storage=self.get_storage())
+            else:
+                self.postgis.create_table(self.node.output, query=query_buffer_create, storage=self.get_storage())
+            if not self.postgis.finalise_table(self.node.output, [('gist', 'geom')], storage=self.get_storage()): return False
             self.postgis.add_table_comment(self.node.output, self.node.name)
 
             # Success Gate: Only update registry now
@@ -332,6 +396,115 @@ class OpenSiteSpatial(ProcessBase):
             self.log.error(f"[buffer] [{self.node.name}] Unexpected error: {e}")
             return False
 
+    def buffer_gridded(self):
+        """
+        Adds buffer to gridded base dataset to produce gridded output, ie. equivalent of buffer followed by preprocess
+        Each grid square is built from buffered features within buffer distance of grid square
+        """
+
+        if not self.postgis.table_exists(self.grid_processing):
+            self.log.info("[buffer] Processing grid does not exist, creating it...")
+            if not self.create_processing_grid():
+                self.log.error(f"[buffer] Failed to create processing grid, unable to buffer {self.node.name}")
+                self.node.status = 'failed'
+                return False
+
+        buffer = self.node.custom_properties['buffer']
+        gridsquare_ids = self.get_processing_grid_square_ids(self.node.custom_properties.get('clip'))
+        if gridsquare_ids is None:
+            self.log.error(f"[buffer] [{self.node.name}] Unable to get processing grid squares")
+            self.node.status = 'failed'
+            return False
+        scratch_table_1 = f"tmp_1_{self.node.output}_{self.node.urn}"
+
+        dbparams = {
+            "crs": sql.Literal(int(self.get_crs_default())),
+            "grid": sql.Identifier(self.grid_processing),
+            "clip": sql.Identifier(OpenSiteConstants.OPENSITE_CLIPPINGMASTER),
+            "input": sql.Identifier(self.node.input),
+            "scratch1": sql.Identifier(scratch_table_1),
+            "output": sql.Identifier(self.node.output),
+            "buffer": sql.Literal(buffer),
+        }
+
+        query_buffer_gridsquare = """
+        INSERT INTO {scratch1} (id, geom)
+            SELECT 
+                grid.id, 
+                (ST_Dump(
+                    ST_CollectionExtract(
+                        ST_Intersection(grid.geom, ST_Union(ST_Buffer(data.geom, {buffer}))), 
+                        3
+                    )
+                )).geom::geometry(Polygon, {crs})
+            FROM {grid} grid
+            JOIN {input} data ON ST_DWithin(grid.geom, data.geom, {buffer})
+            WHERE grid.id = {gridsquare_id}
+            GROUP BY grid.id, grid.geom;"""
+        query_output_create = sql.SQL("""
+        SELECT 
+            data.id, data.geom
+        FROM {scratch1} data
+        JOIN {clip} clipper ON ST_Contains(clipper.geom, data.geom)
+
+        UNION ALL
+
+        SELECT 
+            data.id, (ST_Dump(ST_CollectionExtract(ST_Intersection(data.geom, clipper.geom), 3))).geom::geometry(Polygon, {crs})
+        FROM {scratch1} data
+        JOIN {clip} clipper ON ST_Intersects(data.geom, clipper.geom) 
+        AND NOT ST_Contains(clipper.geom, data.geom);
+        """).format(**dbparams)
+
+        self.postgis.drop_table(scratch_table_1)
+
+        try:
+            self.log.info(f"[buffer] [{self.node.name}] Adding {buffer}m buffer to gridded {self.node.input} to make {self.node.output}")
+
+            self.postgis.create_table(scratch_table_1, columns=sql.SQL("id INTEGER, geom GEOMETRY(Polygon, {crs})").format(**dbparams), storage=self.get_storage('scratch'))
+
+            gridsquares_index, gridsquares_count = 0, len(gridsquare_ids)
+            last_log_time = time.time()
+
+            for gridsquare_id in gridsquare_ids:
+                gridsquares_index += 1
+
+                # Progress reporting - log every PROCESSING_INTERVAL_TIME seconds to avoid flooding terminal
+                current_time = time.time()
+                if  (gridsquares_index == 1) or \
+                    (gridsquares_index == gridsquares_count) or \
+                    (current_time - last_log_time > self.PROCESSING_INTERVAL_TIME):
+                    self.log.info(f"[buffer] [{self.node.name}] Buffering grid square {gridsquares_index}/{gridsquares_count}")
+                    last_log_time = time.time()
+
+                dbparams['gridsquare_id'] = sql.Literal(gridsquare_id)
+                self.postgis.execute_query(sql.SQL(query_buffer_gridsquare).format(**dbparams))
+
+            if not self.postgis.finalise_table(scratch_table_1, [('gist', 'geom')], cluster=None, storage=self.get_storage('scratch')): return False
+            self.postgis.create_table(self.node.output, query=query_output_create, storage=self.get_storage())
+            if not self.postgis.finalise_table(self.node.output, [('gist', 'geom'), ('btree', 'id')], storage=self.get_storage()): return False
+            self.postgis.add_table_comment(self.node.output, self.node.name)
+            self.postgis.drop_table(scratch_table_1)
+
+            # Record grid square hashes so amalgamations only recompute grid squares that have changed
+            self.postgis.update_gridsquare_hashes(self.node.output)
+
+            # Success Gate: Only update registry now
+            if self.postgis.set_table_completed(self.node.output):
+                self.log.info(f"[buffer] [{self.node.name}] Finished adding {buffer}m buffer to gridded {self.node.input} to make {self.node.output}")
+                return True
+            else:
+                # This catches the bug where the node was never registered initially
+                self.log.error(f"[buffer] Buffer added but registry record for {self.node.output} was not found.")
+                return False
+
+        except Error as e:
+            self.log.error(f"[buffer] [{self.node.name}] PostGIS error during gridded buffer creation: {e}")
+            return False
+        except Exception as e:
+            self.log.error(f"[buffer] [{self.node.name}] Unexpected error: {e}")
+            return False
+
     def distance(self):
         """
         Adds minimum distance exclusion to spatial dataset, ie. if anything is further than 'distance', it's selected 
@@ -358,12 +531,30 @@ class OpenSiteSpatial(ProcessBase):
             "input": sql.Identifier(input_table),
             "clipping_master": sql.Identifier(OpenSiteConstants.OPENSITE_CLIPPINGMASTER),
             "output": sql.Identifier(output_table),
-            "output_index": sql.Identifier(f"{output_table}_idx"),
             "distance": sql.Literal(distance),
         }
+        dbparams['clipping_area'] = dbparams['clipping_master']
+
+        # If clip has been pushed down, only create distance exclusion within clip area bounds plus margin
+        if 'clip' in self.node.custom_properties:
+            margin = self.node.custom_properties.get('clip_margin', 0)
+            bounds = self.postgis.get_areas_bounds(self.node.custom_properties['clip'], OpenSiteConstants.CRS_DEFAULT, OpenSiteConstants.CRS_DEFAULT, margin)
+            if bounds is None:
+                self.log.error(f"[distance] [{self.node.name}] Unable to find bounds of clipping area, distance exclusion failed")
+                self.node.status = 'failed'
+                return False
+
+            dbparams['clipping_area'] = sql.SQL("""
+            (SELECT ST_Multi(ST_CollectionExtract(ST_Intersection(geom, ST_MakeEnvelope({left}, {bottom}, {right}, {top}, {crs})), 3)) geom FROM {clipping_master})
+            """).format(
+                left=sql.Literal(bounds['left']), 
+                bottom=sql.Literal(bounds['bottom']), 
+                right=sql.Literal(bounds['right']), 
+                top=sql.Literal(bounds['top']), 
+                crs=sql.Literal(int(self.get_crs_default())),
+                clipping_master=dbparams['clipping_master'])
 
         query_distance_create = sql.SQL("""
-        CREATE TABLE {output} AS 
             WITH exclusion AS (
                 SELECT ST_Union(ST_Buffer(geom, {distance})) as geom 
                 FROM {input}
@@ -374,16 +565,15 @@ class OpenSiteSpatial(ProcessBase):
             FROM (
                 SELECT 
                     ST_Multi(ST_Difference(cm.geom, ex.geom)) as geom
-                FROM {clipping_master} cm
+                FROM {clipping_area} cm
                 CROSS JOIN exclusion ex
             ) sub
             WHERE NOT ST_IsEmpty(sub.geom)
         """).format(**dbparams)
-        query_distance_create_index = sql.SQL("CREATE INDEX {output_index} ON {output} USING GIST (geom)").format(**dbparams)
 
         try:
-            self.postgis.execute_query(query_distance_create)
-            self.postgis.execute_query(query_distance_create_index)
+            self.postgis.create_table(self.node.output, query=query_distance_create, storage=self.get_storage())
+            if not self.postgis.finalise_table(self.node.output, [('gist', 'geom')], storage=self.get_storage()): return False
             self.postgis.add_table_comment(self.node.output, self.node.name)
 
             # Success Gate: Only update registry now
@@ -412,16 +602,20 @@ class OpenSiteSpatial(ProcessBase):
             self.node.status = 'processed'
             return True
     
-        if not self.postgis.table_exists(OpenSiteConstants.OPENSITE_GRIDPROCESSING):
+        if not self.postgis.table_exists(self.grid_processing):
             self.log.info("[preprocess] Processing grid does not exist, creating it...")
             if not self.create_processing_grid():
                 self.log.error(f"Failed to create processing grid, unable to preprocess {self.node.name}")
                 self.node.status = 'failed'
                 return False
             
-        grid_table = OpenSiteConstants.OPENSITE_GRIDPROCESSING
+        grid_table = self.grid_processing
         clip_table = OpenSiteConstants.OPENSITE_CLIPPINGMASTER
-        gridsquare_ids = self.get_processing_grid_square_ids()
+        gridsquare_ids = self.get_processing_grid_square_ids(self.node.custom_properties.get('clip'))
+        if gridsquare_ids is None:
+            self.log.error(f"[preprocess] [{self.node.name}] Unable to get processing grid squares")
+            self.node.status = 'failed'
+            return False
         scratch_table_1 = f"tmp_1_{self.node.output}_{self.node.urn}"
         scratch_table_2 = f"tmp_2_{self.node.output}_{self.node.urn}"
         snapgrid = None
@@ -437,10 +631,6 @@ class OpenSiteSpatial(ProcessBase):
             "scratch1": sql.Identifier(scratch_table_1),
             "scratch2": sql.Identifier(scratch_table_2),
             "output": sql.Identifier(self.node.output),
-            "scratch1_index": sql.Identifier(f"{scratch_table_1}_idx"),
-            "scratch2_index": sql.Identifier(f"{scratch_table_2}_idx"),
-            "output_index": sql.Identifier(f"{self.node.output}_idx"),
-            "output_id_index": sql.Identifier(f"{self.node.output}_id_idx"),
         }
 
         # Drop scratch tables
@@ -454,24 +644,21 @@ class OpenSiteSpatial(ProcessBase):
 
         if snapgrid:
             query_scratch_table_1_dump_makevalid = sql.SQL("""
-            CREATE TABLE {scratch1} AS 
                 SELECT  ST_MakeValid(dumped.geom) geom 
                 FROM    (SELECT (ST_Dump(ST_SnapToGrid(geom, {snapgrid}))).geom geom FROM {input}) dumped 
                 WHERE   ST_geometrytype(dumped.geom) = 'ST_Polygon'
                 """).format(**dbparams)
         else:
             query_scratch_table_1_dump_makevalid = sql.SQL("""
-            CREATE TABLE {scratch1} AS 
                 SELECT  ST_MakeValid(dumped.geom) geom 
                 FROM    (SELECT (ST_Dump(geom)).geom geom FROM {input}) dumped 
                 WHERE   ST_geometrytype(dumped.geom) = 'ST_Polygon'
             """).format(**dbparams)
 
-        query_scratch_table_2_table_create = sql.SQL("""
-        CREATE TABLE {scratch2} (
+        query_scratch_table_2_columns = sql.SQL("""
             gid SERIAL PRIMARY KEY,
             id INTEGER,
-            geom GEOMETRY(Polygon, {crs}))
+            geom GEOMETRY(Polygon, {crs})
         """).format(**dbparams)
         # Note: we use ST_CollectionExtract(..., 3) to only select ST_Polygons from ST_Intersection
         # as with ST_SnapToGrid, we are more likely to have line segments generated by ST_Intersection
@@ -490,7 +677,6 @@ class OpenSiteSpatial(ProcessBase):
             WHERE grid.id = {gridsquare_id}
             GROUP BY grid.id, grid.geom;"""
         query_output_create = sql.SQL("""
-        CREATE TABLE {output} AS
         SELECT 
             data.id, (ST_Dump(data.geom)).geom::geometry(Polygon, {crs}) as geom
         FROM {scratch2} data
@@ -504,50 +690,81 @@ class OpenSiteSpatial(ProcessBase):
         JOIN {clip} clipper ON ST_Intersects(data.geom, clipper.geom) 
         AND NOT ST_Contains(clipper.geom, data.geom);
         """).format(**dbparams)
-        query_scratch_table_1_index = sql.SQL("CREATE INDEX {scratch1_index} ON {scratch1} USING GIST (geom)").format(**dbparams)
-        query_scratch_table_2_index = sql.SQL("CREATE INDEX {scratch2_index} ON {scratch2} USING GIST (geom)").format(**dbparams)
-        query_output_index          = sql.SQL("CREATE INDEX {output_index} ON {output} USING GIST (geom)").format(**dbparams)
-        query_output_id_index       = sql.SQL("CREATE INDEX {output_id_index} ON {output} (id)").format(**dbparams)
+
+        # Gridded base for scenario buffers keeps all geometry types as points and lines still need buffering
+        # Base is not clipped as buffered features outside clipping area may still extend into it
+        if self.node.custom_properties.get('base', False):
+            dbparams['input_geom'] = sql.SQL("ST_SnapToGrid(geom, {snapgrid})").format(**dbparams) if snapgrid else sql.SQL("geom")
+            query_scratch_table_1_dump_makevalid = sql.SQL("""
+                SELECT  (ST_Dump(ST_MakeValid(dumped.geom))).geom geom 
+                FROM    (SELECT (ST_Dump({input_geom})).geom geom FROM {input}) dumped
+            """).format(**dbparams)
+            query_scratch_table_2_columns = sql.SQL("""
+                gid SERIAL PRIMARY KEY,
+                id INTEGER,
+                geom GEOMETRY(Geometry, {crs})
+            """).format(**dbparams)
+            query_scratch_table_2_table_insert = """
+            INSERT INTO {scratch2} (id, geom)
+                SELECT grid.id, (ST_Dump(ST_Intersection(grid.geom, data.geom))).geom
+                FROM {grid} grid
+                JOIN {scratch1} data ON ST_Intersects(grid.geom, data.geom)
+                WHERE grid.id = {gridsquare_id};"""
+            query_output_create = sql.SQL("SELECT id, geom FROM {scratch2} WHERE NOT ST_IsEmpty(geom)").format(**dbparams)
+
 
         try:
-            self.log.info(f"[preprocess] [{self.node.name}] Select only polygons, dump and make valid")
+            # In-process engine doesn't snap to grid so always use PostGIS if snapping or creating gridded base
+            engine, inprocess = 'postgis', None
+            if not snapgrid and not self.node.custom_properties.get('base', False): engine, inprocess = self.get_engine(self.node.input)
 
-            self.postgis.execute_query(query_scratch_table_1_dump_makevalid)
-            self.postgis.execute_query(query_scratch_table_1_index)
+            if engine == 'inprocess':
+                self.log.info(f"[preprocess] [{self.node.name}] Small dataset so preprocessing in-process")
+                inprocess.preprocess(self.node.input, self.node.output, gridsquare_ids, storage=self.get_storage(), grid_table=self.grid_processing)
+            else:
+                self.log.info(f"[preprocess] [{self.node.name}] Select only polygons, dump and make valid")
 
-            self.log.info(f"[preprocess] [{self.node.name}] Cutting data into grid squares and running ST_Union on each square")
+                self.postgis.create_table(scratch_table_1, query=query_scratch_table_1_dump_makevalid, storage=self.get_storage('scratch'))
 
-            self.postgis.execute_query(query_scratch_table_2_table_create)
+                # Scratch table is joined against every grid square so index and analyze it
+                # but keep it unordered as it's dropped at end
+                if not self.postgis.finalise_table(scratch_table_1, [('gist', 'geom')], cluster=None, storage=self.get_storage('scratch')): return False
 
-            gridsquares_index, gridsquares_count = 0, len(gridsquare_ids)
-            last_log_time = time.time()
+                self.log.info(f"[preprocess] [{self.node.name}] Cutting data into grid squares and running ST_Union on each square")
 
-            for gridsquare_id in gridsquare_ids:
-                gridsquares_index += 1
+                self.postgis.create_table(scratch_table_2, columns=query_scratch_table_2_columns, storage=self.get_storage('scratch'))
 
-                # Progress reporting - log every PROCESSING_INTERVAL_TIME seconds to avoid flooding terminal
-                current_time = time.time()
-                if  (gridsquares_index == 1) or \
-                    (gridsquares_index == gridsquares_count) or \
-                    (current_time - last_log_time > self.PROCESSING_INTERVAL_TIME):
-                    self.log.info(f"[preprocess] [{self.node.name}] Processing grid square {gridsquares_index}/{gridsquares_count}")
-                    last_log_time = time.time()
+                gridsquares_index, gridsquares_count = 0, len(gridsquare_ids)
+                last_log_time = time.time()
 
-                dbparams['gridsquare_id'] = sql.Literal(gridsquare_id)
+                for gridsquare_id in gridsquare_ids:
+                    gridsquares_index += 1
+
+                    # Progress reporting - log every PROCESSING_INTERVAL_TIME seconds to avoid flooding terminal
+                    current_time = time.time()
+                    if  (gridsquares_index == 1) or \
+                        (gridsquares_index == gridsquares_count) or \
+                        (current_time - last_log_time > self.PROCESSING_INTERVAL_TIME):
+                        self.log.info(f"[preprocess] [{self.node.name}] Processing grid square {gridsquares_index}/{gridsquares_count}")
+                        last_log_time = time.time()
+
+                    dbparams['gridsquare_id'] = sql.Literal(gridsquare_id)
                 
-                self.postgis.execute_query(sql.SQL(query_scratch_table_2_table_insert).format(**dbparams))
+                    self.postgis.execute_query(sql.SQL(query_scratch_table_2_table_insert).format(**dbparams))
 
-            self.postgis.execute_query(query_scratch_table_2_index)
+                if not self.postgis.finalise_table(scratch_table_2, [('gist', 'geom')], cluster=None, storage=self.get_storage('scratch')): return False
 
-            self.log.info(f"[preprocess] [{self.node.name}] Creating final output")
+                self.log.info(f"[preprocess] [{self.node.name}] Creating final output")
 
-            self.postgis.execute_query(query_output_create)
-            self.postgis.execute_query(query_output_index)
-            self.postgis.execute_query(query_output_id_index)
+                self.postgis.create_table(self.node.output, query=query_output_create, storage=self.get_storage())
+            if not self.postgis.finalise_table(self.node.output, [('gist', 'geom'), ('btree', 'id')], storage=self.get_storage()): return False
             self.postgis.add_table_comment(self.node.output, self.node.name)
             self.postgis.drop_table(scratch_table_1)
             self.postgis.drop_table(scratch_table_2)
 
+            # Record grid square hashes so amalgamations only recompute grid squares that have changed
+            self.postgis.update_gridsquare_hashes(self.node.output)
+
             # Success Gate: Only update registry now
             if self.postgis.set_table_completed(self.node.output):
                 self.log.info(f"[preprocess] [{self.node.name}] COMPLETED")
@@ -569,23 +786,53 @@ class OpenSiteSpatial(ProcessBase):
         """
         Amalgamates datasets into one
         Note: amalgamate is universally applied to all geographical subcomponents even if one subcomponent
+        If amalgamation already exists, only grid squares where child tables have changed are recomputed
         """
 
+        inputs = self.node.input
+
+        # Grid square ids to recompute - None means recompute everything
+        dirty_gridsquare_ids = None
+
         if self.postgis.table_exists(self.node.output):
-            self.log.info(f"[amalgamate] [{self.node.output}] already exists, skipping amalgamate")
-            self.node.status = 'processed'
-            return True
 
-        if not self.postgis.table_exists(OpenSiteConstants.OPENSITE_GRIDPROCESSING):
+            input_hashes = {input: self.postgis.get_gridsquare_hashes(input) for input in inputs}
+            if any(hashes is None for hashes in input_hashes.values()):
+                self.log.info(f"[amalgamate] [{self.node.output}] already exists and unable to track child changes, skipping amalgamate")
+                self.node.status = 'processed'
+                return True
+
+            dirty_gridsquare_ids = self.postgis.get_dirty_gridsquares(self.node.output, input_hashes)
+
+            # Amalgamations created before lineage was recorded are assumed to be up to date
+            if dirty_gridsquare_ids is None:
+                self.postgis.set_gridsquare_lineage(self.node.output, input_hashes)
+                dirty_gridsquare_ids = set()
+
+            if not dirty_gridsquare_ids:
+                self.log.info(f"[amalgamate] [{self.node.output}] already exists and child tables unchanged, skipping amalgamate")
+                self.node.status = 'processed'
+                return True
+
+            dirty_gridsquare_ids = sorted(dirty_gridsquare_ids)
+            self.log.info(f"[amalgamate] [{self.node.name}] Child tables changed in {len(dirty_gridsquare_ids)} grid square(s), recomputing only those grid squares")
+
+        if not self.postgis.table_exists(self.grid_processing):
             self.log.info("[amalgamate] Processing grid does not exist, creating it...")
             if not self.create_processing_grid():
                 self.log.error(f"[amalgamate] Failed to create processing grid, unable to amalgamate {self.node.name}")
                 self.node.status = 'failed'
                 return False
 
-        inputs = self.node.input
-        grid_table = OpenSiteConstants.OPENSITE_GRIDPROCESSING
-        gridsquare_ids = self.get_processing_grid_square_ids()
+        grid_table = self.grid_processing
+        if dirty_gridsquare_ids is None:
+            gridsquare_ids = self.get_processing_grid_square_ids(self.node.custom_properties.get('clip'))
+            if gridsquare_ids is None:
+                self.log.error(f"[amalgamate] [{self.node.name}] Unable to get processing grid squares")
+                self.node.status = 'failed'
+                return False
+        else:
+            gridsquare_ids = dirty_gridsquare_ids
         scratch_table_1 = f"tmp_1_{self.node.output}_{self.node.urn}"
 
         dbparams = {
@@ -593,31 +840,36 @@ class OpenSiteSpatial(ProcessBase):
             "grid":             sql.Identifier(grid_table),
             "scratch1":         sql.Identifier(scratch_table_1),
             "output":           sql.Identifier(self.node.output),
-            "scratch1_index":   sql.Identifier(f"{scratch_table_1}_idx"),
-            "output_index":     sql.Identifier(f"{self.node.output}_idx"),
-            "output_id_index":  sql.Identifier(f"{self.node.output}_id_idx"),
+            "dirty_ids":        sql.Literal(dirty_gridsquare_ids),
         }
 
+        # When recomputing changed grid squares, only select child features in those grid squares
+        if dirty_gridsquare_ids is None:    dbparams['input_filter'] = sql.SQL("TRUE")
+        else:                               dbparams['input_filter'] = sql.SQL("id = ANY({dirty_ids}::int[])").format(**dbparams)
+
         # Drop scratch tables
         self.postgis.drop_table(scratch_table_1)
 
         try:
             self.log.info(f"[amalgamate] [{self.node.name}] Starting amalgamation and dissolving")
 
-            # Create output table regardless of number of children
-            self.postgis.execute_query(sql.SQL("CREATE UNLOGGED TABLE {output} (id int, geom geometry(Geometry, {crs}))").format(**dbparams))
-            self.postgis.add_table_comment(self.node.output, self.node.name)
+            if dirty_gridsquare_ids is None:
+                # Create output table regardless of number of children
+                self.postgis.create_table(self.node.output, columns=sql.SQL("id int, geom geometry(Geometry, {crs})").format(**dbparams), storage=self.get_storage())
+                self.postgis.add_table_comment(self.node.output, self.node.name)
+            else:
+                self.postgis.execute_query(sql.SQL("DELETE FROM {output} WHERE {input_filter}").format(**dbparams))
 
             if len(inputs) == 1:
 
                 dbparams['input'] = sql.Identifier(inputs[0])
                 self.log.info(f"[{self.node.name}] Single child so directly copying from {inputs[0]} to {self.node.output}")
-                self.postgis.execute_query(sql.SQL("INSERT INTO {output} SELECT * FROM {input}").format(**dbparams))
+                self.postgis.execute_query(sql.SQL("INSERT INTO {output} SELECT id, geom FROM {input} WHERE {input_filter}").format(**dbparams))
 
             else:
 
-                # Create empty tables first using UNLOGGED for speed
-                self.postgis.execute_query(sql.SQL("CREATE UNLOGGED TABLE {scratch1} (id int, geom geometry(Geometry, {crs}))").format(**dbparams))
+                # Create empty tables first using scratch storage for speed
+                self.postgis.create_table(scratch_table_1, columns=sql.SQL("id int, geom geometry(Geometry, {crs})").format(**dbparams), storage=self.get_storage('scratch'))
         
                 # Pour each input table in one by one
                 input_index = 0
@@ -625,10 +877,10 @@ class OpenSiteSpatial(ProcessBase):
                     input_index += 1
                     dbparams['input'] = sql.Identifier(input)
                     self.log.info(f"[amalgamate] [{self.node.name}] Amalgamating child table {input_index}/{len(inputs)}")
-                    query_add_table = sql.SQL("INSERT INTO {scratch1} (id, geom) SELECT id, (ST_Dump(geom)).geom FROM {input}").format(**dbparams)
+                    query_add_table = sql.SQL("INSERT INTO {scratch1} (id, geom) SELECT id, (ST_Dump(geom)).geom FROM {input} WHERE {input_filter}").format(**dbparams)
                     self.postgis.execute_query(query_add_table)
 
-                self.postgis.execute_query(sql.SQL("CREATE INDEX ON {scratch1} USING GIST (geom)").format(**dbparams))
+                if not self.postgis.finalise_table(scratch_table_1, [('gist', 'geom')], cluster=None, storage=self.get_storage('scratch')): return False
 
                 gridsquare_index = 0
                 for gridsquare_id in gridsquare_ids:
@@ -647,13 +899,20 @@ class OpenSiteSpatial(ProcessBase):
                     """).format(**dbparams)
                     self.postgis.execute_query(query_union_by_gridsquare)
 
-            self.postgis.execute_query(sql.SQL("CREATE INDEX ON {output} USING GIST (geom)").format(**dbparams))
-            self.postgis.execute_query(sql.SQL("CREATE INDEX {output_id_index} ON {output} (id)").format(**dbparams))
-            self.postgis.execute_query(sql.SQL("DELETE FROM {output} WHERE ST_GeometryType(geom) NOT IN ('ST_Polygon')").format(**dbparams))
+            self.postgis.execute_query(sql.SQL("DELETE FROM {output} WHERE {input_filter} AND ST_GeometryType(geom) NOT IN ('ST_Polygon')").format(**dbparams))
+
+            # When only changed grid squares are recomputed, indexes already exist and rows aren't reordered
+            if dirty_gridsquare_ids is None:    finalised = self.postgis.finalise_table(self.node.output, [('gist', 'geom'), ('btree', 'id')], storage=self.get_storage())
+            else:                               finalised = self.postgis.finalise_table(self.node.output, [], cluster=None, storage=self.get_storage())
+            if not finalised: return False
 
             self.postgis.drop_table(scratch_table_1)
             self.postgis.add_table_comment(self.node.output, self.node.name)
 
+            # Record grid square hashes of output and children so later runs can recompute changed grid squares only
+            self.postgis.update_gridsquare_hashes(self.node.output, dirty_gridsquare_ids)
+            self.postgis.set_gridsquare_lineage(self.node.output, {input: self.postgis.get_gridsquare_hashes(input) for input in inputs})
+
             # Success Gate: Only update registry now
             # Register new table manually as output uses variable ()
             self.postgis.register_node(self.node)
@@ -696,6 +955,8 @@ class OpenSiteSpatial(ProcessBase):
         Postprocess node - join all grid squares together
         We assume each postprocess node has exactly one child, 
         ie. if postprocessing is needed on multiple children, insert amalgamate as single child 
+        Every output feature records grid squares it was built from in 'gridsquare_ids' so if output 
+        already exists, only region around grid squares where input has changed is recomputed
         """
 
         name_elements = self.parse_output_node_name(self.node.name)
@@ -712,15 +973,42 @@ class OpenSiteSpatial(ProcessBase):
             "crs": sql.Literal(self.get_crs_default()),
             "input": sql.Identifier(self.node.input),
             "output": sql.Identifier(self.node.output),
-            "buffered_edges": sql.Identifier(OpenSiteConstants.OPENSITE_GRIDBUFFEDGES),
+            "buffered_edges": sql.Identifier(self.grid_buffered_edges),
             "table_seams": sql.Identifier(table_seams),
             "table_islands": sql.Identifier(table_islands),
             "table_welded": sql.Identifier(table_welded),
         }
 
+        # Grid square ids of region to recompute - None means recompute everything
+        region_gridsquare_ids = None
+
         if self.postgis.table_exists(self.node.output):
-            self.log.info(f"[postprocess] [{self.node.output}] already exists, skipping postprocess")
-            return True
+
+            input_hashes = {self.node.input: self.postgis.get_gridsquare_hashes(self.node.input)}
+            if input_hashes[self.node.input] is None:
+                self.log.info(f"[postprocess] [{self.node.output}] already exists and unable to track input changes, skipping postprocess")
+                return True
+
+            if 'gridsquare_ids' not in self.postgis.get_column_names(self.node.output):
+                self.log.info(f"[postprocess] [{self.node.output}] was created without grid square tracking, recreating it")
+            else:
+                dirty_gridsquare_ids = self.postgis.get_dirty_gridsquares(self.node.output, input_hashes)
+
+                # Outputs created before lineage was recorded are assumed to be up to date
+                if dirty_gridsquare_ids is None:
+                    self.postgis.set_gridsquare_lineage(self.node.output, input_hashes)
+                    dirty_gridsquare_ids = set()
+
+                if not dirty_gridsquare_ids:
+                    self.log.info(f"[postprocess] [{self.node.output}] already exists and input unchanged, skipping postprocess")
+                    return True
+
+                region_gridsquare_ids = self.get_postprocess_region(dirty_gridsquare_ids)
+                self.log.info(f"[postprocess] [{self.node.name}] Input changed in {len(dirty_gridsquare_ids)} grid square(s), recomputing region of {len(region_gridsquare_ids)} grid square(s)")
+
+        dbparams['region_ids'] = sql.Literal(region_gridsquare_ids)
+        if region_gridsquare_ids is None:   dbparams['input_filter'] = sql.SQL("TRUE")
+        else:                               dbparams['input_filter'] = sql.SQL("a.id = ANY({region_ids}::int[])").format(**dbparams)
 
         try:
 
@@ -731,22 +1019,21 @@ class OpenSiteSpatial(ProcessBase):
                     self.postgis.drop_table(t)
 
             cleanup()
-            self.postgis.drop_table(self.node.output)
+            if region_gridsquare_ids is None: self.postgis.drop_table(self.node.output)
 
             # --- STEP 1: Isolate Seam Candidates ---
             self.log.info(f"[postprocess] [{self.node.name}] Step 1: Extracting seam candidates...")
             start = datetime.datetime.now()
-            self.postgis.execute_query(sql.SQL("""
-            CREATE TABLE {table_seams} AS
-            SELECT a.geom AS geom FROM {input} a WHERE EXISTS (SELECT 1 FROM {buffered_edges} b WHERE ST_Intersects(a.geom, b.geom))""").format(**dbparams))
+            self.postgis.create_table(table_seams, storage=self.get_storage('scratch'), query=sql.SQL("""
+            SELECT a.id, a.geom AS geom FROM {input} a WHERE {input_filter} AND EXISTS (SELECT 1 FROM {buffered_edges} b WHERE ST_Intersects(a.geom, b.geom))""").format(**dbparams))
+            self.postgis.finalise_table(table_seams, [('gist', 'geom')], cluster=None, storage=self.get_storage('scratch'))
             self.log.info(f"[postprocess] [{self.node.name}] Step 1: COMPLETED in {datetime.datetime.now() - start}")
 
             # --- STEP 2: Isolate Islands ---
             self.log.info(f"[postprocess] [{self.node.name}] Step 2: Isolating islands...")
             start = datetime.datetime.now()
-            self.postgis.execute_query(sql.SQL("""
-            CREATE TABLE {table_islands} AS
-            SELECT a.geom AS geom FROM {input} a WHERE NOT EXISTS (SELECT 1 FROM {buffered_edges} b WHERE ST_Intersects(a.geom, b.geom))""").format(**dbparams))
+            self.postgis.create_table(table_islands, storage=self.get_storage('scratch'), query=sql.SQL("""
+            SELECT ARRAY[a.id] AS gridsquare_ids, a.geom AS geom FROM {input} a WHERE {input_filter} AND NOT EXISTS (SELECT 1 FROM {buffered_edges} b WHERE ST_Intersects(a.geom, b.geom))""").format(**dbparams))
             self.log.info(f"[postprocess] [{self.node.name}] Step 2: COMPLETED in {datetime.datetime.now() - start}")
 
             # --- STEP 3: Weld seams ---
@@ -754,11 +1041,35 @@ class OpenSiteSpatial(ProcessBase):
             start = datetime.datetime.now()
             strategy = "CONVENTIONAL"
 
+            # Unioning very large numbers of vertices can exhaust PostGIS so for these keep gridded data from outset
+            # Vertices being unioned estimated (upper bound) from vertex count of each grid square in region
+            stats = self.postgis.get_table_stats(self.node.input)
+            if stats and stats['gridsquare_vertices'] is not None:
+                if region_gridsquare_ids is None:   union_vertices = stats['total_vertices']
+                else:                               union_vertices = sum(stats['gridsquare_vertices'].get(str(gridsquare_id), 0) for gridsquare_id in region_gridsquare_ids)
+                if union_vertices > OpenSiteConstants.POSTPROCESS_UNION_MAX_VERTICES:
+                    self.log.warning(f"[postprocess] [{self.node.name}] {union_vertices} vertices too many to union so copying over gridded data to target table")
+                    strategy = "KEEPGRIDDED"
+
             # EXECUTION: Conventional Path (Fast)
+            # Seams are clustered into connected groups so each welded feature knows which grid squares it spans
+            # Only seams touching another seam are clustered - seams that touch none are already welded features
+            # When recomputing, seams are limited to region grown from dirty grid squares (see get_postprocess_region)
+            # so clustering window only holds seams connected to changed grid squares, not whole seam table
             if strategy == "CONVENTIONAL":
                 self.log.info(f"[postprocess] [{self.node.name}] Strategy: {strategy}")
                 try:
-                    self.postgis.execute_query(sql.SQL("CREATE TABLE {table_welded} AS SELECT ST_Union(geom) AS geom FROM {table_seams}").format(**dbparams))
+                    self.postgis.create_table(table_welded, storage=self.get_storage('scratch'), query=sql.SQL("""
+                    WITH seams AS 
+                    (
+                        SELECT a.id, a.geom, EXISTS (SELECT 1 FROM {table_seams} b WHERE b.ctid <> a.ctid AND ST_Intersects(a.geom, b.geom)) AS connected 
+                        FROM {table_seams} a
+                    )
+                    SELECT ARRAY[id] AS gridsquare_ids, geom FROM seams WHERE NOT connected
+                    UNION ALL
+                    SELECT array_agg(DISTINCT id ORDER BY id) AS gridsquare_ids, ST_Union(geom) AS geom 
+                    FROM (SELECT id, geom, ST_ClusterDBSCAN(geom, eps := 0, minpoints := 1) OVER () AS cluster_id FROM seams WHERE connected) clusters 
+                    GROUP BY cluster_id""").format(**dbparams))
                 except Exception as e:
                     self.log.warning(f"[postprocess] [{self.node.name}] Conventional weld failed - geometry too complex for PostGIS so copying over gridded data to target table")
                     strategy = "KEEPGRIDDED"
@@ -769,7 +1080,7 @@ class OpenSiteSpatial(ProcessBase):
             if strategy == "KEEPGRIDDED":
                 self.log.info(f"[postprocess] [{self.node.name}] Strategy: {strategy}")
                 try:
-                    self.postgis.execute_query(sql.SQL("CREATE TABLE {table_welded} AS SELECT geom FROM {table_seams}").format(**dbparams))
+                    self.postgis.create_table(table_welded, storage=self.get_storage('scratch'), query=sql.SQL("SELECT ARRAY[id] AS gridsquare_ids, geom FROM {table_seams}").format(**dbparams))
                 except Exception as e:
                     self.log.warning(f"[postprocess] [{self.node.name}] Unable to copy over gridded data to target table")
                     cleanup()
@@ -779,17 +1090,32 @@ class OpenSiteSpatial(ProcessBase):
 
             # --- STEP 4: Final assembly ---
             self.log.info(f"[postprocess] [{self.node.name}] Step 4: Finalizing output...")
-            self.postgis.execute_query(sql.SQL("""
-            CREATE TABLE {output} AS
-            SELECT geom FROM {table_welded}
-            UNION ALL
-            SELECT geom FROM {table_islands};
-            CREATE INDEX ON {output} USING GIST (geom);
-            """).format(**dbparams))
+            if region_gridsquare_ids is None:
+                self.postgis.create_table(self.node.output, storage=self.get_storage(), query=sql.SQL("""
+                SELECT gridsquare_ids, geom FROM {table_welded}
+                UNION ALL
+                SELECT gridsquare_ids, geom FROM {table_islands}
+                """).format(**dbparams))
+                finalised = self.postgis.finalise_table(self.node.output, [('gist', 'geom'), ('gin', 'gridsquare_ids')], storage=self.get_storage())
+            else:
+                # Fixpoint region guarantees every feature overlapping region lies entirely within region
+                self.postgis.execute_query(sql.SQL("""
+                DELETE FROM {output} WHERE gridsquare_ids && {region_ids}::int[];
+                INSERT INTO {output} (gridsquare_ids, geom)
+                SELECT gridsquare_ids, geom FROM {table_welded}
+                UNION ALL
+                SELECT gridsquare_ids, geom FROM {table_islands};
+                """).format(**dbparams))
+                finalised = self.postgis.finalise_table(self.node.output, [], cluster=None, storage=self.get_storage())
 
             cleanup()
+            if not finalised: return False
             self.log.info(f"[postprocess] [{self.node.name}] Success")
 
+            # Record grid square hashes of output and input so later runs can recompute changed region only
+            self.postgis.update_gridsquare_hashes(self.node.output, region_gridsquare_ids)
+            self.postgis.set_gridsquare_lineage(self.node.output, {self.node.input: self.postgis.get_gridsquare_hashes(self.node.input)})
+
             self.postgis.add_table_comment(self.node.output, self.node.name)
             self.postgis.register_node(self.node, None, name_elements['branch'])
             
@@ -804,74 +1130,273 @@ class OpenSiteSpatial(ProcessBase):
             self.log.error(f"[postprocess] [{self.node.name}] Error during postprocess: {e}")
             return False
 
-    def clip(self):
+    def get_postprocess_region(self, dirty_gridsquare_ids):
         """
-        Clips dataset to clipping path
-        We assume all clipping areas are an alphabetically-ordered lowercase list, eg. ['east sussex', 'surrey']
+        Gets region of grid squares that must be recomputed when postprocess input changes in dirty_gridsquare_ids
+        Welded features span several grid squares so region is expanded until no output feature 
+        or changed input feature crosses region boundary
+        """
+
+        region = set(dirty_gridsquare_ids)
+
+        dbparams = {
+            "input": sql.Identifier(self.node.input),
+            "output": sql.Identifier(self.node.output),
+        }
+
+        while True:
+            dbparams['region_ids'] = sql.Literal(sorted(region))
+            results = self.postgis.fetch_all(sql.SQL("""
+            SELECT unnest(o.gridsquare_ids) AS gridsquare_id FROM {output} o WHERE o.gridsquare_ids && {region_ids}::int[]
+            UNION
+            SELECT unnest(o.gridsquare_ids) AS gridsquare_id FROM {input} a 
+            JOIN {output} o ON ST_Intersects(a.geom, o.geom) 
+            WHERE a.id = ANY({region_ids}::int[])
+            """).format(**dbparams))
+
+            expanded = region | {row['gridsquare_id'] for row in results}
+            if expanded == region: return sorted(region)
+            region = expanded
+
+    def generalise(self):
+        """
+        Generalises dataset to level of detail (LOD) using tolerance in node's 'tolerance' property
+        Features are dissolved per 'gridsquare_ids' group before simplifying so seams between pieces of same feature,
+        eg. from subdivided clip masks, can't open up. If ST_CoverageSimplify is available, groups are simplified 
+        together as coverage so shared edges between groups stay shared, otherwise with ST_SimplifyPreserveTopology
+        Results are snapped to grid of tolerance * GENERALISE_PRECISION_FACTOR
+        Every output feature keeps its 'gridsquare_ids' so if output already exists, only features in grid squares 
+        where input has changed - and, for coverage simplification, their neighbours - are regenerated
         """
 
-        # Convert output-focused name to normal name for registry listing
         name_elements = self.parse_output_node_name(self.node.name)
         self.node.name = name_elements['name']
-        clip_text = ';'.join(self.node.custom_properties['clip'])
+        tolerance = self.node.custom_properties['tolerance']
 
-        self.log.info(f"[clip] Running clip mask '{clip_text}' on {self.node.name} table {input}")
+        track_gridsquares = ('gridsquare_ids' in self.postgis.get_column_names(self.node.input))
+        coverage = track_gridsquares and self.postgis.has_coverage_simplify()
+
+        dbparams = {
+            "crs": sql.Literal(int(self.get_crs_default())),
+            "input": sql.Identifier(self.node.input),
+            "output": sql.Identifier(self.node.output),
+            "tolerance": sql.Literal(tolerance),
+            "precision": sql.Literal(tolerance * OpenSiteConstants.GENERALISE_PRECISION_FACTOR),
+        }
+
+        # Grid square ids where input has changed - None means regenerate everything
+        dirty_gridsquare_ids = None
 
         if self.postgis.table_exists(self.node.output):
-            self.postgis.drop_table(self.node.output)
 
-        cliptemp = f"tmp_1_{self.node.output}_{self.node.urn}"
+            input_hashes = {self.node.input: self.postgis.get_gridsquare_hashes(self.node.input)}
+            if (not track_gridsquares) or (input_hashes[self.node.input] is None):
+                self.log.info(f"[generalise] [{self.node.name}] Unable to track input changes, regenerating {self.node.output}")
+            else:
+                dirty_gridsquare_ids = self.postgis.get_dirty_gridsquares(self.node.output, input_hashes)
+                if dirty_gridsquare_ids is not None and not dirty_gridsquare_ids:
+                    self.log.info(f"[generalise] [{self.node.output}] already exists and input unchanged, skipping generalise")
+                    return True
+                if dirty_gridsquare_ids is not None:
+                    dirty_gridsquare_ids = sorted(dirty_gridsquare_ids)
+                    self.log.info(f"[generalise] [{self.node.name}] Input changed in {len(dirty_gridsquare_ids)} grid square(s), regenerating only those features")
+
+        # Coverage simplification of edge depends on features either side of it so features touching 
+        # changed features are regenerated too, simplified alongside features touching them
+        regenerate_gridsquare_ids, context_gridsquare_ids = dirty_gridsquare_ids, dirty_gridsquare_ids
+        if coverage and dirty_gridsquare_ids is not None:
+            regenerate_gridsquare_ids = self.get_touching_gridsquare_ids(dirty_gridsquare_ids)
+            context_gridsquare_ids = self.get_touching_gridsquare_ids(regenerate_gridsquare_ids)
+
+        def gridsquare_filter(gridsquare_ids):
+            if gridsquare_ids is None: return sql.SQL("TRUE")
+            return sql.SQL("gridsquare_ids && {ids}::int[]").format(ids=sql.Literal(gridsquare_ids))
+
+        dbparams['regenerate_ids'] = sql.Literal(regenerate_gridsquare_ids)
+        dbparams['regenerate_filter'] = gridsquare_filter(regenerate_gridsquare_ids)
+        dbparams['context_filter'] = gridsquare_filter(context_gridsquare_ids)
+
+        # Snapping to grid can collapse or invalidate small polygons so make valid and drop empty results
+        if not track_gridsquares:
+            query_generalise = sql.SQL("""
+            SELECT geom::geometry(MultiPolygon, {crs}) AS geom FROM 
+            (
+                SELECT ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_SnapToGrid(ST_SimplifyPreserveTopology(geom, {tolerance}), {precision})), 3)) AS geom 
+                FROM {input}
+            ) generalised 
+            WHERE NOT ST_IsEmpty(geom)""").format(**dbparams)
+        else:
+            if coverage:
+                dbparams['simplify'] = sql.SQL("ST_CoverageSimplify(geom, {tolerance}) OVER ()").format(**dbparams)
+            else:
+                dbparams['simplify'] = sql.SQL("ST_SimplifyPreserveTopology(geom, {tolerance})").format(**dbparams)
 
-        areas, initial_areas = [], self.node.custom_properties['clip']
+            query_generalise = sql.SQL("""
+            SELECT gridsquare_ids, geom::geometry(MultiPolygon, {crs}) AS geom FROM 
+            (
+                SELECT gridsquare_ids, ST_Multi(ST_CollectionExtract(ST_MakeValid(ST_SnapToGrid(geom, {precision})), 3)) AS geom FROM 
+                (
+                    SELECT gridsquare_ids, {simplify} AS geom FROM 
+                    (
+                        SELECT gridsquare_ids, ST_Union(geom) AS geom FROM {input} WHERE {context_filter} GROUP BY gridsquare_ids
+                    ) dissolved
+                ) simplified 
+                WHERE {regenerate_filter}
+            ) generalised 
+            WHERE NOT ST_IsEmpty(geom)""").format(**dbparams)
 
-        # Convert all areas and check each exists in boundaries database
-        for area in initial_areas:
+        try:
+            self.log.info(f"[generalise] [{self.node.name}] Generalising {self.node.input} with tolerance {tolerance}")
 
-            if area in OpenSiteConstants.OSM_NAME_CONVERT: area = OpenSiteConstants.OSM_NAME_CONVERT[area]
+            if dirty_gridsquare_ids is None:
+                self.postgis.drop_table(self.node.output)
+                self.postgis.create_table(self.node.output, query=query_generalise, storage=self.get_storage())
+                indexes = [('gist', 'geom'), ('gin', 'gridsquare_ids')] if track_gridsquares else [('gist', 'geom')]
+                finalised = self.postgis.finalise_table(self.node.output, indexes, storage=self.get_storage())
+            else:
+                # Grid squares of replaced features also change so their hashes must be updated
+                changed_gridsquare_ids = self.get_group_gridsquare_ids(regenerate_gridsquare_ids)
+                self.postgis.execute_query(sql.SQL("""
+                DELETE FROM {output} WHERE gridsquare_ids && {regenerate_ids}::int[];
+                INSERT INTO {output} (gridsquare_ids, geom) """).format(**dbparams) + query_generalise)
+                finalised = self.postgis.finalise_table(self.node.output, [], cluster=None, storage=self.get_storage())
+
+            if not finalised: return False
+
+            # Record grid square hashes of output and input so later runs only regenerate changed features
+            if track_gridsquares:
+                if regenerate_gridsquare_ids is not None:
+                    changed_gridsquare_ids = sorted(set(changed_gridsquare_ids) | set(self.get_group_gridsquare_ids(regenerate_gridsquare_ids)))
+                    self.postgis.update_gridsquare_hashes(self.node.output, changed_gridsquare_ids)
+                else:
+                    self.postgis.update_gridsquare_hashes(self.node.output)
+                self.postgis.set_gridsquare_lineage(self.node.output, {self.node.input: self.postgis.get_gridsquare_hashes(self.node.input)})
 
-            # Run get_areas_bounds as check to see if area exists in boundaries table
-            if not self.postgis.get_areas_bounds([area]):
-                self.log.error(f"[clip] Unable to find clipping area '{area}' in boundaries database, unable to proceed")
+            self.postgis.add_table_comment(self.node.output, self.node.name)
+            self.postgis.register_node(self.node, None, name_elements['branch'])
+
+            if self.postgis.set_table_completed(self.node.output):
+                self.log.info(f"[generalise] [{self.node.name}] COMPLETED")
+                return True
+            else:
+                self.log.error(f"[generalise] [{self.node.name}] Generalise completed but registry record for {self.node.output} was not found.")
                 return False
 
-            areas.append(area)
+        except Error as e:
+            self.log.error(f"[generalise] [{self.node.name}] PostGIS Error: {e}")
+            return False
+        except Exception as e:
+            self.log.error(f"[generalise] [{self.node.name}] Unexpected error: {e}")
+            return False
+
+    def get_touching_gridsquare_ids(self, gridsquare_ids):
+        """
+        Gets ids of grid squares of input features that touch features in gridsquare_ids, including gridsquare_ids
+        """
+
+        dbparams = {
+            "input": sql.Identifier(self.node.input),
+            "ids": sql.Literal(sorted(gridsquare_ids)),
+        }
+
+        results = self.postgis.fetch_all(sql.SQL("""
+        SELECT DISTINCT unnest(b.gridsquare_ids) AS gridsquare_id FROM {input} a 
+        JOIN {input} b ON ST_Intersects(a.geom, b.geom) 
+        WHERE a.gridsquare_ids && {ids}::int[]""").format(**dbparams))
+
+        return sorted(set(gridsquare_ids) | {row['gridsquare_id'] for row in results})
+
+    def get_group_gridsquare_ids(self, gridsquare_ids):
+        """
+        Gets ids of all grid squares of output features in gridsquare_ids, ie. grid squares whose output content 
+        changed when those features were regenerated. Returns None, ie. all grid squares, if gridsquare_ids is None
+        """
+
+        if gridsquare_ids is None: return None
+
+        dbparams = {
+            "output": sql.Identifier(self.node.output),
+            "ids": sql.Literal(sorted(gridsquare_ids)),
+        }
+
+        results = self.postgis.fetch_all(sql.SQL("""
+        SELECT DISTINCT unnest(gridsquare_ids) AS gridsquare_id FROM {output} WHERE gridsquare_ids && {ids}::int[]""").format(**dbparams))
+
+        return sorted(set(gridsquare_ids) | {row['gridsquare_id'] for row in results})
+
+    def clip(self):
+        """
+        Clips dataset to clipping path
+        Clipping uses cached, subdivided clip mask shared by all layers using same list of areas
+        Pieces of each feature clipped by different subdivided mask polygons are unioned back into one feature
+        so features aren't cut along internal lines of subdivided mask
+        """
+
+        # Convert output-focused name to normal name for registry listing
+        name_elements = self.parse_output_node_name(self.node.name)
+        self.node.name = name_elements['name']
+        clip_text = ';'.join(self.node.custom_properties['clip'])
+
+        self.log.info(f"[clip] Running clip mask '{clip_text}' on {self.node.name} table {self.node.input}")
+
+        if self.postgis.table_exists(self.node.output):
+            self.postgis.drop_table(self.node.output)
+
+        # Get cached clip mask, building it if this is first layer to use it
+        mask_table = self.postgis.create_clip_mask(self.node.custom_properties['clip'])
+        if not mask_table:
+            self.log.error(f"[clip] Unable to create clip mask for '{clip_text}', unable to proceed")
+            return False
 
         dbparams = {
             "crs": sql.Literal(int(self.get_crs_default())),
-            "areas": sql.Literal(areas),
             "input": sql.Identifier(self.node.input),
-            "clip": sql.Identifier(OpenSiteConstants.OPENSITE_OSMBOUNDARIES),
-            "cliptemp": sql.Identifier(cliptemp),
+            "mask": sql.Identifier(mask_table),
             "output": sql.Identifier(self.node.output),
-            "cliptemp_index": sql.Identifier(f"{cliptemp}_idx"),
-            "output_index": sql.Identifier(f"{self.node.output}_idx"),
         }
 
-        query_cliptemp_st_union = sql.SQL("""
-        CREATE TABLE {cliptemp} AS 
-            SELECT (ST_Dump(ST_Union(ST_MakeValid(geom)))).geom::geometry(Polygon, {crs}) as geom 
-            FROM {clip} 
-            WHERE LOWER(name) = ANY({areas}) 
-            OR LOWER(council_name) = ANY({areas})"""
-        ).format(**dbparams)
-        query_cliptemp_create_index = sql.SQL("CREATE INDEX {cliptemp_index} ON {cliptemp} USING GIST (geom)").format(**dbparams)
+        # Carry over grid squares that each feature was built from so downstream outputs can update incrementally
+        track_gridsquares = ('gridsquare_ids' in self.postgis.get_column_names(self.node.input))
+        dbparams['gridsquare_ids']          = sql.SQL("d.gridsquare_ids, " if track_gridsquares else "")
+
+        # MATERIALIZED prevents planner inlining clipped geometry into WHERE 
+        # so ST_Intersection is only computed once per row
+        # Features within single mask polygon are kept as they are and only features cut into 
+        # more than one piece by subdivided mask need unioning
         query_fast_clip = sql.SQL("""
-        CREATE TABLE {output} AS 
-        SELECT 
-            CASE 
-                WHEN ST_Within(d.geom, c.geom) THEN d.geom 
-                ELSE ST_Multi(ST_CollectionExtract(ST_Intersection(d.geom, c.geom), 3)) 
-            END::geometry(MultiPolygon, {crs}) as geom
-        FROM {input} d
-        JOIN {cliptemp} c ON ST_Intersects(d.geom, c.geom)
-        WHERE NOT ST_IsEmpty(ST_Intersection(d.geom, c.geom))""").format(**dbparams)
+        WITH pieces AS MATERIALIZED 
+        (
+            SELECT d.ctid AS feature, 
+                CASE 
+                    WHEN ST_Within(d.geom, c.geom) THEN d.geom 
+                    ELSE ST_CollectionExtract(ST_Intersection(d.geom, c.geom), 3) 
+                END AS geom
+            FROM {input} d
+            JOIN {mask} c ON ST_Intersects(d.geom, c.geom)
+        ),
+        clipped AS MATERIALIZED 
+        (
+            SELECT feature, 
+                CASE 
+                    WHEN cardinality(geoms) = 1 THEN ST_Multi(geoms[1]) 
+                    ELSE ST_Multi(ST_CollectionExtract(ST_UnaryUnion(ST_Collect(geoms)), 3)) 
+                END AS geom
+            FROM (SELECT feature, array_agg(geom) AS geoms FROM pieces WHERE NOT ST_IsEmpty(geom) GROUP BY feature) grouped
+        )
+        SELECT {gridsquare_ids}c.geom::geometry(MultiPolygon, {crs}) AS geom 
+        FROM clipped c JOIN {input} d ON d.ctid = c.feature 
+        WHERE NOT ST_IsEmpty(c.geom)""").format(**dbparams)
 
         try:
-            self.postgis.execute_query(query_cliptemp_st_union)
-            self.postgis.execute_query(query_cliptemp_create_index)
-            self.postgis.execute_query(query_fast_clip)
-            self.postgis.drop_table(cliptemp)
+            engine, inprocess = self.get_engine(self.node.input)
+            if engine == 'inprocess':
+                self.log.info(f"[clip] [{self.node.name}] Small dataset so clipping in-process")
+                inprocess.clip(self.node.input, self.node.output, mask_table, track_gridsquares, storage=self.get_storage())
+            else:
+                self.postgis.create_table(self.node.output, query=query_fast_clip, storage=self.get_storage())
+            if not self.postgis.finalise_table(self.node.output, [('gist', 'geom')], storage=self.get_storage()): return False
             self.postgis.add_table_comment(self.node.output, self.node.name)
+            if track_gridsquares: self.postgis.update_gridsquare_hashes(self.node.output)
 
             # Register new table manually as output uses variable ()
             self.postgis.register_node(self.node, None, name_elements['branch'])
@@ -889,4 +1414,3 @@ class OpenSiteSpatial(ProcessBase):
         except Exception as e:
             self.log.error(f"[clip] Unexpected error: {e}")
             return False
-            
\ No newline at end of file
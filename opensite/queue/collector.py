@@ -0,0 +1,164 @@
+import fnmatch
+import logging
+from opensite.constants import OpenSiteConstants
+from opensite.logging.opensite import OpenSiteLogger
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class OpenSiteGarbageCollector:
+    """
+    Reclaims database space used by intermediate tables once every node consuming them has completed
+    Depending on mode, collected tables are either dropped ('drop') or moved to compressed
+    archive files ('archive') that are restored rather than rebuilt if a later run needs them
+    """
+
+    GC_MODES = ['drop', 'archive']
+
+    def __init__(self, graph, mode=OpenSiteConstants.GC_MODE, budget_gb=OpenSiteConstants.GC_DISK_BUDGET_GB, keep=OpenSiteConstants.GC_KEEP, log_level=logging.INFO):
+        self.graph = graph
+        self.mode = mode
+        self.budget = int(budget_gb * 1024 * 1024 * 1024)
+        self.keep = keep
+        self.log = OpenSiteLogger("OpenSiteGarbageCollector", log_level)
+        self.postgis = OpenSitePostGIS(log_level)
+        self.collected = set()
+        self.producers, self.consumers, self.inputs = self.get_table_dependants()
+
+    def get_table_dependants(self):
+        """
+        Gets nodes that produce and consume every collectable table from graph
+        Returns producers {table: [node]}, consumers {table: [node] or None} and inputs {consumer urn: {table}}
+        Consumers is None for tables with no consuming node, ie. final outputs, so they're never collected
+        """
+
+        # Parent links aren't maintained when nodes are inserted so get parents by walking tree
+        parents = {}
+        def walk(node):
+            for child in node.children:
+                if child.urn not in parents: parents[child.urn] = []
+                parents[child.urn].append(node)
+                walk(child)
+        walk(self.graph.root)
+
+        # Group nodes have no action so are processed as soon as their children are
+        # Consumers are therefore nearest ancestors that do something
+        def get_consumers(node):
+            consumers = []
+            for parent in parents.get(node.urn, []):
+                if parent.action: consumers.append(parent)
+                else: consumers += get_consumers(parent)
+            return consumers
+
+        producers, consumers, inputs = {}, {}, {}
+
+        for node_dict in self.graph.find_nodes_by_props({}):
+            node = self.graph.find_node_by_urn(node_dict['urn'])
+            if not self.is_collectable_output(node.output): continue
+
+            if node.output not in producers:
+                producers[node.output], consumers[node.output] = [], []
+            producers[node.output].append(node)
+
+            node_consumers = get_consumers(node)
+            if not node_consumers: consumers[node.output] = None
+            if consumers[node.output] is None: continue
+            for consumer in node_consumers:
+                consumers[node.output].append(consumer)
+                if consumer.urn not in inputs: inputs[consumer.urn] = set()
+                inputs[consumer.urn].add(node.output)
+
+        return producers, consumers, inputs
+
+    def is_collectable_output(self, output):
+        """
+        Checks whether output is data table that could be collected
+        Internal tables, eg. processing grid, are never collected
+        """
+
+        if not output: return False
+        return output.startswith(OpenSiteConstants.DATABASE_GENERAL_PREFIX)
+
+    def is_kept(self, table):
+        """
+        Checks whether table matches keep-list, using table name and name and action of nodes producing it
+        """
+
+        for node in self.producers[table]:
+            for value in [table, node.name, node.action]:
+                if value is None: continue
+                if any(fnmatch.fnmatch(value, pattern) for pattern in self.keep): return True
+        return False
+
+    def is_collectable(self, table, ignore_urn=None):
+        """
+        Checks whether table can be collected, ie. it's not kept, every node producing it
+        has completed and every node consuming it (apart from ignore_urn) has completed
+        """
+
+        if table in self.collected: return False
+        if self.consumers[table] is None: return False
+        if self.is_kept(table): return False
+        if not all(node.status == 'processed' for node in self.producers[table]): return False
+        return all(node.status == 'processed' for node in self.consumers[table] if node.urn != ignore_urn)
+
+    def get_collectable_tables(self):
+        """
+        Gets all tables that can currently be collected
+        """
+
+        return [table for table in self.producers if self.is_collectable(table)]
+
+    def get_release_count(self, node):
+        """
+        Gets number of tables that become collectable once node completes
+        Used by scheduler to prefer nodes that lower peak disk usage
+        """
+
+        if self.mode not in self.GC_MODES: return 0
+        return len([table for table in self.inputs.get(node.urn, set()) if self.is_collectable(table, ignore_urn=node.urn)])
+
+    def collect_table(self, table):
+        """
+        Drops or archives single table
+        """
+
+        self.collected.add(table)
+
+        if self.mode == 'archive': return self.postgis.archive_table(table)
+
+        if self.postgis.drop_table(table):
+            self.log.info(f"[collect_table] Dropped {table}")
+            return True
+        return False
+
+    def collect(self):
+        """
+        Collects tables whose consumers have all completed
+        If disk budget set, only collects tables while database is larger than budget, largest tables first
+        Returns number of tables collected
+        """
+
+        if self.mode not in self.GC_MODES: return 0
+
+        tables = [table for table in self.get_collectable_tables() if self.postgis.table_exists(table)]
+        if not tables: return 0
+
+        sizes = self.postgis.get_table_sizes(tables)
+        database_size = None
+        if self.budget:
+            database_size = self.postgis.get_database_size()
+            if database_size <= self.budget: return 0
+            tables = sorted(tables, key=lambda table: sizes.get(table, 0), reverse=True)
+
+        collected = 0
+        for table in tables:
+            if self.budget and (database_size <= self.budget): break
+            if not self.collect_table(table):
+                self.log.error(f"[collect] Unable to collect {table}")
+                continue
+            collected += 1
+            if database_size is not None: database_size -= sizes.get(table, 0)
+
+        if collected:
+            self.log.info(f"[collect] Collected {collected} table(s) using mode '{self.mode}'")
+
+        return collected
@@ -18,9 +18,12 @@ from opensite.download.opensite import OpenSiteDownloader
 from opensite.processing.unzip import OpenSiteUnzipper
 from opensite.processing.concatenate import OpenSiteConcatenator
 from opensite.processing.run import OpenSiteRunner
+from opensite.processing.extract import OpenSiteExtractor
 from opensite.processing.importer import OpenSiteImporter
 from opensite.processing.spatial import OpenSiteSpatial
 from opensite.output.opensite import OpenSiteOutput
+from opensite.postgis.opensite import OpenSitePostGIS
+from opensite.queue.collector import OpenSiteGarbageCollector
 from colorama import Fore, Style, init
 
 init()
@@ -37,7 +40,7 @@ class OpenSiteQueue:
     DOWNLOAD_RETRY_TOTALATTEMPTS    = 10
     SHUTDOWN_TIME_DELAY             = 10
 
-    def __init__(self, graph, max_workers=None, log_level=logging.DEBUG, overwrite=False, stop_event=None):
+    def __init__(self, graph, max_workers=None, log_level=logging.DEBUG, overwrite=False, stop_event=None, gc=None):
         self.graph = graph
         self.action_groups = self.graph.get_action_groups()
         self.terminal_status = self.graph.get_terminal_status()
@@ -48,6 +51,12 @@ class OpenSiteQueue:
         self.process_started = None
         self.shutdownstatus = None
 
+        # Garbage collector reclaims intermediate tables once all nodes consuming them have completed
+        self.collector = None
+        if gc is None: gc = OpenSiteConstants.GC_MODE
+        if gc in OpenSiteGarbageCollector.GC_MODES:
+            self.collector = OpenSiteGarbageCollector(self.graph, mode=gc, log_level=self.log_level)
+
         # Resource Scaling
         self.cpus = os.cpu_count() or 1
         if self.cpus > 1: self.cpus -= 1
@@ -102,49 +111,39 @@ class OpenSiteQueue:
         self.log.info("All file sizes fetched.")
 
     def _fetch_db_sizes(self, nodes: List[Node]):
-        """Fetch database table sizes for all preprocess nodes in one batch query."""
+        """
+        Fetch sizes of input tables for all preprocess and buffer nodes in one batch query
+        Size is total vertices of input table taken from geometry statistics recorded when table was finalised
+        as this reflects processing cost better than table size on disk
+        """
         
         # Filter nodes that need a DB size check
         nodes_to_check = [
             n for n in nodes 
-            if n.action == 'preprocess' and not hasattr(n, '_db_table_size')
+            if n.action in ['preprocess', 'buffer'] and not hasattr(n, '_db_table_size') and n.input
         ]
         
         if not nodes_to_check:
             return
 
-        # Extract the table names we need to look for
-        table_names = [n.table_name for n in nodes_to_check if hasattr(n, 'table_name')]
-        
-        if not table_names:
-            return
+        table_names = list({n.input for n in nodes_to_check})
 
         self.log.info(f"Fetching database sizes for {len(table_names)} tables...")
 
-        # Single query to get sizes for all tables in the list
-        query = """
-            SELECT relname, pg_total_relation_size(c.oid) 
-            FROM pg_class c
-            JOIN pg_namespace n ON n.oid = c.relnamespace
-            WHERE n.nspname = 'public' 
-            AND relname = ANY(%s);
-        """
+        postgis = OpenSitePostGIS(self.log_level)
+        stats = postgis.get_tables_stats(table_names)
 
-        conn = self.postgis.pool.getconn()
-        try:
-            with conn.cursor() as cursor:
-                cursor.execute(query, (table_names,))
-                # Create a lookup dictionary: { 'table_name': size_in_bytes }
-                size_map = {row[0]: row[1] for row in cursor.fetchall()}
-                
-                # Assign sizes back to nodes
-                for node in nodes_to_check:
-                    node._db_table_size = size_map.get(node.table_name, 0)
-                    if node._db_table_size > 0:
-                        self.log.info(f"Table {node.table_name} size: {node._db_table_size} bytes")
-                    
-        finally:
-            self.postgis.pool.putconn(conn)
+        # Input tables without statistics, eg. imported tables, fall back to vertices estimated from size on disk
+        # Each vertex is two doubles, ie. 16 bytes, so this overestimates by size of attributes and indexes
+        missing = [table for table in table_names if table not in stats]
+        sizes = postgis.get_table_sizes(missing) if missing else {}
+
+        # Assign sizes back to nodes
+        for node in nodes_to_check:
+            if node.input in stats:     node._db_table_size = stats[node.input]['total_vertices']
+            else:                       node._db_table_size = sizes.get(node.input, 0) // 16
+            if node._db_table_size > 0:
+                self.log.info(f"Table {node.input} size: {node._db_table_size}")
 
         self.log.info("All database table sizes fetched.")
         
@@ -214,6 +213,13 @@ class OpenSiteQueue:
 
         logger.info(f"[CPU:{action}] {name}")
 
+        # If output was archived by garbage collector in previous run, restore it rather than rebuilding it
+        if output and output.startswith(OpenSiteConstants.DATABASE_GENERAL_PREFIX):
+            postgis = OpenSitePostGIS(log_level)
+            if postgis.is_table_archived(output) and not postgis.table_exists(output):
+                logger.info(f"[CPU:{action}] {name} Restoring archived table {output}")
+                if postgis.restore_table(output): postgis.set_table_completed(output)
+
         node = Node(    urn=urn, \
                         global_urn=global_urn, \
                         name=name, \
@@ -231,6 +237,10 @@ class OpenSiteQueue:
                 runner = OpenSiteRunner(node, log_level, shared_lock, shared_metadata)
                 success = runner.run()
 
+            if action == 'extract':
+                extractor = OpenSiteExtractor(node, log_level, shared_lock, shared_metadata)
+                success = extractor.run()
+
             if action == 'import':
                 importer = OpenSiteImporter(node, log_level, shared_lock, shared_metadata)
                 success = importer.run()
@@ -259,6 +269,10 @@ class OpenSiteQueue:
                 spatializer = OpenSiteSpatial(node, log_level, shared_lock, shared_metadata)
                 success = spatializer.clip()
 
+            if action == 'generalise':
+                spatializer = OpenSiteSpatial(node, log_level, shared_lock, shared_metadata)
+                success = spatializer.generalise()
+
             if action == 'output':
                 spatializer = OpenSiteOutput(node, log_level, overwrite, shared_lock, shared_metadata)
                 success = spatializer.run()
@@ -314,7 +328,7 @@ class OpenSiteQueue:
 
             return 'failed'
 
-    def run(self, preview=False):
+    def run(self):
         """
         Main orchestration loop. Uses a continuous sweep to pipeline
         I/O and CPU tasks simultaneously.
@@ -340,6 +354,9 @@ class OpenSiteQueue:
             
             unfinishednodes = None
 
+            # Garbage collection runs on I/O thread so archiving large tables doesn't hold up scheduling
+            gc_future = None
+
             while True:
 
                 # Check whether loop is due to be shutdown
@@ -438,6 +455,10 @@ class OpenSiteQueue:
                         self.graph.log.error(f"Task for URN {urn} generated an exception: {e}")
                         self.sync_global_status(urn, "failed")
 
+                # Collect intermediate tables no longer needed, one collection at a time
+                if self.collector and done and (gc_future is None or gc_future.done()):
+                    gc_future = io_exec.submit(self.collector.collect)
+
                 # Tiny sleep to prevent high CPU usage on the main thread
                 time.sleep(0.05)
     
@@ -496,6 +517,9 @@ class OpenSiteQueue:
             is_db_size_dependent = (node.action in ['preprocess', 'buffer'])
 
             action_weight = 0 if is_download else 1
+
+            # Prefer nodes whose completion allows intermediate tables to be collected to lower peak disk usage
+            release_weight = -self.collector.get_release_count(node) if self.collector else 0
             
             try:
                 format_weight = OpenSiteConstants.DOWNLOADS_PRIORITY.index(node.format)
@@ -517,13 +541,12 @@ class OpenSiteQueue:
                 if file_path.exists():
                     size_val = file_path.stat().st_size
             elif is_db_size_dependent:
-                # Use the database table size
-                # Assuming you've stored the result of pg_total_relation_size on the node
+                # Use total vertices (or size on disk) of input table
                 size_val = getattr(node, '_db_table_size', 0)
 
             size_weight = -size_val if size_val and size_val > 0 else 0
 
-            return (action_weight, format_weight, size_weight)
+            return (action_weight, release_weight, format_weight, size_weight)
 
         # Order by size (filesize or database size) using pre-fetch request (may not always work)
         if checksizes:
@@ -0,0 +1,48 @@
+import pytest
+import opensite.model.graph.opensite as graph_module
+from opensite.constants import OpenSiteConstants
+from opensite.model.graph.opensite import OpenSiteGraph
+
+OSM_URL = 'https://download.example.com/great-britain-latest.osm.pbf'
+
+class _Registry:
+    def sync_registry(self): pass
+
+@pytest.fixture
+def graph(monkeypatch):
+    monkeypatch.setattr(graph_module, 'OpenSitePostGIS', _Registry)
+    monkeypatch.setattr(OpenSiteConstants, 'OSM_ENGINE', 'pyosmium')
+    return OpenSiteGraph(outputformats=['gpkg'])
+
+def add_branch(graph, name, yml):
+    """
+    Adds branch with OSM dataset, ie. import node above YML download node
+    """
+
+    branch = graph.create_node(name, node_type='branch', custom_properties={'branch': name, 'yml': yml, 'osm': OSM_URL})
+    importer = graph.create_node('woodland', action='import', format=OpenSiteConstants.OSM_YML_FORMAT, \
+                                 output=f"{graph.TABLENAME_PREFIX}woodland", custom_properties={'branch': name})
+    download = graph.create_node('woodland', node_type='download', action='download', format=OpenSiteConstants.OSM_YML_FORMAT, \
+                                 input='https://example.com/woodland.yml', output='osm/woodland.yml', custom_properties={'branch': name})
+    importer.children.append(download)
+    branch.children.append(importer)
+    graph.root.children.append(branch)
+    return importer
+
+def get_runner(importer):
+    return next(child for child in importer.children if child.node_type == 'osm-runner')
+
+def test_clipped_runner_maps_only_to_clipped_tables(graph):
+    unclipped = add_branch(graph, 'unclipped', {})
+    clipped = add_branch(graph, 'clipped', {'clip': ['Cornwall']})
+
+    graph.add_osmexporttool()
+    graph.add_clip_pushdown()
+    graph.add_osm_tables()
+
+    unclipped_runner, clipped_runner = get_runner(unclipped), get_runner(clipped)
+    assert unclipped_runner.output != clipped_runner.output
+    assert clipped.output != unclipped.output
+    assert unclipped_runner.custom_properties['tables'] == {'osm/woodland.yml': unclipped.output}
+    assert clipped_runner.custom_properties['tables'] == {'osm/woodland.yml': clipped.output}
+    assert clipped_runner.custom_properties['tables'] is not unclipped_runner.custom_properties['tables']
@@ -0,0 +1,69 @@
+import pytest
+import opensite.model.graph.opensite as graph_module
+from opensite.constants import OpenSiteConstants
+from opensite.model.graph.opensite import OpenSiteGraph
+from opensite.postgis.opensite import OpenSitePostGIS
+
+class _Database:
+    def sync_registry(self): pass
+    def get_table_bounds(self, *args): return {'left': -8, 'bottom': 49, 'right': 2, 'top': 61}
+    def get_generalised_table(self, generalised, tolerance): return OpenSitePostGIS.get_generalised_table(self, generalised, tolerance)
+
+def get_outputs(monkeypatch, outputformats, generalise_formats={}, clip=None):
+    """
+    Builds output branch for branch with single dataset and gets {format: output node}
+    """
+
+    monkeypatch.setattr(graph_module, 'OpenSitePostGIS', _Database)
+    monkeypatch.setattr(OpenSiteConstants, 'GENERALISE_FORMATS', generalise_formats)
+    graph = OpenSiteGraph(outputformats=outputformats)
+
+    branch = graph.create_node('wind', title='Wind', node_type='branch', custom_properties={'branch': 'wind', 'height-to-tip': 150, 'blade-radius': 50, \
+                               'yml': {'osm': 'https://example.com/gb.osm.pbf', 'ckan': 'https://example.com'}})
+    all_layers = graph.create_node('all-layers', title='All layers', action='amalgamate', output=f"{graph.TABLENAME_PREFIX}all", custom_properties={'branch': 'wind'})
+    dataset = graph.create_node('woodland', title='Woodland', action='amalgamate', output=f"{graph.TABLENAME_PREFIX}woodland", \
+                                style={'color': 'green'}, custom_properties={'branch': 'wind'})
+    if clip: branch.custom_properties['yml']['clip'] = clip
+    all_layers.children.append(dataset)
+    branch.children.append(all_layers)
+    graph.root.children.append(branch)
+
+    graph.add_outputs()
+
+    outputs = {}
+    for node_dict in graph.find_nodes_by_props({'action': 'output'}):
+        node = graph.find_node_by_urn(node_dict['urn'])
+        if node.output.startswith('wind--woodland') and node.format: outputs[node.format] = node
+    return outputs
+
+def get_actions(node):
+    return [node.action] + [action for child in node.children for action in get_actions(child)]
+
+def test_only_mbtiles_waits_for_generalisation(monkeypatch):
+    outputs = get_outputs(monkeypatch, ['gpkg', 'mbtiles', 'shp', 'geojson'])
+    assert outputs['mbtiles'].children[0].action == 'generalise'
+    assert 'generalise' in get_actions(outputs['mbtiles'])
+    for fmt in ['gpkg', 'shp', 'geojson']:
+        assert 'generalise' not in get_actions(outputs[fmt]), fmt
+        assert outputs[fmt].input == outputs['mbtiles'].input
+
+def test_generalised_formats_are_opt_in(monkeypatch):
+    outputs = get_outputs(monkeypatch, ['gpkg', 'geojson'], {'geojson': 10})
+    assert 'generalise' in get_actions(outputs['geojson'])
+    assert outputs['geojson'].input != outputs['gpkg'].input
+    assert 'generalise' not in get_actions(outputs['gpkg'])
+
+@pytest.mark.parametrize('clip, final_action', [(None, 'postprocess'), (['Cornwall'], 'clip')])
+def test_formats_fan_out_from_final_table(monkeypatch, clip, final_action):
+    outputs = get_outputs(monkeypatch, ['gpkg', 'shp', 'fgb', 'parquet', 'mbtiles'], clip=clip)
+
+    def get_final_nodes(node):
+        if node.action == final_action: return [node]
+        return [final for child in node.children for final in get_final_nodes(child)]
+
+    final_nodes = [final for output in outputs.values() for final in get_final_nodes(output)]
+    assert len({node.output for node in final_nodes}) == 1
+    # Final table node is built once - other formats depend on clones of it without children that share its output
+    assert len([node for node in final_nodes if node.children]) == 1
+    for fmt in ['gpkg', 'shp', 'fgb', 'parquet']:
+        assert outputs[fmt].children[0].action == final_action, fmt
@@ -0,0 +1,58 @@
+import pytest
+from opensite.processing.osm import OpenSiteOSMExtractor
+
+@pytest.fixture
+def extractor():
+    return OpenSiteOSMExtractor()
+
+def matches(extractor, where, tags):
+    return extractor.evaluate(extractor.parse_where(where), tags)
+
+def test_eq_and_ne(extractor):
+    assert matches(extractor, "natural = 'wood'", {'natural': 'wood'})
+    assert not matches(extractor, "natural = 'wood'", {'natural': 'water'})
+    assert matches(extractor, "natural != 'wood'", {'natural': 'water'})
+    assert matches(extractor, "natural <> 'wood'", {'natural': 'water'})
+
+def test_in(extractor):
+    where = "landuse IN ('forest', 'meadow')"
+    assert extractor.parse_where(where) == ('in', 'landuse', {'forest', 'meadow'})
+    assert matches(extractor, where, {'landuse': 'meadow'})
+    assert not matches(extractor, where, {'landuse': 'farmland'})
+
+def test_not_in(extractor):
+    where = "landuse NOT IN ('forest', 'meadow')"
+    assert extractor.parse_where(where) == ('notin', 'landuse', {'forest', 'meadow'})
+    assert matches(extractor, where, {'landuse': 'farmland'})
+    assert not matches(extractor, where, {'landuse': 'forest'})
+
+def test_is_null(extractor):
+    assert matches(extractor, "access IS NULL", {'highway': 'track'})
+    assert not matches(extractor, "access IS NULL", {'access': 'private'})
+    assert matches(extractor, "access IS NOT NULL", {'access': 'private'})
+    assert not matches(extractor, "access IS NOT NULL", {'highway': 'track'})
+
+def test_missing_tags_are_false(extractor):
+    # As with SQL, comparisons with missing tags are never true, even when negated
+    for where in ["natural = 'wood'", "natural != 'wood'", "natural IN ('wood')", "natural NOT IN ('wood')"]:
+        assert not matches(extractor, where, {'landuse': 'forest'}), where
+
+def test_not_is_negation(extractor):
+    assert matches(extractor, "NOT natural = 'wood'", {'landuse': 'forest'})
+    assert not matches(extractor, "NOT natural = 'wood'", {'natural': 'wood'})
+
+def test_precedence_and_parentheses(extractor):
+    where = "power = 'line' OR power = 'cable' AND location = 'overhead'"
+    assert matches(extractor, where, {'power': 'line'})
+    assert not matches(extractor, where, {'power': 'cable'})
+    where = "(power = 'line' OR power = 'cable') AND location = 'overhead'"
+    assert not matches(extractor, where, {'power': 'line'})
+    assert matches(extractor, where, {'power': 'cable', 'location': 'overhead'})
+
+def test_quoted_keys_and_values(extractor):
+    assert matches(extractor, "\"addr:street\" = 'King''s Road'", {'addr:street': "King's Road"})
+
+def test_invalid_where_raises(extractor):
+    for where in ["natural =", "natural IN 'wood'", "natural = 'wood' AND", "natural NOT 'wood'"]:
+        with pytest.raises(ValueError):
+            extractor.parse_where(where)
@@ -0,0 +1,54 @@
+import os
+import pytest
+from email.utils import formatdate
+from starlette.datastructures import Headers
+from opensite.app.staticfiles import OpenSiteStaticFiles, get_file_etag
+
+FILE_SIZE = 1000
+FILE_MTIME = 1700000000
+
+@pytest.fixture
+def staticfiles(tmp_path):
+    return OpenSiteStaticFiles(directory=tmp_path)
+
+@pytest.fixture
+def stat_result():
+    return os.stat_result((0o100644, 1234, 0, 1, 0, 0, FILE_SIZE, FILE_MTIME, FILE_MTIME, FILE_MTIME))
+
+def get_byte_range(staticfiles, stat_result, headers):
+    return staticfiles.get_byte_range(Headers(headers), get_file_etag(stat_result), stat_result)
+
+def test_no_range(staticfiles, stat_result):
+    assert get_byte_range(staticfiles, stat_result, {}) is None
+    assert get_byte_range(staticfiles, stat_result, {'range': 'items=0-10'}) is None
+
+def test_single_range(staticfiles, stat_result):
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99'}) == (0, 99)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=500-'}) == (500, FILE_SIZE - 1)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=900-5000'}) == (900, FILE_SIZE - 1)
+
+def test_suffix_range(staticfiles, stat_result):
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=-100'}) == (FILE_SIZE - 100, FILE_SIZE - 1)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=-5000'}) == (0, FILE_SIZE - 1)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=-0'}) == 'unsatisfiable'
+
+def test_unsatisfiable_and_invalid_ranges(staticfiles, stat_result):
+    assert get_byte_range(staticfiles, stat_result, {'range': f'bytes={FILE_SIZE}-'}) == 'unsatisfiable'
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=100-50'}) is None
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=abc-def'}) is None
+
+def test_multiple_ranges_send_whole_file(staticfiles, stat_result):
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99,200-299'}) is None
+
+def test_if_range_etag(staticfiles, stat_result):
+    etag = get_file_etag(stat_result)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99', 'if-range': etag}) == (0, 99)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99', 'if-range': '"stale"'}) is None
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99', 'if-range': f'W/{etag}'}) is None
+
+def test_if_range_date(staticfiles, stat_result):
+    unchanged = formatdate(FILE_MTIME, usegmt=True)
+    changed = formatdate(FILE_MTIME - 60, usegmt=True)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99', 'if-range': unchanged}) == (0, 99)
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99', 'if-range': changed}) is None
+    assert get_byte_range(staticfiles, stat_result, {'range': 'bytes=0-99', 'if-range': 'not a date'}) is None
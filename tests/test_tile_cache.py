@@ -0,0 +1,32 @@
+import sqlite3
+import pytest
+from opensite.app.tiles import OpenSiteTileCache
+from opensite.constants import OpenSiteConstants
+
+@pytest.fixture
+def tiles(tmp_path, monkeypatch):
+    conn = sqlite3.connect(tmp_path / "layer.mbtiles")
+    conn.execute("CREATE TABLE metadata (name TEXT, value TEXT)")
+    conn.execute("CREATE TABLE tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)")
+    conn.execute("INSERT INTO metadata VALUES ('maxzoom', '2')")
+    conn.execute("INSERT INTO tiles VALUES (2, 1, 2, ?)", (b'tile',))
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(OpenSiteConstants, 'OUTPUT_LAYERS_FOLDER', str(tmp_path))
+    return OpenSiteTileCache()
+
+def test_get_tile(tiles):
+    assert tiles.get_tile('layer', 2, 1, 1)[0] == b'tile'
+    assert tiles.get_tile('layer', 2, 0, 0)[0] == b''
+    assert tiles.get_tile('missing', 0, 0, 0) == (None, None)
+
+def test_tiles_above_maxzoom_are_not_found_or_cached(tiles):
+    assert tiles.get_tile('layer', 3, 0, 0) == (None, None)
+    assert len(tiles.tiles) == 0
+
+def test_missing_tiles_count_towards_cache_size(tiles, monkeypatch):
+    monkeypatch.setattr(OpenSiteConstants, 'TILE_CACHE_MAX_BYTES', 3 * OpenSiteTileCache.ENTRY_OVERHEAD)
+    for x in range(4):
+        assert tiles.get_tile('layer', 2, x, 3)[0] == b''
+    assert len(tiles.tiles) == 3
+    assert tiles.tiles_size == 3 * OpenSiteTileCache.ENTRY_OVERHEAD